@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Team, Project, Collection, Environment, APIRequest, RequestHistory
+from .search import SearchQueryError, search_history
 
 @admin.register(Team)
 class TeamAdmin(admin.ModelAdmin):
@@ -37,5 +38,16 @@ class RequestHistoryAdmin(admin.ModelAdmin):
     list_display = ('request', 'method', 'url', 'response_status', 'executed_at', 'executed_by')
     list_filter = ('method', 'response_status', 'executed_by')
     search_fields = ('url',)
+    search_help_text = 'Words, $.body.path=value, status:404 or method:POST'
     date_hierarchy = 'executed_at'
     readonly_fields = ('executed_at',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the search index instead of scanning every URL
+        if not search_term:
+            return queryset, False
+        try:
+            return search_history(queryset, search_term), False
+        except SearchQueryError as e:
+            self.message_user(request, str(e), level='error')
+            return queryset.none(), False
@@ -0,0 +1,562 @@
+"""
+REST API for machine clients (``/api/v1/``), built on Django REST framework.
+
+Resources: projects, collections, requests, environments, (read-only)
+history, latency analytics over archived history and body files for upload
+probes. Everything a user can see in the web UI is reachable: projects they
+own or share through a team. Only the owner may change or delete a project;
+team members may manage its collections, requests and environments.
+
+Syncing many saved requests takes a few calls:
+
+- ``POST /api/v1/requests/bulk/`` creates a list of requests with one
+  ``bulk_create`` and ``PATCH`` to the same URL updates a list of partial
+  requests (each with its ``id``) with one ``bulk_update``. A batch is all or
+  nothing: when any item is invalid nothing is written and the errors are
+  returned per item.
+- ``POST /api/v1/requests/bulk-execute/`` runs a list of requests (optionally
+  against an environment) on the headless runner's worker pool;
+  ``POST /api/v1/requests/{id}/execute/`` runs one and returns its response.
+- ``POST /api/v1/collections/{id}/compare/`` runs a collection against two or
+  more environments at once and pairs the results per request.
+
+Lists use cursor pagination (``?page_size=`` up to 1000) so syncing a large
+table never re-counts it or skips rows that were inserted meanwhile, and
+``?fields=id,name`` returns only the listed fields. Requests are throttled per
+user, and executions additionally under the ``probe_execute`` scope.
+"""
+from datetime import datetime, timedelta
+
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import permissions, serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.routers import DefaultRouter
+from rest_framework.throttling import ScopedRateThrottle, UserRateThrottle
+
+from .archive import ArchiveUnavailable, archive_overview, latency_stats
+from .bodies import (
+    UPLOAD_CHUNK_SIZE, BodyFileError, body_file_meta, delete_body_file, list_body_files,
+    store_body_file,
+)
+from .codec import json_response
+from .comparisons import compare_environments
+from .engine import (ProbeConfigError, prepare_probe, probe_data_from_api_request, record_failure,
+                     record_history)
+from .environments import substitute_probe_data, unresolved_variables
+from .governor import GovernorTimeout
+from .headless import DEFAULT_WORKERS, MAX_WORKERS, run_suite, summarize
+from .models import APIRequest, Collection, Environment, Project, RequestHistory
+from .serializers import (
+    APIRequestSerializer, CollectionSerializer, EnvironmentSerializer, ProjectSerializer,
+    RequestHistorySerializer, accessible_projects,
+)
+from .singleflight import execute_coalesced
+from .spool import client_payload
+
+
+# Most items one bulk create, update or execute call may carry
+BULK_LIMIT = getattr(settings, 'PROBEFLEX_API_BULK_LIMIT', 1000)
+
+# Time range of an analytics query without ?start= (days before its end)
+ANALYTICS_DEFAULT_DAYS = 365
+
+
+class ProbeCursorPagination(CursorPagination):
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering = 'id'
+
+
+class HistoryCursorPagination(ProbeCursorPagination):
+    ordering = ('-executed_at', '-id')
+
+
+class IsProjectOwnerOrReadOnly(permissions.BasePermission):
+    """Team members may read a project; only its owner may change or delete it."""
+
+    def has_object_permission(self, request, view, obj):
+        return request.method in permissions.SAFE_METHODS or obj.owner_id == request.user.id
+
+
+def _requested_fields(request):
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+
+def _int_param(request, name):
+    """
+    An ID query parameter, or None when it is absent.
+
+    Raises:
+        serializers.ValidationError: If the value is not a number (answered with a 400)
+    """
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    if not value.isdigit():
+        raise serializers.ValidationError({'error': f"Invalid {name} ID"})
+    return int(value)
+
+
+def _datetime_param(request, name, default):
+    """
+    An ISO date or datetime query parameter as an aware datetime.
+
+    Raises:
+        ValueError: If the value cannot be parsed
+    """
+    value = request.query_params.get(name)
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{name} must be an ISO date or datetime")
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class ProbeViewSet(viewsets.ModelViewSet):
+    """Common behavior: cursor pagination, sparse fieldsets and per-user throttling."""
+    pagination_class = ProbeCursorPagination
+    throttle_scope = None  # Set on execution actions for ScopedRateThrottle
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.method == 'GET':
+            context['fields'] = _requested_fields(self.request)
+        return context
+
+    def projects(self):
+        return accessible_projects(self.request.user)
+
+
+class ProjectViewSet(ProbeViewSet):
+    serializer_class = ProjectSerializer
+    permission_classes = [permissions.IsAuthenticated, IsProjectOwnerOrReadOnly]
+
+    def get_queryset(self):
+        return (Project.objects.filter(id__in=self.projects())
+                .select_related('owner').prefetch_related('teams'))
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+
+
+class CollectionViewSet(ProbeViewSet):
+    serializer_class = CollectionSerializer
+
+    def get_queryset(self):
+        queryset = (Collection.objects.filter(project__in=self.projects())
+                    .annotate(request_count=Count('requests'),
+                              passing_count=Count('requests', filter=Q(requests__summary__last_passed=True)),
+                              failing_count=Count('requests', filter=Q(requests__summary__last_passed=False))))
+        project_id = _int_param(self.request, 'project')
+        if project_id is not None:
+            queryset = queryset.filter(project_id=project_id)
+        return queryset
+
+    @action(detail=True, methods=['post'],
+            throttle_classes=[UserRateThrottle, ScopedRateThrottle], throttle_scope='probe_execute')
+    def compare(self, request, pk=None):
+        """
+        Run the collection against several of its project's environments on
+        one worker pool and return the paired results (see
+        ``probe_app.comparisons``).
+
+        Body: ``{"environments": [baseline_id, other_id, ...], "variables": {...},
+        "iterations": 5, "workers": 8, "save_history": false}``
+        """
+        collection = self.get_object()
+        data = request.data if isinstance(request.data, dict) else {}
+        ids = data.get('environments')
+        if (not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids)
+                or len(set(ids)) != len(ids) or len(ids) < 2):
+            return Response({'error': 'Expected "environments", a list of at least two '
+                                      'different environment IDs'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        variables = data.get('variables') or {}
+        if not isinstance(variables, dict):
+            return Response({'error': '"variables" must be an object'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            iterations = int(data.get('iterations', 5))
+            workers = min(max(int(data.get('workers', DEFAULT_WORKERS)), 1), MAX_WORKERS)
+        except (TypeError, ValueError):
+            return Response({'error': '"iterations" and "workers" must be integers'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        api_requests = list(collection.requests.select_related('collection').order_by('id'))
+        if iterations < 1 or iterations * len(ids) * len(api_requests) > BULK_LIMIT:
+            return Response({'error': f"Between 1 and {BULK_LIMIT} probes per call "
+                                      f"(requests x environments x iterations)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        found = Environment.objects.filter(project_id=collection.project_id).in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            return Response({'error': 'Environments not found', 'ids': missing},
+                            status=status.HTTP_404_NOT_FOUND)
+        report = compare_environments(api_requests, [found[pk] for pk in ids],
+                                      variables=variables, workers=workers,
+                                      iterations=iterations,
+                                      save_history=bool(data.get('save_history', False)),
+                                      user=request.user)
+        return Response(report)
+
+
+class EnvironmentViewSet(ProbeViewSet):
+    serializer_class = EnvironmentSerializer
+
+    def get_queryset(self):
+        queryset = Environment.objects.filter(project__in=self.projects())
+        project_id = _int_param(self.request, 'project')
+        if project_id is not None:
+            queryset = queryset.filter(project_id=project_id)
+        return queryset
+
+
+class APIRequestViewSet(ProbeViewSet):
+    """
+    Saved requests, filterable with ``?collection=`` and ``?project=``, plus
+    the bulk and execution endpoints.
+    """
+    serializer_class = APIRequestSerializer
+
+    def get_queryset(self):
+        queryset = APIRequest.objects.filter(collection__project__in=self.projects())
+        collection_id = _int_param(self.request, 'collection')
+        if collection_id is not None:
+            queryset = queryset.filter(collection_id=collection_id)
+        project_id = _int_param(self.request, 'project')
+        if project_id is not None:
+            queryset = queryset.filter(collection__project_id=project_id)
+        if self.action in ('execute', 'bulk_execute'):
+            # Probes need the project's host limits
+            queryset = queryset.select_related('collection__project')
+        else:
+            queryset = queryset.select_related('summary')
+        return queryset
+
+    def _bulk_items(self):
+        """The list of items posted to a bulk endpoint, or an error Response."""
+        items = self.request.data
+        if not isinstance(items, list) or not items:
+            return None, Response({'error': 'Expected a non-empty list of requests'},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > BULK_LIMIT:
+            return None, Response({'error': f"At most {BULK_LIMIT} requests per call"},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(item, dict) for item in items):
+            return None, Response({'error': 'Every item must be an object'},
+                                  status=status.HTTP_400_BAD_REQUEST)
+        return items, None
+
+    def _bulk_context(self, items):
+        """Serializer context with the collections the items reference, fetched at once."""
+        collection_ids = {item['collection'] for item in items
+                          if isinstance(item.get('collection'), int)}
+        collections = Collection.objects.filter(id__in=collection_ids, project__in=self.projects())
+        context = self.get_serializer_context()
+        context['related'] = {Collection: {collection.id: collection for collection in collections}}
+        return context
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        Create (POST) or partially update (PATCH) a list of requests in one
+        transaction.
+        """
+        items, error = self._bulk_items()
+        if error:
+            return error
+        context = self._bulk_context(items)
+
+        if request.method == 'POST':
+            serializer = APIRequestSerializer(data=items, many=True, context=context)
+            if not serializer.is_valid():
+                return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+            with transaction.atomic():
+                created = serializer.save()
+            return Response(APIRequestSerializer(created, many=True, context=context).data,
+                            status=status.HTTP_201_CREATED)
+
+        ids = [item.get('id') for item in items]
+        if not all(isinstance(pk, int) for pk in ids) or len(set(ids)) != len(ids):
+            return Response({'error': 'Every item needs a unique integer "id"'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        instances = self.get_queryset().in_bulk(ids)
+        errors = []
+        changed = set()
+        # One serializer validates every item so its fields are only built once
+        serializer = APIRequestSerializer(partial=True, context=context)
+        for item in items:
+            instance = instances.get(item['id'])
+            if instance is None:
+                errors.append({'id': [f"Request {item['id']} does not exist."]})
+                continue
+            serializer.instance = instance
+            try:
+                attrs = serializer.run_validation(item)
+            except serializers.ValidationError as e:
+                errors.append(e.detail)
+                continue
+            errors.append({})
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                changed.add(name)
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        updated = [instances[pk] for pk in ids]
+        if changed:
+            now = timezone.now()
+            for instance in updated:
+                instance.updated_at = now
+            with transaction.atomic():
+                APIRequest.objects.bulk_update(updated, sorted(changed | {'updated_at'}),
+                                               batch_size=500)
+        return Response(APIRequestSerializer(updated, many=True, context=context).data)
+
+    def _variables(self, data):
+        """
+        Variables of the environment named in ``data`` overlaid with its
+        ``variables`` object.
+
+        Raises:
+            Environment.DoesNotExist: If the environment is not accessible
+        """
+        variables = {}
+        environment_id = data.get('environment')
+        if environment_id is not None:
+            environment = Environment.objects.get(id=environment_id, project__in=self.projects())
+            variables.update(environment.variables or {})
+        variables.update(data.get('variables') or {})
+        return variables
+
+    @action(detail=False, methods=['post'], url_path='bulk-execute',
+            throttle_classes=[UserRateThrottle, ScopedRateThrottle], throttle_scope='probe_execute')
+    def bulk_execute(self, request):
+        """
+        Execute a list of saved requests and return a summary and one result
+        per request (status and time; bodies are kept in history only).
+
+        Body: ``{"ids": [...], "environment": id, "variables": {...},
+        "workers": 8, "save_history": true}``
+        """
+        data = request.data if isinstance(request.data, dict) else {}
+        ids = data.get('ids')
+        if not isinstance(ids, list) or not ids or not all(isinstance(pk, int) for pk in ids):
+            return Response({'error': 'Expected "ids", a non-empty list of request IDs'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(ids) > BULK_LIMIT:
+            return Response({'error': f"At most {BULK_LIMIT} requests per call"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            variables = self._variables(data)
+            workers = min(max(int(data.get('workers', DEFAULT_WORKERS)), 1), MAX_WORKERS)
+        except Environment.DoesNotExist:
+            return Response({'error': 'Environment not found'}, status=status.HTTP_404_NOT_FOUND)
+        except (TypeError, ValueError):
+            return Response({'error': '"workers" must be an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        found = self.get_queryset().in_bulk(ids)
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            return Response({'error': 'Requests not found', 'ids': missing},
+                            status=status.HTTP_404_NOT_FOUND)
+        results, wall_time = run_suite([found[pk] for pk in ids], variables=variables,
+                                       workers=workers,
+                                       save_history=bool(data.get('save_history', True)),
+                                       user=request.user)
+        return Response({'summary': summarize(results, wall_time), 'results': results})
+
+    @action(detail=True, methods=['post'],
+            throttle_classes=[UserRateThrottle, ScopedRateThrottle], throttle_scope='probe_execute')
+    def execute(self, request, pk=None):
+        """
+        Execute one saved request, record it in history and return the
+        response the way ``/api/send/`` does.
+
+        Body (optional): ``{"environment": id, "variables": {...}}``
+        """
+        api_request = self.get_object()
+        data = request.data if isinstance(request.data, dict) else {}
+        try:
+            variables = self._variables(data)
+        except Environment.DoesNotExist:
+            return Response({'error': 'Environment not found'}, status=status.HTTP_404_NOT_FOUND)
+        probe_data = substitute_probe_data(probe_data_from_api_request(api_request), variables)
+        missing = unresolved_variables(probe_data)
+        if missing:
+            return Response({'error': f"Undefined variables: {', '.join(sorted(missing))}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            probe = prepare_probe(probe_data)
+        except ProbeConfigError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = execute_coalesced(probe, spool_for=request.user)
+        except GovernorTimeout as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except requests.RequestException as e:
+            try:
+                record_failure(api_request, probe, e, request.user)
+            except Exception as history_error:
+                print(f"Error saving request history: {str(history_error)}")
+            if isinstance(e, requests.Timeout):
+                return Response({'error': str(e)}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        try:
+            record_history(api_request, probe, result, request.user)
+        except Exception as history_error:
+            print(f"Error saving request history: {str(history_error)}")
+        # The probe codec renders unparsed (RawJSON) bodies as they were received
+        return json_response(client_payload(result))
+
+
+class RequestHistoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Executions of accessible requests, newest first, filterable with
+    ``?request=``, ``?collection=`` and ``?project=``. Response bodies are only
+    loaded when the ``response_body`` field is part of the response.
+    """
+    serializer_class = RequestHistorySerializer
+    pagination_class = HistoryCursorPagination
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = _requested_fields(self.request)
+        return context
+
+    def get_queryset(self):
+        queryset = (RequestHistory.objects
+                    .filter(request__collection__project__in=accessible_projects(self.request.user))
+                    .select_related('executed_by'))
+        fields = _requested_fields(self.request)
+        if fields is not None and 'response_body' not in fields:
+            queryset = queryset.defer('response_body')
+        for param, lookup in (('request', 'request_id'), ('collection', 'request__collection_id'),
+                              ('project', 'request__collection__project_id')):
+            value = _int_param(self.request, param)
+            if value is not None:
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """
+    Latency analytics over archived history (see ``probe_app.archive``).
+
+    ``GET /api/v1/analytics/`` lists what is archived per accessible project;
+    ``GET /api/v1/analytics/latency/`` returns percentiles and error rates,
+    filtered by ``?project=``, ``?collection=``, ``?request=``, ``?start=`` and
+    ``?end=`` (ISO dates or datetimes; the last year by default), bucketed by
+    ``?interval=`` (hour, day, week, month) and grouped by ``?group_by=``
+    (project, collection, request). ``?recent=true`` adds history that is
+    still in the database.
+    """
+
+    def _project_ids(self):
+        ids = list(accessible_projects(self.request.user).values_list('id', flat=True))
+        project_id = _int_param(self.request, 'project')
+        if project_id is not None:
+            ids = [project_id] if project_id in ids else []
+        return ids
+
+    def list(self, request):
+        try:
+            return Response(archive_overview(self._project_ids()))
+        except ArchiveUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @action(detail=False, methods=['get'])
+    def latency(self, request):
+        params = request.query_params
+        try:
+            end = _datetime_param(request, 'end', timezone.now())
+            start = _datetime_param(request, 'start', end - timedelta(days=ANALYTICS_DEFAULT_DAYS))
+            if start >= end:
+                raise ValueError('start must be before end')
+            results = latency_stats(
+                self._project_ids(), start, end,
+                collection_id=_int_param(request, 'collection'),
+                request_id=_int_param(request, 'request'),
+                interval=params.get('interval') or None,
+                group_by=params.get('group_by') or None,
+                include_recent=params.get('recent', '').lower() in ('1', 'true', 'yes'),
+            )
+        except ArchiveUnavailable as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'start': start, 'end': end, 'results': results})
+
+
+class BodyFileViewSet(viewsets.ViewSet):
+    """
+    Files sent as multipart or binary request bodies (see ``probe_app.bodies``).
+
+    ``POST /api/v1/body-files/`` takes a ``multipart/form-data`` upload with a
+    ``file`` part (and an optional ``content_type`` field overriding the
+    part's) and returns the file's ``ref``; the upload is spooled to disk by
+    Django and copied in chunks, never held in memory. Lists only show the
+    user's own files.
+    """
+    parser_classes = [MultiPartParser]
+    lookup_value_regex = '[A-Za-z0-9_-]+'
+
+    def list(self, request):
+        return Response(list_body_files(request.user.id))
+
+    def create(self, request):
+        uploaded = request.FILES.get('file')
+        if uploaded is None:
+            return Response({'error': 'Expected a "file" part'}, status=status.HTTP_400_BAD_REQUEST)
+        content_type = request.data.get('content_type') or uploaded.content_type
+        try:
+            meta = store_body_file(uploaded.chunks(UPLOAD_CHUNK_SIZE), uploaded.name, content_type,
+                                   request.user.id)
+        except BodyFileError as e:
+            return Response({'error': str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        return Response(meta, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        try:
+            meta = body_file_meta(pk)
+        except BodyFileError:
+            meta = None
+        if meta is None or meta.get('owner') != request.user.id:
+            return Response({'error': 'Body file not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(meta)
+
+    def destroy(self, request, pk=None):
+        try:
+            delete_body_file(pk, request.user.id)
+        except BodyFileError:
+            return Response({'error': 'Body file not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+router = DefaultRouter()
+router.register('projects', ProjectViewSet, basename='api-project')
+router.register('collections', CollectionViewSet, basename='api-collection')
+router.register('requests', APIRequestViewSet, basename='api-request')
+router.register('environments', EnvironmentViewSet, basename='api-environment')
+router.register('history', RequestHistoryViewSet, basename='api-history')
+router.register('analytics', AnalyticsViewSet, basename='api-analytics')
+router.register('body-files', BodyFileViewSet, basename='api-body-file')
@@ -0,0 +1,514 @@
+"""
+Cold-history archival to columnar segment files, and analytics over them.
+
+History older than ``PROBEFLEX_ARCHIVE_AFTER_DAYS`` is moved out of
+``RequestHistory`` into compressed Parquet files under
+``PROBEFLEX_ARCHIVE_DIR``, partitioned by project and UTC day::
+
+    archive/history/project=3/date=2026-01-31/part-1200-98765.parquet
+    archive/rollups/project=3/date=2026-01-31/part-1200-98765.parquet
+
+A history segment keeps the columns capacity reviews need (request,
+collection, time, method, URL, status, latency, queueing delay, attempts,
+protocol, response fingerprint) but not headers or bodies, sorted by request
+and time. Its rollup holds the same day per request as a latency histogram:
+execution and failure counts, latency sum, minimum and maximum per
+logarithmic latency bin (the bins of ``stats.LatencyHistogram`` at
+``ROLLUP_ACCURACY``). History pinned as a baseline stays in the database and
+is not archived.
+
+Analytics read both through memory-mapped datasets. Whole days come from the
+rollups, which are a small fraction of the history rows; partial days at the
+edges of a range and hourly intervals scan the history segments and bin them
+the same way. Partition filters (project, day) prune whole files, only the
+needed columns are read, and binning and grouping run in Arrow compute
+kernels, so a year of executions is summarized in well under a second without
+touching the OLTP database. Percentiles are accurate to ``ROLLUP_ACCURACY``;
+counts, means, minimums, maximums and error rates are exact.
+
+Needs ``pip install pyarrow``; without it ``ARCHIVE_AVAILABLE`` is False
+and archival and analytics raise ``ArchiveUnavailable``.
+"""
+import math
+import os
+import uuid
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import APIRequest, Project, RequestHistory
+from .stats import MIN_TRACKED_VALUE, LatencyHistogram
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs as pafs
+except ImportError:
+    pa = None
+
+# Whether history can be archived and analyzed
+ARCHIVE_AVAILABLE = pa is not None
+
+# Root directory of the segment files
+ARCHIVE_DIR = Path(getattr(settings, 'PROBEFLEX_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive'))
+
+# History older than this many days is archived by the archive_history command
+ARCHIVE_AFTER_DAYS = getattr(settings, 'PROBEFLEX_ARCHIVE_AFTER_DAYS', 30)
+
+# Parquet compression codec of new segments
+ARCHIVE_COMPRESSION = getattr(settings, 'PROBEFLEX_ARCHIVE_COMPRESSION', 'zstd')
+
+# Relative accuracy of the latency bins of rollups, and so of archived percentiles
+ROLLUP_ACCURACY = 0.02
+
+# Rows per Parquet row group (and per database fetch while archiving)
+ROW_GROUP_SIZE = 64 * 1024
+
+# History rows deleted per statement once their segment is written
+DELETE_BATCH_SIZE = 500
+
+# Time buckets and groupings accepted by latency_stats
+INTERVALS = ('hour', 'day', 'week', 'month')
+GROUPINGS = {'project': 'project', 'collection': 'collection_id', 'request': 'request_id'}
+
+# Percentiles reported by latency_stats
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+# RequestHistory values archived, in segment column order
+_HISTORY_VALUES = ('id', 'request_id', 'request__collection_id', 'executed_at', 'method', 'url',
+                   'response_status', 'response_time', 'queue_time', 'attempts', 'http_version',
+                   'coalesced', 'response_size', 'response_wire_size', 'response_encoding',
+                   'decompression_time', 'response_hash', 'response_changed', 'executed_by_id')
+
+# Rollup bin of latencies at or below MIN_TRACKED_VALUE (LatencyHistogram's zero bucket); sorts first
+ZERO_BIN = -2 ** 31
+
+# Rollup measures and how partial rollups of the same bin are combined
+_ROLLUP_MEASURES = (('count', 'sum'), ('failed', 'sum'), ('total', 'sum'), ('min', 'min'), ('max', 'max'))
+
+
+class ArchiveUnavailable(RuntimeError):
+    """Raised when archival or analytics are used without pyarrow installed."""
+
+
+def _require():
+    if not ARCHIVE_AVAILABLE:
+        raise ArchiveUnavailable('History archival needs pyarrow (pip install pyarrow)')
+
+
+def segment_schema():
+    """Arrow schema of the rows stored in a history segment."""
+    return pa.schema([
+        ('id', pa.int64()),
+        ('request_id', pa.int64()),
+        ('collection_id', pa.int64()),
+        ('executed_at', pa.timestamp('us', tz='UTC')),
+        ('method', pa.string()),
+        ('url', pa.string()),
+        ('response_status', pa.int16()),
+        ('response_time', pa.float64()),
+        ('queue_time', pa.float64()),
+        ('attempts', pa.int16()),
+        ('http_version', pa.string()),
+        ('coalesced', pa.bool_()),
+        ('response_size', pa.int64()),
+        ('response_wire_size', pa.int64()),
+        ('response_encoding', pa.string()),
+        ('decompression_time', pa.float64()),
+        ('response_hash', pa.string()),
+        ('response_changed', pa.bool_()),
+        ('executed_by_id', pa.int64()),
+    ])
+
+
+def rollup_schema():
+    """Arrow schema of a rollup: one row per request and latency bin of the day."""
+    return pa.schema([
+        ('request_id', pa.int64()),
+        ('collection_id', pa.int64()),
+        ('bin', pa.int32()),
+        ('count', pa.int64()),
+        ('failed', pa.int64()),
+        ('total', pa.float64()),
+        ('min', pa.float64()),
+        ('max', pa.float64()),
+    ])
+
+
+def _partition_fields():
+    return [pa.field('project', pa.int64()), pa.field('date', pa.date32())]
+
+
+def _day_bounds(day):
+    start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def archive_cutoff(older_than_days=None):
+    """Start of the oldest UTC day that is kept in the database."""
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return _day_bounds((timezone.now() - timedelta(days=days)).astimezone(dt_timezone.utc).date())[0]
+
+
+def archivable_history(cutoff):
+    """History executed before ``cutoff``, without entries pinned as baselines."""
+    pinned = APIRequest.objects.filter(baseline__isnull=False).values('baseline_id')
+    return RequestHistory.objects.filter(executed_at__lt=cutoff).exclude(id__in=pinned)
+
+
+def _rollup(table, keys):
+    """
+    Bin the executions of ``table`` (response_time, response_status and the
+    ``keys`` columns) into rollup rows per key and latency bin.
+    """
+    times = table['response_time']
+    log_gamma = math.log(LatencyHistogram(ROLLUP_ACCURACY).gamma)
+    # Same bins as LatencyHistogram: ceil(log(value) / log(gamma)), ZERO_BIN for the zero bucket
+    bins = pc.cast(pc.ceil(pc.divide(pc.ln(pc.max_element_wise(times, MIN_TRACKED_VALUE)), log_gamma)),
+                   pa.int32())
+    bins = pc.if_else(pc.greater(times, MIN_TRACKED_VALUE), bins, pa.scalar(ZERO_BIN, pa.int32()))
+    status = table['response_status']
+    failed = pc.cast(pc.or_kleene(pc.is_null(status), pc.greater_equal(status, 400)), pa.int64())
+    binned = pa.table([table[key] for key in keys] + [bins, failed, times],
+                      names=list(keys) + ['bin', 'failed', 'response_time'])
+    aggregated = binned.group_by(list(keys) + ['bin']).aggregate([
+        ('response_time', 'count'), ('failed', 'sum'), ('response_time', 'sum'),
+        ('response_time', 'min'), ('response_time', 'max')])
+    return aggregated.rename_columns(list(keys) + ['bin', 'count', 'failed', 'total', 'min', 'max'])
+
+
+def _merge_rollups(table, keys):
+    """Combine rollup rows with the same keys and latency bin."""
+    aggregated = table.group_by(list(keys) + ['bin']).aggregate(list(_ROLLUP_MEASURES))
+    return aggregated.rename_columns(list(keys) + ['bin'] + [name for name, _ in _ROLLUP_MEASURES])
+
+
+def _write_parquet(path, table):
+    """Write a table to ``path`` through a temporary file, replacing any previous file."""
+    # Dot-prefixed files are ignored by readers until they are complete
+    temp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        pq.write_table(table, temp_path, compression=ARCHIVE_COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+        os.replace(temp_path, path)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+def _write_segment(rows, project_id, day):
+    """
+    Write one project's history of one day to a new segment and its rollup.
+
+    Returns:
+        (row count, ids of the archived rows)
+    """
+    partition = Path(f"project={project_id}") / f"date={day.isoformat()}"
+    history_dir = ARCHIVE_DIR / 'history' / partition
+    history_dir.mkdir(parents=True, exist_ok=True)
+    temp_path = history_dir / f".part-{uuid.uuid4().hex}.parquet.tmp"
+    schema = segment_schema()
+    attempts = schema.get_field_index('attempts')
+    ids = []
+    columns = {name: [] for name in schema.names}
+    rollups = []
+
+    def flush(writer):
+        chunk = pa.Table.from_pydict(columns, schema=schema)
+        writer.write_table(chunk, row_group_size=ROW_GROUP_SIZE)
+        rollups.append(_rollup(chunk, ('request_id', 'collection_id')))
+        for values in columns.values():
+            values.clear()
+
+    try:
+        with pq.ParquetWriter(temp_path, schema, compression=ARCHIVE_COMPRESSION) as writer:
+            for row in rows.iterator(chunk_size=ROW_GROUP_SIZE):
+                row = list(row)
+                row[attempts] = len(row[attempts] or ())  # Only the number of attempts is kept
+                for name, value in zip(schema.names, row):
+                    columns[name].append(value)
+                ids.append(row[0])
+                if len(ids) % ROW_GROUP_SIZE == 0:
+                    flush(writer)
+            if columns['id']:
+                flush(writer)
+        if not ids:
+            temp_path.unlink()
+            return 0, ids
+        # Named after the rows it holds, so re-archiving the same rows after an
+        # interruption replaces the segment instead of duplicating it
+        name = f"part-{min(ids)}-{max(ids)}.parquet"
+        rollup_dir = ARCHIVE_DIR / 'rollups' / partition
+        rollup_dir.mkdir(parents=True, exist_ok=True)
+        rollup = _merge_rollups(pa.concat_tables(rollups), ('request_id', 'collection_id'))
+        _write_parquet(rollup_dir / name, rollup.cast(rollup_schema()).sort_by('request_id'))
+        os.replace(temp_path, history_dir / name)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return len(ids), ids
+
+
+def archive_history(older_than_days=None, dry_run=False, progress=None):
+    """
+    Move history older than ``older_than_days`` whole UTC days into segments.
+
+    Each project's rows of one day are written to a segment and its rollup,
+    and deleted from the database once both are complete. ``progress`` is
+    called with (project id, day, rows) after each segment.
+
+    Returns:
+        (rows archived, segments written); with ``dry_run`` the rows and
+        segments that would be, without writing or deleting anything
+    """
+    _require()
+    history = archivable_history(archive_cutoff(older_than_days))
+    total_rows = 0
+    segments = 0
+    for project_id in Project.objects.order_by('id').values_list('id', flat=True):
+        project_history = history.filter(request__collection__project_id=project_id)
+        days = (project_history.annotate(day=TruncDate('executed_at', tzinfo=dt_timezone.utc))
+                .order_by('day').values_list('day', flat=True).distinct())
+        for day in list(days):
+            start, end = _day_bounds(day)
+            rows = (project_history.filter(executed_at__gte=start, executed_at__lt=end)
+                    .order_by('request_id', 'executed_at', 'id'))
+            if dry_run:
+                count = rows.count()
+            else:
+                count, ids = _write_segment(rows.values_list(*_HISTORY_VALUES), project_id, day)
+                for offset in range(0, len(ids), DELETE_BATCH_SIZE):
+                    with transaction.atomic():
+                        RequestHistory.objects.filter(id__in=ids[offset:offset + DELETE_BATCH_SIZE]).delete()
+            if count:
+                total_rows += count
+                segments += 1
+                if progress:
+                    progress(project_id, day, count)
+    return total_rows, segments
+
+
+def _dataset(kind):
+    """The 'history' or 'rollups' files as a memory-mapped dataset, or None while there are none."""
+    directory = ARCHIVE_DIR / kind
+    if not directory.is_dir():
+        return None
+    partition_fields = _partition_fields()
+    schema = segment_schema() if kind == 'history' else rollup_schema()
+    for field in partition_fields:
+        schema = schema.append(field)
+    return ds.dataset(str(directory), schema=schema, format='parquet',
+                      partitioning=ds.partitioning(pa.schema(partition_fields), flavor='hive'),
+                      filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+
+def archive_overview(project_ids):
+    """
+    Segments, rows, bytes and the first and last archived day per project.
+
+    Row counts come from the segment footers; no data pages are read.
+    """
+    _require()
+    overview = {}
+    for kind in ('history', 'rollups'):
+        dataset = _dataset(kind)
+        if dataset is None:
+            continue
+        for fragment in dataset.get_fragments(filter=ds.field('project').isin(list(project_ids))):
+            keys = ds.get_partition_keys(fragment.partition_expression)
+            entry = overview.setdefault(keys['project'], {
+                'project': keys['project'], 'segments': 0, 'rows': 0, 'bytes': 0,
+                'first_day': keys['date'], 'last_day': keys['date']})
+            entry['bytes'] += os.path.getsize(fragment.path)
+            if kind == 'history':
+                entry['segments'] += 1
+                entry['rows'] += fragment.metadata.num_rows
+                entry['first_day'] = min(entry['first_day'], keys['date'])
+                entry['last_day'] = max(entry['last_day'], keys['date'])
+    return [overview[project] for project in sorted(overview)]
+
+
+def _recent_table(project_ids, start, end, collection_id, request_id):
+    """History still in the database that matches a query, in the segment layout."""
+    rows = RequestHistory.objects.filter(request__collection__project_id__in=project_ids,
+                                         executed_at__gte=start, executed_at__lt=end)
+    if collection_id is not None:
+        rows = rows.filter(request__collection_id=collection_id)
+    if request_id is not None:
+        rows = rows.filter(request_id=request_id)
+    fields = [pa.field('project', pa.int64())] + [
+        segment_schema().field(name) for name in
+        ('collection_id', 'request_id', 'executed_at', 'response_status', 'response_time')]
+    values = list(zip(*rows.values_list('request__collection__project_id', 'request__collection_id',
+                                        'request_id', 'executed_at', 'response_status', 'response_time')))
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for field, column in
+                                 zip(fields, values or [[]] * len(fields))], schema=pa.schema(fields))
+
+
+def _ts(value):
+    return pa.scalar(value, pa.timestamp('us', tz='UTC'))
+
+
+def _day(value):
+    return pa.scalar(value, pa.date32())
+
+
+def latency_stats(project_ids, start, end, collection_id=None, request_id=None,
+                  interval=None, group_by=None, include_recent=False):
+    """
+    Latency percentiles and error rates of archived executions.
+
+    Args:
+        project_ids: Projects to include (the ones the caller may access)
+        start, end: Time range of the executions (aware datetimes, end excluded)
+        collection_id, request_id: Optional narrower filters
+        interval: Optional time bucket, one of INTERVALS
+        group_by: Optional grouping, one of GROUPINGS
+        include_recent: Also read matching history still in the database
+
+    Returns:
+        A list of rows with the period and group (when requested), count,
+        mean, min, max, p50, p90, p95, p99 (milliseconds) and error_rate
+        (share of executions without a status or with a status >= 400)
+
+    Raises:
+        ValueError: For an unknown interval or grouping
+    """
+    _require()
+    if interval is not None and interval not in INTERVALS:
+        raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+    if group_by is not None and group_by not in GROUPINGS:
+        raise ValueError(f"group_by must be one of {', '.join(GROUPINGS)}")
+    project_ids = list(project_ids)
+    if not project_ids:
+        return []
+    start, end = start.astimezone(dt_timezone.utc), end.astimezone(dt_timezone.utc)
+
+    # Rollup rows are keyed by the time they cover ('time': a day, or an hour
+    # for hourly intervals) and the grouping column
+    keys = ['time'] if interval is not None else []
+    if group_by is not None:
+        keys.append(GROUPINGS[group_by])
+    time_unit = 'hour' if interval == 'hour' else 'day'
+    measures = [name for name, _ in _ROLLUP_MEASURES]
+    filters = ds.field('project').isin(project_ids)
+    if collection_id is not None:
+        filters &= ds.field('collection_id') == collection_id
+    if request_id is not None:
+        filters &= ds.field('request_id') == request_id
+    parts = []
+
+    def add_executions(table):
+        if interval is not None:
+            table = table.append_column('time', pc.floor_temporal(table['executed_at'], unit=time_unit))
+        parts.append(_rollup(table, keys))
+
+    def scan_history(expression):
+        dataset = _dataset('history')
+        if dataset is not None:
+            columns = ['response_status', 'response_time'] + [key for key in keys if key != 'time']
+            if interval is not None:
+                columns.append('executed_at')
+            add_executions(dataset.to_table(columns=columns, filter=filters & expression))
+
+    # Whole UTC days in the range come from the rollups, the rest from the segments
+    first_day = start.date() if start == _day_bounds(start.date())[0] else start.date() + timedelta(days=1)
+    end_day = end.date()
+    if interval == 'hour' or first_day >= end_day:
+        scan_history((ds.field('date') >= _day(start.date())) & (ds.field('date') <= _day(end_day))
+                     & (ds.field('executed_at') >= _ts(start)) & (ds.field('executed_at') < _ts(end)))
+    else:
+        rollups = _dataset('rollups')
+        if rollups is not None:
+            columns = [key for key in keys if key != 'time'] + ['bin'] + measures
+            if interval is not None:
+                columns.append('date')
+            table = rollups.to_table(columns=columns, filter=filters & (ds.field('date') >= _day(first_day))
+                                     & (ds.field('date') < _day(end_day)))
+            if interval is not None:
+                table = table.append_column('time', pc.cast(table['date'], pa.timestamp('us', tz='UTC')))
+            parts.append(table.select(keys + ['bin'] + measures))
+        if first_day > start.date():
+            scan_history((ds.field('date') == _day(start.date())) & (ds.field('executed_at') >= _ts(start)))
+        if end > _day_bounds(end_day)[0]:
+            scan_history((ds.field('date') == _day(end_day)) & (ds.field('executed_at') < _ts(end)))
+    if include_recent:
+        add_executions(_recent_table(project_ids, start, end, collection_id, request_id))
+
+    parts = [part.cast(parts[0].schema) for part in parts if part.num_rows]
+    if not parts:
+        return []
+    table = pa.concat_tables(parts)
+    if interval is not None:
+        table = table.set_column(table.schema.get_field_index('time'), 'time',
+                                 pc.floor_temporal(table['time'], unit=interval))
+    table = _merge_rollups(table, keys).sort_by([(key, 'ascending') for key in keys + ['bin']])
+    return _summaries(table, keys, interval, group_by)
+
+
+def _shifted(column, first):
+    """``column`` moved down one row, starting with ``first`` (the last value drops off)."""
+    head = pa.array([first], type=column.type)
+    return pa.chunked_array([head] + column.slice(0, len(column) - 1).chunks, type=column.type)
+
+
+def _summaries(table, keys, interval, group_by):
+    """
+    One result row per distinct ``keys`` of merged rollup rows, which must be
+    sorted by keys and then bin.
+
+    Percentiles follow ``LatencyHistogram.quantile``: the value at quantile q
+    is the bin where the running count first exceeds q * (count - 1),
+    computed for every group at once from running sums over the sorted rows.
+    """
+    if not keys:
+        table = table.append_column('group', pa.repeat(0, table.num_rows))
+        keys = ['group']
+    # Groups are runs of equal keys: mark where each starts and number them
+    starts = pa.chunked_array([pa.array([True]), pa.repeat(False, table.num_rows - 1)])
+    for key in keys:
+        starts = pc.or_(starts, pc.not_equal(table[key], _shifted(table[key], None)))
+    starts = pc.fill_null(starts, True)
+    group_index = pc.subtract(pc.cumulative_sum(pc.cast(starts, pa.int64())), 1)
+
+    # Sorted like the table, so totals row i is group i whatever order group_by emits
+    totals = (table.group_by(keys, use_threads=False).aggregate(list(_ROLLUP_MEASURES))
+              .sort_by([(key, 'ascending') for key in keys]))
+    counts = totals['count_sum']
+    running = pc.cumulative_sum(table['count'])
+    group_base = pc.take(pc.subtract(pc.cumulative_sum(counts), counts), group_index)
+    seen = pc.subtract(running, group_base)
+
+    gamma = LatencyHistogram(ROLLUP_ACCURACY).gamma
+    percentiles = {}
+    for q in PERCENTILES:
+        rank = pc.take(pc.multiply(pc.cast(pc.subtract(counts, 1), pa.float64()), q), group_index)
+        reached = pc.greater(pc.cast(seen, pa.float64()), rank)
+        first = pc.and_(reached, pc.or_(starts, pc.invert(_shifted(reached, False))))
+        bins = pc.filter(table['bin'], first)
+        # Bin midpoint (as LatencyHistogram._bucket_value), clamped to the observed range
+        values = pc.multiply(pc.power(gamma, pc.cast(bins, pa.float64())), 2 / (gamma + 1))
+        values = pc.min_element_wise(pc.max_element_wise(values, totals['min_min']), totals['max_max'])
+        values = pc.if_else(pc.equal(bins, ZERO_BIN), 0.0, values)
+        percentiles[f"p{round(q * 100)}"] = values.to_pylist()
+
+    columns = totals.to_pydict()
+    results = []
+    for i, count in enumerate(columns['count_sum']):
+        entry = {}
+        if interval is not None:
+            entry['period'] = columns['time'][i].isoformat()
+        if group_by is not None:
+            entry[group_by] = columns[GROUPINGS[group_by]][i]
+        entry.update(count=count, mean=columns['total_sum'][i] / count, min=columns['min_min'][i],
+                     max=columns['max_max'][i])
+        for name, values in percentiles.items():
+            entry[name] = values[i]
+        entry['error_rate'] = columns['failed_sum'][i] / count
+        results.append(entry)
+    return results
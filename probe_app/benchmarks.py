@@ -0,0 +1,243 @@
+"""
+Benchmarks for the ProbeFlex probe pipeline.
+
+Each benchmark runs against a local ``StandInServer`` and returns a plain
+dictionary of measurements (throughput, latency percentiles, wall time and
+memory), so results can be written to JSON and compared between commits with
+the ``probe_bench`` management command.
+
+Benchmarks expect to run against a throwaway database (the command creates a
+test database) because they create users, requests and history rows.
+"""
+import gc
+import json
+import threading
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.test import Client
+
+from . import codec
+from .engine import execute_probe, prepare_probe, record_history
+from .models import APIRequest, Collection, Project
+from .runs import ProbeRun
+from .standin import build_payload
+from .stats import LatencyHistogram
+
+
+# Payloads for the JSON codec benchmark: name -> (size in bytes, nesting depth)
+JSON_CODEC_PAYLOADS = {
+    'large_flat': (8 * 1024 * 1024, 0),
+    'deeply_nested': (1024 * 1024, 500),
+}
+
+# Repetitions of each JSON codec measurement
+JSON_CODEC_ROUNDS = 5
+
+
+class BenchmarkContext:
+    """Fixtures and parameters shared by all benchmarks of one invocation."""
+
+    def __init__(self, server_url, requests=500, concurrency=8, collection_size=20,
+                 trace_memory=False, verify_ssl=True):
+        self.server_url = server_url
+        self.verify_ssl = verify_ssl
+        self.requests = requests
+        self.concurrency = concurrency
+        self.collection_size = collection_size
+        self.trace_memory = trace_memory
+
+        self.user = User.objects.create_user('probe-bench', password='probe-bench')
+        self.project = Project.objects.create(name='Benchmark', owner=self.user)
+        self.collection = Collection.objects.create(name='Benchmark', project=self.project)
+        self.api_requests = [
+            APIRequest.objects.create(name=f"Bench {index}", url=server_url,
+                                      verify_ssl=verify_ssl, collection=self.collection)
+            for index in range(collection_size)
+        ]
+
+
+def _measure(function, trace_memory):
+    """Call ``function`` and return (result, wall_seconds, peak_traced_bytes or None)."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = function()
+    finally:
+        wall = time.perf_counter() - start
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result, wall, peak
+
+
+def _run_concurrently(total, concurrency, task):
+    """
+    Call ``task(index)`` ``total`` times from ``concurrency`` threads.
+
+    Returns a LatencyHistogram of per-call latencies (ms), the error count and
+    the first error message (if any).
+    """
+    histogram = LatencyHistogram()
+    errors = [0, None]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def worker():
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            start = time.perf_counter()
+            error = None
+            try:
+                task(index)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                histogram.add(elapsed)
+                if error:
+                    errors[0] += 1
+                    errors[1] = errors[1] or error
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return histogram, errors[0], errors[1]
+
+
+def _summarize(histogram, errors, wall, peak, operations, first_error=None):
+    return {
+        'operations': operations,
+        'errors': errors,
+        'first_error': first_error,
+        'wall_time': wall,
+        'throughput': operations / wall if wall else None,
+        'latency_ms': histogram.summary() if histogram else None,
+        'memory_peak_bytes': peak,
+    }
+
+
+def bench_send_request(context):
+    """End-to-end ``/api/send/`` calls, including history writes, through the Django stack."""
+    local = threading.local()
+
+    def task(index):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client()
+            client.force_login(context.user)
+        api_request = context.api_requests[index % len(context.api_requests)]
+        response = client.post('/api/send/', {
+            'url': context.server_url,
+            'method': 'GET',
+            'api_request_id': api_request.id,
+            'verify_ssl': context.verify_ssl,
+        }, content_type='application/json')
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.content[:200]!r}")
+
+    (histogram, errors, first_error), wall, peak = _measure(
+        lambda: _run_concurrently(context.requests, context.concurrency, task),
+        context.trace_memory)
+    return _summarize(histogram, errors, wall, peak, context.requests, first_error)
+
+
+def bench_history_write(context):
+    """Throughput of RequestHistory inserts for a typical probe result."""
+    probe = prepare_probe({'url': context.server_url, 'method': 'GET',
+                           'verify_ssl': context.verify_ssl})
+    result = execute_probe(probe)
+    api_request = context.api_requests[0]
+
+    def task(index):
+        record_history(api_request, probe, result, context.user)
+
+    (histogram, errors, first_error), wall, peak = _measure(
+        lambda: _run_concurrently(context.requests, 1, task),
+        context.trace_memory)
+    return _summarize(histogram, errors, wall, peak, context.requests, first_error)
+
+
+def bench_collection_run(context):
+    """Wall time of a collection run executing ``requests`` probes with history."""
+    iterations = max(1, context.requests // len(context.api_requests))
+    run = ProbeRun(context.collection, context.user,
+                   iterations=iterations, concurrency=context.concurrency)
+
+    _, wall, peak = _measure(run.execute, context.trace_memory)
+    summary = _summarize(run.histogram, run.failed, wall, peak, run.completed)
+    summary['upstream_latency_ms'] = summary.pop('latency_ms')
+    return summary
+
+
+def _best_of(rounds, function):
+    """Return the fastest of ``rounds`` calls to ``function``, in milliseconds."""
+    best = None
+    for _ in range(rounds):
+        # Like timeit: cyclic GC passes over large documents would dominate
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            function()
+            elapsed = (time.perf_counter() - start) * 1000
+        finally:
+            gc.enable()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_json_codec(context):
+    """
+    Decode and encode large and deeply nested bodies with the probe codec.
+
+    Each round decodes a response body, encodes a send_request payload around
+    it and encodes the same payload with the body passed through as raw JSON.
+    ``breakdown_ms`` compares the best times with the standard library.
+    """
+    histogram = LatencyHistogram()
+    breakdown = {}
+
+    def run():
+        for name, (size, depth) in JSON_CODEC_PAYLOADS.items():
+            content = build_payload(size, depth)
+            document = codec.loads(content)
+            payload = {'status_code': 200, 'headers': {}, 'body': document, 'time': 1.0}
+            raw_payload = dict(payload, body=codec.RawJSON(content))
+            for _ in range(JSON_CODEC_ROUNDS):
+                start = time.perf_counter()
+                codec.dumps(dict(payload, body=codec.loads(content)))
+                codec.dumps(raw_payload)
+                histogram.add((time.perf_counter() - start) * 1000)
+            breakdown[name] = {
+                'bytes': len(content),
+                'decode': _best_of(JSON_CODEC_ROUNDS, lambda: codec.loads(content)),
+                'encode': _best_of(JSON_CODEC_ROUNDS, lambda: codec.dumps(payload)),
+                'passthrough': _best_of(JSON_CODEC_ROUNDS, lambda: codec.dumps(raw_payload)),
+                'stdlib_decode': _best_of(JSON_CODEC_ROUNDS, lambda: json.loads(content)),
+                'stdlib_encode': _best_of(JSON_CODEC_ROUNDS, lambda: json.dumps(payload)),
+            }
+
+    _, wall, peak = _measure(run, context.trace_memory)
+    operations = len(JSON_CODEC_PAYLOADS) * JSON_CODEC_ROUNDS
+    summary = _summarize(histogram, 0, wall, peak, operations)
+    summary['codec'] = codec.CODEC_NAME
+    summary['breakdown_ms'] = breakdown
+    return summary
+
+
+# Benchmarks run by the probe_bench command, in order
+BENCHMARKS = {
+    'send_request': bench_send_request,
+    'history_write': bench_history_write,
+    'collection_run': bench_collection_run,
+    'json_codec': bench_json_codec,
+}
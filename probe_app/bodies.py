@@ -0,0 +1,398 @@
+"""
+Typed request bodies: form data, multipart uploads, raw text and files.
+
+A probe body is sent as JSON unless it is a typed body, a dictionary with a
+``$body`` kind:
+
+* ``{"$body": "raw", "text": "..."}`` sends the text as is (``text/plain``
+  unless a Content-Type header is set).
+* ``{"$body": "form", "fields": {...}}`` sends URL-encoded form fields.
+* ``{"$body": "multipart", "fields": {...}, "files": {"upload": {"file":
+  ref, "filename": "...", "content_type": "..."}}}`` sends
+  ``multipart/form-data`` with the referenced body files as file parts.
+* ``{"$body": "binary", "file": ref, "content_type": "..."}`` sends one body
+  file as the whole body.
+
+Body files are uploaded once (``POST /api/v1/body-files/``) into
+``PROBEFLEX_BODY_FILES_DIR`` and referenced by the opaque ``ref`` returned,
+so saved requests, collection runs and load tests never hold file contents in
+the database or the browser. Anyone who knows a reference can send the file;
+references are unguessable and only listed to their owner. Load test agents
+on other hosts need the same directory (a shared volume).
+
+Multipart and binary bodies are streamed from disk in
+``PROBEFLEX_UPLOAD_CHUNK_SIZE`` chunks with a Content-Length computed up
+front, or with chunked transfer encoding when ``"chunked": true`` or when
+they are compressed on the way (see ``probe_app.compression``), so a probe
+uses constant memory however large the upload. Every attempt (retry
+or hedge) reads the files again, and reports the bytes it sent and how long
+sending them took.
+"""
+import hashlib
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+from .compression import compressor
+
+
+# Directory holding uploaded body files
+BODY_FILES_DIR = Path(getattr(settings, 'PROBEFLEX_BODY_FILES_DIR',
+                              Path(tempfile.gettempdir()) / 'probeflex-bodyfiles'))
+
+# Largest body file accepted (bytes)
+BODY_FILE_MAX_SIZE = getattr(settings, 'PROBEFLEX_BODY_FILE_MAX_SIZE', 2 * 1024 ** 3)
+
+# Bytes read from disk at a time when storing or sending body files
+UPLOAD_CHUNK_SIZE = getattr(settings, 'PROBEFLEX_UPLOAD_CHUNK_SIZE', 64 * 1024)
+
+# Key marking a typed body, and the kinds of typed bodies
+BODY_KIND_KEY = '$body'
+BODY_KINDS = ('raw', 'form', 'multipart', 'binary')
+
+DEFAULT_FILE_CONTENT_TYPE = 'application/octet-stream'
+
+_REF_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+class BodyFileError(ValueError):
+    """Raised when a body file is missing, too large or a reference is invalid."""
+
+
+def _body_path(ref):
+    return BODY_FILES_DIR / f"{ref}.body"
+
+
+def _meta_path(ref):
+    return BODY_FILES_DIR / f"{ref}.meta"
+
+
+def store_body_file(chunks, name, content_type, owner_id):
+    """
+    Write an uploaded file to the body file directory, chunk by chunk.
+
+    Returns:
+        The file's metadata: ref, name, content_type, size, sha256, owner
+        and created_at
+
+    Raises:
+        BodyFileError: If the file exceeds ``BODY_FILE_MAX_SIZE``
+    """
+    BODY_FILES_DIR.mkdir(parents=True, exist_ok=True)
+    ref = secrets.token_urlsafe(24)
+    digest = hashlib.sha256()
+    size = 0
+    handle, temp_path = tempfile.mkstemp(dir=BODY_FILES_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as output:
+            for chunk in chunks:
+                size += len(chunk)
+                if size > BODY_FILE_MAX_SIZE:
+                    raise BodyFileError(f"Body files are limited to {BODY_FILE_MAX_SIZE} bytes")
+                digest.update(chunk)
+                output.write(chunk)
+        os.replace(temp_path, _body_path(ref))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    meta = {
+        'ref': ref,
+        'name': name,
+        'content_type': content_type or DEFAULT_FILE_CONTENT_TYPE,
+        'size': size,
+        'sha256': digest.hexdigest(),
+        'owner': owner_id,
+        'created_at': time.time(),
+    }
+    _meta_path(ref).write_text(json.dumps(meta), encoding='utf-8')
+    return meta
+
+
+def body_file_meta(ref):
+    """
+    The metadata of a body file.
+
+    Raises:
+        BodyFileError: If the reference is malformed or the file is gone
+    """
+    if not isinstance(ref, str) or not _REF_PATTERN.match(ref):
+        raise BodyFileError(f"Invalid body file reference: {ref!r}")
+    try:
+        meta = json.loads(_meta_path(ref).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        raise BodyFileError(f"Body file {ref} does not exist")
+    if not _body_path(ref).exists():
+        raise BodyFileError(f"Body file {ref} does not exist")
+    return meta
+
+
+def list_body_files(owner_id):
+    """Metadata of the body files uploaded by a user, newest first."""
+    files = []
+    if BODY_FILES_DIR.exists():
+        for path in BODY_FILES_DIR.glob('*.meta'):
+            try:
+                meta = json.loads(path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if meta.get('owner') == owner_id:
+                files.append(meta)
+    files.sort(key=lambda meta: meta['created_at'], reverse=True)
+    return files
+
+
+def delete_body_file(ref, owner_id):
+    """
+    Delete a body file uploaded by ``owner_id``.
+
+    Raises:
+        BodyFileError: If the file does not exist or belongs to someone else
+    """
+    meta = body_file_meta(ref)
+    if meta.get('owner') != owner_id:
+        raise BodyFileError(f"Body file {ref} does not exist")
+    _meta_path(ref).unlink(missing_ok=True)
+    _body_path(ref).unlink(missing_ok=True)
+
+
+def is_typed_body(body):
+    """Whether a probe body is a typed body rather than a JSON document."""
+    return isinstance(body, dict) and BODY_KIND_KEY in body
+
+
+class _FilePart:
+    """A body file sent as (part of) a streamed body."""
+
+    __slots__ = ('path', 'size')
+
+    def __init__(self, meta):
+        self.path = _body_path(meta['ref'])
+        self.size = meta['size']
+
+
+class StreamingBody:
+    """
+    A request body made of literal bytes and body files, read lazily.
+
+    Kept in a prepared probe's ``request_kwargs['data']``; the transports
+    ``open`` a new ``BodyReader`` for every attempt. A body with a
+    ``compression`` setting is compressed while it is sent, which needs
+    chunked transfer encoding since its length is not known up front.
+    """
+
+    def __init__(self, parts, chunked=False):
+        self.parts = parts
+        self.chunked = chunked
+        self.compression = ''
+        self.length = sum(len(part) if isinstance(part, bytes) else part.size for part in parts)
+
+    def compress(self, setting):
+        self.compression = setting
+        self.chunked = True
+
+    def open(self, deadline=None):
+        return BodyReader(self, deadline)
+
+    def __repr__(self):
+        return f"<StreamingBody {self.length} bytes{' chunked' if self.chunked else ''}>"
+
+
+class BodyReader:
+    """
+    One pass over a ``StreamingBody``: a file-like object for requests and
+    an iterator of chunks for httpx and chunked transfers.
+
+    Files are opened as they are reached and closed at their end; the total
+    deadline of the attempt is checked before every read.
+    """
+
+    def __init__(self, body, deadline=None):
+        self.chunked = body.chunked
+        self.compression = body.compression
+        self.wire_size = 0
+        self._length = body.length
+        self._parts = iter(body.parts)
+        self._deadline = deadline
+        self._current = None  # Open file or remaining bytes of the current part
+        self._remaining = 0
+        self.sent = 0
+        self.started = None
+        self.finished = None
+
+    def __len__(self):
+        return self._length
+
+    def _next_part(self):
+        part = next(self._parts, None)
+        if part is None:
+            return False
+        if isinstance(part, bytes):
+            self._current, self._remaining = part, len(part)
+        else:
+            self._current, self._remaining = open(part.path, 'rb'), part.size
+        return True
+
+    def read(self, size=-1):
+        if self._deadline is not None:
+            self._deadline.check()
+        if self.started is None:
+            self.started = time.perf_counter()
+        if size is None or size < 0:
+            size = UPLOAD_CHUNK_SIZE
+        while self._remaining == 0:
+            self._close_part()
+            if not self._next_part():
+                if self.finished is None:
+                    self.finished = time.perf_counter()
+                return b''
+        count = min(size, self._remaining)
+        if isinstance(self._current, bytes):
+            data = self._current[:count]
+            self._current = self._current[count:]
+        else:
+            data = self._current.read(count)
+            if len(data) < count:
+                raise OSError(f"{self._current.name} shrank while it was being sent")
+        self._remaining -= len(data)
+        self.sent += len(data)
+        return data
+
+    def __iter__(self):
+        if self.compression:
+            yield from self._compressed()
+            return
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            self.wire_size += len(chunk)
+            yield chunk
+
+    def _compressed(self):
+        _, stream = compressor(self.compression)
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            output = stream.compress(chunk) if chunk else stream.flush()
+            if output:
+                self.wire_size += len(output)
+                yield output
+            if not chunk:
+                return
+
+    def _close_part(self):
+        if self._current is not None and not isinstance(self._current, bytes):
+            self._current.close()
+        self._current = None
+
+    def close(self):
+        self._close_part()
+
+    def stats(self):
+        """
+        Bytes sent, the time sending them took (ms) and the throughput
+        (bytes/s), plus the encoding and size before compression of a
+        compressed body.
+        """
+        elapsed = (self.finished or time.perf_counter()) - self.started if self.started else 0.0
+        # requests reads the reader directly when it has a length
+        size = self.wire_size or self.sent
+        stats = {
+            'size': size,
+            'time': elapsed * 1000,
+            'throughput': size / elapsed if elapsed > 0 else None,
+        }
+        if self.compression:
+            stats.update(encoding=self.compression, uncompressed_size=self.sent)
+        return stats
+
+
+def _quote_parameter(value):
+    # The HTML form encoding of multipart names and filenames
+    return str(value).replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+def _multipart(body, boundary):
+    fields = body.get('fields') or {}
+    files = body.get('files') or {}
+    if not isinstance(fields, dict) or not isinstance(files, dict):
+        raise ValueError('Multipart "fields" and "files" must be objects')
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote_parameter(name)}"\r\n\r\n'
+            .encode('utf-8')
+            + (value if isinstance(value, str) else json.dumps(value)).encode('utf-8') + b'\r\n')
+    for name, spec in files.items():
+        if isinstance(spec, str):
+            spec = {'file': spec}
+        if not isinstance(spec, dict):
+            raise ValueError(f"Multipart file {name!r} must be a body file reference")
+        meta = body_file_meta(spec.get('file'))
+        filename = spec.get('filename') or meta['name'] or name
+        content_type = spec.get('content_type') or meta['content_type']
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote_parameter(name)}"; '
+            f'filename="{_quote_parameter(filename)}"\r\nContent-Type: {content_type}\r\n\r\n'
+            .encode('utf-8'))
+        parts.append(_FilePart(meta))
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('ascii'))
+    return parts
+
+
+def prepare_body(body, headers):
+    """
+    Turn a typed body into request keyword arguments.
+
+    Sets the Content-Type header unless the probe has one (multipart bodies
+    always set their own, since it carries the boundary).
+
+    Returns:
+        ``{'data': ...}`` with a string, a dictionary of form fields or a
+        ``StreamingBody``
+
+    Raises:
+        ValueError: If the body is malformed (BodyFileError if a referenced
+            file does not exist)
+    """
+    kind = body.get(BODY_KIND_KEY)
+    has_content_type = any(name.lower() == 'content-type' for name in headers)
+    chunked = bool(body.get('chunked'))
+
+    if kind == 'raw':
+        text = body.get('text', '')
+        if not isinstance(text, str):
+            raise ValueError('Raw bodies need a "text" string')
+        if not has_content_type:
+            headers['Content-Type'] = 'text/plain; charset=utf-8'
+        return {'data': text.encode('utf-8')}
+
+    if kind == 'form':
+        fields = body.get('fields') or {}
+        if not isinstance(fields, dict):
+            raise ValueError('Form "fields" must be an object')
+        if not has_content_type:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        return {'data': {str(name): value if isinstance(value, str) else json.dumps(value)
+                         for name, value in fields.items()}}
+
+    if kind == 'multipart':
+        boundary = f"probeflex-{secrets.token_hex(16)}"
+        for name in [name for name in headers if name.lower() == 'content-type']:
+            del headers[name]
+        headers['Content-Type'] = f"multipart/form-data; boundary={boundary}"
+        return {'data': StreamingBody(_multipart(body, boundary), chunked)}
+
+    if kind == 'binary':
+        meta = body_file_meta(body.get('file'))
+        if not has_content_type:
+            headers['Content-Type'] = body.get('content_type') or meta['content_type']
+        return {'data': StreamingBody([_FilePart(meta)], chunked)}
+
+    raise ValueError(f"Unknown body kind {kind!r} (expected one of {', '.join(BODY_KINDS)})")
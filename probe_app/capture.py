@@ -0,0 +1,513 @@
+"""
+Record-and-replay capture proxy: turns real traffic into saved requests.
+
+The proxy sits between an application under test and its upstreams, either
+as a forward HTTP proxy (``HTTP_PROXY=http://127.0.0.1:8082``) or, with an
+``upstream`` URL, as a reverse proxy the application calls instead of the
+upstream itself (the way to capture HTTPS APIs: a forward proxy only sees
+``CONNECT`` tunnels, which are passed through without being recorded).
+
+Every exchange is forwarded as it streams: request and response bodies are
+relayed chunk by chunk and only their first ``body_limit`` bytes are kept for
+the recording. Exchanges are handed to a ``CaptureRecorder`` thread, so the
+proxy itself never waits for the database. The recorder deduplicates
+requests by method and templated path (numeric, UUID and long hexadecimal
+segments become ``{id}``), creates one ``APIRequest`` per new route in the
+target collection and stores up to ``history_per_request`` executions of
+each as ``RequestHistory``, all with bulk inserts.
+
+Captured requests are saved with their templated path, so the mock server
+(``probe_app.mocks``) answers any id on the route, and with the query
+parameters, headers and JSON body of their first exchange; the history
+entries keep the URLs actually called. ``Authorization`` and ``Cookie``
+headers are dropped unless ``keep_credentials`` is set.
+"""
+import asyncio
+import queue
+import re
+import ssl
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlsplit
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .codec import db_json, decode_json
+from .diffing import response_fingerprint
+from .mocks import PARAMETER_SEGMENT, route_path
+from .models import APIRequest, RequestHistory
+from .search import SEARCH_INDEX, index_entries
+from .summaries import update_summaries
+
+
+# Path segments replaced by {id} in route templates
+ID_SEGMENT = re.compile(
+    r'^(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+    r'|[0-9a-fA-F]{16,})$')
+
+# Connection-level headers that are not part of a saved request
+HOP_BY_HOP = frozenset({
+    'connection', 'keep-alive', 'proxy-connection', 'proxy-authorization', 'proxy-authenticate',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'content-length', 'host',
+})
+
+# Headers holding credentials, dropped from recordings by default
+CREDENTIAL_HEADERS = frozenset({'authorization', 'cookie'})
+
+# Longest request or response head the proxy accepts
+MAX_HEAD_SIZE = 64 * 1024
+
+# Size of the chunks bodies are relayed in
+RELAY_CHUNK_SIZE = 64 * 1024
+
+# Exchanges waiting for the recorder; further ones are counted as dropped
+RECORDER_QUEUE_SIZE = 10000
+
+
+def template_path(path):
+    """The route template of a path: ``/users/42/orders`` -> ``/users/{id}/orders``."""
+    segments = [segment for segment in path.split('/') if segment]
+    return '/' + '/'.join('{id}' if ID_SEGMENT.match(segment) or PARAMETER_SEGMENT.match(segment)
+                          else segment for segment in segments)
+
+
+def _decode_body(content, headers):
+    """The recorded form of a captured body: parsed JSON, text, or None."""
+    encoding = headers.get('content-encoding', '').lower()
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            content = zlib.decompress(content)
+        elif encoding not in ('', 'identity'):
+            return None
+    except zlib.error:
+        return None
+    if 'json' in headers.get('content-type', '').lower():
+        try:
+            return decode_json(content)
+        except ValueError:
+            pass
+    return content.decode('utf-8', errors='replace')
+
+
+class CaptureRecorder:
+    """
+    Writes captured exchanges to a collection from a background thread.
+
+    ``record`` never blocks; exchanges arriving while the queue is full are
+    counted in ``dropped``. Call ``close`` to write what is pending.
+    """
+
+    def __init__(self, collection, user=None, history_per_request=10, keep_credentials=False,
+                 batch_size=500, flush_interval=0.5):
+        self.collection = collection
+        self.user = user
+        self.history_per_request = history_per_request
+        self.keep_credentials = keep_credentials
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.created = 0
+        self.recorded = 0
+        self.dropped = 0
+        self._queue = queue.Queue(RECORDER_QUEUE_SIZE)
+        self._routes = {}  # (method, template) -> [api_request, executions recorded]
+        for api_request in APIRequest.objects.filter(collection=collection).annotate(
+                history_count=Count('history')):
+            key = (api_request.method, template_path(route_path(api_request.url)))
+            self._routes.setdefault(key, [api_request, api_request.history_count])
+        self._thread = threading.Thread(target=self._run, name='probeflex-capture', daemon=True)
+        self._thread.start()
+
+    def record(self, exchange):
+        try:
+            self._queue.put_nowait(exchange)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    exchange = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    exchange = False
+                if exchange:
+                    batch.append(exchange)
+                if exchange is None or len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                    if batch:
+                        try:
+                            self._write(batch)
+                        except Exception as e:
+                            print(f"Error saving captured requests: {str(e)}")
+                        batch = []
+                    deadline = time.monotonic() + self.flush_interval
+                if exchange is None:
+                    return
+        finally:
+            close_old_connections()
+
+    def _request_headers(self, headers):
+        return {name: value for name, value in headers.items()
+                if name.lower() not in HOP_BY_HOP
+                and (self.keep_credentials or name.lower() not in CREDENTIAL_HEADERS)}
+
+    def _write(self, batch):
+        """
+        Create the new requests and the history entries of one batch.
+
+        Routes and counts are only updated once the batch is saved, so a batch
+        that fails leaves nothing behind for the next one to refer to.
+        """
+        new_routes = {}  # (method, template) -> [api_request, 0] of this batch
+        counts = {}  # (method, template) -> executions of this batch recorded
+        entries = []
+        for exchange in batch:
+            parts = urlsplit(exchange['url'])
+            template = template_path(parts.path)
+            key = (exchange['method'], template)
+            route = self._routes.get(key) or new_routes.get(key)
+            request_body = None
+            if exchange['body_complete'] and exchange['body']:
+                request_body = _decode_body(exchange['body'], exchange['lower_headers'])
+            if route is None:
+                api_request = APIRequest(
+                    collection=self.collection,
+                    name=f"{exchange['method']} {template}"[:100],
+                    url=parts._replace(path=template, query='', fragment='').geturl(),
+                    method=exchange['method'],
+                    headers=self._request_headers(exchange['headers']),
+                    params=dict(parse_qsl(parts.query, keep_blank_values=True)),
+                    body=request_body if isinstance(request_body, (dict, list)) else {},
+                    auth={},
+                )
+                route = new_routes[key] = [api_request, 0]
+            if route[1] + counts.get(key, 0) >= self.history_per_request:
+                continue
+            counts[key] = counts.get(key, 0) + 1
+            entries.append((route[0], exchange, request_body))
+
+        new_requests = [api_request for api_request, _ in new_routes.values()]
+        with transaction.atomic():
+            APIRequest.objects.bulk_create(new_requests, batch_size=self.batch_size)
+            histories = []
+            bodies = []
+            for api_request, exchange, request_body in entries:
+                response_body = None
+                if exchange['response_complete']:
+                    response_body = _decode_body(exchange['response_body'],
+                                                 exchange['lower_response_headers'])
+                parts = urlsplit(exchange['url'])
+                histories.append(RequestHistory(
+                    request=api_request,
+                    url=parts._replace(query='', fragment='').geturl(),
+                    method=exchange['method'],
+                    headers=self._request_headers(exchange['headers']),
+                    params=dict(parse_qsl(parts.query, keep_blank_values=True)),
+                    body=request_body,
+                    auth={},
+                    response_status=exchange['status'],
+                    response_headers=exchange['response_headers'],
+                    response_body=db_json(response_body),
+                    response_time=exchange['time'],
+                    http_version=exchange['http_version'],
+                    response_hash=(response_fingerprint(exchange['status'], response_body)
+                                   if response_body is not None else ''),
+                    executed_at=exchange['executed_at'],
+                    executed_by=self.user,
+                ))
+                bodies.append(response_body)
+            RequestHistory.objects.bulk_create(histories, batch_size=self.batch_size)
+            update_summaries(histories)
+        self._routes.update(new_routes)
+        for key, count in counts.items():
+            self._routes[key][1] += count
+        if SEARCH_INDEX:
+            index_entries((history.id, history.url, history.response_headers, body)
+                          for history, body in zip(histories, bodies))
+        self.created += len(new_requests)
+        self.recorded += len(histories)
+
+
+class _Head:
+    """A parsed request or response head."""
+
+    __slots__ = ('start_line', 'headers', 'lower')
+
+    def __init__(self, raw):
+        lines = raw.decode('latin-1').split('\r\n')
+        self.start_line = lines[0]
+        self.headers = []
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(':')
+                self.headers.append((name.strip(), value.strip()))
+        self.lower = {name.lower(): value for name, value in self.headers}
+
+    def encode(self, start_line, drop=(), extra=()):
+        lines = [start_line]
+        lines.extend(f"{name}: {value}" for name, value in self.headers if name.lower() not in drop)
+        lines.extend(f"{name}: {value}" for name, value in extra)
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    def keep_alive(self, version):
+        connection = self.lower.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+
+class _Capture:
+    """The first ``limit`` bytes of a relayed body."""
+
+    __slots__ = ('limit', 'chunks', 'size', 'complete')
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+        self.complete = True
+
+    def add(self, data):
+        if self.size < self.limit:
+            self.chunks.append(data[:self.limit - self.size])
+        elif data:
+            self.complete = False
+        self.size += len(data)
+        if self.size > self.limit:
+            self.complete = False
+
+    def content(self):
+        return b''.join(self.chunks)
+
+
+async def _read_head(reader):
+    try:
+        raw = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.LimitOverrunError:
+        raise ValueError('Head too large')
+    return _Head(raw[:-4])
+
+
+async def _relay_body(reader, writer, head, capture, until_eof=False):
+    """Copy one message body from ``reader`` to ``writer`` as it arrives."""
+    if 'chunked' in head.lower.get('transfer-encoding', '').lower():
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            writer.write(size_line)
+            size = int(size_line.split(b';', 1)[0].strip() or b'0', 16)
+            if size == 0:
+                # Trailers, up to the blank line
+                while True:
+                    line = await reader.readuntil(b'\r\n')
+                    writer.write(line)
+                    if line == b'\r\n':
+                        break
+                await writer.drain()
+                return
+            while size:
+                data = await reader.read(min(size, RELAY_CHUNK_SIZE))
+                if not data:
+                    raise ConnectionError('Connection closed mid-body')
+                size -= len(data)
+                capture.add(data)
+                writer.write(data)
+                await writer.drain()
+            writer.write(await reader.readexactly(2))
+    elif 'content-length' in head.lower:
+        remaining = int(head.lower['content-length'])
+        while remaining:
+            data = await reader.read(min(remaining, RELAY_CHUNK_SIZE))
+            if not data:
+                raise ConnectionError('Connection closed mid-body')
+            remaining -= len(data)
+            capture.add(data)
+            writer.write(data)
+            await writer.drain()
+    elif until_eof:
+        while True:
+            data = await reader.read(RELAY_CHUNK_SIZE)
+            if not data:
+                return
+            capture.add(data)
+            writer.write(data)
+            await writer.drain()
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(RELAY_CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+class CaptureProxy:
+    """The asyncio proxy server feeding a CaptureRecorder."""
+
+    def __init__(self, recorder, upstream=None, body_limit=64 * 1024, verify_ssl=True):
+        self.recorder = recorder
+        self.upstream = urlsplit(upstream) if upstream else None
+        self.body_limit = body_limit
+        self.ssl_context = ssl.create_default_context()
+        if not verify_ssl:
+            self.ssl_context.check_hostname = False
+            self.ssl_context.verify_mode = ssl.CERT_NONE
+
+    def _target(self, target):
+        """(scheme, host, port, origin-form target) of a request target."""
+        if '://' in target:
+            parts = urlsplit(target)
+        elif self.upstream is not None:
+            parts = self.upstream._replace(path=self.upstream.path.rstrip('/') + target)
+        else:
+            raise ValueError('Not a proxy request (set an upstream to capture origin-form requests)')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        return parts.scheme, parts.hostname, port, path
+
+    async def _open(self, scheme, host, port):
+        if scheme == 'https':
+            return await asyncio.open_connection(host, port, ssl=self.ssl_context,
+                                                 server_hostname=host, limit=MAX_HEAD_SIZE)
+        return await asyncio.open_connection(host, port, limit=MAX_HEAD_SIZE)
+
+    async def _tunnel(self, target, client_reader, client_writer):
+        host, _, port = target.rpartition(':')
+        upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port or 443))
+        client_writer.write(b'HTTP/1.1 200 Connection Established\r\n\r\n')
+        await client_writer.drain()
+        await asyncio.gather(_pipe(client_reader, upstream_writer),
+                             _pipe(upstream_reader, client_writer))
+
+    async def handle(self, client_reader, client_writer):
+        upstream = None  # (origin, reader, writer) kept alive between requests
+        try:
+            while True:
+                try:
+                    head = await _read_head(client_reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                method, target, version = head.start_line.split(' ', 2)
+                if method == 'CONNECT':
+                    await self._tunnel(target, client_reader, client_writer)
+                    return
+                try:
+                    scheme, host, port, path = self._target(target)
+                except ValueError as e:
+                    body = str(e).encode('utf-8')
+                    client_writer.write(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n'
+                                        b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+                    await client_writer.drain()
+                    return
+                origin = (scheme, host, port)
+                if upstream is None or upstream[0] != origin or upstream[2].is_closing():
+                    if upstream is not None:
+                        upstream[2].close()
+                    try:
+                        upstream = (origin, *await self._open(scheme, host, port))
+                    except OSError as e:
+                        body = f"Cannot reach {host}:{port}: {e}".encode('utf-8')
+                        client_writer.write(b'HTTP/1.1 502 Bad Gateway\r\nConnection: close\r\n'
+                                            b'Content-Length: %d\r\n\r\n%s' % (len(body), body))
+                        await client_writer.drain()
+                        return
+                _, upstream_reader, upstream_writer = upstream
+                keep_alive = await self._exchange(head, method, version, scheme, host, port, path,
+                                                  client_reader, client_writer,
+                                                  upstream_reader, upstream_writer)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, OSError, ValueError):
+            return
+        except asyncio.CancelledError:
+            return  # The proxy is shutting down
+        finally:
+            if upstream is not None:
+                upstream[2].close()
+            client_writer.close()
+
+    async def _exchange(self, head, method, version, scheme, host, port, path,
+                        client_reader, client_writer, upstream_reader, upstream_writer):
+        """Relay one request and its response; returns whether the client connection stays open."""
+        default_port = 443 if scheme == 'https' else 80
+        host_header = host if port == default_port else f"{host}:{port}"
+        start = time.perf_counter()
+        executed_at = timezone.now()
+        upstream_writer.write(head.encode(f"{method} {path} HTTP/1.1",
+                                          drop=('host', 'proxy-connection', 'proxy-authorization'),
+                                          extra=(('Host', host_header),)))
+        request_capture = _Capture(self.body_limit)
+        await _relay_body(client_reader, upstream_writer, head, request_capture)
+        await upstream_writer.drain()
+
+        while True:
+            response_head = await _read_head(upstream_reader)
+            response_version, status, _ = (response_head.start_line.split(' ', 2) + [''])[:3]
+            status = int(status)
+            if not 100 <= status < 200 or status == 101:
+                break
+            client_writer.write(response_head.encode(response_head.start_line))  # e.g. 100 Continue
+        client_writer.write(response_head.encode(response_head.start_line))
+        if status == 101:
+            # Upgraded (e.g. WebSocket): relay both ways, nothing to record
+            await client_writer.drain()
+            await asyncio.gather(_pipe(client_reader, upstream_writer),
+                                 _pipe(upstream_reader, client_writer))
+            return False
+
+        response_capture = _Capture(self.body_limit)
+        framed = ('content-length' in response_head.lower
+                  or 'chunked' in response_head.lower.get('transfer-encoding', '').lower())
+        if method != 'HEAD' and status not in (204, 304):
+            await _relay_body(upstream_reader, client_writer, response_head, response_capture,
+                              until_eof=not framed)
+        await client_writer.drain()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        url = f"{scheme}://{host_header}{path}"
+        self.recorder.record({
+            'method': method,
+            'url': url,
+            'headers': dict(head.headers),
+            'lower_headers': head.lower,
+            'body': request_capture.content(),
+            'body_complete': request_capture.complete,
+            'status': status,
+            'response_headers': dict(response_head.headers),
+            'lower_response_headers': response_head.lower,
+            'response_body': response_capture.content(),
+            'response_complete': response_capture.complete,
+            'time': elapsed,
+            'http_version': response_version,
+            'executed_at': executed_at,
+        })
+        if not framed and method != 'HEAD' and status not in (204, 304):
+            return False  # The body ended with the upstream connection
+        return head.keep_alive(version) and response_head.keep_alive(response_version)
+
+
+async def run_proxy(proxy, host='127.0.0.1', port=8082, on_ready=None):
+    """Serve ``proxy`` until cancelled."""
+    server = await asyncio.start_server(proxy.handle, host, port, limit=MAX_HEAD_SIZE)
+    if on_ready:
+        on_ready(server.sockets[0].getsockname())
+    async with server:
+        await server.serve_forever()
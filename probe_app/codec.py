@@ -0,0 +1,197 @@
+"""
+Pluggable JSON codec for the probe pipeline.
+
+Every probe response used to be decoded with ``json.loads``, re-encoded by
+``JsonResponse`` and encoded again for history rows and event streams. This
+module routes those hot paths through one codec: orjson when it is installed
+(``PROBEFLEX_JSON_CODEC = 'auto'``, the default), or the standard library.
+Set ``PROBEFLEX_JSON_CODEC`` to ``'orjson'`` to require it or ``'json'`` to
+disable it.
+
+Bodies that are already valid JSON bytes (``RawJSON``) are spliced
+into the encoded output as is, so they are never parsed into Python objects
+just to be serialized again.
+"""
+import hashlib
+import json
+import re
+import secrets
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import JSONField, Value
+from django.db.models.functions import Cast
+from django.http import HttpResponse
+from requests.utils import guess_json_utf
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON_CODEC = getattr(settings, 'PROBEFLEX_JSON_CODEC', 'auto')
+
+if JSON_CODEC not in ('auto', 'orjson', 'json'):
+    raise ImproperlyConfigured("PROBEFLEX_JSON_CODEC must be 'auto', 'orjson' or 'json'")
+if JSON_CODEC == 'orjson' and orjson is None:
+    raise ImproperlyConfigured("PROBEFLEX_JSON_CODEC is 'orjson' but orjson is not installed")
+
+# Name of the codec in use, reported by benchmarks
+CODEC_NAME = 'orjson' if orjson is not None and JSON_CODEC != 'json' else 'json'
+
+if CODEC_NAME == 'orjson':
+    # Datetimes go through DjangoJSONEncoder so output matches JsonResponse
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_django_encoder = DjangoJSONEncoder()
+
+
+class RawJSON:
+    """
+    A JSON response body kept as the raw bytes it arrived in.
+
+    ``record_history`` stores ``text`` as is; ``parse()`` is the fallback for
+    code that really needs the decoded document.
+    """
+
+    __slots__ = ('content', 'encoding', 'fingerprint')
+
+    def __init__(self, content, encoding='utf-8', fingerprint=None):
+        self.content = content
+        self.encoding = encoding
+        # Canonical hash of the document, when it was computed during validation
+        self.fingerprint = fingerprint
+
+    @property
+    def text(self):
+        return str(self.content, self.encoding, errors='replace')
+
+    def parse(self):
+        return decode_json(self.content, self.encoding)
+
+    def __len__(self):
+        return len(self.content)
+
+    def __repr__(self):
+        return f"<RawJSON {len(self.content)} bytes>"
+
+
+def loads(data):
+    """Decode JSON from ``str``, ``bytes`` or a buffer."""
+    if CODEC_NAME == 'orjson':
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # The standard library also accepts NaN, Infinity and lone surrogates
+            pass
+    if isinstance(data, (memoryview, bytearray)):
+        data = bytes(data)
+    return json.loads(data)
+
+
+def decode_json(content, encoding=None):
+    """
+    Decode a JSON response body the way ``requests.Response.json()`` would.
+
+    ``encoding`` is the charset declared by the response; without one the
+    UTF flavour is guessed from the first bytes.
+
+    Raises:
+        ValueError: If the body is not valid JSON
+    """
+    encoding = encoding or guess_json_utf(bytes(content[:4])) or 'utf-8'
+    if encoding.lower().replace('-', '') == 'utf8':
+        return loads(content)
+    try:
+        return loads(str(content, encoding))
+    except LookupError as e:
+        raise ValueError(str(e))
+
+
+def _encoded_fragment(raw):
+    if raw.encoding.lower().replace('-', '') == 'utf8':
+        return bytes(raw.content)
+    return raw.text.encode('utf-8')
+
+
+def dumps(value):
+    """
+    Encode ``value`` as compact UTF-8 JSON bytes.
+
+    Types the codec does not know (dates, decimals, lazy translations) are
+    handled by ``DjangoJSONEncoder``. ``RawJSON`` values anywhere in the
+    structure are inserted verbatim.
+    """
+    fragments = []
+    nonce = None
+
+    def default(obj):
+        nonlocal nonce
+        if isinstance(obj, RawJSON):
+            if nonce is None:
+                nonce = secrets.token_hex(8)
+            fragments.append(obj)
+            # NUL is always escaped and the nonce is random, so real data cannot spell the marker
+            return f"\x00{nonce}:{len(fragments) - 1}\x00"
+        return _django_encoder.default(obj)
+
+    encoded = None
+    if CODEC_NAME == 'orjson':
+        try:
+            encoded = orjson.dumps(value, default=default, option=_ORJSON_OPTIONS)
+        except TypeError:
+            # Integers beyond 64 bits and other values orjson rejects
+            fragments.clear()
+    if encoded is None:
+        encoded = json.dumps(value, default=default, separators=(',', ':'),
+                             ensure_ascii=False).encode('utf-8')
+
+    if fragments:
+        # One pass, so markers quoted inside a spliced body are left alone
+        marker = re.compile(rb'"\\u0000' + nonce.encode('ascii') + rb':(\d+)\\u0000"')
+        encoded = marker.sub(lambda match: _encoded_fragment(fragments[int(match[1])]), encoded)
+    return encoded
+
+
+def fingerprint_json(value):
+    """
+    Return a hash of a decoded JSON document in canonical form.
+
+    Keys are sorted and the encoding is compact, so documents that only
+    differ in key order or whitespace share a fingerprint.
+    """
+    if CODEC_NAME == 'orjson':
+        try:
+            canonical = orjson.dumps(value, default=_django_encoder.default,
+                                     option=_ORJSON_OPTIONS | orjson.OPT_SORT_KEYS)
+        except TypeError:
+            canonical = None
+    if CODEC_NAME != 'orjson' or canonical is None:
+        canonical = json.dumps(value, default=_django_encoder.default, sort_keys=True,
+                               separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(canonical, digest_size=16).hexdigest()
+
+
+def dumps_text(value):
+    """Encode ``value`` as a compact JSON ``str``."""
+    return dumps(value).decode('utf-8')
+
+
+def json_response(data, status=200):
+    """Drop-in replacement for ``JsonResponse`` on hot paths, encoded with the codec."""
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+def db_json(value):
+    """
+    Prepare a value for a ``JSONField`` column, pre-encoded with the codec.
+
+    Django would otherwise encode it again with ``json.dumps``; ``RawJSON``
+    bodies are stored without being parsed at all. None stays SQL NULL.
+    """
+    if value is None:
+        return None
+    text = value.text if isinstance(value, RawJSON) else dumps_text(value)
+    return Cast(Value(text), output_field=JSONField())
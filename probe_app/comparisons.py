@@ -0,0 +1,247 @@
+"""
+Side-by-side runs of a suite against several environments.
+
+Every request is executed ``iterations`` times against each environment on
+one shared worker pool (``headless.run_pool``), so a second environment adds
+parallel work rather than a second serial run. Tasks are ordered iteration,
+request, environment: the environments of a request are probed back to back,
+so they see the same moment of upstream load and the pairs stay comparable.
+
+Results are paired per request against the first (baseline) environment:
+
+* Latency: the difference of the mean response times with a 95% Welch
+  confidence interval (needs at least two iterations), relative to the
+  baseline mean. A difference is ``significant`` when its interval excludes
+  zero.
+* Status: the statuses (or errors) seen in each environment; a mismatch is
+  any status that one environment returned and the other never did.
+* Body: the first response of each environment is fingerprinted and, when
+  the fingerprints differ, diffed structurally (JSON) or line by line (text)
+  with ``probe_app.diffing``.
+
+History is not written by default: executions of one request against
+different environments would otherwise alternate in its history and flag
+every entry as a changed response.
+"""
+import math
+import statistics
+from collections import Counter
+
+from .codec import RawJSON
+from .diffing import diff_json, diff_text, response_fingerprint
+from .headless import DEFAULT_WORKERS, _execute, probe_passed, run_pool, summarize
+
+
+# Most changes reported per body diff
+COMPARISON_DIFF_LIMIT = 100
+
+# Two-sided 95% quantiles of Student's t by degrees of freedom; fractional
+# degrees of freedom use the next lower entry, which widens the interval
+_T_QUANTILES = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+    9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+    16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074,
+    23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045,
+    30: 2.042, 40: 2.021, 60: 2.000, 120: 1.980,
+}
+_Z_QUANTILE = 1.960
+
+
+def environment_labels(environments):
+    """Display names of environments, with the ID added to names used twice."""
+    counts = Counter(environment.name for environment in environments)
+    return [environment.name if counts[environment.name] == 1
+            else f"{environment.name} #{environment.id}"
+            for environment in environments]
+
+
+def t_quantile(degrees_of_freedom):
+    """The two-sided 95% quantile of Student's t (conservative for fractional df)."""
+    if degrees_of_freedom > max(_T_QUANTILES):
+        return _Z_QUANTILE
+    df = max(1, math.floor(degrees_of_freedom))
+    return _T_QUANTILES[max(key for key in _T_QUANTILES if key <= df)]
+
+
+def latency_delta(baseline, other):
+    """
+    Compare two samples of response times (ms).
+
+    Returns:
+        Dictionary with the difference of the means (``other`` minus
+        ``baseline``), its 95% Welch confidence interval (None with fewer
+        than two samples on either side), the difference relative to the
+        baseline mean, and whether the interval excludes zero; None when
+        either sample is empty
+    """
+    if not baseline or not other:
+        return None
+    baseline_mean = statistics.fmean(baseline)
+    other_mean = statistics.fmean(other)
+    delta = other_mean - baseline_mean
+    result = {
+        'mean': delta,
+        'ci_low': None,
+        'ci_high': None,
+        'relative': delta / baseline_mean if baseline_mean else None,
+        'significant': False,
+    }
+    if len(baseline) < 2 or len(other) < 2:
+        return result
+
+    baseline_error = statistics.variance(baseline) / len(baseline)
+    other_error = statistics.variance(other) / len(other)
+    standard_error = math.sqrt(baseline_error + other_error)
+    if standard_error == 0:
+        margin = 0.0
+    else:
+        # Welch-Satterthwaite degrees of freedom
+        df = (baseline_error + other_error) ** 2 / (
+            baseline_error ** 2 / (len(baseline) - 1) + other_error ** 2 / (len(other) - 1))
+        margin = t_quantile(df) * standard_error
+    result.update(ci_low=delta - margin, ci_high=delta + margin,
+                  significant=delta - margin > 0 or delta + margin < 0)
+    return result
+
+
+def _latency(times):
+    if not times:
+        return {'count': 0}
+    return {
+        'count': len(times),
+        'mean': statistics.fmean(times),
+        'median': statistics.median(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'min': min(times),
+        'max': max(times),
+    }
+
+
+def _outcome(entry):
+    return 'error' if entry['error'] is not None else str(entry['status_code'])
+
+
+def diff_bodies(old, new):
+    """Diff two decoded response bodies the way ``diff_history`` diffs stored ones."""
+    if isinstance(old, RawJSON):
+        old = old.parse()
+    if isinstance(new, RawJSON):
+        new = new.parse()
+    if isinstance(old, str) and isinstance(new, str):
+        lines, truncated = diff_text(old, new)
+        return {'kind': 'text', 'lines': lines, 'truncated': truncated}
+    changes, truncated = diff_json(old, new, limit=COMPARISON_DIFF_LIMIT)
+    if not changes:
+        changes, truncated = diff_json(old, new, limit=COMPARISON_DIFF_LIMIT, exact=True)
+    return {'kind': 'json', 'changes': changes, 'truncated': truncated}
+
+
+def _pair(baseline, other):
+    """Compare the results of one request in the baseline and another environment."""
+    statuses = set(baseline['statuses']) ^ set(other['statuses'])
+    comparison = {
+        'environment': other['environment'],
+        'latency_delta_ms': latency_delta(baseline['times'], other['times']),
+        'status_mismatch': bool(statuses),
+        'body': None,
+    }
+    if baseline['fingerprint'] and other['fingerprint']:
+        identical = baseline['fingerprint'] == other['fingerprint']
+        comparison['body'] = {'identical': identical}
+        if not identical:
+            comparison['body'].update(diff_bodies(baseline['body'], other['body']))
+    return comparison
+
+
+def compare_environments(api_requests, environments, variables=None, workers=DEFAULT_WORKERS,
+                         iterations=1, save_history=False, user=None, on_result=None,
+                         cancellation=None):
+    """
+    Execute every request against each environment and pair the results.
+
+    ``variables`` override those of every environment. ``on_result`` and
+    ``cancellation`` are those of ``run_pool``; result entries carry their
+    ``environment`` label.
+
+    Returns:
+        Dictionary with the environment labels (the first is the baseline),
+        one ``summarize`` summary per environment, one report per request
+        (latency per environment and a comparison with the baseline for each
+        other environment), the number of requests with status mismatches
+        and body differences, and the wall time
+    """
+    labels = environment_labels(environments)
+    environment_variables = [{**(environment.variables or {}), **(variables or {})}
+                             for environment in environments]
+    tasks = [(iteration, api_request, index)
+             for iteration in range(1, iterations + 1)
+             for api_request in api_requests
+             for index in range(len(environments))]
+    first_bodies = {}
+
+    def execute(session, task, cancellation):
+        iteration, api_request, index = task
+        entry = _execute(session, api_request, environment_variables[index], save_history, user,
+                         cancellation, keep_body=True)
+        body = entry.pop('body', None)
+        entry['iteration'] = iteration
+        entry['environment'] = labels[index]
+        entry['passed'] = probe_passed(entry)
+        if entry['error'] is None and body is not None:
+            # Only the first response per environment is kept for the body diff
+            first_bodies.setdefault((api_request.id, index), body)
+        return entry
+
+    results, wall_time = run_pool(tasks, execute, workers=workers, on_result=on_result,
+                                  cancellation=cancellation)
+
+    by_pair = {}
+    for entry in results:
+        by_pair.setdefault((entry['api_request_id'], entry['environment']), []).append(entry)
+
+    reports = []
+    status_mismatches = body_differences = 0
+    for api_request in api_requests:
+        sides = []
+        for index, label in enumerate(labels):
+            entries = by_pair.get((api_request.id, label), [])
+            body = first_bodies.get((api_request.id, index))
+            sides.append({
+                'environment': label,
+                'url': entries[0]['url'] if entries else None,
+                'statuses': dict(Counter(_outcome(entry) for entry in entries)),
+                'times': [entry['time'] for entry in entries if entry['time'] is not None],
+                'body': body,
+                # Statuses are compared on their own, so the body is fingerprinted without one
+                'fingerprint': response_fingerprint(None, body) if body is not None else None,
+            })
+        comparisons = [_pair(sides[0], side) for side in sides[1:]]
+        status_mismatches += any(comparison['status_mismatch'] for comparison in comparisons)
+        body_differences += any(comparison['body'] and not comparison['body']['identical']
+                                for comparison in comparisons)
+        reports.append({
+            'api_request_id': api_request.id,
+            'name': api_request.name,
+            'method': api_request.method,
+            'collection': api_request.collection.name,
+            'environments': [{
+                'environment': side['environment'],
+                'url': side['url'],
+                'statuses': side['statuses'],
+                'latency_ms': _latency(side['times']),
+            } for side in sides],
+            'comparisons': comparisons,
+        })
+
+    return {
+        'environments': labels,
+        'baseline': labels[0],
+        'iterations': iterations,
+        'wall_time': wall_time,
+        'summaries': {label: summarize([entry for entry in results if entry['environment'] == label],
+                                       wall_time)
+                      for label in labels},
+        'requests': reports,
+        'status_mismatches': status_mismatches,
+        'body_differences': body_differences,
+    }
@@ -0,0 +1,332 @@
+"""
+Content encodings of probe bodies: streaming decompression of responses and
+optional compression of request bodies.
+
+Responses are read from the transports as they came over the wire (content
+decoding is switched off in requests and httpx) and decoded here chunk by
+chunk, so every probe records its wire size, its decoded size and the time
+spent decompressing. Both sizes are bounded by
+``PROBEFLEX_MAX_RESPONSE_SIZE``: decoders yield their output in bounded
+pieces and the read stops with ``ResponseTooLarge`` as soon as either size
+passes the cap, so a small compressed body cannot expand without limit.
+
+gzip and deflate use zlib; ``br`` needs the optional ``brotli`` (or
+``brotlicffi``) package and ``zstd`` the optional ``zstandard`` package. Only
+encodings that can be decoded are offered in the default Accept-Encoding
+header; a response in any other encoding is kept as received.
+
+Request bodies are compressed when a probe sets ``request_compression``
+(``gzip``, ``deflate``, ``br`` or ``zstd``, optionally with a level such as
+``gzip:9``). JSON, form and raw bodies are compressed once when the probe is
+prepared; streamed file bodies are compressed on the fly and sent with
+chunked transfer encoding.
+"""
+import re
+import time
+import zlib
+
+import requests
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Whether br and zstd bodies can be decoded and encoded
+BROTLI_AVAILABLE = brotli is not None
+ZSTD_AVAILABLE = zstandard is not None
+
+# Largest response body read, both as received and decoded (bytes)
+MAX_RESPONSE_SIZE = getattr(settings, 'PROBEFLEX_MAX_RESPONSE_SIZE', 512 * 1024 ** 2)
+
+# Size of the pieces decoders produce, and of the raw reads feeding them
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# zstd frames can expand enormously, so their input is fed in small slices
+_ZSTD_INPUT_SLICE = 4 * 1024
+
+# Encodings that can be decoded, in the order they are offered
+SUPPORTED_ENCODINGS = tuple(['gzip', 'deflate'] + (['br'] if BROTLI_AVAILABLE else [])
+                            + (['zstd'] if ZSTD_AVAILABLE else []))
+
+# Default Accept-Encoding header of probes
+ACCEPT_ENCODING = ', '.join(SUPPORTED_ENCODINGS)
+
+# Request compression: encoding and optional level
+_COMPRESSION_PATTERN = re.compile(r'^(gzip|deflate|br|zstd)(?::(\d{1,2}))?$')
+
+# Errors raised by the decompressors on corrupt input
+_DECODE_ERRORS = tuple({zlib.error, ValueError, getattr(brotli, 'error', ValueError),
+                        getattr(zstandard, 'ZstdError', ValueError)})
+
+
+class ResponseTooLarge(requests.RequestException):
+    """Raised when a response body exceeds ``MAX_RESPONSE_SIZE``."""
+
+
+class _ZlibDecoder:
+    """gzip (possibly several members) or deflate (zlib-wrapped or raw)."""
+
+    def __init__(self, encoding):
+        self.gzip = encoding in ('gzip', 'x-gzip')
+        self._new(16 + zlib.MAX_WBITS if self.gzip else zlib.MAX_WBITS)
+        self._started = False
+
+    def _new(self, wbits):
+        self._wbits = wbits
+        self._decompressor = zlib.decompressobj(wbits)
+
+    def decode(self, data):
+        if not self._started and not self.gzip and data:
+            # Some servers send raw deflate without the zlib wrapper
+            self._started = True
+            try:
+                zlib.decompressobj().decompress(data[:2])
+            except zlib.error:
+                self._new(-zlib.MAX_WBITS)
+        while data:
+            output = self._decompressor.decompress(data, DECODE_CHUNK_SIZE)
+            data = self._decompressor.unconsumed_tail
+            if self._decompressor.eof and self._decompressor.unused_data:
+                # The next gzip member
+                data = self._decompressor.unused_data
+                self._new(self._wbits)
+            if output:
+                yield output
+
+    def flush(self):
+        output = self._decompressor.flush()
+        if output:
+            yield output
+
+
+class _BrotliDecoder:
+    def __init__(self, encoding):
+        self._decompressor = brotli.Decompressor()
+        # brotli >= 1.2 can bound its output; brotlicffi and older versions cannot
+        self._bounded = hasattr(self._decompressor, 'is_finished')
+
+    def decode(self, data):
+        if not self._bounded:
+            output = (self._decompressor.process(data) if hasattr(self._decompressor, 'process')
+                      else self._decompressor.decompress(data))
+            if output:
+                yield output
+            return
+        output = self._decompressor.process(data, output_buffer_limit=DECODE_CHUNK_SIZE)
+        if output:
+            yield output
+        # Output that reached the limit may have more pending behind it
+        while len(output) >= DECODE_CHUNK_SIZE and not self._decompressor.is_finished():
+            output = self._decompressor.process(b'', output_buffer_limit=DECODE_CHUNK_SIZE)
+            if output:
+                yield output
+
+    def flush(self):
+        return iter(())
+
+
+class _ZstdDecoder:
+    def __init__(self, encoding):
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj(read_across_frames=True)
+
+    def decode(self, data):
+        for start in range(0, len(data), _ZSTD_INPUT_SLICE):
+            output = self._decompressor.decompress(data[start:start + _ZSTD_INPUT_SLICE])
+            if output:
+                yield output
+
+    def flush(self):
+        return iter(())
+
+
+def _decoder(encoding):
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return _ZlibDecoder(encoding)
+    if encoding == 'br' and BROTLI_AVAILABLE:
+        return _BrotliDecoder(encoding)
+    if encoding == 'zstd' and ZSTD_AVAILABLE:
+        return _ZstdDecoder(encoding)
+    return None
+
+
+class ContentDecoder:
+    """
+    Decode one response body from its wire chunks.
+
+    ``feed`` the chunks as they arrive and ``finish`` to get the decoded
+    body. Encodings listed in Content-Encoding are undone in reverse order;
+    when one of them cannot be decoded the body is kept as received.
+
+    Raises:
+        ResponseTooLarge: From ``feed`` or ``finish`` once the wire or the
+            decoded size exceeds ``limit``
+        requests.exceptions.ContentDecodingError: If the body is corrupt
+    """
+
+    def __init__(self, content_encoding, limit=MAX_RESPONSE_SIZE):
+        self.encoding = ', '.join(
+            coding for coding in (part.strip().lower() for part in (content_encoding or '').split(','))
+            if coding and coding != 'identity')
+        self.limit = limit
+        stages = [_decoder(coding) for coding in reversed(self.encoding.split(', '))] if self.encoding else []
+        self.decoded = None not in stages
+        self._stages = stages if self.decoded else []
+        self.wire_size = 0
+        self.size = 0
+        self.decode_time = 0.0  # seconds
+        self._chunks = []
+
+    def _keep(self, output):
+        self.size += len(output)
+        if self.size > self.limit:
+            raise ResponseTooLarge(f"Response body exceeds {self.limit} bytes when decoded")
+        self._chunks.append(output)
+
+    def _run(self, data, final=False):
+        pieces = [data]
+        for stage in self._stages:
+            pieces = self._through(stage, pieces, final)
+        for output in pieces:
+            self._keep(output)
+
+    @staticmethod
+    def _through(stage, pieces, final):
+        for piece in pieces:
+            yield from stage.decode(piece)
+        if final:
+            yield from stage.flush()
+
+    def feed(self, chunk):
+        self.wire_size += len(chunk)
+        if self.wire_size > self.limit:
+            raise ResponseTooLarge(f"Response body exceeds {self.limit} bytes")
+        if not self._stages:
+            self._keep(chunk)
+            return
+        self._decode(chunk)
+
+    def _decode(self, data, final=False):
+        start = time.perf_counter()
+        try:
+            self._run(data, final)
+        except _DECODE_ERRORS as e:
+            raise requests.exceptions.ContentDecodingError(
+                f"Cannot decode {self.encoding} response body: {e}") from e
+        finally:
+            self.decode_time += time.perf_counter() - start
+
+    def finish(self):
+        """The decoded body."""
+        if self._stages:
+            self._decode(b'', final=True)
+        content = b''.join(self._chunks)
+        self._chunks = [content]
+        return content
+
+    def stats(self):
+        """Content encoding, wire and decoded sizes, and decompression time (ms)."""
+        return {
+            'encoding': self.encoding,
+            'decoded': self.decoded,
+            'wire_size': self.wire_size,
+            'size': self.size,
+            'decode_time': self.decode_time * 1000,
+        }
+
+
+def validate_compression(value):
+    """
+    Normalize a request compression setting ('' for none).
+
+    Raises:
+        ValueError: If the encoding is unknown, its package is missing or the
+            level is out of range
+    """
+    value = (value or '').strip().lower()
+    if not value:
+        return ''
+    match = _COMPRESSION_PATTERN.match(value)
+    if not match:
+        raise ValueError('Request compression must be gzip, deflate, br or zstd, '
+                         'optionally with a level (e.g. gzip:9)')
+    encoding, level = match.group(1), match.group(2)
+    if encoding == 'br' and not BROTLI_AVAILABLE:
+        raise ValueError('br compression requires the brotli package (pip install brotli)')
+    if encoding == 'zstd' and not ZSTD_AVAILABLE:
+        raise ValueError('zstd compression requires the zstandard package (pip install zstandard)')
+    if level is not None:
+        maximum = {'gzip': 9, 'deflate': 9, 'br': 11, 'zstd': 22}[encoding]
+        if not 0 <= int(level) <= maximum:
+            raise ValueError(f"{encoding} levels range from 0 to {maximum}")
+    return value
+
+
+def compressor(setting):
+    """
+    A new streaming compressor for a validated compression setting.
+
+    Returns:
+        (content_encoding, object with compress(data) and flush())
+    """
+    encoding, _, level = setting.partition(':')
+    level = int(level) if level else None
+    if encoding in ('gzip', 'deflate'):
+        wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+        return encoding, zlib.compressobj(6 if level is None else level, zlib.DEFLATED, wbits)
+    if encoding == 'br':
+        return encoding, _BrotliCompressor(level)
+    return encoding, _ZstdCompressor(level)
+
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=5 if level is None else level)
+        # brotli calls it process, brotlicffi compress
+        self._process = getattr(self._compressor, 'process', None) or self._compressor.compress
+
+    def compress(self, data):
+        return self._process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def compress_bytes(data, setting):
+    """
+    Compress a whole request body.
+
+    Returns:
+        (content_encoding, compressed bytes, statistics with the original
+        and compressed sizes and the compression time in ms)
+    """
+    start = time.perf_counter()
+    encoding, stream = compressor(setting)
+    compressed = stream.compress(data) + stream.flush()
+    return encoding, compressed, {
+        'encoding': setting,
+        'size': len(data),
+        'wire_size': len(compressed),
+        'time': (time.perf_counter() - start) * 1000,
+    }
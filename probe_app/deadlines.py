@@ -0,0 +1,286 @@
+"""
+Timeout budgets, total deadlines and cancellation for probes.
+
+A probe's ``timeout`` (milliseconds, ``APIRequest.timeout``) is its total
+deadline: the longest one attempt may take from sending the request to
+having read the whole response. It is split into the budgets ``requests``
+understands, a connect timeout (at most ``PROBEFLEX_CONNECT_TIMEOUT``) and a
+per-read timeout (at most ``PROBEFLEX_READ_TIMEOUT``), plus the total
+deadline itself.
+
+The per-read timeout alone does not bound a server that trickles a byte
+every few seconds, so the attempt runs while a ``Deadline`` is armed: a
+single watchdog thread shuts down the socket of any attempt still waiting
+for its response headers or reading its body when its deadline passes,
+which makes the blocked read fail at once. The transports attach the
+connection to the deadline before the request is sent, then the response.
+The same mechanism cancels probes: a ``Cancellation`` aborts every probe it
+tracks, e.g. when a collection run is cancelled or a hedged duplicate loses.
+"""
+import heapq
+import itertools
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+
+# Total deadline used when a probe does not set a timeout (milliseconds)
+DEFAULT_TIMEOUT = 30000
+
+# Upper bound for the connect budget of any probe (milliseconds)
+CONNECT_TIMEOUT = getattr(settings, 'PROBEFLEX_CONNECT_TIMEOUT', 10000)
+
+# Upper bound for the per-read budget of any probe (milliseconds)
+READ_TIMEOUT = getattr(settings, 'PROBEFLEX_READ_TIMEOUT', 30000)
+
+# Longest total deadline a probe may ask for (milliseconds)
+MAX_TIMEOUT = getattr(settings, 'PROBEFLEX_MAX_TIMEOUT', 300000)
+
+
+class ProbeDeadlineExceeded(requests.Timeout):
+    """Raised when a probe did not complete within its total deadline."""
+
+
+class ProbeCancelled(requests.RequestException):
+    """Raised when a probe is cancelled while in flight."""
+
+
+def timeout_budgets(timeout_ms=None):
+    """
+    Split a probe timeout into its budgets.
+
+    Returns:
+        (connect, read, total) in seconds; ``total`` is clamped to
+        [1 ms, MAX_TIMEOUT] and the other two never exceed it
+    """
+    try:
+        total = float(timeout_ms) if timeout_ms else DEFAULT_TIMEOUT
+    except (TypeError, ValueError):
+        total = DEFAULT_TIMEOUT
+    total = min(max(total, 1), MAX_TIMEOUT) / 1000
+    return min(CONNECT_TIMEOUT / 1000, total), min(READ_TIMEOUT / 1000, total), total
+
+
+def _socket(target):
+    """
+    The socket an attempt reads from, if it can be found: ``target`` is the
+    urllib3 connection a request is sent on or a streamed requests or httpx
+    response.
+    """
+    sock = getattr(target, 'sock', None)  # A connection (None until it connects)
+    if sock is None:
+        raw = getattr(target, 'raw', None)  # Only requests responses have one
+        sock = getattr(getattr(raw, 'connection', None), 'sock', None)
+        if sock is None:
+            # http.client detaches the socket from connections that close after the
+            # response, but the body is still read from it through the response file
+            fp = getattr(getattr(raw, '_fp', None), 'fp', None)
+            sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    if sock is None:
+        stream = getattr(target, 'extensions', {}).get('network_stream')  # httpx
+        sock = stream.get_extra_info('socket') if stream is not None else None
+    return sock
+
+
+def _shutdown(target):
+    """Shut down the socket an attempt reads from, unblocking its reader."""
+    sock = _socket(target)
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # Already closed
+
+
+class Deadline:
+    """
+    The total deadline of one probe attempt.
+
+    ``reason`` is None while the attempt may continue, then 'deadline' or
+    'cancelled'. A connection or response attached while the deadline is
+    armed is shut down when the deadline passes or ``abort`` is called.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+        self.reason = None
+        self._target = None
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def abort(self, reason='cancelled'):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            target = self._target
+        if target is not None:
+            _shutdown(target)
+
+    def attach(self, target):
+        """Shut ``target`` (a connection or response) down if the attempt is aborted."""
+        with self._lock:
+            self._target = target
+            aborted = self.reason is not None
+        if aborted:
+            _shutdown(target)
+
+    def detach(self):
+        with self._lock:
+            self._target = None
+
+    def error(self):
+        """The exception describing why the attempt stopped."""
+        if self.reason == 'cancelled':
+            return ProbeCancelled('The probe was cancelled')
+        return ProbeDeadlineExceeded(
+            f"The probe did not complete within its {self.seconds * 1000:.0f} ms deadline")
+
+    def check(self):
+        if self.reason is not None:
+            raise self.error()
+
+
+class _Watchdog:
+    """One daemon thread aborting armed deadlines as they expire."""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def arm(self, deadline):
+        with self._condition:
+            heapq.heappush(self._heap, (deadline.expires, next(self._counter), deadline))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='probeflex-deadlines',
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                expires, _, deadline = self._heap[0]
+                delay = expires - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            # Finished attempts are detached, so aborting them only sets the reason
+            deadline.abort('deadline')
+
+
+_watchdog = _Watchdog()
+
+
+@contextmanager
+def armed(deadline, response=None):
+    """
+    Send a request, or read ``response``, under ``deadline``.
+
+    Without a response the transport attaches the connection itself once it
+    has one. Errors raised after the deadline passed or the probe was
+    cancelled are replaced with ProbeDeadlineExceeded or ProbeCancelled.
+    """
+    if response is not None:
+        deadline.attach(response)
+    try:
+        deadline.check()
+        yield
+    except Exception as e:
+        if deadline.reason is None:
+            if deadline.remaining() > 0:
+                raise
+            # A read timeout as long as the deadline can beat the watchdog to it
+            deadline.abort('deadline')
+        if response is not None:
+            response.close()
+        raise deadline.error() from e
+    finally:
+        deadline.detach()
+    deadline.check()
+
+
+def start_deadline(seconds, cancellations=()):
+    """Create and arm the deadline of one attempt, tracked by each of ``cancellations``."""
+    deadline = Deadline(seconds)
+    _watchdog.arm(deadline)
+    for cancellation in cancellations:
+        cancellation.track(deadline)
+    return deadline
+
+
+class Cancellation:
+    """
+    Cancels every in-flight probe attempt it tracks, and wakes probes paused
+    between attempts or queued for their host (see ``pause``).
+
+    Attempts started after ``cancel`` fail immediately with ProbeCancelled.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self._deadlines = set()
+        self._lock = threading.Lock()
+
+    def track(self, deadline):
+        with self._lock:
+            self._deadlines.add(deadline)
+            cancelled = self.cancelled
+        if cancelled:
+            deadline.abort('cancelled')
+
+    def release(self, deadline):
+        with self._lock:
+            self._deadlines.discard(deadline)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            deadlines = list(self._deadlines)
+        for deadline in deadlines:
+            deadline.abort('cancelled')
+
+
+class _Sleeper:
+    """Tracked by a Cancellation like a deadline, so cancelling it wakes a paused probe."""
+
+    def __init__(self):
+        self.woken = threading.Event()
+
+    def abort(self, reason='cancelled'):
+        self.woken.set()
+
+
+def pause(seconds, cancellations=()):
+    """
+    Sleep for ``seconds``, waking up as soon as one of ``cancellations`` is cancelled.
+
+    Raises:
+        ProbeCancelled: If the probe is cancelled before or during the pause
+    """
+    cancellations = [scope for scope in cancellations if scope is not None]
+    if not cancellations:
+        time.sleep(seconds)
+        return
+    sleeper = _Sleeper()
+    for cancellation in cancellations:
+        cancellation.track(sleeper)
+    try:
+        if sleeper.woken.wait(seconds):
+            raise ProbeCancelled('The probe was cancelled')
+    finally:
+        for cancellation in cancellations:
+            cancellation.release(sleeper)
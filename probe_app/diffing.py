@@ -0,0 +1,483 @@
+"""
+Structural diffs between RequestHistory responses.
+
+JSON bodies are compared as trees and the result is a list of changes
+addressed by RFC 6901 JSON pointers (``add``, ``remove``, ``replace``); text
+bodies get a unified line diff.
+
+Two things keep diffs of large, nearly identical documents cheap:
+
+* Every history row stores a fingerprint of its response (a hash of the
+  status and the canonical body, see ``response_fingerprint``), so identical
+  responses are recognised without loading the bodies at all.
+* Inside a document, subtrees are compared with C-level equality and only
+  differing subtrees are descended into; long arrays are bisected. When all
+  but one child of a differing container are known to be equal, the remaining
+  child is known to differ and is not compared at all, so following a change
+  down a deep document costs roughly one pass over it instead of one pass per
+  level. If that fast pass finds nothing although the fingerprints differ
+  (say ``1`` became ``true``), an exact pass comparing encodings follows.
+  Arrays of different lengths first skip their equal leading and trailing
+  runs (found by halving), so only the changed region is aligned.
+
+Stored bodies of at least ``PROBEFLEX_OFFLOAD_THRESHOLD`` bytes are decoded
+and diffed in the offload process pool (``probe_app.offload``), so a diff of
+large documents does not hold the GIL of the request thread.
+"""
+import difflib
+import gc
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.db.models import TextField
+from django.db.models.functions import Cast, Substr
+
+from .codec import RawJSON, dumps, fingerprint_json, loads
+from .offload import run_offloaded
+
+
+# Maximum number of changes reported by one diff
+MAX_DIFF_CHANGES = 500
+
+# Containers whose encoding is larger than this are summarized in changes
+MAX_CHANGE_VALUE_SIZE = 2000
+
+# Strings longer than this are truncated in changes
+MAX_CHANGE_STRING = 1000
+
+# Maximum number of lines in a text diff
+MAX_TEXT_DIFF_LINES = 2000
+
+# Stored response bodies kept in memory per process, keyed by history ID
+BODY_CACHE_SIZE = 4
+
+
+def response_fingerprint(status_code, body):
+    """
+    Return a short hash identifying a response by status and body.
+
+    JSON bodies are hashed in canonical form (sorted keys, compact), so
+    documents that differ only in key order or whitespace get the same
+    fingerprint. ``RawJSON`` bodies reuse the fingerprint computed while they
+    were validated.
+    """
+    if isinstance(body, RawJSON):
+        digest = body.fingerprint or fingerprint_json(body.parse())
+    elif isinstance(body, str):
+        digest = hashlib.blake2b(body.encode('utf-8'), digest_size=16).hexdigest()
+    else:
+        digest = fingerprint_json(body)
+    return hashlib.blake2b(f"{status_code}:{digest}".encode('ascii'), digest_size=16).hexdigest()
+
+
+def _escape_token(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _kind(value):
+    if isinstance(value, dict):
+        return 'object'
+    if isinstance(value, list):
+        return 'array'
+    if isinstance(value, str):
+        return 'string'
+    if isinstance(value, bool):
+        return 'boolean'
+    if value is None:
+        return 'null'
+    return 'number'
+
+
+def _preview(value):
+    """Represent a changed value compactly enough to send to the browser."""
+    if isinstance(value, str) and len(value) > MAX_CHANGE_STRING:
+        return {'type': 'string', 'length': len(value), 'preview': value[:MAX_CHANGE_STRING]}
+    if isinstance(value, (dict, list)):
+        encoded = dumps(value)
+        if len(encoded) > MAX_CHANGE_VALUE_SIZE:
+            return {'type': _kind(value), 'length': len(value), 'size': len(encoded)}
+    return value
+
+
+class _StructuralDiff:
+    """
+    Walks two documents and collects changes, up to ``limit``.
+
+    In the default fast mode subtrees are skipped when Python considers them
+    equal, which is a C-level comparison but treats ``1``, ``1.0`` and ``true``
+    alike inside containers. In ``exact`` mode subtrees are compared by their
+    encoded bytes instead.
+    """
+
+    def __init__(self, limit, exact=False):
+        self.limit = limit
+        self.exact = exact
+        self.changes = []
+        self.truncated = False
+        # Pending (old, new, path, known_different) comparisons; an explicit
+        # stack keeps documents nested deeper than the recursion limit working
+        self.pending = []
+
+    def same(self, old, new):
+        if _kind(old) != _kind(new):
+            return False
+        if self.exact and isinstance(old, (dict, list)):
+            return dumps(old) == dumps(new)
+        return old == new
+
+    def add(self, op, path, old=None, new=None):
+        if len(self.changes) >= self.limit:
+            self.truncated = True
+            return
+        change = {'op': op, 'path': path}
+        if op != 'add':
+            change['old'] = _preview(old)
+        if op != 'remove':
+            change['new'] = _preview(new)
+        self.changes.append(change)
+
+    @property
+    def full(self):
+        return len(self.changes) >= self.limit
+
+    def run(self, old, new):
+        self.pending.append((old, new, '', False))
+        while self.pending:
+            self.compare(*self.pending.pop())
+
+    def schedule(self, tasks):
+        """Queue child comparisons so they are processed in document order."""
+        self.pending.extend(reversed(tasks))
+
+    def compare(self, old, new, path, known_different=False):
+        """
+        Record the differences between ``old`` and ``new`` located at ``path``.
+
+        ``known_different`` says the caller already established that the two
+        differ, which lets containers skip comparing their last candidate
+        child. Scalars are always compared, so a wrong inference (e.g. objects
+        that only differ in key order) never reports a change.
+        """
+        if self.full:
+            self.truncated = self.truncated or known_different or not self.same(old, new)
+            return
+        if _kind(old) != _kind(new):
+            self.add('replace', path, old, new)
+        elif isinstance(old, dict):
+            self._compare_objects(old, new, path, known_different)
+        elif isinstance(old, list):
+            self._compare_arrays(old, new, path, known_different)
+        elif old != new:
+            self.add('replace', path, old, new)
+
+    def _compare_objects(self, old, new, path, known_different):
+        found = False
+        unresolved = []
+        for key, value in old.items():
+            if key not in new:
+                self.add('remove', f"{path}/{_escape_token(key)}", old=value)
+                found = True
+            elif isinstance(value, (dict, list)) and isinstance(new[key], (dict, list)):
+                unresolved.append(key)
+            elif not self.same(value, new[key]):
+                self.add('replace', f"{path}/{_escape_token(key)}", value, new[key])
+                found = True
+        for key, value in new.items():
+            if key not in old:
+                self.add('add', f"{path}/{_escape_token(key)}", new=value)
+                found = True
+
+        # Compare nested containers smallest first; the largest one is skipped
+        # when it is the only place left where the known difference can be
+        unresolved.sort(key=lambda key: len(old[key]))
+        tasks = []
+        for index, key in enumerate(unresolved):
+            child = f"{path}/{_escape_token(key)}"
+            if known_different and not found and index == len(unresolved) - 1:
+                tasks.append((old[key], new[key], child, True))
+            elif not self.same(old[key], new[key]):
+                tasks.append((old[key], new[key], child, True))
+                found = True
+        self.schedule(tasks)
+
+    def _range_same(self, old, new, start, end):
+        return self.same(old[start:end], new[start:end])
+
+    def _first_difference(self, old, new, start, end):
+        """Index of the first differing element in a range known to differ (by halving)."""
+        while end - start > 1:
+            middle = (start + end) // 2
+            if self._range_same(old, new, start, middle):
+                start = middle
+            else:
+                end = middle
+        return start
+
+    def _last_difference(self, old, new, start, end):
+        """Index of the last differing element in a range known to differ (by halving)."""
+        while end - start > 1:
+            middle = (start + end) // 2
+            if self._range_same(old, new, middle, end):
+                end = middle
+            else:
+                start = middle
+        return start
+
+    def _differences(self, old, new, start, end, known_different, found, cap):
+        """Collect up to ``cap`` differing positions of equal-length arrays into ``found``."""
+        if len(found) >= cap:
+            return
+        if not known_different and self._range_same(old, new, start, end):
+            return
+        if end - start <= 8:
+            found.extend(index for index in range(start, end)
+                         if not self.same(old[index], new[index]))
+            return
+        middle = (start + end) // 2
+        if self._range_same(old, new, start, middle):
+            # The left half is equal, so the right half holds the difference
+            self._differences(old, new, middle, end, True, found, cap)
+        else:
+            self._differences(old, new, start, middle, True, found, cap)
+            self._differences(old, new, middle, end, False, found, cap)
+
+    def _compare_arrays(self, old, new, path, known_different):
+        if len(old) == len(new):
+            if not known_different and self.same(old, new):
+                return
+            if not old:
+                return
+            # Narrow down to the span between the first and last difference
+            first = self._first_difference(old, new, 0, len(old))
+            last = self._last_difference(old, new, first, len(old))
+            span = last + 1 - first
+            cap = max(8, span // 4)
+            positions = []
+            self._differences(old, new, first, last + 1, True, positions, cap + 1)
+            if len(positions) <= cap:
+                self.schedule([(old[index], new[index], f"{path}/{index}", True)
+                               for index in positions])
+                return
+            # Most positions changed: elements were probably inserted and removed
+            self._align(old, new, path, first, last + 1, first, last + 1)
+        else:
+            self._align(old, new, path, 0, len(old), 0, len(new))
+
+    def _common_run(self, old, new, old_start, new_start, length, step):
+        """
+        Number of equal elements (at most ``length``) from the given starts,
+        walking forwards (``step`` 1) or backwards from the element before
+        each start (``step`` -1). Found by halving; only the part not already
+        known to be equal is compared at every step.
+        """
+        low, high = 0, length
+        while low < high:
+            middle = (low + high + 1) // 2
+            if step > 0:
+                equal = self.same(old[old_start + low:old_start + middle],
+                                  new[new_start + low:new_start + middle])
+            else:
+                equal = self.same(old[old_start - middle:old_start - low],
+                                  new[new_start - middle:new_start - low])
+            if equal:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _align(self, old, new, path, old_start, old_end, new_start, new_end):
+        """Align two array ranges by element encoding and diff the gaps."""
+        length = min(old_end - old_start, new_end - new_start)
+        prefix = self._common_run(old, new, old_start, new_start, length, 1)
+        old_start += prefix
+        new_start += prefix
+        suffix = self._common_run(old, new, old_end, new_end, length - prefix, -1)
+        old_end -= suffix
+        new_end -= suffix
+        if old_start == old_end or new_start == new_end:
+            # A pure insertion or removal
+            for index in range(old_start, old_end):
+                self.add('remove', f"{path}/{new_start}", old=old[index])
+            for index in range(new_start, new_end):
+                self.add('add', f"{path}/{index}", new=new[index])
+            return
+        old_keys = [dumps(item) for item in old[old_start:old_end]]
+        new_keys = [dumps(item) for item in new[new_start:new_end]]
+        matcher = difflib.SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+        tasks = []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                continue
+            i1, i2, j1, j2 = i1 + old_start, i2 + old_start, j1 + new_start, j2 + new_start
+            # Changes apply in order, so this block starts at position j1 of the array
+            paired = min(i2 - i1, j2 - j1) if tag == 'replace' else 0
+            for offset in range(paired):
+                tasks.append((old[i1 + offset], new[j1 + offset], f"{path}/{j1 + offset}", True))
+            for index in range(i1 + paired, i2):
+                self.add('remove', f"{path}/{j1 + paired}", old=old[index])
+            for index in range(j1 + paired, j2):
+                self.add('add', f"{path}/{index}", new=new[index])
+        self.schedule(tasks)
+
+
+def diff_json(old, new, limit=MAX_DIFF_CHANGES, exact=False):
+    """
+    Compute the structural diff between two JSON documents.
+
+    With ``exact`` changes between values Python considers equal (``1`` and
+    ``true``) are reported as well, at the cost of comparing encodings.
+
+    Returns:
+        Tuple of (changes, truncated)
+    """
+    walker = _StructuralDiff(limit, exact=exact)
+    walker.run(old, new)
+    return walker.changes, walker.truncated
+
+
+def diff_text(old, new, max_lines=MAX_TEXT_DIFF_LINES):
+    """
+    Compute a unified line diff between two texts.
+
+    Common leading and trailing lines are trimmed before running difflib, so
+    near-identical large texts only diff the region that changed.
+
+    Returns:
+        Tuple of (diff lines, truncated)
+    """
+    old_lines = old.splitlines()
+    new_lines = new.splitlines()
+    prefix = 0
+    while prefix < min(len(old_lines), len(new_lines)) and old_lines[prefix] == new_lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while (suffix < min(len(old_lines), len(new_lines)) - prefix
+           and old_lines[-1 - suffix] == new_lines[-1 - suffix]):
+        suffix += 1
+    # Keep the usual three lines of context around the changed region
+    prefix, suffix = max(0, prefix - 3), max(0, suffix - 3)
+    lines = []
+    for line in difflib.unified_diff(old_lines[prefix:len(old_lines) - suffix],
+                                     new_lines[prefix:len(new_lines) - suffix],
+                                     'old', 'new', lineterm='', n=3):
+        if line.startswith('@@'):
+            # Re-number hunks relative to the full texts
+            line = _offset_hunk(line, prefix)
+        lines.append(line)
+        if len(lines) >= max_lines:
+            return lines, True
+    return lines, False
+
+
+def _offset_hunk(header, offset):
+    parts = header.split(' ')
+    for position in (1, 2):
+        sign, numbers = parts[position][0], parts[position][1:]
+        start, _, count = numbers.partition(',')
+        start = str(int(start) + offset)
+        parts[position] = sign + start + (f",{count}" if count else '')
+    return ' '.join(parts)
+
+
+_body_cache = OrderedDict()
+_body_cache_lock = threading.Lock()
+
+
+def _history():
+    # Imported here: offload pool workers import this module without the app registry
+    from .models import RequestHistory
+    return RequestHistory.objects
+
+
+def load_response_body(history_id):
+    """
+    Load the stored response body of a history entry as encoded JSON bytes,
+    with a small LRU cache.
+
+    The column is fetched as text and left undecoded; ``diff_history``
+    decodes it with the probe codec, in the offload pool when it is large.
+    """
+    with _body_cache_lock:
+        if history_id in _body_cache:
+            _body_cache.move_to_end(history_id)
+            return _body_cache[history_id]
+    raw = (_history().filter(pk=history_id)
+           .annotate(body_text=Cast('response_body', output_field=TextField()))
+           .values_list('body_text', flat=True).first())
+    body = b'null' if raw is None else raw.encode('utf-8')
+    with _body_cache_lock:
+        _body_cache[history_id] = body
+        while len(_body_cache) > BODY_CACHE_SIZE:
+            _body_cache.popitem(last=False)
+    return body
+
+
+def diff_history(old_entry, new_entry, limit=MAX_DIFF_CHANGES):
+    """
+    Diff the responses of two RequestHistory entries.
+
+    Returns a dictionary with both entries' IDs and statuses, whether the
+    responses are identical, the body kind (``json`` or ``text``) and either
+    structural ``changes`` or unified diff ``lines``.
+    """
+    result = {
+        'old': {'id': old_entry.id, 'status': old_entry.response_status,
+                'executed_at': old_entry.executed_at},
+        'new': {'id': new_entry.id, 'status': new_entry.response_status,
+                'executed_at': new_entry.executed_at},
+        'status_changed': old_entry.response_status != new_entry.response_status,
+        'truncated': False,
+    }
+    if old_entry.response_hash and old_entry.response_hash == new_entry.response_hash:
+        # Same fingerprint: the bodies do not need to be loaded, only their kind
+        if stored_body_kind(new_entry.id) == 'text':
+            result.update(identical=True, kind='text', lines=[])
+        else:
+            result.update(identical=True, kind='json', changes=[])
+        return result
+
+    old_body = load_response_body(old_entry.id)
+    new_body = load_response_body(new_entry.id)
+    outcome = run_offloaded(_diff_stored, old_body + new_body, len(old_body), limit,
+                            old_entry.response_hash != new_entry.response_hash)
+    changed = outcome.get('lines') or outcome.get('changes')
+    result.update(outcome, identical=not changed and not result['status_changed'])
+    return result
+
+
+def stored_body_kind(history_id):
+    """
+    ``text`` if the stored response body of a history entry is a JSON
+    string, else ``json``; only the first character of the column is read.
+    """
+    head = (_history().filter(pk=history_id)
+            .annotate(head=Substr(Cast('response_body', output_field=TextField()), 1, 1))
+            .values_list('head', flat=True).first())
+    return 'text' if head == '"' else 'json'
+
+
+def _diff_stored(buffer, split, limit, fingerprints_differ):
+    """
+    Pool-side diff of two stored bodies, encoded back to back in ``buffer``.
+
+    Returns:
+        The kind and either ``changes`` or ``lines``, and ``truncated``
+    """
+    # Decoded documents have no reference cycles; collections triggered by
+    # their millions of objects would cost more than the decoding itself
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        old_body = loads(buffer[:split])
+        new_body = loads(buffer[split:])
+    finally:
+        if collecting:
+            gc.enable()
+    if isinstance(old_body, str) and isinstance(new_body, str):
+        lines, truncated = diff_text(old_body, new_body)
+        return {'kind': 'text', 'lines': lines, 'truncated': truncated}
+    changes, truncated = diff_json(old_body, new_body, limit=limit)
+    if not changes and fingerprints_differ:
+        changes, truncated = diff_json(old_body, new_body, limit=limit, exact=True)
+    return {'kind': 'json', 'changes': changes, 'truncated': truncated}
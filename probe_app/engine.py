@@ -0,0 +1,539 @@
+"""
+Probe engine for ProbeFlex.
+
+This module holds the request execution logic shared by the interactive
+``send_request`` endpoint and collection runs. A probe is described by the
+same dictionary the frontend posts to ``/api/send/`` (url, method, headers,
+params, body, auth, follow_redirects, verify_ssl, timeout, http_version);
+``prepare_probe`` turns it into keyword arguments for ``requests`` and
+``execute_probe`` performs the call. Bodies are sent as JSON unless they are
+typed bodies (form data, multipart and file uploads, raw text; see
+``probe_app.bodies``), and are compressed when the probe sets
+``request_compression`` (see ``probe_app.compression``).
+"""
+import asyncio
+import time
+from contextlib import nullcontext
+from functools import partial
+from urllib.parse import urlencode
+
+import requests
+from django.db import transaction
+
+from .bodies import StreamingBody, is_typed_body, prepare_body
+from .codec import db_json, decode_json, dumps
+from .compression import ACCEPT_ENCODING, compress_bytes, validate_compression
+from .deadlines import (Cancellation, ProbeCancelled, ProbeDeadlineExceeded, start_deadline,
+                        timeout_budgets)
+from .diffing import response_fingerprint
+from .governor import govern
+from .search import SEARCH_INDEX, index_history
+from .metrics import (
+    PROBES_TOTAL, PROBE_ERRORS_TOTAL, PROBE_TIMEOUTS_TOTAL, PROBE_BUDGET_USED, PROBE_RETRIES_TOTAL,
+    PROBE_HEDGES_TOTAL, PROBE_UPLOAD_BYTES_TOTAL, PROBE_UPLOAD_THROUGHPUT, PROBE_RESPONSE_BYTES_TOTAL,
+    PROBE_DECOMPRESSION_TIME, UPSTREAM_LATENCY, GOVERNOR_WAIT, HISTORY_WRITE_LATENCY, project_label, status_class,
+)
+from .models import RequestHistory
+from .offload import OFFLOAD_THRESHOLD, decode_body
+from .retries import hedge_delay, send_with_policy, validate_retry_policy
+from .spool import LARGE_RESPONSE_THRESHOLD, store_response
+from .summaries import apply_execution, locked_summary
+from .transports import HTTP2_AVAILABLE, HTTP_VERSIONS, send as transport_send
+
+
+# HTTP methods the engine is willing to execute
+SUPPORTED_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS')
+
+
+class ProbeConfigError(ValueError):
+    """Raised when a probe definition is missing required data or is invalid."""
+
+
+def probe_data_from_api_request(api_request):
+    """
+    Build a probe definition from a saved APIRequest.
+
+    Returns a dictionary in the same shape the frontend posts to send_request,
+    including the api_request_id so the execution is recorded in history and
+    the project's host limits for the governor and the request's retry policy.
+    """
+    return {
+        'api_request_id': api_request.id,
+        'project_id': api_request.collection.project_id,
+        'host_limits': api_request.collection.project.host_limits,
+        'retry_policy': api_request.retry_policy,
+        'url': api_request.url,
+        'method': api_request.method,
+        'headers': dict(api_request.headers or {}),
+        'params': dict(api_request.params or {}),
+        'body': api_request.body or {},
+        'auth': api_request.auth or {},
+        'follow_redirects': api_request.follow_redirects,
+        'verify_ssl': api_request.verify_ssl,
+        'timeout': api_request.timeout,
+        'http_version': api_request.http_version,
+        'request_compression': api_request.request_compression,
+    }
+
+
+def _compress_body(request_kwargs, headers, setting):
+    """
+    Compress the prepared body of a probe in place.
+
+    JSON, form and raw bodies are encoded and compressed now; streamed bodies
+    are compressed while they are sent.
+
+    Returns:
+        The compression statistics of ``compress_bytes`` (None for streamed bodies)
+    """
+    if 'json' in request_kwargs:
+        data = dumps(request_kwargs.pop('json'))
+    else:
+        data = request_kwargs.get('data')
+        if isinstance(data, StreamingBody):
+            data.compress(setting)
+            headers['Content-Encoding'] = setting.partition(':')[0]
+            return None
+        if isinstance(data, dict):
+            data = urlencode(data, doseq=True)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+    encoding, request_kwargs['data'], stats = compress_bytes(data, setting)
+    headers['Content-Encoding'] = encoding
+    return stats
+
+
+def prepare_probe(data):
+    """
+    Normalize a probe definition and resolve authentication and default headers.
+
+    Returns a dictionary with the effective url, method, headers, params, body
+    and auth data, plus the keyword arguments to pass to ``requests``.
+
+    Raises:
+        ProbeConfigError: If the URL is missing, the method or HTTP version is
+            not supported, the retry policy, request compression or typed body
+            is invalid or a body file does not exist
+    """
+    url = data.get('url', '')
+    method = data.get('method', 'GET').upper()
+    headers = data.get('headers', {})
+    params = data.get('params', {})
+    request_body = data.get('body', {})
+    auth_data = data.get('auth', {})
+    follow_redirects = data.get('follow_redirects', True)
+    verify_ssl = data.get('verify_ssl', True)
+
+    # Validate required fields
+    if not url:
+        raise ProbeConfigError('URL is required')
+    if method not in SUPPORTED_METHODS:
+        raise ProbeConfigError('Invalid HTTP method')
+    try:
+        retry_policy = validate_retry_policy(data.get('retry_policy') or {})
+    except ValueError as e:
+        raise ProbeConfigError(str(e))
+    http_version = data.get('http_version') or '1.1'
+    if http_version not in HTTP_VERSIONS:
+        raise ProbeConfigError('Invalid HTTP version')
+    if not HTTP2_AVAILABLE and http_version != '1.1':
+        if http_version == '2':
+            raise ProbeConfigError('HTTP/2 probes require httpx with HTTP/2 support (pip install "httpx[http2]")')
+        http_version = '1.1'
+    try:
+        request_compression = validate_compression(data.get('request_compression'))
+    except ValueError as e:
+        raise ProbeConfigError(str(e))
+
+    # Check if authentication is already applied to headers (by client-side JS)
+    auth_already_applied = 'Authorization' in headers
+
+    # Handle different authentication methods
+    auth = None
+
+    # Basic Authentication: uses HTTP Basic Auth with username/password
+    if auth_data and auth_data.get('type') == 'basic':
+        username = auth_data.get('username', '')
+        password = auth_data.get('password', '')
+        if username:
+            auth = (username, password)
+
+    # Bearer Token Authentication: adds Authorization header with Bearer token
+    elif auth_data and auth_data.get('type') == 'bearer' and not auth_already_applied:
+        token = auth_data.get('token', '')
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+
+    # API Key Authentication: can be in header or query parameter
+    elif auth_data and auth_data.get('type') == 'apikey' and not auth_already_applied:
+        key_name = auth_data.get('key', '')
+        key_value = auth_data.get('value', '')
+        location = auth_data.get('location', 'header')
+
+        if key_name and key_value:
+            if location == 'header':
+                headers[key_name] = key_value
+            elif location == 'query':
+                params[key_name] = key_value
+
+    # Typed bodies set their own Content-Type
+    body_kwargs = {}
+    if method in ['POST', 'PUT', 'PATCH'] and is_typed_body(request_body):
+        try:
+            body_kwargs = prepare_body(request_body, headers)
+        except ValueError as e:
+            raise ProbeConfigError(str(e))
+
+    # Set default headers if not already present
+    if method in ['POST', 'PUT', 'PATCH'] and not body_kwargs and 'Content-Type' not in headers:
+        headers['Content-Type'] = 'application/json'
+
+    # Add User-Agent for API identification
+    if 'User-Agent' not in headers:
+        headers['User-Agent'] = 'ProbeFlex/1.0 (API Testing Tool)'
+
+    # Add Accept header for response format preference
+    if 'Accept' not in headers:
+        headers['Accept'] = 'application/json, text/plain, */*'
+
+    # Offer the encodings the transports can decode (and measure)
+    if not any(name.lower() == 'accept-encoding' for name in headers):
+        headers['Accept-Encoding'] = ACCEPT_ENCODING
+
+    # Prepare request configuration
+    request_kwargs = {
+        'headers': headers,
+        'params': params,
+        'verify': verify_ssl,
+        'allow_redirects': follow_redirects,
+    }
+
+    # Add Basic Auth if configured (for requests library)
+    if auth:
+        request_kwargs['auth'] = auth
+
+    # Handle request body for methods that support it
+    if body_kwargs:
+        request_kwargs.update(body_kwargs)
+    elif method in ['POST', 'PUT', 'PATCH']:
+        # Send empty JSON object if no body provided
+        if not request_body or request_body == {}:
+            request_kwargs['json'] = {}
+        else:
+            request_kwargs['json'] = request_body
+
+    # Handle GET requests with body content (convert to query params)
+    elif method == 'GET' and request_body:
+        # Convert body content to query parameters for GET requests
+        if isinstance(request_body, dict):
+            for key, value in request_body.items():
+                request_kwargs['params'][key] = value
+
+    # Compress the body for benchmarking when asked to
+    compression_stats = None
+    if request_compression and method in ['POST', 'PUT', 'PATCH']:
+        compression_stats = _compress_body(request_kwargs, headers, request_compression)
+
+    return {
+        'url': url,
+        'method': method,
+        'headers': headers,
+        'params': params,
+        'body': request_body,
+        'auth': auth_data,
+        'project_id': data.get('project_id'),
+        'host_limits': data.get('host_limits') or {},
+        'retry_policy': retry_policy,
+        'timeouts': timeout_budgets(data.get('timeout')),
+        'http_version': http_version,
+        'request_compression': compression_stats,
+        'api_request_id': data.get('api_request_id'),
+        'request_kwargs': request_kwargs,
+    }
+
+
+def _timeout_phase(error):
+    """The budget a timeout exhausted: connect, read or the total deadline."""
+    if isinstance(error, ProbeDeadlineExceeded):
+        return 'total'
+    if isinstance(error, requests.ConnectTimeout):
+        return 'connect'
+    return 'read'
+
+
+def _send(session, probe, governed, project, cancellation=None, hedge=False, race=None):
+    """
+    Perform one upstream attempt of a probe, after the governor admits it.
+
+    The attempt runs under the probe's connect and read timeouts and its
+    total deadline, and is aborted when ``cancellation`` (the whole probe) or
+    ``race`` (a hedged duplicate that lost) is cancelled. Hedged duplicates
+    use a fresh connection rather than the shared session, so they do not
+    queue behind the slow request they race.
+
+    Returns:
+        (response, elapsed_seconds, queued_seconds)
+    """
+    total_timeout = probe['timeouts'][2]
+    cancellations = [scope for scope in (cancellation, race) if scope is not None]
+    admission = (govern(probe['url'], probe.get('project_id'), probe.get('host_limits'), cancellations)
+                 if governed else nullcontext())
+    deadline = None
+    queue_time = 0.0
+    start_time = None
+    try:
+        with admission as permit:
+            if permit is not None:
+                queue_time = permit.wait
+                GOVERNOR_WAIT.observe(queue_time, project=project)
+            # The deadline covers the upstream call only, not the time queued
+            deadline = start_deadline(total_timeout, cancellations)
+            deadline.check()
+            # Record start time for response time measurement
+            start_time = time.perf_counter()
+            response = transport_send(session, probe, deadline, fresh=hedge)
+            end_time = time.perf_counter()
+    except Exception as e:
+        # The failed attempt's timing, for its attempt record and history entry
+        e.timing = (time.perf_counter() - start_time if start_time is not None else None, queue_time)
+        PROBE_ERRORS_TOTAL.inc(project=project, error_class=type(e).__name__)
+        if isinstance(e, requests.Timeout):
+            PROBE_TIMEOUTS_TOTAL.inc(project=project, phase=_timeout_phase(e))
+        raise
+    finally:
+        if deadline is not None:
+            for scope in cancellations:
+                scope.release(deadline)
+
+    UPSTREAM_LATENCY.observe(end_time - start_time, project=project)
+    if response.upload is not None:
+        PROBE_UPLOAD_BYTES_TOTAL.inc(response.upload['size'], project=project)
+        if response.upload['throughput'] is not None:
+            PROBE_UPLOAD_THROUGHPUT.observe(response.upload['throughput'], project=project)
+    transfer = response.transfer
+    PROBE_RESPONSE_BYTES_TOTAL.inc(transfer['wire_size'], project=project, stage='wire')
+    PROBE_RESPONSE_BYTES_TOTAL.inc(transfer['size'], project=project, stage='decoded')
+    if transfer['encoding'] and transfer['decoded']:
+        PROBE_DECOMPRESSION_TIME.observe(transfer['decode_time'] / 1000, encoding=transfer['encoding'])
+    PROBE_BUDGET_USED.observe((end_time - start_time) / total_timeout, project=project)
+    PROBES_TOTAL.inc(project=project, method=probe['method'],
+                     status_class=status_class(response.status_code))
+    return response, end_time - start_time, queue_time
+
+
+def execute_probe(probe, session=None, spool_for=None, decode=True, governed=True,
+                  cancellation=None):
+    """
+    Execute a prepared probe and return the response data for the frontend.
+
+    A ``ProbeSession`` can be passed to reuse pooled connections across
+    many probes (collection runs, load tests); otherwise a one-off request
+    is made. The probe's ``http_version`` selects the transport (see
+    ``probe_app.transports``) and the negotiated protocol is returned as
+    ``http_version``.
+
+    When ``spool_for`` is a user and the body exceeds the large-response
+    threshold, the raw body is spooled for lazy inspection and the result
+    carries its ``body_ref`` (see ``spool.client_payload``).
+
+    With ``decode=False`` the body is not decoded at all and ``body`` is None;
+    callers that only need status and timing (load tests) skip the parsing.
+
+    Unless ``governed=False`` (load tests, which pace themselves), the probe
+    first waits for the per-host governor; that wait is returned as
+    ``queue_time`` and is not part of ``time``.
+
+    A probe with a ``retry_policy`` is retried and hedged as described in
+    ``probe_app.retries``; ``time`` and ``queue_time`` are those of the answer
+    kept, and ``attempts`` lists every attempt made (empty without a policy).
+
+    Each attempt is bounded by the probe's timeouts (see
+    ``probe_app.deadlines``); cancelling ``cancellation`` aborts the probe
+    while it is in flight, queued for its host or waiting to retry.
+
+    Returns:
+        Dictionary with status_code, headers, body (JSON or text), body_size
+        (decoded), wire_size (as received), content_encoding,
+        decompression_time, time and queue_time in ms, attempts and
+        http_version, plus the ``upload`` statistics (size, time, throughput)
+        of a streamed body and the ``request_compression`` statistics of a
+        compressed one
+
+    Raises:
+        requests.RequestException: If the upstream call fails, times out
+            (ProbeDeadlineExceeded for the total deadline) or is cancelled
+            (ProbeCancelled)
+        GovernorTimeout: If the probe queued too long for its host
+    """
+    project = project_label(probe.get('project_id'))
+    policy = probe.get('retry_policy') or {}
+
+    send = partial(_send, session, probe, governed, project, cancellation)
+    if policy:
+        delay = hedge_delay(policy, probe['method'], probe.get('api_request_id'))
+        response, elapsed, queued, attempts = send_with_policy(
+            send, policy, delay,
+            on_retry=lambda reason: PROBE_RETRIES_TOTAL.inc(project=project, reason=reason),
+            cancellation=cancellation)
+        for attempt in attempts:
+            if attempt['hedge']:
+                PROBE_HEDGES_TOTAL.inc(project=project,
+                                       outcome='won' if attempt['status'] is not None else 'lost')
+    else:
+        response, elapsed, queued = send(False)
+        attempts = []
+
+    # Calculate response time
+    response_time = elapsed * 1000  # Convert to milliseconds
+
+    # Parse response body (attempt JSON first, fallback to text). Large bodies
+    # are classified in the offload pool and JSON ones stay unparsed (RawJSON)
+    if not decode:
+        response_body = None
+    elif len(response.content) >= OFFLOAD_THRESHOLD:
+        response_body = decode_body(response.content, response.encoding)
+    else:
+        try:
+            response_body = decode_json(response.content, response.encoding)
+        except ValueError:
+            response_body = response.text
+
+    result = {
+        'status_code': response.status_code,
+        'headers': dict(response.headers),
+        'body': response_body,
+        'body_size': len(response.content),
+        'wire_size': response.transfer['wire_size'],
+        'content_encoding': response.transfer['encoding'],
+        'decompression_time': response.transfer['decode_time'],
+        'time': response_time,
+        'queue_time': queued * 1000,
+        'attempts': attempts,
+        'http_version': response.http_version,
+    }
+    if response.upload is not None:
+        result['upload'] = response.upload
+    if probe.get('request_compression'):
+        result['request_compression'] = probe['request_compression']
+
+    # Keep large bodies server-side so the browser only fetches what it shows
+    if spool_for is not None and result['body_size'] > LARGE_RESPONSE_THRESHOLD:
+        result['body_ref'] = store_response(response.content,
+                                            response.headers.get('Content-Type', ''),
+                                            spool_for.id,
+                                            parsed=response_body)
+        result['body_kind'] = 'text' if isinstance(response_body, str) else 'json'
+    return result
+
+
+async def aexecute_probe(probe, **kwargs):
+    """
+    Run ``execute_probe`` from async code in a worker thread.
+
+    Cancelling the awaiting task aborts the probe in flight instead of
+    leaving the thread blocked on the upstream until its deadline.
+    """
+    cancellation = kwargs.pop('cancellation', None) or Cancellation()
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(
+            None, partial(execute_probe, probe, cancellation=cancellation, **kwargs))
+    except asyncio.CancelledError:
+        cancellation.cancel()
+        raise
+
+
+def _failure_result(error):
+    """
+    The result of a probe that got no response, for ``record_history``.
+
+    The entry has no status or body; its time, queue time and attempts are
+    those of the failed attempts, which ``_send`` and ``send_with_policy``
+    attach to the error.
+    """
+    elapsed, queued = getattr(error, 'timing', (None, 0.0))
+    return {
+        'status_code': None,
+        'headers': {},
+        'body': None,
+        'time': (elapsed or 0.0) * 1000,
+        'queue_time': queued * 1000,
+        'attempts': getattr(error, 'attempts', []),
+        'error': f"{type(error).__name__}: {error}",
+    }
+
+
+def record_failure(api_request, probe, error, user):
+    """
+    Record an execution of a saved API request that got no response.
+
+    Only upstream failures (connection errors, timeouts) are recorded, with
+    the error and the attempts made; cancelled probes and other errors
+    return None without writing history.
+    """
+    if not isinstance(error, requests.RequestException) or isinstance(error, ProbeCancelled):
+        return None
+    return record_history(api_request, probe, _failure_result(error), user)
+
+
+def record_history(api_request, probe, result, user):
+    """
+    Create the RequestHistory record for one execution of a saved API request.
+
+    The response body is encoded with the probe codec rather than by the
+    JSONField; unparsed JSON bodies (``RawJSON``) are written as their
+    original text.
+
+    The response fingerprint is stored with the row and compared with the
+    previous execution of the same request to set ``response_changed``
+    (None for the first execution, or when the previous row predates
+    fingerprints). The entry is folded into the request's summary in the same
+    transaction, and added to the search index.
+    """
+    start_time = time.perf_counter()
+    response_hash = ''
+    if result['body'] is not None:
+        response_hash = response_fingerprint(result['status_code'], result['body'])
+    with transaction.atomic():
+        summary = locked_summary(api_request.pk)
+        if summary.last_run_at is not None:
+            previous_hash = summary.last_response_hash
+        else:
+            # A new summary: history recorded before summaries existed, if any
+            previous_hash = (RequestHistory.objects.filter(request=api_request)
+                             .order_by('-executed_at', '-id')
+                             .values_list('response_hash', flat=True).first())
+        response_changed = None
+        if previous_hash and response_hash:
+            response_changed = previous_hash != response_hash
+        history = RequestHistory.objects.create(
+            request=api_request,
+            url=probe['url'],
+            method=probe['method'],
+            headers=probe['headers'],
+            params=probe['params'],
+            body=probe['body'],
+            auth=probe['auth'],
+            response_status=result['status_code'],
+            response_headers=result['headers'],
+            response_body=db_json(result['body']),
+            response_time=result['time'],
+            queue_time=result.get('queue_time', 0),
+            attempts=result.get('attempts', []),
+            error=result.get('error', ''),
+            http_version=result.get('http_version', ''),
+            response_size=result.get('body_size'),
+            response_wire_size=result.get('wire_size'),
+            response_encoding=result.get('content_encoding', ''),
+            decompression_time=result.get('decompression_time'),
+            coalesced=result.get('coalesced', False),
+            response_hash=response_hash,
+            response_changed=response_changed,
+            executed_by=user
+        )
+        apply_execution(summary, history)
+        summary.save()
+    if SEARCH_INDEX:
+        index_history(history, result['body'])
+    HISTORY_WRITE_LATENCY.observe(time.perf_counter() - start_time)
+    return history
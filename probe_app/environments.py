@@ -0,0 +1,66 @@
+"""
+Environment variable substitution for probes.
+
+Saved requests may reference variables of an ``Environment`` as
+``{{name}}`` in their URL, headers, query parameters, body and auth
+settings::
+
+    GET {{base_url}}/users    Authorization: Bearer {{token}}
+
+``substitute_probe_data`` replaces every reference in a probe definition (the
+dictionary built by ``probe_data_from_api_request``) before it is prepared.
+References to variables the environment does not define are left as they
+are, so a missing variable shows up verbatim in the request that was sent.
+"""
+import re
+
+# A {{name}} reference; names may contain letters, digits, '_', '-' and '.'
+VARIABLE_PATTERN = re.compile(r'\{\{\s*([\w.-]+)\s*\}\}')
+
+# Probe definition keys whose strings may contain references
+SUBSTITUTED_KEYS = ('url', 'headers', 'params', 'body', 'auth')
+
+
+def substitute(value, variables):
+    """
+    Replace ``{{name}}`` references in a string, or in every string nested in
+    a list or dictionary (keys included).
+    """
+    if isinstance(value, str):
+        if '{{' not in value:
+            return value
+        return VARIABLE_PATTERN.sub(
+            lambda match: str(variables.get(match.group(1), match.group(0))), value)
+    if isinstance(value, dict):
+        return {substitute(key, variables): substitute(item, variables)
+                for key, item in value.items()}
+    if isinstance(value, list):
+        return [substitute(item, variables) for item in value]
+    return value
+
+
+def substitute_probe_data(data, variables):
+    """Return a copy of a probe definition with environment variables substituted."""
+    if not variables:
+        return data
+    substituted = dict(data)
+    for key in SUBSTITUTED_KEYS:
+        if substituted.get(key) is not None:
+            substituted[key] = substitute(substituted[key], variables)
+    return substituted
+
+
+def unresolved_variables(data):
+    """Names still referenced in a probe definition after substitution."""
+    names = set()
+    stack = [data.get(key) for key in SUBSTITUTED_KEYS]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, str):
+            names.update(VARIABLE_PATTERN.findall(value))
+        elif isinstance(value, dict):
+            stack.extend(value.keys())
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+    return names
@@ -0,0 +1,265 @@
+"""
+Streaming exporters for RequestHistory.
+
+Each exporter is a generator that walks a RequestHistory queryset with
+``.iterator(chunk_size=...)`` and yields encoded chunks one entry at a time,
+so a download of millions of rows starts immediately and never holds more
+than one database chunk in memory. The output is meant to be handed straight
+to a ``StreamingHttpResponse``.
+"""
+import json
+import zlib
+from urllib.parse import urlencode
+
+from django.db.models import TextField
+from django.db.models.functions import Cast
+
+from .bodies import BODY_KIND_KEY, DEFAULT_FILE_CONTENT_TYPE, is_typed_body
+from .codec import RawJSON, dumps, loads
+
+
+# Number of rows fetched from the database per round trip while exporting
+EXPORT_CHUNK_SIZE = 2000
+
+# Formats supported by the export endpoint, mapped to their content type
+EXPORT_FORMATS = {
+    'jsonl': 'application/x-ndjson',
+    'har': 'application/json',
+}
+
+
+def _dumps(value):
+    """Serialize a value to compact JSON, handling datetimes and decimals."""
+    return dumps(value).decode('utf-8')
+
+
+def _response_body(entry):
+    """
+    Return the stored response body of an exported entry.
+
+    Export querysets fetch the column as text (see ``export_stream``), so the
+    body is passed through as ``RawJSON`` without being parsed.
+    """
+    raw = getattr(entry, 'response_body_json', None)
+    if raw is not None and raw != 'null':
+        return RawJSON(raw.encode('utf-8'))
+    return entry.response_body
+
+
+def history_to_dict(entry):
+    """Convert a RequestHistory instance into a plain JSON-serializable dictionary."""
+    return {
+        'id': entry.id,
+        'request_id': entry.request_id,
+        'executed_at': entry.executed_at,
+        'executed_by_id': entry.executed_by_id,
+        'method': entry.method,
+        'url': entry.url,
+        'headers': entry.headers,
+        'params': entry.params,
+        'body': entry.body,
+        'response_status': entry.response_status,
+        'response_headers': entry.response_headers,
+        'response_body': _response_body(entry),
+        'response_time': entry.response_time,
+        'queue_time': entry.queue_time,
+        'attempts': entry.attempts,
+        'error': entry.error,
+        'http_version': entry.http_version,
+        'coalesced': entry.coalesced,
+        'response_size': entry.response_size,
+        'response_wire_size': entry.response_wire_size,
+        'response_encoding': entry.response_encoding,
+        'decompression_time': entry.decompression_time,
+    }
+
+
+def _har_pairs(mapping):
+    """Convert a header or query parameter dictionary into a HAR name/value list."""
+    if not isinstance(mapping, dict):
+        return []
+    return [{'name': str(name), 'value': str(value)} for name, value in mapping.items()]
+
+
+def _header(mapping, name):
+    """The value of a header in a stored header dictionary, matched case-insensitively."""
+    if isinstance(mapping, dict):
+        for key, value in mapping.items():
+            if key.lower() == name:
+                return value
+    return ''
+
+
+def _form_value(value):
+    # Typed bodies send non-string field values as JSON (see ``prepare_body``)
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def _har_post_data(entry):
+    """
+    Build the HAR ``postData`` of an entry's request body.
+
+    The MIME type is the Content-Type the probe sent; typed bodies are shown
+    as what went over the wire (raw text, form fields, multipart parts)
+    rather than as their ``$body`` spec. Body files are not exported, only
+    named.
+    """
+    body = entry.body
+    mime_type = _header(entry.headers, 'content-type')
+    if not is_typed_body(body):
+        return {'mimeType': mime_type or 'application/json', 'text': _har_text(body)}
+
+    kind = body.get(BODY_KIND_KEY)
+    if kind == 'raw':
+        return {'mimeType': mime_type or 'text/plain; charset=utf-8',
+                'text': str(body.get('text', ''))}
+    if kind == 'form':
+        fields = body.get('fields') if isinstance(body.get('fields'), dict) else {}
+        pairs = [(str(name), _form_value(value)) for name, value in fields.items()]
+        return {
+            'mimeType': mime_type or 'application/x-www-form-urlencoded',
+            'params': [{'name': name, 'value': value} for name, value in pairs],
+            'text': urlencode(pairs),
+        }
+    if kind == 'multipart':
+        fields = body.get('fields') if isinstance(body.get('fields'), dict) else {}
+        files = body.get('files') if isinstance(body.get('files'), dict) else {}
+        params = [{'name': str(name), 'value': _form_value(value)} for name, value in fields.items()]
+        for name, spec in files.items():
+            spec = spec if isinstance(spec, dict) else {'file': spec}
+            params.append({'name': str(name), 'fileName': str(spec.get('filename') or name),
+                           'contentType': spec.get('content_type') or DEFAULT_FILE_CONTENT_TYPE})
+        return {'mimeType': mime_type or 'multipart/form-data', 'params': params, 'text': ''}
+    return {
+        'mimeType': mime_type or body.get('content_type') or DEFAULT_FILE_CONTENT_TYPE,
+        'text': '',
+        'comment': f"Body file {body.get('file')}",
+    }
+
+
+def _har_text(value):
+    """Render a stored JSON body as text for the HAR content fields."""
+    if value is None:
+        return ''
+    if isinstance(value, RawJSON):
+        # A stored JSON string is shown as the string itself
+        return loads(value.content) if value.content.startswith(b'"') else value.text
+    if isinstance(value, str):
+        return value
+    return _dumps(value)
+
+
+def history_to_har_entry(entry):
+    """
+    Convert a RequestHistory instance into a HAR 1.2 ``entry`` object.
+
+    Fields ProbeFlex does not capture (cookies, header sizes, detailed
+    timings) are filled with the HAR "unknown" values so the result loads in
+    standard tools. The response body size is the size as received and the
+    content ``compression`` the bytes content encoding saved.
+    """
+    response_headers = entry.response_headers or {}
+    content_type = _header(response_headers, 'content-type')
+
+    request = {
+        'method': entry.method,
+        'url': entry.url,
+        'httpVersion': entry.http_version or 'HTTP/1.1',
+        'cookies': [],
+        'headers': _har_pairs(entry.headers),
+        'queryString': _har_pairs(entry.params),
+        'headersSize': -1,
+        'bodySize': -1,
+    }
+    if entry.body:
+        request['postData'] = _har_post_data(entry)
+
+    response_text = _har_text(_response_body(entry))
+    content = {
+        'size': len(response_text) if entry.response_size is None else entry.response_size,
+        'mimeType': content_type,
+        'text': response_text,
+    }
+    body_size = -1
+    if entry.response_wire_size is not None:
+        body_size = entry.response_wire_size
+        if entry.response_encoding and entry.response_size is not None:
+            content['compression'] = entry.response_size - entry.response_wire_size
+    response = {
+        'status': entry.response_status or 0,
+        'statusText': '',
+        'httpVersion': entry.http_version or 'HTTP/1.1',
+        'cookies': [],
+        'headers': _har_pairs(response_headers),
+        'content': content,
+        'redirectURL': '',
+        'headersSize': -1,
+        'bodySize': body_size,
+    }
+    if entry.error:
+        # Custom field (as browsers write it) for executions that got no response
+        response['_error'] = entry.error
+    return {
+        'startedDateTime': entry.executed_at.isoformat(),
+        # HAR's total time is the sum of its timings, including the governor queue
+        'time': entry.response_time + entry.queue_time,
+        'request': request,
+        'response': response,
+        'cache': {},
+        'timings': {'blocked': entry.queue_time, 'send': 0, 'wait': entry.response_time, 'receive': 0},
+        'comment': f"ProbeFlex history #{entry.id}",
+    }
+
+
+def iter_jsonl(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield one JSON document per history entry, newline-delimited."""
+    for entry in queryset.iterator(chunk_size=chunk_size):
+        yield dumps(history_to_dict(entry)) + b'\n'
+
+
+def iter_har(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield a HAR 1.2 document incrementally.
+
+    The surrounding ``log`` object is written by hand so entries can be
+    emitted as they are read instead of building the full list first.
+    """
+    yield (
+        '{"log":{"version":"1.2",'
+        '"creator":{"name":"ProbeFlex","version":"1.0"},'
+        '"entries":['
+    ).encode('utf-8')
+    separator = b''
+    for entry in queryset.iterator(chunk_size=chunk_size):
+        yield separator + dumps(history_to_har_entry(entry))
+        separator = b','
+    yield b']}}'
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Compress a stream of byte chunks into a single gzip member on the fly.
+
+    Output is flushed whenever the compressor produces data, so the client
+    keeps receiving bytes while the export is still running.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(queryset, export_format, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """Return the chunk generator for the given export format, optionally gzipped."""
+    # Response bodies are fetched as stored text and passed through unparsed
+    queryset = queryset.defer('response_body').annotate(
+        response_body_json=Cast('response_body', output_field=TextField()))
+    if export_format == 'har':
+        chunks = iter_har(queryset, chunk_size)
+    else:
+        chunks = iter_jsonl(queryset, chunk_size)
+    if compress:
+        chunks = gzip_stream(chunks)
+    return chunks
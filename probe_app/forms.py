@@ -105,12 +105,12 @@ class ProjectForm(forms.ModelForm):
     
     Projects are the top-level organizational unit in ProbeFlex, containing
     collections of related API endpoints. This form allows users to define
-    the project name and description. Additional project settings like team
-    access are handled separately in the views.
+    the project name, description and per-host probe limits. Additional
+    project settings like team access are handled separately in the views.
     """
     class Meta:
         model = Project
-        fields = ['name', 'description']
+        fields = ['name', 'description', 'host_limits']
         widgets = {
             # Project name input with Bootstrap styling
             'name': forms.TextInput(attrs={'class': 'form-control'}),
@@ -119,6 +119,11 @@ class ProjectForm(forms.ModelForm):
                 'class': 'form-control', 
                 'rows': 3  # Keep description concise but allow multiple lines
             }),
+            # Host limits are edited as JSON; Project.clean() validates them
+            'host_limits': forms.Textarea(attrs={
+                'class': 'form-control font-monospace',
+                'rows': 4
+            }),
         }
 
 
@@ -185,8 +190,8 @@ class APIRequestForm(forms.ModelForm):
     """
     Form for creating and editing API request configurations.
     
-    This form handles the basic metadata for API requests (name and description).
-    The actual API request configuration (URL, method, headers, parameters,
+    This form handles the basic metadata for API requests (name and description)
+    and the HTTP version and retry policy. The actual API request configuration (URL, method, headers, parameters,
     body, authentication) is handled through JavaScript in the frontend
     interface and passed as hidden form fields or AJAX data to the views.
     
@@ -195,7 +200,7 @@ class APIRequestForm(forms.ModelForm):
     """
     class Meta:
         model = APIRequest
-        fields = ['name', 'description']
+        fields = ['name', 'description', 'http_version', 'request_compression', 'retry_policy']
         widgets = {
             # API request name input with Bootstrap styling
             'name': forms.TextInput(attrs={'class': 'form-control'}),
@@ -204,4 +209,16 @@ class APIRequestForm(forms.ModelForm):
                 'class': 'form-control', 
                 'rows': 2  # Keep concise - main details are in the API config
             }),
+            # Protocol the request is sent with
+            'http_version': forms.Select(attrs={'class': 'form-select'}),
+            # Request body compression for benchmarking; APIRequest.clean() validates it
+            'request_compression': forms.TextInput(attrs={
+                'class': 'form-control',
+                'placeholder': 'e.g. gzip, br:5 or zstd:3'
+            }),
+            # Retry policy is edited as JSON; APIRequest.clean() validates it
+            'retry_policy': forms.Textarea(attrs={
+                'class': 'form-control font-monospace',
+                'rows': 3
+            }),
         } 
\ No newline at end of file
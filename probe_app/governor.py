@@ -0,0 +1,240 @@
+"""
+Per-host rate limiting and concurrency governor for outbound probes.
+
+Limits are configured per destination host, site-wide with
+``PROBEFLEX_HOST_LIMITS`` and per project with ``Project.host_limits``::
+
+    {
+        "api.internal.example.com": {"rate": 10, "burst": 20, "concurrency": 4},
+        "*": {"concurrency": 8}
+    }
+
+``rate`` is a token bucket refill rate in probes per second (``burst``
+tokens at most, ``rate`` by default), ``concurrency`` caps probes in flight
+to the host. ``"*"`` applies to hosts without an entry of their own. A probe
+must satisfy both the site-wide and its project's limits.
+
+Probes over a limit wait instead of failing, for at most
+``PROBEFLEX_GOVERNOR_MAX_WAIT`` seconds. The wait is reported as
+``queue_time``, separately from the upstream latency.
+
+State lives in the Django cache so the limits hold across worker processes
+when a shared backend (Redis, Memcached, database) is configured; the
+default local-memory cache limits each process on its own. Only atomic
+``cache.add`` is relied on: bucket updates happen under a short lock taken
+with it, and concurrency slots are leased keys that expire if a worker dies.
+"""
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+
+from .deadlines import pause
+
+# Longest a probe may queue for its host before it fails (seconds)
+GOVERNOR_MAX_WAIT = getattr(settings, 'PROBEFLEX_GOVERNOR_MAX_WAIT', 60)
+
+# Concurrency slots expire after this many seconds if never released (crashed worker)
+GOVERNOR_SLOT_LEASE = getattr(settings, 'PROBEFLEX_GOVERNOR_SLOT_LEASE', 300)
+
+# Seconds a token bucket lock may be held before it expires
+_LOCK_TIMEOUT = 2
+
+# Longest pause between attempts to take a concurrency slot (seconds)
+_MAX_POLL_INTERVAL = 0.1
+
+_LIMIT_KEYS = {'rate', 'burst', 'concurrency'}
+
+
+class GovernorTimeout(Exception):
+    """Raised when a probe would have to queue longer than GOVERNOR_MAX_WAIT."""
+
+
+def validate_limits(limits):
+    """
+    Check a host limits mapping and return it with numbers normalized.
+
+    Raises:
+        ValueError: If the mapping is malformed
+    """
+    if not isinstance(limits, dict):
+        raise ValueError('Host limits must be an object mapping hosts to limits')
+    normalized = {}
+    for host, spec in limits.items():
+        if not isinstance(spec, dict) or not spec:
+            raise ValueError(f"Limits for {host!r} must be a non-empty object")
+        unknown = set(spec) - _LIMIT_KEYS
+        if unknown:
+            raise ValueError(f"Unknown limit for {host!r}: {', '.join(sorted(unknown))}")
+        if 'burst' in spec and 'rate' not in spec:
+            raise ValueError(f"'burst' for {host!r} requires a 'rate'")
+        entry = {}
+        try:
+            if 'rate' in spec:
+                entry['rate'] = float(spec['rate'])
+                entry['burst'] = float(spec.get('burst', max(1.0, entry['rate'])))
+            if 'concurrency' in spec:
+                entry['concurrency'] = int(spec['concurrency'])
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid limits for {host!r}")
+        if entry.get('rate', 1) <= 0 or entry.get('burst', 1) < 1 or entry.get('concurrency', 1) < 1:
+            raise ValueError(f"Limits for {host!r} must be positive (burst and concurrency at least 1)")
+        normalized[host.lower()] = entry
+    return normalized
+
+
+try:
+    # Site-wide per-host limits, shared by every project
+    HOST_LIMITS = validate_limits(getattr(settings, 'PROBEFLEX_HOST_LIMITS', {}))
+except ValueError as e:
+    raise ImproperlyConfigured(f"PROBEFLEX_HOST_LIMITS: {e}")
+
+
+def host_key(url):
+    """The host (and explicit port) a probe URL connects to, lower-cased."""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    return f"{host}:{parts.port}" if parts.port else host
+
+
+def _host_spec(limits, host):
+    if not limits:
+        return None
+    bare_host = host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+    return limits.get(host) or limits.get(bare_host) or limits.get('*')
+
+
+@contextmanager
+def _bucket_lock(key):
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+    # The lock expires on its own, so a crashed holder only delays others briefly
+    while not cache.add(lock_key, token, timeout=_LOCK_TIMEOUT):
+        time.sleep(0.002)
+    try:
+        yield
+    finally:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _reserve_token(key, host, rate, burst, max_wait):
+    """
+    Take one token from a bucket, returning how long to wait until it is due.
+
+    Tokens may be reserved ahead (the balance goes negative), so queued probes
+    are released in arrival order at the configured rate without polling.
+    """
+    with _bucket_lock(key):
+        now = time.time()
+        state = cache.get(key)
+        tokens, updated = state if state else (burst, now)
+        tokens = min(burst, tokens + (now - updated) * rate) - 1
+        wait = max(0.0, -tokens / rate)
+        if wait > max_wait:
+            raise GovernorTimeout(f"Rate limit queue for {host} is longer than {GOVERNOR_MAX_WAIT}s")
+        cache.set(key, (tokens, now), timeout=int((burst - tokens) / rate) + 60)
+    return wait
+
+
+def _refund_token(key, rate, burst):
+    """Give back a token reserved by a probe that was not admitted after all."""
+    with _bucket_lock(key):
+        state = cache.get(key)
+        if state is None:
+            return  # The bucket expired, so it is full again anyway
+        tokens, updated = state
+        tokens = min(burst, tokens + 1)
+        cache.set(key, (tokens, updated), timeout=int((burst - tokens) / rate) + 60)
+
+
+def _acquire_slot(key, host, concurrency, deadline, cancellations=()):
+    """Lease one of ``concurrency`` slots, polling with backoff while all are taken."""
+    token = uuid.uuid4().hex
+    interval = 0.005
+    while True:
+        # Start at a random slot so waiters do not all contend for slot 0
+        first = random.randrange(concurrency)
+        for offset in range(concurrency):
+            slot_key = f"{key}:slot:{(first + offset) % concurrency}"
+            if cache.add(slot_key, token, timeout=GOVERNOR_SLOT_LEASE):
+                return slot_key, token
+        if time.monotonic() >= deadline:
+            raise GovernorTimeout(f"No free concurrency slot for {host} within {GOVERNOR_MAX_WAIT}s")
+        pause(min(interval, max(0.0, deadline - time.monotonic())), cancellations)
+        interval = min(interval * 2, _MAX_POLL_INTERVAL)
+
+
+def _release_slot(slot_key, token):
+    if cache.get(slot_key) == token:
+        cache.delete(slot_key)
+
+
+class Permit:
+    """Admission of one probe; ``wait`` is the time it spent queued (seconds)."""
+
+    __slots__ = ('wait', 'slots')
+
+    def __init__(self):
+        self.wait = 0.0
+        self.slots = []
+
+
+@contextmanager
+def govern(url, project_id=None, project_limits=None, cancellations=()):
+    """
+    Wait until a probe to ``url`` is allowed by the site-wide and project limits.
+
+    Yields a ``Permit``; the probe's concurrency slots are held until the
+    block exits. Hosts without limits pass straight through. Cancelling one
+    of ``cancellations`` ends the wait early.
+
+    Raises:
+        GovernorTimeout: If the probe would queue longer than GOVERNOR_MAX_WAIT
+        ProbeCancelled: If the probe is cancelled while it queues
+    """
+    permit = Permit()
+    host = host_key(url)
+    levels = [('site', _host_spec(HOST_LIMITS, host))]
+    if project_id:
+        levels.append((f"project:{project_id}", _host_spec(project_limits, host)))
+    levels = [(scope, spec) for scope, spec in levels if spec]
+    if not levels:
+        yield permit
+        return
+
+    start = time.monotonic()
+    deadline = start + GOVERNOR_MAX_WAIT
+    reserved = []
+    admitted = False
+    try:
+        # Hold the concurrency slots first so the rate-paced send happens right away
+        for scope, spec in levels:
+            if 'concurrency' in spec:
+                permit.slots.append(_acquire_slot(f"probeflex:governor:{scope}:{host}", host,
+                                                  spec['concurrency'], deadline, cancellations))
+        wait = 0.0
+        for scope, spec in levels:
+            if 'rate' in spec:
+                remaining = deadline - time.monotonic()
+                burst = spec.get('burst', max(1.0, spec['rate']))
+                bucket = f"probeflex:governor:{scope}:bucket:{host}"
+                wait = max(wait, _reserve_token(bucket, host, spec['rate'], burst, remaining))
+                reserved.append((bucket, spec['rate'], burst))
+        if wait:
+            pause(wait, cancellations)
+        permit.wait = time.monotonic() - start
+        admitted = True
+        yield permit
+    finally:
+        if not admitted:
+            # A later level refused the probe or it was cancelled: the tokens were never used
+            for bucket, rate, burst in reserved:
+                _refund_token(bucket, rate, burst)
+        for slot_key, token in permit.slots:
+            _release_slot(slot_key, token)
@@ -0,0 +1,223 @@
+"""
+Headless runs of saved requests for CI (``manage.py probe run``).
+
+A suite is a list of APIRequests (a collection or a whole project) executed
+against an optional environment with a bounded pool of worker threads that
+share one ``ProbeSession``. Unlike collection runs started from the web UI,
+every result is kept so it can be reported, and nothing is published to
+browsers.
+
+A probe passes when it gets a response with a status below 400. Probes that
+still reference undefined environment variables are not sent and count as
+errors.
+"""
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from django.db import close_old_connections
+
+from .deadlines import Cancellation
+from .engine import (execute_probe, prepare_probe, probe_data_from_api_request, record_failure,
+                     record_history)
+from .environments import substitute_probe_data, unresolved_variables
+from .stats import LatencyHistogram
+from .transports import ProbeSession
+
+
+# Default number of worker threads
+DEFAULT_WORKERS = 8
+
+# Upper bound on worker threads for one suite
+MAX_WORKERS = 256
+
+
+def _execute(session, api_request, variables, save_history, user, cancellation, keep_body=False):
+    """
+    Execute one saved request and return its result entry.
+
+    With ``keep_body`` the decoded response body is returned as the entry's
+    ``body`` (history or not).
+    """
+    data = substitute_probe_data(probe_data_from_api_request(api_request), variables)
+    entry = {
+        'api_request_id': api_request.id,
+        'name': api_request.name,
+        'method': api_request.method,
+        'project': api_request.collection.project.name,
+        'collection': api_request.collection.name,
+        'url': data['url'],
+        'status_code': None,
+        'time': None,
+        'error': None,
+    }
+    missing = unresolved_variables(data)
+    if missing:
+        entry['error'] = f"Undefined variables: {', '.join(sorted(missing))}"
+        return entry
+    try:
+        probe = prepare_probe(data)
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+        return entry
+    try:
+        result = execute_probe(probe, session=session, decode=save_history or keep_body,
+                               cancellation=cancellation)
+    except Exception as e:
+        entry['error'] = f"{type(e).__name__}: {e}"
+        if save_history:
+            try:
+                record_failure(api_request, probe, e, user)
+            except Exception as history_error:
+                print(f"Error saving request history: {str(history_error)}")
+        return entry
+    entry['status_code'] = result['status_code']
+    entry['time'] = result['time']
+    if keep_body:
+        entry['body'] = result['body']
+    if save_history:
+        try:
+            record_history(api_request, probe, result, user)
+        except Exception as history_error:
+            print(f"Error saving request history: {str(history_error)}")
+    return entry
+
+
+def run_pool(tasks, execute, workers=DEFAULT_WORKERS, on_result=None, cancellation=None):
+    """
+    Call ``execute(session, task, cancellation)`` for every task with
+    ``workers`` threads sharing one ``ProbeSession``.
+
+    ``on_result`` is called with each returned entry as it completes (from the
+    worker threads). Cancelling ``cancellation`` aborts the probes in flight
+    and skips the rest.
+
+    Returns:
+        (results, wall_time) where results are in task order; tasks skipped
+        after a cancellation have none
+    """
+    cancellation = cancellation or Cancellation()
+    results = [None] * len(tasks)
+    indexes = iter(range(len(tasks)))
+    lock = threading.Lock()
+    session = ProbeSession()
+
+    def worker():
+        try:
+            while not cancellation.cancelled:
+                with lock:
+                    index = next(indexes, None)
+                if index is None:
+                    return
+                entry = execute(session, tasks[index], cancellation)
+                results[index] = entry
+                if on_result:
+                    on_result(entry)
+        finally:
+            close_old_connections()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True)
+               for _ in range(max(1, min(workers, MAX_WORKERS, len(tasks))))]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            # Short joins keep the main thread responsive to Ctrl-C
+            while thread.is_alive():
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        cancellation.cancel()
+        for thread in threads:
+            thread.join()
+        raise
+    finally:
+        session.close()
+    wall_time = time.perf_counter() - start
+    return [entry for entry in results if entry is not None], wall_time
+
+
+def run_suite(api_requests, variables=None, workers=DEFAULT_WORKERS, iterations=1,
+              save_history=True, user=None, on_result=None, cancellation=None):
+    """
+    Execute every request ``iterations`` times with ``workers`` threads.
+
+    ``on_result`` and ``cancellation`` are those of ``run_pool``.
+
+    Returns:
+        (results, wall_time) where results are in suite order and each has
+        'passed' set
+    """
+    tasks = [(iteration, api_request)
+             for iteration in range(1, iterations + 1)
+             for api_request in api_requests]
+
+    def execute(session, task, cancellation):
+        iteration, api_request = task
+        entry = _execute(session, api_request, variables or {}, save_history, user, cancellation)
+        entry['iteration'] = iteration
+        entry['passed'] = probe_passed(entry)
+        return entry
+
+    return run_pool(tasks, execute, workers=workers, on_result=on_result,
+                    cancellation=cancellation)
+
+
+def probe_passed(entry):
+    """Whether a result entry got a response with a status below 400."""
+    return entry['error'] is None and entry['status_code'] < 400
+
+
+def summarize(results, wall_time):
+    """Counts and latency percentiles of a finished suite."""
+    histogram = LatencyHistogram()
+    for entry in results:
+        if entry['time'] is not None:
+            histogram.add(entry['time'])
+    errors = sum(1 for entry in results if entry['error'] is not None)
+    passed = sum(1 for entry in results if entry['passed'])
+    return {
+        'total': len(results),
+        'passed': passed,
+        'failed': len(results) - passed - errors,
+        'errors': errors,
+        'wall_time': wall_time,
+        'throughput': len(results) / wall_time if wall_time else 0,
+        'latency_ms': histogram.summary(),
+    }
+
+
+def junit_xml(results, suite_name, wall_time):
+    """
+    Render results as a JUnit XML report.
+
+    Responses with a status of 400 or more are failures, probes without a
+    response are errors.
+    """
+    summary = summarize(results, wall_time)
+    suites = ET.Element('testsuites')
+    suite = ET.SubElement(suites, 'testsuite', {
+        'name': suite_name,
+        'tests': str(summary['total']),
+        'failures': str(summary['failed']),
+        'errors': str(summary['errors']),
+        'skipped': '0',
+        'time': f"{wall_time:.3f}",
+    })
+    for entry in results:
+        name = f"{entry['method']} {entry['name']}"
+        if entry['iteration'] > 1:
+            name += f" #{entry['iteration']}"
+        case = ET.SubElement(suite, 'testcase', {
+            'classname': f"{entry['project']}.{entry['collection']}",
+            'name': name,
+            'time': f"{(entry['time'] or 0) / 1000:.3f}",
+        })
+        if entry['error'] is not None:
+            error = ET.SubElement(case, 'error', {'message': entry['error']})
+            error.text = f"{entry['method']} {entry['url']}\n{entry['error']}"
+        elif not entry['passed']:
+            failure = ET.SubElement(case, 'failure', {'message': f"HTTP {entry['status_code']}"})
+            failure.text = f"{entry['method']} {entry['url']} returned {entry['status_code']}"
+    ET.indent(suites)
+    return ET.tostring(suites, encoding='unicode', xml_declaration=True)
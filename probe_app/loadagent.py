@@ -0,0 +1,16 @@
+"""
+Entry point of load-test agents spawned by a local coordinator.
+
+A spawned process imports the module of its target before calling it. This
+module imports nothing that needs the app registry, so the agent sets Django
+up first and only then imports ``probe_app.loadtest`` (whose probe engine
+imports the models).
+"""
+
+
+def run_local_agent(address, authkey):
+    import django
+    django.setup()
+
+    from .loadtest import agent_main
+    agent_main(address, authkey)
@@ -0,0 +1,357 @@
+"""
+Distributed load generation for ProbeFlex.
+
+A coordinator splits one load-test plan across N agents. Each agent is a
+separate process (started locally, or on other hosts with the ``probe_load
+agent`` command) that executes its share of the plan with its own thread pool
+and its own share of the request rate.
+
+Agents periodically send *cumulative* reports: counters plus a serialized
+``LatencyHistogram``. Because the histogram bucket boundaries depend only on
+the configured accuracy, the coordinator merges the latest report of every
+agent by adding bucket counts, so the combined percentiles are exactly those
+of a single histogram that had seen every request.
+
+Coordinator and agents talk over ``multiprocessing.connection`` (TCP,
+authenticated with a shared key). Plans carry fully resolved probe
+definitions, so agents never need database access.
+"""
+import itertools
+import multiprocessing
+import secrets
+import threading
+import time
+from multiprocessing.connection import Client, Listener, wait
+
+from .engine import execute_probe, prepare_probe, probe_data_from_api_request
+from .loadagent import run_local_agent
+from .stats import LatencyHistogram
+from .transports import ProbeSession
+
+
+# Seconds between two progress reports sent by an agent
+REPORT_INTERVAL = 1.0
+
+# How long the coordinator waits for every agent to connect (seconds)
+AGENT_CONNECT_TIMEOUT = 60
+
+
+class LoadTestError(Exception):
+    """Raised when a load test cannot be planned or an agent fails."""
+
+
+def build_plan(api_requests, total_requests=None, duration=None, rate=None, concurrency=8):
+    """
+    Build a load-test plan from saved API requests.
+
+    The plan cycles through the requests in order. It stops after
+    ``total_requests`` probes or ``duration`` seconds, whichever comes first;
+    ``rate`` caps the overall probes per second (None means as fast as the
+    workers allow).
+    """
+    if not api_requests:
+        raise LoadTestError('The load test has no requests to execute')
+    if not total_requests and not duration:
+        raise LoadTestError('Either a request count or a duration is required')
+    return {
+        'probes': [probe_data_from_api_request(api_request) for api_request in api_requests],
+        'total_requests': total_requests,
+        'duration': duration,
+        'rate': rate,
+        'concurrency': concurrency,
+    }
+
+
+def split_plan(plan, agents):
+    """
+    Divide a plan into ``agents`` shares.
+
+    Request counts and the rate limit are divided as evenly as possible (the
+    first shares absorb the remainder); each agent keeps the full probe list
+    and concurrency, and starts at a different offset in the probe cycle.
+    """
+    shares = []
+    for index in range(agents):
+        share = dict(plan, agent=index, offset=index)
+        if plan['total_requests']:
+            base, extra = divmod(plan['total_requests'], agents)
+            share['total_requests'] = base + (1 if index < extra else 0)
+        if plan['rate']:
+            share['rate'] = plan['rate'] / agents
+        shares.append(share)
+    return shares
+
+
+class AgentState:
+    """Counters and histogram of one agent; reports are cumulative snapshots."""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.lock = threading.Lock()
+        self.histogram = LatencyHistogram()
+        self.completed = 0
+        self.errors = 0
+        self.status_counts = {}
+        self.error_counts = {}
+        self.upload_bytes = 0
+        self.upload_time = 0.0  # ms spent sending streamed request bodies
+        self.wire_bytes = 0  # response bodies as received
+        self.decoded_bytes = 0  # and after content decoding
+        self.decompression_time = 0.0  # ms
+
+    def record(self, result=None, error=None):
+        with self.lock:
+            self.completed += 1
+            if error is not None:
+                self.errors += 1
+                name = type(error).__name__
+                self.error_counts[name] = self.error_counts.get(name, 0) + 1
+            else:
+                key = str(result['status_code'])
+                self.status_counts[key] = self.status_counts.get(key, 0) + 1
+                self.histogram.add(result['time'])
+                self.wire_bytes += result['wire_size']
+                self.decoded_bytes += result['body_size']
+                self.decompression_time += result['decompression_time']
+                if 'upload' in result:
+                    self.upload_bytes += result['upload']['size']
+                    self.upload_time += result['upload']['time']
+
+    def report(self, final=False):
+        with self.lock:
+            return {
+                'type': 'done' if final else 'report',
+                'agent': self.agent,
+                'completed': self.completed,
+                'errors': self.errors,
+                'status_counts': dict(self.status_counts),
+                'error_counts': dict(self.error_counts),
+                'upload_bytes': self.upload_bytes,
+                'upload_time': self.upload_time,
+                'wire_bytes': self.wire_bytes,
+                'decoded_bytes': self.decoded_bytes,
+                'decompression_time': self.decompression_time,
+                'histogram': self.histogram.to_dict(),
+            }
+
+
+def run_share(share, report=None, report_interval=REPORT_INTERVAL):
+    """
+    Execute one agent's share of a plan and return its final report.
+
+    Work is paced open-loop: probe ``k`` is scheduled at ``start + k / rate``
+    regardless of how long earlier probes took, so slow responses do not
+    silently lower the offered load. ``report`` is called with cumulative
+    snapshots every ``report_interval`` seconds.
+    """
+    state = AgentState(share['agent'])
+    probes = share['probes']
+    total = share['total_requests']
+    rate = share['rate']
+    start = time.monotonic()
+    deadline = start + share['duration'] if share['duration'] else None
+    counter = iter(range(total)) if total else itertools.count()
+    counter_lock = threading.Lock()
+
+    # Shared by all workers, so HTTP/2 probes are multiplexed over a few connections
+    session = ProbeSession()
+
+    def worker():
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            if rate:
+                delay = start + index / rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            if deadline and time.monotonic() >= deadline:
+                return
+            data = probes[(share['offset'] + index) % len(probes)]
+            try:
+                # prepare_probe mutates headers/params, so give it fresh copies; retry
+                # policies are dropped so every result is a single attempt
+                probe = prepare_probe(dict(data, headers=dict(data['headers']),
+                                           params=dict(data['params']), retry_policy={}))
+                # Only status and timing are reported, so bodies are never decoded
+                state.record(result=execute_probe(probe, session=session, decode=False,
+                                                  governed=False))
+            except Exception as e:
+                state.record(error=e)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(share['concurrency'])]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            alive = [thread for thread in threads if thread.is_alive()]
+            if not alive:
+                break
+            alive[0].join(timeout=report_interval)
+            if report:
+                report(state.report())
+    finally:
+        session.close()
+    return state.report(final=True)
+
+
+def merge_reports(reports):
+    """Merge the latest report of every agent into one exact summary."""
+    histogram = LatencyHistogram()
+    merged = {'completed': 0, 'errors': 0, 'status_counts': {}, 'error_counts': {},
+              'upload_bytes': 0, 'upload_time': 0.0, 'wire_bytes': 0, 'decoded_bytes': 0,
+              'decompression_time': 0.0}
+    for report in reports:
+        histogram.merge(LatencyHistogram.from_dict(report['histogram']))
+        merged['completed'] += report['completed']
+        merged['errors'] += report['errors']
+        merged['upload_bytes'] += report.get('upload_bytes', 0)
+        merged['upload_time'] += report.get('upload_time', 0.0)
+        for field in ('wire_bytes', 'decoded_bytes', 'decompression_time'):
+            merged[field] += report.get(field, 0)
+        for field in ('status_counts', 'error_counts'):
+            for key, count in report[field].items():
+                merged[field][key] = merged[field].get(key, 0) + count
+    merged['latency_ms'] = histogram.summary()
+    merged['histogram'] = histogram.to_dict()
+    return merged
+
+
+def agent_main(address, authkey):
+    """
+    Agent entry point: connect to the coordinator, run the assigned share and report back.
+
+    Used both by locally spawned agent processes and by ``probe_load agent``.
+    """
+    connection = Client(tuple(address), authkey=authkey)
+    try:
+        share = connection.recv()
+        send_lock = threading.Lock()
+
+        def report(snapshot):
+            with send_lock:
+                connection.send(snapshot)
+
+        final = run_share(share, report=report)
+        report(final)
+    except Exception as e:
+        connection.send({'type': 'error', 'error': f"{type(e).__name__}: {e}"})
+    finally:
+        connection.close()
+
+
+class Coordinator:
+    """
+    Distributes a plan to agents and merges their reports.
+
+    With ``spawn_local=True`` the coordinator starts the agents itself as local
+    processes; otherwise it waits for ``agents`` remote agents to connect to
+    ``address``.
+    """
+
+    def __init__(self, plan, agents, address=('127.0.0.1', 0), authkey=None, spawn_local=True,
+                 connect_timeout=AGENT_CONNECT_TIMEOUT):
+        self.plan = plan
+        self.agents = agents
+        self.address = address
+        self.authkey = authkey or secrets.token_bytes(32)
+        self.spawn_local = spawn_local
+        self.connect_timeout = connect_timeout
+        self.latest = {}
+
+    def run(self, progress=None, listening=None):
+        """
+        Run the load test and return the merged summary.
+
+        ``listening`` is called with the bound address before agents are
+        awaited; ``progress`` is called with the merged summary whenever an
+        agent reports.
+
+        Raises:
+            LoadTestError: If agents fail to connect in time or report an error
+        """
+        shares = split_plan(self.plan, self.agents)
+        processes = []
+        with Listener(tuple(self.address), authkey=self.authkey) as listener:
+            if self.spawn_local:
+                context = multiprocessing.get_context('spawn')
+                for _ in range(self.agents):
+                    process = context.Process(target=run_local_agent,
+                                              args=(listener.address, self.authkey), daemon=True)
+                    process.start()
+                    processes.append(process)
+
+            if listening:
+                listening(listener.address)
+
+            # Listener.accept() has no timeout; accept in a helper thread and
+            # give up when it has not seen every agent in time
+            connections = []
+
+            def accept_agents():
+                for share in shares:
+                    connection = listener.accept()
+                    connection.send(share)
+                    connections.append(connection)
+
+            acceptor = threading.Thread(target=accept_agents, daemon=True)
+            acceptor.start()
+            deadline = time.monotonic() + self.connect_timeout
+            while acceptor.is_alive() and time.monotonic() < deadline:
+                acceptor.join(timeout=0.1)
+                # A local agent that died during startup will never connect
+                if any(process.exitcode not in (None, 0) for process in processes):
+                    break
+            if len(connections) < self.agents:
+                for connection in connections:
+                    connection.close()
+                raise LoadTestError(f"Only {len(connections)} of {self.agents} agents connected")
+
+            # Agent startup is not part of the measured load
+            started = time.monotonic()
+
+            errors = self._collect(connections, progress)
+
+        for process in processes:
+            process.join(timeout=5)
+        if errors:
+            raise LoadTestError('; '.join(errors))
+
+        summary = merge_reports(self.latest.values())
+        summary['agents'] = self.agents
+        summary['wall_time'] = time.monotonic() - started
+        summary['throughput'] = summary['completed'] / summary['wall_time']
+        # Streamed request bodies: the rate one probe sends at, and the total offered
+        if summary['upload_bytes']:
+            summary['upload_throughput'] = (summary['upload_bytes'] / (summary['upload_time'] / 1000)
+                                            if summary['upload_time'] else None)
+            summary['upload_bandwidth'] = summary['upload_bytes'] / summary['wall_time']
+        # Compressed responses: how much smaller they were on the wire
+        if summary['wire_bytes']:
+            summary['compression_ratio'] = summary['decoded_bytes'] / summary['wire_bytes']
+        return summary
+
+    def _collect(self, connections, progress):
+        """Receive reports until every agent has finished; return agent errors."""
+        pending = set(connections)
+        errors = []
+        while pending:
+            for connection in wait(list(pending)):
+                try:
+                    message = connection.recv()
+                except EOFError:
+                    pending.discard(connection)
+                    errors.append('An agent disconnected before finishing')
+                    continue
+                if message['type'] == 'error':
+                    pending.discard(connection)
+                    errors.append(message['error'])
+                    continue
+                self.latest[message['agent']] = message
+                if message['type'] == 'done':
+                    pending.discard(connection)
+                    connection.close()
+                if progress:
+                    progress(merge_reports(self.latest.values()))
+        return errors
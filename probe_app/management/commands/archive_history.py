@@ -0,0 +1,40 @@
+"""
+Move old request history into columnar archive segments.
+
+Usage:
+    python manage.py archive_history [--older-than 30] [--dry-run]
+
+History executed more than ``--older-than`` whole days ago (default:
+PROBEFLEX_ARCHIVE_AFTER_DAYS) is written to Parquet segments under
+PROBEFLEX_ARCHIVE_DIR, one per project and day, and deleted from the
+database. Run it daily, e.g. from cron. Needs ``pip install pyarrow``.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from probe_app.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_DIR, ArchiveUnavailable, archive_history
+
+
+class Command(BaseCommand):
+    help = 'Move request history older than a number of days into columnar archive segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help=f"Archive history older than this many days (default: {ARCHIVE_AFTER_DAYS})")
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be archived without writing or deleting anything')
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 1:
+            raise CommandError('--older-than must be at least 1')
+
+        def progress(project_id, day, rows):
+            self.stdout.write(f"  project {project_id}, {day}: {rows} entries")
+
+        try:
+            rows, segments = archive_history(options['older_than'], dry_run=options['dry_run'],
+                                             progress=progress)
+        except ArchiveUnavailable as e:
+            raise CommandError(str(e))
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {rows} history entries in {segments} segments under {ARCHIVE_DIR}"))
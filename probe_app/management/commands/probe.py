@@ -0,0 +1,264 @@
+"""
+Run saved requests headlessly, e.g. as a CI smoke suite.
+
+Usage:
+    # Every request of collection 3 against the "Staging" environment, 16 workers
+    python manage.py probe run --collection 3 --environment Staging --workers 16 \\
+        --junit reports/probeflex.xml
+
+    # A whole project, variables from the command line, no history written
+    python manage.py probe run --project 1 --var base_url=http://localhost:8080 \\
+        --var token=$API_TOKEN --no-history --json reports/probeflex.json
+
+    # Collection 3 against Production (the baseline) and Staging, 10 times each
+    python manage.py probe compare --collection 3 --environment Production \\
+        --environment Staging --iterations 10 --json reports/compare.json
+
+``run`` exits with status 1 when any probe fails (a response status of 400 or
+more) or errors (no response); ``compare`` when any request got a status in
+one environment that it never got in the baseline, or the other way round.
+System checks are skipped so the command starts without importing the web
+views and templates.
+"""
+import json
+import threading
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from probe_app.comparisons import compare_environments
+from probe_app.headless import DEFAULT_WORKERS, junit_xml, run_suite, summarize
+from probe_app.models import APIRequest, Collection, Environment, Project
+
+
+def _variable(value):
+    name, separator, variable_value = value.partition('=')
+    if not separator or not name:
+        raise CommandError(f"Expected NAME=VALUE, got {value!r}")
+    return name, variable_value
+
+
+def _write(path, text):
+    output = Path(path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(text, encoding='utf-8')
+    return output
+
+
+class Command(BaseCommand):
+    help = 'Run the saved requests of a collection or project headlessly (for CI)'
+
+    # Checks import the URLconf (views, templates, forms); probes need none of it
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        modes = parser.add_subparsers(dest='mode', required=True)
+
+        run = modes.add_parser('run', help='Run a collection or project')
+        target = run.add_mutually_exclusive_group(required=True)
+        target.add_argument('--collection', type=int, help='ID of the Collection to run')
+        target.add_argument('--project', type=int, help='ID of the Project to run (every collection)')
+        run.add_argument('--environment',
+                         help="ID or name of the project's Environment whose variables are substituted")
+        run.add_argument('--var', action='append', default=[], type=_variable, metavar='NAME=VALUE',
+                         help='Set a variable, overriding the environment (repeatable)')
+        run.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                         help=f"Concurrent probes (default: {DEFAULT_WORKERS})")
+        run.add_argument('--iterations', type=int, default=1,
+                         help='Times to run every request (default: 1)')
+        run.add_argument('--no-history', action='store_true',
+                         help='Do not write RequestHistory entries (bodies are not decoded either)')
+        run.add_argument('--user', help='Username recorded as executing the probes (default: project owner)')
+        run.add_argument('--junit', help='Write a JUnit XML report to this file')
+        run.add_argument('--json', help='Write a JSON report to this file')
+        run.add_argument('--quiet', action='store_true', help='Only print the summary')
+
+        compare = modes.add_parser('compare', help='Run a collection or project against several '
+                                                   'environments and compare the results')
+        target = compare.add_mutually_exclusive_group(required=True)
+        target.add_argument('--collection', type=int, help='ID of the Collection to run')
+        target.add_argument('--project', type=int, help='ID of the Project to run (every collection)')
+        compare.add_argument('--environment', action='append', required=True,
+                             help='ID or name of an Environment to run against (at least two; '
+                                  'the first is the baseline)')
+        compare.add_argument('--var', action='append', default=[], type=_variable,
+                             metavar='NAME=VALUE',
+                             help='Set a variable in every environment (repeatable)')
+        compare.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                             help=f"Concurrent probes across all environments (default: {DEFAULT_WORKERS})")
+        compare.add_argument('--iterations', type=int, default=5,
+                             help='Times to run every request per environment (default: 5)')
+        compare.add_argument('--history', action='store_true',
+                             help='Write RequestHistory entries (not written by default)')
+        compare.add_argument('--user', help='Username recorded as executing the probes (default: project owner)')
+        compare.add_argument('--json', help='Write a JSON report to this file')
+        compare.add_argument('--quiet', action='store_true', help='Only print the differences')
+
+    def _suite(self, options):
+        """The project, suite name and saved requests selected by --collection or --project."""
+        if options['collection']:
+            collection = Collection.objects.select_related('project').filter(
+                pk=options['collection']).first()
+            if collection is None:
+                raise CommandError(f"Collection {options['collection']} does not exist")
+            project = collection.project
+            suite_name = f"{project.name}.{collection.name}"
+            api_requests = collection.requests.all()
+        else:
+            project = Project.objects.filter(pk=options['project']).first()
+            if project is None:
+                raise CommandError(f"Project {options['project']} does not exist")
+            suite_name = project.name
+            api_requests = APIRequest.objects.filter(collection__project=project)
+        api_requests = list(api_requests.select_related('collection__project')
+                            .order_by('collection_id', 'id'))
+        if not api_requests:
+            raise CommandError('There are no saved requests to run')
+        return project, suite_name, api_requests
+
+    def _environment(self, project, lookup):
+        environments = Environment.objects.filter(project=project)
+        environment = environments.filter(name=lookup).first()
+        if environment is None and lookup.isdigit():
+            environment = environments.filter(pk=int(lookup)).first()
+        if environment is None:
+            raise CommandError(f"Project {project.name!r} has no environment {lookup!r}")
+        return environment
+
+    def _user(self, project, options):
+        if not options['user']:
+            return project.owner
+        user = User.objects.filter(username=options['user']).first()
+        if user is None:
+            raise CommandError(f"User {options['user']!r} does not exist")
+        return user
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['iterations'] < 1:
+            raise CommandError('--workers and --iterations must be at least 1')
+        if options['mode'] == 'compare':
+            return self.compare(options)
+
+        project, suite_name, api_requests = self._suite(options)
+        variables = {}
+        environment = None
+        if options['environment']:
+            environment = self._environment(project, options['environment'])
+            variables.update(environment.variables or {})
+        variables.update(options['var'])
+        user = self._user(project, options)
+
+        total = len(api_requests) * options['iterations']
+        against = f" against {environment.name}" if environment else ''
+        self.stdout.write(f"Running {total} probes from {suite_name}{against} "
+                          f"with {options['workers']} workers")
+        output_lock = threading.Lock()
+
+        def on_result(entry):
+            if entry['passed'] or options['quiet']:
+                return
+            outcome = entry['error'] or f"HTTP {entry['status_code']}"
+            with output_lock:
+                self.stdout.write(self.style.ERROR(
+                    f"  FAIL {entry['method']} {entry['name']} ({entry['url']}): {outcome}"))
+
+        try:
+            results, wall_time = run_suite(api_requests, variables=variables,
+                                           workers=options['workers'],
+                                           iterations=options['iterations'],
+                                           save_history=not options['no_history'],
+                                           user=user, on_result=on_result)
+        except KeyboardInterrupt:
+            raise CommandError('Interrupted; probes in flight were cancelled')
+
+        summary = summarize(results, wall_time)
+        latency = summary['latency_ms']
+        style = self.style.SUCCESS if summary['passed'] == summary['total'] else self.style.ERROR
+        self.stdout.write(style(
+            f"{summary['passed']} passed, {summary['failed']} failed, {summary['errors']} errors "
+            f"in {wall_time:.2f}s ({summary['throughput']:.1f}/s)"))
+        if latency['count']:
+            self.stdout.write(f"  latency ms: p50={latency['p50']:.2f} p95={latency['p95']:.2f} "
+                              f"max={latency['max']:.2f}")
+
+        if options['junit']:
+            output = _write(options['junit'], junit_xml(results, suite_name, wall_time))
+            self.stdout.write(f"JUnit report written to {output}")
+        if options['json']:
+            report = {
+                'suite': suite_name,
+                'environment': environment.name if environment else None,
+                'summary': summary,
+                'results': results,
+            }
+            output = _write(options['json'], json.dumps(report, indent=2))
+            self.stdout.write(f"JSON report written to {output}")
+
+        if summary['passed'] != summary['total']:
+            raise CommandError(f"{summary['total'] - summary['passed']} of {summary['total']} probes failed")
+
+    def compare(self, options):
+        project, suite_name, api_requests = self._suite(options)
+        environments = [self._environment(project, lookup) for lookup in options['environment']]
+        if len({environment.id for environment in environments}) < 2:
+            raise CommandError('Compare needs at least two different environments')
+        user = self._user(project, options)
+
+        total = len(api_requests) * options['iterations'] * len(environments)
+        names = ', '.join(environment.name for environment in environments)
+        self.stdout.write(f"Running {total} probes from {suite_name} against {names} "
+                          f"with {options['workers']} workers")
+        try:
+            report = compare_environments(api_requests, environments, variables=dict(options['var']),
+                                          workers=options['workers'],
+                                          iterations=options['iterations'],
+                                          save_history=options['history'], user=user)
+        except KeyboardInterrupt:
+            raise CommandError('Interrupted; probes in flight were cancelled')
+
+        for entry in report['requests']:
+            lines = []
+            for comparison in entry['comparisons']:
+                against = comparison['environment']
+                delta = comparison['latency_delta_ms']
+                if delta and (delta['significant'] or not options['quiet']):
+                    interval = (f" [{delta['ci_low']:+.2f}, {delta['ci_high']:+.2f}]"
+                                if delta['ci_low'] is not None else '')
+                    relative = f" ({delta['relative']:+.1%})" if delta['relative'] is not None else ''
+                    style = self.style.WARNING if delta['significant'] else str
+                    lines.append(style(f"    {against}: {delta['mean']:+.2f} ms{relative}{interval}"))
+                if comparison['status_mismatch']:
+                    statuses = {side['environment']: side['statuses'] for side in entry['environments']
+                                if side['environment'] in (report['baseline'], against)}
+                    lines.append(self.style.ERROR(f"    {against}: statuses differ {statuses}"))
+                body = comparison['body']
+                if body and not body['identical']:
+                    count = len(body['changes'] if body['kind'] == 'json' else body['lines'])
+                    unit = 'changes' if body['kind'] == 'json' else 'diff lines'
+                    lines.append(self.style.WARNING(f"    {against}: body differs ({count} {unit})"))
+            if lines:
+                self.stdout.write(f"  {entry['method']} {entry['name']}")
+                for line in lines:
+                    self.stdout.write(line)
+
+        for label, summary in report['summaries'].items():
+            latency = summary['latency_ms']
+            timing = (f", p50={latency['p50']:.2f} p95={latency['p95']:.2f} ms"
+                      if latency['count'] else '')
+            self.stdout.write(f"{label}: {summary['passed']} passed, {summary['failed']} failed, "
+                              f"{summary['errors']} errors{timing}")
+        style = self.style.ERROR if report['status_mismatches'] else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{report['status_mismatches']} requests with status mismatches, "
+            f"{report['body_differences']} with body differences "
+            f"(baseline {report['baseline']}, {report['wall_time']:.2f}s)"))
+
+        if options['json']:
+            output = _write(options['json'], json.dumps(dict(report, suite=suite_name), indent=2,
+                                                         default=str))
+            self.stdout.write(f"JSON report written to {output}")
+
+        if report['status_mismatches']:
+            raise CommandError(f"{report['status_mismatches']} of {len(report['requests'])} "
+                               f"requests returned different statuses")
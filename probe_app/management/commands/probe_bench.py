@@ -0,0 +1,192 @@
+"""
+Benchmark the probe pipeline against a local stand-in server.
+
+Usage:
+    python manage.py probe_bench
+    python manage.py probe_bench --requests 2000 --concurrency 16 --latency 20 --payload-size 100000
+    python manage.py probe_bench --tls --output bench_results/baseline.json
+    python manage.py probe_bench --compare bench_results/baseline.json
+
+Benchmarks run against a temporary test database, so the configured database
+is never modified. Results are written as JSON together with the git commit
+they were measured on.
+"""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+import urllib3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from probe_app.benchmarks import BENCHMARKS, BenchmarkContext
+from probe_app.standin import StandInServer
+
+
+# Measurements shown in the comparison table: (label, path into a result, higher is better)
+COMPARED_METRICS = (
+    ('throughput', ('throughput',), True),
+    ('p50 ms', ('latency_ms', 'p50'), False),
+    ('p95 ms', ('latency_ms', 'p95'), False),
+    ('p99 ms', ('latency_ms', 'p99'), False),
+    ('wall s', ('wall_time',), False),
+    ('mem peak', ('memory_peak_bytes',), False),
+)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _lookup(result, path):
+    for key in path:
+        if not isinstance(result, dict):
+            return None
+        result = result.get(key)
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Benchmark send_request, history writes and collection runs against a local stand-in server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Probes per benchmark (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent workers (default: 8)')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Stand-in server latency in milliseconds (default: 0)')
+        parser.add_argument('--payload-size', type=int, default=1024,
+                            help='Stand-in response size in bytes (default: 1024)')
+        parser.add_argument('--depth', type=int, default=0,
+                            help='Nesting depth of the stand-in response (default: 0)')
+        parser.add_argument('--collection-size', type=int, default=20,
+                            help='Requests in the benchmark collection (default: 20)')
+        parser.add_argument('--tls', action='store_true',
+                            help='Serve the stand-in over HTTPS with a self-signed certificate')
+        parser.add_argument('--trace-memory', action='store_true',
+                            help='Record Python memory peaks with tracemalloc (slows the benchmarks)')
+        parser.add_argument('--only', action='append', choices=sorted(BENCHMARKS),
+                            help='Run only the named benchmark (repeatable)')
+        parser.add_argument('--output', help='Path of the JSON results file '
+                                             '(default: bench_results/<commit>-<timestamp>.json)')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+
+    def handle(self, *args, **options):
+        names = options['only'] or list(BENCHMARKS)
+        baseline = None
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read comparison file: {e}")
+
+        if options['tls']:
+            # The stand-in certificate is self-signed and verification is disabled on purpose
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+        setup_test_environment()
+        tempdir = None
+        if connection.vendor == 'sqlite':
+            # The default in-memory test database uses table-level locks that fail
+            # under concurrent writers; a file-backed database behaves like production
+            tempdir = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempdir.name, 'bench.sqlite3')
+        old_database_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = {}
+        try:
+            with StandInServer(latency_ms=options['latency'], payload_size=options['payload_size'],
+                               depth=options['depth'], tls=options['tls']) as server:
+                context = BenchmarkContext(
+                    server.url,
+                    requests=options['requests'],
+                    concurrency=options['concurrency'],
+                    collection_size=options['collection_size'],
+                    trace_memory=options['trace_memory'],
+                    # The stand-in certificate is self-signed
+                    verify_ssl=not options['tls'],
+                )
+
+                for name in names:
+                    self.stdout.write(f"Running {name}...")
+                    results[name] = BENCHMARKS[name](context)
+                    self._print_result(name, results[name])
+        finally:
+            connection.creation.destroy_test_db(old_database_name, verbosity=0)
+            teardown_test_environment()
+            if tempdir is not None:
+                tempdir.cleanup()
+
+        commit = _git_commit()
+        report = {
+            'meta': {
+                'commit': commit,
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'parameters': {key: options[key] for key in (
+                    'requests', 'concurrency', 'latency', 'payload_size', 'depth',
+                    'collection_size', 'tls', 'trace_memory')},
+            },
+            'results': results,
+        }
+
+        output = options['output']
+        if not output:
+            stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+            output = Path(settings.BASE_DIR) / 'bench_results' / f"{commit or 'unknown'}-{stamp}.json"
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        self.stdout.write(self.style.SUCCESS(f"Results written to {output}"))
+
+        if baseline:
+            self._print_comparison(baseline, report)
+
+    def _print_result(self, name, result):
+        latency = result.get('latency_ms') or result.get('upstream_latency_ms') or {}
+        line = (f"  {name}: {result['operations']} ops in {result['wall_time']:.2f}s "
+                f"({result['throughput'] or 0:.1f}/s), errors={result['errors']}")
+        if result.get('first_error'):
+            line += f" (first: {result['first_error']})"
+        if latency.get('p50') is not None:
+            line += f", p50={latency['p50']:.2f}ms p95={latency['p95']:.2f}ms p99={latency['p99']:.2f}ms"
+        if result.get('memory_peak_bytes'):
+            line += f", mem peak={result['memory_peak_bytes'] / 1024 / 1024:.1f} MB"
+        self.stdout.write(line)
+        for payload, timings in result.get('breakdown_ms', {}).items():
+            self.stdout.write(f"    {payload} ({result['codec']}): " + ', '.join(
+                f"{label}={value:.1f}ms" for label, value in timings.items() if label != 'bytes'))
+
+    def _print_comparison(self, baseline, report):
+        self.stdout.write(f"\nComparison with {baseline['meta'].get('commit')} "
+                          f"({baseline['meta'].get('timestamp')}):")
+        for name, result in report['results'].items():
+            previous = baseline.get('results', {}).get(name)
+            if previous is None:
+                continue
+            self.stdout.write(f"  {name}")
+            for label, path, higher_is_better in COMPARED_METRICS:
+                # Collection runs report upstream latency under their own key
+                if path[0] == 'latency_ms' and 'upstream_latency_ms' in result:
+                    path = ('upstream_latency_ms',) + path[1:]
+                old, new = _lookup(previous, path), _lookup(result, path)
+                if not old or new is None:
+                    continue
+                change = (new - old) / old * 100
+                improved = change > 0 if higher_is_better else change < 0
+                style = self.style.SUCCESS if improved else self.style.WARNING
+                self.stdout.write(f"    {label:<10} {old:>12.2f} -> {new:>12.2f}  " +
+                                  style(f"{change:+.1f}%"))
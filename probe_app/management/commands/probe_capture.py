@@ -0,0 +1,85 @@
+"""
+Capture real traffic into a collection with a recording proxy.
+
+Usage:
+    # Forward proxy: point the application's HTTP_PROXY at it
+    python manage.py probe_capture --collection 3 --port 8082
+    HTTP_PROXY=http://127.0.0.1:8082 ./run-my-app
+
+    # Reverse proxy in front of one upstream (also records HTTPS APIs)
+    python manage.py probe_capture --collection 3 --upstream https://api.example.com --port 8082
+
+Press Ctrl-C to stop; pending recordings are written before the command
+exits. See ``probe_app.capture`` for how requests are deduplicated.
+"""
+import asyncio
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from probe_app.capture import CaptureProxy, CaptureRecorder, run_proxy
+from probe_app.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Run a proxy that records the traffic passing through it as saved requests of a collection'
+
+    # Checks import the URLconf (views, templates, forms); the proxy needs none of it
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', type=int, required=True,
+                            help='ID of the Collection captured requests are saved to')
+        parser.add_argument('--upstream',
+                            help='Forward every request to this base URL (reverse proxy mode)')
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8082, help='Port to listen on (default: 8082)')
+        parser.add_argument('--history-per-request', type=int, default=10,
+                            help='Executions recorded per captured request (default: 10)')
+        parser.add_argument('--body-limit', type=int, default=64 * 1024,
+                            help='Bytes of each body kept for the recording (default: 65536)')
+        parser.add_argument('--keep-credentials', action='store_true',
+                            help='Record Authorization and Cookie headers')
+        parser.add_argument('--insecure', action='store_true',
+                            help='Do not verify the certificate of an HTTPS upstream')
+        parser.add_argument('--user', help='Username recorded as executing the requests (default: project owner)')
+
+    def handle(self, *args, **options):
+        if options['history_per_request'] < 0 or options['body_limit'] < 0:
+            raise CommandError('--history-per-request and --body-limit cannot be negative')
+        upstream = options['upstream']
+        if upstream and not upstream.startswith(('http://', 'https://')):
+            raise CommandError('--upstream must be an http:// or https:// URL')
+
+        collection = Collection.objects.select_related('project__owner').filter(
+            pk=options['collection']).first()
+        if collection is None:
+            raise CommandError(f"Collection {options['collection']} does not exist")
+        user = collection.project.owner
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"User {options['user']!r} does not exist")
+
+        recorder = CaptureRecorder(collection, user=user,
+                                   history_per_request=options['history_per_request'],
+                                   keep_credentials=options['keep_credentials'])
+        proxy = CaptureProxy(recorder, upstream=upstream, body_limit=options['body_limit'],
+                             verify_ssl=not options['insecure'])
+
+        def on_ready(address):
+            mode = f"reverse proxy for {upstream}" if upstream else 'forward proxy'
+            self.stdout.write(self.style.SUCCESS(
+                f"Capturing into {collection.project.name}.{collection.name} as a {mode} "
+                f"on {address[0]}:{address[1]}; press Ctrl-C to stop"))
+
+        try:
+            asyncio.run(run_proxy(proxy, options['host'], options['port'], on_ready=on_ready))
+        except KeyboardInterrupt:
+            pass
+        except OSError as e:
+            raise CommandError(f"Cannot listen on {options['host']}:{options['port']}: {e}")
+        finally:
+            recorder.close()
+        self.stdout.write(f"Created {recorder.created} requests and recorded {recorder.recorded} "
+                          f"executions ({recorder.dropped} dropped)")
@@ -0,0 +1,154 @@
+"""
+Generate load against saved API requests from several agent processes.
+
+Usage:
+    # Four local agents, 10,000 probes of a collection capped at 500 requests/second
+    python manage.py probe_load run --collection 3 --agents 4 --requests 10000 --rate 500
+
+    # One saved request for 60 seconds, agents on other hosts
+    python manage.py probe_load run --request 12 --duration 60 --agents 2 \\
+        --listen 0.0.0.0:7700 --remote --authkey $PROBEFLEX_LOAD_AUTHKEY
+    python manage.py probe_load agent --connect coordinator.example.com:7700 \\
+        --authkey $PROBEFLEX_LOAD_AUTHKEY
+
+The coordinator resolves the plan from the database and divides request
+counts and the rate limit between agents. Agents only need this code base and
+network access to the coordinator; they never touch the database. Results are
+merged exactly from the agents' latency histograms.
+"""
+import json
+import os
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from probe_app.loadtest import Coordinator, LoadTestError, agent_main, build_plan
+from probe_app.models import APIRequest
+
+
+def _address(value):
+    host, _, port = value.rpartition(':')
+    if not host or not port.isdigit():
+        raise CommandError(f"Expected HOST:PORT, got {value!r}")
+    return host, int(port)
+
+
+class Command(BaseCommand):
+    help = 'Run a distributed load test (coordinator) or serve as a load-test agent'
+
+    def add_arguments(self, parser):
+        modes = parser.add_subparsers(dest='mode', required=True)
+
+        run = modes.add_parser('run', help='Coordinate a load test')
+        target = run.add_mutually_exclusive_group(required=True)
+        target.add_argument('--request', type=int, help='ID of the APIRequest to load')
+        target.add_argument('--collection', type=int, help='ID of the Collection to load')
+        run.add_argument('--requests', type=int, help='Total probes across all agents')
+        run.add_argument('--duration', type=float, help='Stop after this many seconds')
+        run.add_argument('--rate', type=float,
+                         help='Overall probes per second, divided between agents (default: unlimited)')
+        run.add_argument('--agents', type=int, default=2, help='Number of agents (default: 2)')
+        run.add_argument('--concurrency', type=int, default=8,
+                         help='Worker threads per agent (default: 8)')
+        run.add_argument('--listen', default='127.0.0.1:0',
+                         help='Coordinator address agents connect to (default: 127.0.0.1, any port)')
+        run.add_argument('--remote', action='store_true',
+                         help='Wait for agents started with "probe_load agent" instead of spawning local ones')
+        run.add_argument('--authkey', default=os.environ.get('PROBEFLEX_LOAD_AUTHKEY'),
+                         help='Shared secret for agents (required with --remote; '
+                              'default: $PROBEFLEX_LOAD_AUTHKEY)')
+        run.add_argument('--connect-timeout', type=float, default=60,
+                         help='Seconds to wait for every agent to connect (default: 60)')
+        run.add_argument('--output', help='Write the merged summary to this JSON file')
+
+        agent = modes.add_parser('agent', help='Run as an agent of a remote coordinator')
+        agent.add_argument('--connect', required=True, help='Coordinator HOST:PORT')
+        agent.add_argument('--authkey', default=os.environ.get('PROBEFLEX_LOAD_AUTHKEY'),
+                           help='Shared secret (default: $PROBEFLEX_LOAD_AUTHKEY)')
+
+    def handle(self, *args, **options):
+        if options['mode'] == 'agent':
+            self._agent(options)
+        else:
+            self._coordinate(options)
+
+    def _agent(self, options):
+        if not options['authkey']:
+            raise CommandError('An --authkey shared with the coordinator is required')
+        address = _address(options['connect'])
+        self.stdout.write(f"Connecting to coordinator at {address[0]}:{address[1]}...")
+        agent_main(address, options['authkey'].encode('utf-8'))
+        self.stdout.write(self.style.SUCCESS('Agent finished'))
+
+    def _coordinate(self, options):
+        if options['agents'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--agents and --concurrency must be at least 1')
+        if options['remote'] and not options['authkey']:
+            raise CommandError('--remote requires an --authkey shared with the agents')
+
+        if options['request']:
+            api_requests = list(APIRequest.objects.select_related('collection__project')
+                                .filter(pk=options['request']))
+        else:
+            api_requests = list(APIRequest.objects.select_related('collection__project')
+                                .filter(collection_id=options['collection']))
+        try:
+            plan = build_plan(api_requests,
+                              total_requests=options['requests'],
+                              duration=options['duration'],
+                              rate=options['rate'],
+                              concurrency=options['concurrency'])
+        except LoadTestError as e:
+            raise CommandError(str(e))
+
+        authkey = options['authkey'].encode('utf-8') if options['authkey'] else None
+        coordinator = Coordinator(plan, options['agents'],
+                                  address=_address(options['listen']),
+                                  authkey=authkey,
+                                  spawn_local=not options['remote'],
+                                  connect_timeout=options['connect_timeout'])
+
+        def listening(address):
+            if options['remote']:
+                self.stdout.write(f"Waiting for {options['agents']} agents on {address[0]}:{address[1]}...")
+
+        last_completed = [None]
+
+        def progress(summary):
+            if summary['completed'] == last_completed[0]:
+                return
+            last_completed[0] = summary['completed']
+            self.stdout.write(f"  {summary['completed']} probes, {summary['errors']} errors, "
+                              f"p95={summary['latency_ms']['p95'] or 0:.2f}ms")
+
+        try:
+            summary = coordinator.run(progress=progress, listening=listening)
+        except LoadTestError as e:
+            raise CommandError(str(e))
+
+        latency = summary['latency_ms']
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary['completed']} probes from {summary['agents']} agents in "
+            f"{summary['wall_time']:.2f}s ({summary['throughput']:.1f}/s), errors={summary['errors']}"))
+        if latency['count']:
+            self.stdout.write(f"  latency ms: p50={latency['p50']:.2f} p90={latency['p90']:.2f} "
+                              f"p95={latency['p95']:.2f} p99={latency['p99']:.2f} max={latency['max']:.2f}")
+        self.stdout.write(f"  status codes: {summary['status_counts']}")
+        if summary['upload_bytes']:
+            per_probe = summary['upload_throughput']
+            self.stdout.write(f"  uploaded {summary['upload_bytes'] / 1024 ** 2:.1f} MiB at "
+                              f"{summary['upload_bandwidth'] / 1024 ** 2:.2f} MiB/s"
+                              + (f" ({per_probe / 1024 ** 2:.2f} MiB/s per probe)" if per_probe else ''))
+        if summary['wire_bytes'] != summary['decoded_bytes']:
+            self.stdout.write(f"  received {summary['wire_bytes'] / 1024 ** 2:.1f} MiB "
+                              f"({summary['decoded_bytes'] / 1024 ** 2:.1f} MiB decoded, "
+                              f"ratio {summary['compression_ratio']:.2f}), "
+                              f"{summary['decompression_time']:.0f} ms decompressing")
+        if summary['error_counts']:
+            self.stdout.write(f"  errors: {summary['error_counts']}")
+
+        if options['output']:
+            output = Path(options['output'])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(json.dumps(summary, indent=2))
+            self.stdout.write(f"Summary written to {output}")
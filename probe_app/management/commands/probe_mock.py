@@ -0,0 +1,111 @@
+"""
+Serve the recorded responses of a collection as a mock upstream.
+
+Usage:
+    # Collection 3 on port 8081 with 20 +/- 5 ms of injected latency
+    python manage.py probe_mock --collection 3 --port 8081 --latency 20 --jitter 5
+
+    # Hand-written routes only, four processes sharing the port
+    python manage.py probe_mock --routes mocks/payments.json --workers 4
+
+Routes are loaded from the database once, before the server starts; restart
+the command to pick up new recordings. ``--list`` prints the route table and
+exits. See ``probe_app.mocks`` for how requests are matched.
+"""
+import json
+import multiprocessing
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from probe_app.mocks import MockServerConfig, build_routes, listen, serve
+from probe_app.models import Collection
+
+
+class Command(BaseCommand):
+    help = 'Serve the recorded responses of a collection (and hand-written routes) as a mock server'
+
+    # Checks import the URLconf (views, templates, forms); the mock server needs none of it
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', type=int, help='ID of the Collection whose responses are served')
+        parser.add_argument('--routes',
+                            help='JSON file with a list of hand-written routes '
+                                 '({"method", "path", "status", "headers", "body", "latency_ms"})')
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8081, help='Port to listen on (default: 8081)')
+        parser.add_argument('--latency', type=float, default=0,
+                            help='Milliseconds to wait before every response (default: 0)')
+        parser.add_argument('--jitter', type=float, default=0,
+                            help='Random +/- milliseconds added to the latency (default: 0)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Server processes accepting on the port (default: 1)')
+        parser.add_argument('--list', action='store_true', help='Print the routes and exit')
+
+    def handle(self, *args, **options):
+        if options['collection'] is None and not options['routes']:
+            raise CommandError('Pass --collection, --routes or both')
+        if options['latency'] < 0 or options['jitter'] < 0:
+            raise CommandError('--latency and --jitter cannot be negative')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        collection = None
+        if options['collection'] is not None:
+            collection = Collection.objects.filter(pk=options['collection']).first()
+            if collection is None:
+                raise CommandError(f"Collection {options['collection']} does not exist")
+        handwritten = []
+        if options['routes']:
+            try:
+                handwritten = json.loads(Path(options['routes']).read_text(encoding='utf-8'))
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['routes']}: {e}")
+            if not isinstance(handwritten, list):
+                raise CommandError(f"{options['routes']} must contain a list of routes")
+        try:
+            routes, skipped = build_routes(collection, handwritten)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for api_request in skipped:
+            self.stdout.write(self.style.WARNING(
+                f"  Skipped {api_request.method} {api_request.name}: no recorded response"))
+        if not routes.count:
+            raise CommandError('There are no routes to serve')
+        if options['list']:
+            for method, path, response in routes.routes():
+                self.stdout.write(f"  {method:7} {path} -> {response.status} "
+                                  f"({len(response.body)} bytes, {response.source})")
+            return
+
+        # Workers inherit the routes and the listening socket, not the database connection
+        connections.close_all()
+        config = MockServerConfig(routes, options['latency'], options['jitter'])
+        try:
+            sock = listen(options['host'], options['port'])
+        except OSError as e:
+            raise CommandError(f"Cannot listen on {options['host']}:{options['port']}: {e}")
+        host, port = sock.getsockname()[:2]
+        self.stdout.write(self.style.SUCCESS(
+            f"Serving {routes.count} mock routes on http://{host}:{port}/ "
+            f"with {options['workers']} worker(s); press Ctrl-C to stop"))
+
+        workers = []
+        if options['workers'] > 1:
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise CommandError('--workers needs the fork start method (not available on this platform)')
+            context = multiprocessing.get_context('fork')
+            workers = [context.Process(target=serve, args=(config, sock), daemon=True)
+                       for _ in range(options['workers'] - 1)]
+            for worker in workers:
+                worker.start()
+        try:
+            serve(config, sock)
+        finally:
+            for worker in workers:
+                worker.terminate()
+                worker.join()
+            sock.close()
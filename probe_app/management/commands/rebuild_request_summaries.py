@@ -0,0 +1,31 @@
+"""
+Rebuild the per-request execution summaries from request history.
+
+Usage:
+    python manage.py rebuild_request_summaries [--batch-size 500]
+
+New executions update their request's summary as they are recorded; run
+this once after upgrading to summarize existing history, or after changing
+PROBEFLEX_SUMMARY_WINDOW.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from probe_app.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the last-result summary of every API request from its history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Requests summarized per transaction (default: 500)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        def progress(count):
+            self.stdout.write(f"  {count} requests summarized")
+
+        total = rebuild_summaries(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Summarized {total} requests"))
@@ -0,0 +1,30 @@
+"""
+Rebuild the request history search index.
+
+Usage:
+    python manage.py rebuild_search_index [--batch-size 500]
+
+New executions are indexed as they are recorded; run this once after
+upgrading to index existing history, or after changing PROBEFLEX_SEARCH_INDEX.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from probe_app.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text and body-field search index over request history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='History entries indexed per transaction (default: 500)')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        def progress(count):
+            self.stdout.write(f"  {count} entries indexed")
+
+        total = rebuild_index(batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} history entries"))
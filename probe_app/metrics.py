@@ -0,0 +1,283 @@
+"""
+Instrumentation for the ProbeFlex probe engine.
+
+A small, dependency-free metrics registry with counters, gauges and
+histograms, rendered in the Prometheus text exposition format by the
+``/metrics/`` endpoint.
+
+Label cardinality is bounded on purpose: probes are labelled by project, not
+by URL, and every metric accepts at most ``MAX_LABEL_SETS`` distinct label
+combinations. Further combinations are folded into a single series whose
+label values are all ``"other"``, so a misbehaving caller cannot blow up the
+scrape size or the Prometheus index.
+
+Metrics are kept per process; with several worker processes each one must be
+scraped (or exposed through a sidecar) individually.
+"""
+import threading
+from bisect import bisect_left
+
+
+# Maximum number of distinct label combinations tracked per metric
+MAX_LABEL_SETS = 200
+
+# Label value used once a metric has reached MAX_LABEL_SETS combinations
+OVERFLOW_LABEL_VALUE = 'other'
+
+# Default latency buckets in seconds (1 ms .. 60 s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class handling names, help text and bounded label sets."""
+
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        """Return the series key for ``labels`` (caller holds the lock)."""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        if key not in self._series and len(self._series) >= MAX_LABEL_SETS:
+            key = tuple(OVERFLOW_LABEL_VALUE for _ in self.labelnames)
+        return key
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def _series_for(self, labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = self._new_series()
+        return series
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                lines.extend(self._render_series(key, series))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    metric_type = 'counter'
+
+    def _new_series(self):
+        return [0.0]
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._series_for(labels)[0] += amount
+
+    def _render_series(self, key, series):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series[0])}"]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (in-flight work, pool sizes)."""
+
+    metric_type = 'gauge'
+
+    def _new_series(self):
+        return [0.0]
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._series_for(labels)[0] = value
+
+    def inc(self, amount=1, **labels):
+        with self._lock:
+            self._series_for(labels)[0] += amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def _render_series(self, key, series):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(series[0])}"]
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed histogram of observed values (seconds)."""
+
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        # Per-bucket counts (last slot is +Inf), then sum
+        return {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+
+    def observe(self, value, **labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series_for(labels)
+            series['counts'][index] += 1
+            series['sum'] += value
+
+    def _render_series(self, key, series):
+        lines = []
+        cumulative = 0
+        bounds = self.buckets + (float('inf'),)
+        for bound, count in zip(bounds, series['counts']):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together by the metrics endpoint."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+PROBES_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probes_total',
+    'Probes executed, by project, method and response status class.',
+    ('project', 'method', 'status_class')))
+
+PROBE_ERRORS_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probe_errors_total',
+    'Probes that failed without an HTTP response, by project and exception class.',
+    ('project', 'error_class')))
+
+UPSTREAM_LATENCY = REGISTRY.register(Histogram(
+    'probeflex_upstream_latency_seconds',
+    'Time from sending a probe to receiving the full upstream response.',
+    ('project',)))
+
+OVERHEAD_LATENCY = REGISTRY.register(Histogram(
+    'probeflex_overhead_seconds',
+    'Time ProbeFlex spends handling a probe outside the upstream call.',
+    ('project',)))
+
+GOVERNOR_WAIT = REGISTRY.register(Histogram(
+    'probeflex_governor_wait_seconds',
+    'Time probes queued for the per-host rate and concurrency governor.',
+    ('project',)))
+
+PROBE_TIMEOUTS_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probe_timeouts_total',
+    'Probe attempts that timed out, by project and phase (connect, read or total deadline).',
+    ('project', 'phase')))
+
+PROBE_BUDGET_USED = REGISTRY.register(Histogram(
+    'probeflex_probe_budget_used_ratio',
+    'Fraction of its total deadline a completed probe attempt used.',
+    ('project',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)))
+
+PROBE_RETRIES_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probe_retries_total',
+    'Probe attempts retried under a retry policy, by project and reason (status code or exception class).',
+    ('project', 'reason')))
+
+PROBE_HEDGES_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probe_hedges_total',
+    'Hedged duplicate probes sent, by project and whether the duplicate answered first.',
+    ('project', 'outcome')))
+
+PROBES_COALESCED_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probes_coalesced_total',
+    'Probes answered by an identical in-flight probe instead of their own upstream call, '
+    'by project and whether that probe ran in this process (local) or another one (shared).',
+    ('project', 'scope')))
+
+PROBE_UPLOAD_BYTES_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probe_upload_bytes_total',
+    'Bytes of streamed request bodies (multipart and file uploads) sent by probe attempts.',
+    ('project',)))
+
+PROBE_UPLOAD_THROUGHPUT = REGISTRY.register(Histogram(
+    'probeflex_probe_upload_throughput_bytes_per_second',
+    'Rate at which probe attempts sent their streamed request bodies.',
+    ('project',),
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 4 * 1024 ** 2, 16 * 1024 ** 2, 64 * 1024 ** 2,
+             256 * 1024 ** 2, 1024 ** 3)))
+
+PROBE_RESPONSE_BYTES_TOTAL = REGISTRY.register(Counter(
+    'probeflex_probe_response_bytes_total',
+    'Response body bytes read by probe attempts, as received (wire) and after content decoding (decoded).',
+    ('project', 'stage')))
+
+PROBE_DECOMPRESSION_TIME = REGISTRY.register(Histogram(
+    'probeflex_probe_decompression_seconds',
+    'Time probe attempts spent decompressing response bodies, by content encoding.',
+    ('encoding',)))
+
+HISTORY_WRITE_LATENCY = REGISTRY.register(Histogram(
+    'probeflex_history_write_seconds',
+    'Time taken to write one RequestHistory row.'))
+
+POOL_WORKERS = REGISTRY.register(Gauge(
+    'probeflex_pool_workers',
+    'Worker threads currently allocated to collection runs.'))
+
+POOL_WORKERS_BUSY = REGISTRY.register(Gauge(
+    'probeflex_pool_workers_busy',
+    'Collection run worker threads currently executing a probe.'))
+
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'probeflex_run_queue_depth',
+    'Probes of active collection runs that have not started yet.'))
+
+ACTIVE_RUNS = REGISTRY.register(Gauge(
+    'probeflex_runs_active',
+    'Collection runs currently executing.'))
+
+
+def project_label(project_id):
+    """Label value for a probe's project; ad-hoc probes are grouped together."""
+    return str(project_id) if project_id else 'adhoc'
+
+
+def status_class(status_code):
+    """Collapse a status code into its class ('2xx', '4xx', ...)."""
+    return f"{status_code // 100}xx"
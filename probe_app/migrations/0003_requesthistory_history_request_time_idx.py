@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0002_apirequest_follow_redirects_apirequest_timeout_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='requesthistory',
+            index=models.Index(fields=['request', 'executed_at'], name='history_request_time_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-19 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0003_requesthistory_history_request_time_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requesthistory',
+            name='response_hash',
+            field=models.CharField(blank=True, default='', help_text='Fingerprint of the response status and canonical body', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='response_changed',
+            field=models.BooleanField(blank=True, help_text='Whether the response differs from the previous execution (empty for the first one)', null=True),
+        ),
+        migrations.AddField(
+            model_name='apirequest',
+            name='baseline',
+            field=models.ForeignKey(blank=True, help_text='History entry pinned as the reference response for diffs', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='baseline_for', to='probe_app.requesthistory'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.1 on 2026-10-19 15:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_FTS_TABLE = 'probe_app_historysearch_fts'
+
+# External-content FTS5 table kept in sync with the document table by triggers
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5(
+        document, content='probe_app_historysearchdocument', content_rowid='history_id')""",
+    f"""CREATE TRIGGER probe_app_historysearch_ai AFTER INSERT ON probe_app_historysearchdocument BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, document) VALUES (new.history_id, new.document);
+    END""",
+    f"""CREATE TRIGGER probe_app_historysearch_ad AFTER DELETE ON probe_app_historysearchdocument BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, document)
+        VALUES ('delete', old.history_id, old.document);
+    END""",
+    f"""CREATE TRIGGER probe_app_historysearch_au AFTER UPDATE ON probe_app_historysearchdocument BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, document)
+        VALUES ('delete', old.history_id, old.document);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, document) VALUES (new.history_id, new.document);
+    END""",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS probe_app_historysearch_au',
+    'DROP TRIGGER IF EXISTS probe_app_historysearch_ad',
+    'DROP TRIGGER IF EXISTS probe_app_historysearch_ai',
+    f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}',
+]
+
+POSTGRESQL_CREATE = [
+    """CREATE INDEX history_search_document_gin ON probe_app_historysearchdocument
+        USING gin (to_tsvector('simple', document))""",
+]
+
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS history_search_document_gin',
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                # Without FTS5, probe_app.search falls back to substring matching
+                return
+        statements = SQLITE_CREATE
+    elif vendor == 'postgresql':
+        statements = POSTGRESQL_CREATE
+    else:
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0004_history_response_fingerprint_and_baseline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorySearchDocument',
+            fields=[
+                ('history', models.OneToOneField(help_text="The history entry this document indexes", on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='probe_app.requesthistory')),
+                ('document', models.TextField(help_text='Searchable text of the execution')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HistoryBodyField',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(help_text="JSON path of the value, e.g. 'error.code' or 'items[].id'", max_length=255)),
+                ('value', models.CharField(help_text='Scalar value as text (JSON literal for numbers, booleans and null)', max_length=255)),
+                ('history', models.ForeignKey(help_text='The history entry whose response contains this value', on_delete=django.db.models.deletion.CASCADE, related_name='body_fields', to='probe_app.requesthistory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['path', 'value'], name='history_body_field_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:20
+
+from django.db import migrations
+
+
+# Expression indexes backing probe_app.usersearch
+USER_SEARCH_INDEXES = {
+    'probe_user_username_lower_idx': 'username',
+    'probe_user_email_lower_idx': 'email',
+}
+
+
+def create_user_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in ('sqlite', 'postgresql'):
+        return
+    # Prefix matches use LIKE on PostgreSQL, which needs pattern ops under non-C collations
+    opclass = ' text_pattern_ops' if vendor == 'postgresql' else ''
+    quote = schema_editor.quote_name
+    table = quote(apps.get_model('auth', 'User')._meta.db_table)
+    for name, column in USER_SEARCH_INDEXES.items():
+        schema_editor.execute(
+            f"CREATE INDEX {quote(name)} ON {table} (LOWER({quote(column)}){opclass})")
+
+
+def drop_user_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    for name in USER_SEARCH_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('probe_app', '0005_history_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_user_search_indexes, drop_user_search_indexes),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0006_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='host_limits',
+            field=models.JSONField(blank=True, default=dict, help_text='Per-host limits for probes, e.g. {"api.example.com": {"rate": 10, "burst": 20, "concurrency": 4}, "*": {"concurrency": 8}}'),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='queue_time',
+            field=models.FloatField(default=0, help_text='Time the request waited for the host governor before it was sent (in milliseconds)'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0007_project_host_limits_history_queue_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirequest',
+            name='retry_policy',
+            field=models.JSONField(blank=True, default=dict, help_text='Retries and hedging, e.g. {"max_attempts": 3, "backoff_ms": 200, "retry_on_status": [502, 503, 504], "hedge": "p95"} (empty: one attempt)'),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='attempts',
+            field=models.JSONField(blank=True, default=list, help_text='Every attempt made for this execution (retries and hedged duplicates) with its status, error and timing'),
+        ),
+    ]
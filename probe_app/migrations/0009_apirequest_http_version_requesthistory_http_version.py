@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-19 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0008_apirequest_retry_policy_requesthistory_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirequest',
+            name='http_version',
+            field=models.CharField(choices=[('1.1', 'HTTP/1.1'), ('2', 'HTTP/2'), ('prefer-2', 'HTTP/2 if the server supports it')], default='1.1', help_text='HTTP version to send the request with (HTTP/2 requires httpx[http2])', max_length=8),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='http_version',
+            field=models.CharField(blank=True, default='', help_text='HTTP version negotiated with the server (e.g., HTTP/1.1, HTTP/2)', max_length=16),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0009_apirequest_http_version_requesthistory_http_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requesthistory',
+            name='coalesced',
+            field=models.BooleanField(default=False, help_text='Whether the response came from an identical probe already in flight instead of an upstream call of its own'),
+        ),
+    ]
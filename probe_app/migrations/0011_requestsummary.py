@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-19 22:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0010_requesthistory_coalesced'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestSummary',
+            fields=[
+                ('request', models.OneToOneField(help_text='The API request this summary describes', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='probe_app.apirequest')),
+                ('last_status', models.IntegerField(blank=True, help_text='HTTP status code of the latest execution', null=True)),
+                ('last_response_time', models.FloatField(blank=True, help_text='Response time of the latest execution (in milliseconds)', null=True)),
+                ('last_response_hash', models.CharField(blank=True, default='', help_text='Response fingerprint of the latest execution', max_length=32)),
+                ('last_passed', models.BooleanField(blank=True, help_text='Whether the latest execution passed (a status below 400)', null=True)),
+                ('streak', models.PositiveIntegerField(default=0, help_text='Consecutive latest executions with the same outcome as the last one')),
+                ('p95_response_time', models.FloatField(blank=True, help_text='95th percentile of the recent response times (in milliseconds)', null=True)),
+                ('recent_response_times', models.JSONField(blank=True, default=list, help_text='Response times of the most recent executions, oldest first')),
+                ('last_run_at', models.DateTimeField(blank=True, help_text='When the latest execution ran', null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-19 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0011_requestsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='apirequest',
+            name='request_compression',
+            field=models.CharField(blank=True, default='', help_text='Compress the request body with gzip, deflate, br or zstd, optionally with a level (e.g. gzip:9); empty to send it uncompressed', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='response_size',
+            field=models.BigIntegerField(blank=True, help_text='Size of the response body after content decoding (in bytes)', null=True),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='response_wire_size',
+            field=models.BigIntegerField(blank=True, help_text='Size of the response body as received, before content decoding (in bytes)', null=True),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='response_encoding',
+            field=models.CharField(blank=True, default='', help_text='Content-Encoding of the response (e.g., gzip, br, zstd); empty if uncompressed', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='requesthistory',
+            name='decompression_time',
+            field=models.FloatField(blank=True, help_text='Time spent decompressing the response body (in milliseconds)', null=True),
+        ),
+    ]
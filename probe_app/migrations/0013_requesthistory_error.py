@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('probe_app', '0012_response_compression'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requesthistory',
+            name='error',
+            field=models.TextField(blank=True, default='', help_text='Why the execution got no response (connection error, timeout, cancellation); empty if it got one'),
+        ),
+    ]
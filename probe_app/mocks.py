@@ -0,0 +1,426 @@
+"""
+Mock server serving the recorded responses of a collection.
+
+Every saved request of the collection becomes a route: its method and the
+path of its URL, where segments written as ``{{name}}``, ``{name}`` or
+``:name`` match any value (``GET {{base_url}}/users/{{id}}`` answers
+``GET /users/42``). A route answers with the request's pinned baseline, or
+else its latest recorded response. Hand-written routes, from a JSON list of
+``{"method", "path", "status", "headers", "body", "latency_ms"}`` objects,
+are added on top and replace recorded routes with the same method and path.
+
+Routes are indexed in a trie of path segments (literal segments win over
+parameters) and every response is encoded once when the server starts, so
+answering a request is a dictionary walk and a write. Latency can be
+injected globally or per route, with random jitter.
+
+The routes can be served two ways:
+
+- ``MockApplication``, an ASGI application, for any ASGI server;
+- ``serve``, a small asyncio HTTP/1.1 server (keep-alive and pipelining)
+  that writes the precomputed bytes directly and can accept on one socket
+  from several processes (``manage.py probe_mock``).
+"""
+import asyncio
+import random
+import re
+import socket
+from http import HTTPStatus
+from urllib.parse import unquote, urlsplit
+
+from django.db.models import OuterRef, Subquery
+
+from .codec import dumps
+from .models import APIRequest, RequestHistory
+
+# A path segment matching any value: {{name}}, {name} or :name
+PARAMETER_SEGMENT = re.compile(r'^(?:\{\{\s*[\w.-]+\s*\}\}|\{[\w.-]+\}|:[\w.-]+)$')
+
+# A leading {{variable}} standing for the scheme and host
+HOST_VARIABLE = re.compile(r'^\{\{\s*[\w.-]+\s*\}\}')
+
+# Recorded headers that describe the recorded connection, not the response
+SKIPPED_HEADERS = frozenset({
+    'connection', 'keep-alive', 'transfer-encoding', 'content-length', 'content-encoding',
+    'date', 'server', 'proxy-connection', 'upgrade', 'trailer', 'te',
+})
+
+# Longest request head the built-in server accepts
+MAX_HEAD_SIZE = 64 * 1024
+
+
+def route_path(url):
+    """The path of a saved request URL, with a leading {{host}} variable removed."""
+    url = HOST_VARIABLE.sub('', url.strip())
+    if '://' in url:
+        url = urlsplit(url).path
+    path = url.split('?', 1)[0].split('#', 1)[0]
+    return '/' + path.strip('/')
+
+
+def _segments(path):
+    return [unquote(segment) for segment in path.strip('/').split('/') if segment]
+
+
+class MockResponse:
+    """A response with its wire encodings computed up front."""
+
+    __slots__ = ('status', 'headers', 'body', 'latency_ms', 'source', 'asgi_headers', '_wire')
+
+    def __init__(self, status, headers, body, latency_ms=None, source=''):
+        self.status = status
+        self.headers = headers  # [(name, value)] without Content-Length
+        self.body = body
+        self.latency_ms = latency_ms  # None uses the server's latency
+        self.source = source
+        self.asgi_headers = [(name.lower().encode('latin-1', 'replace'),
+                              value.encode('latin-1', 'replace')) for name, value in headers]
+        self.asgi_headers.append((b'content-length', str(len(body)).encode('ascii')))
+        # HTTP/1.1 bytes indexed by (head request, close connection)
+        self._wire = {(head, close): self._encode(head, close)
+                      for head in (False, True) for close in (False, True)}
+
+    def _encode(self, head, close):
+        try:
+            reason = HTTPStatus(self.status).phrase
+        except ValueError:
+            reason = ''
+        lines = [f"HTTP/1.1 {self.status} {reason}"]
+        lines.extend(f"{name}: {value}" for name, value in self.headers)
+        lines.append(f"Content-Length: {len(self.body)}")
+        lines.append('Connection: close' if close else 'Connection: keep-alive')
+        encoded = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1', 'replace')
+        return encoded if head else encoded + self.body
+
+    def wire(self, head=False, close=False):
+        return self._wire[head, close]
+
+
+def json_response(status, document, headers=()):
+    return MockResponse(status, [('Content-Type', 'application/json'), *headers], dumps(document))
+
+
+class _Node:
+    __slots__ = ('children', 'parameter', 'responses')
+
+    def __init__(self):
+        self.children = {}
+        self.parameter = None
+        self.responses = {}
+
+
+class RouteTrie:
+    """Routes indexed by path segment; literal segments are preferred over parameters."""
+
+    def __init__(self):
+        self._root = _Node()
+        self.count = 0
+
+    def add(self, method, path, response):
+        node = self._root
+        for segment in _segments(path):
+            if PARAMETER_SEGMENT.match(segment):
+                if node.parameter is None:
+                    node.parameter = _Node()
+                node = node.parameter
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if method.upper() not in node.responses:
+            self.count += 1
+        node.responses[method.upper()] = response
+
+    def _find(self, node, segments, index):
+        if index == len(segments):
+            return node if node.responses else None
+        child = node.children.get(segments[index])
+        if child is not None:
+            found = self._find(child, segments, index + 1)
+            if found is not None:
+                return found
+        if node.parameter is not None:
+            return self._find(node.parameter, segments, index + 1)
+        return None
+
+    def match(self, method, path):
+        """
+        The response for a request.
+
+        Returns:
+            (response, allowed) where response is None when no route matches;
+            allowed lists the methods of a path that exists but not for
+            ``method`` (empty when the path does not exist)
+        """
+        node = self._find(self._root, _segments(path), 0)
+        if node is None:
+            return None, []
+        response = node.responses.get(method)
+        if response is None and method == 'HEAD':
+            response = node.responses.get('GET')
+        if response is None:
+            return None, sorted(node.responses)
+        return response, []
+
+    def routes(self):
+        """(method, path template, response) of every route, depth first."""
+        stack = [(self._root, '')]
+        while stack:
+            node, path = stack.pop()
+            for method, response in sorted(node.responses.items()):
+                yield method, path or '/', response
+            if node.parameter is not None:
+                stack.append((node.parameter, f"{path}/{{param}}"))
+            for segment, child in sorted(node.children.items(), reverse=True):
+                stack.append((child, f"{path}/{segment}"))
+
+
+def recorded_response(history):
+    """A MockResponse replaying one RequestHistory entry."""
+    headers = [(name, str(value)) for name, value in (history.response_headers or {}).items()
+               if name.lower() not in SKIPPED_HEADERS]
+    content_type = next((value for name, value in headers if name.lower() == 'content-type'), '')
+    body = history.response_body
+    if body is None:
+        encoded = b''
+    elif isinstance(body, str) and 'json' not in content_type.lower():
+        encoded = body.encode('utf-8')
+    else:
+        encoded = dumps(body)
+        if not content_type:
+            headers.append(('Content-Type', 'application/json'))
+    return MockResponse(history.response_status, headers, encoded,
+                        source=f"history {history.id}")
+
+
+def handwritten_response(spec):
+    """
+    A MockResponse from a hand-written route.
+
+    Raises:
+        ValueError: If the route is malformed
+    """
+    if not isinstance(spec, dict) or not spec.get('path'):
+        raise ValueError('Every mock route needs a "path"')
+    status = spec.get('status', 200)
+    if not isinstance(status, int) or not 100 <= status <= 599:
+        raise ValueError(f"Invalid status for {spec['path']}: {status!r}")
+    headers = spec.get('headers') or {}
+    if not isinstance(headers, dict):
+        raise ValueError(f"Headers of {spec['path']} must be an object")
+    headers = [(str(name), str(value)) for name, value in headers.items()
+               if name.lower() not in SKIPPED_HEADERS]
+    body = spec.get('body')
+    if body is None:
+        encoded = b''
+    elif isinstance(body, str):
+        encoded = body.encode('utf-8')
+        if not any(name.lower() == 'content-type' for name, _ in headers):
+            headers.append(('Content-Type', 'text/plain; charset=utf-8'))
+    else:
+        encoded = dumps(body)
+        if not any(name.lower() == 'content-type' for name, _ in headers):
+            headers.append(('Content-Type', 'application/json'))
+    latency = spec.get('latency_ms')
+    if latency is not None and (not isinstance(latency, (int, float)) or latency < 0):
+        raise ValueError(f"Invalid latency_ms for {spec['path']}: {latency!r}")
+    return MockResponse(status, headers, encoded, latency_ms=latency, source='hand-written')
+
+
+def build_routes(collection=None, handwritten=()):
+    """
+    Index the recorded responses of ``collection`` and the ``handwritten`` routes.
+
+    Returns:
+        (trie, skipped) where skipped lists the saved requests that have no
+        recorded response
+
+    Raises:
+        ValueError: If a hand-written route is malformed
+    """
+    trie = RouteTrie()
+    skipped = []
+    if collection is not None:
+        latest = (RequestHistory.objects
+                  .filter(request=OuterRef('pk'), response_status__isnull=False)
+                  .order_by('-executed_at', '-id').values('id')[:1])
+        api_requests = list(APIRequest.objects.filter(collection=collection)
+                            .annotate(latest_history_id=Subquery(latest)).order_by('id'))
+        history_ids = {api_request.baseline_id or api_request.latest_history_id
+                       for api_request in api_requests} - {None}
+        histories = RequestHistory.objects.in_bulk(history_ids)
+        for api_request in api_requests:
+            history = histories.get(api_request.baseline_id or api_request.latest_history_id)
+            if history is None or history.response_status is None:
+                skipped.append(api_request)
+                continue
+            trie.add(api_request.method, route_path(api_request.url), recorded_response(history))
+    for spec in handwritten:
+        response = handwritten_response(spec)
+        trie.add(spec.get('method', 'GET'), spec['path'], response)
+    return trie, skipped
+
+
+class MockServerConfig:
+    """Routes plus the latency injected before every response (milliseconds)."""
+
+    def __init__(self, routes, latency_ms=0, jitter_ms=0):
+        self.routes = routes
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def delay(self, response):
+        """Seconds to wait before sending ``response``."""
+        latency = self.latency_ms if response.latency_ms is None else response.latency_ms
+        if self.jitter_ms:
+            latency += random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, latency) / 1000
+
+    def respond(self, method, target):
+        """The response to a request, including 404 and 405 answers."""
+        path = target.split('?', 1)[0]
+        response, allowed = self.routes.match(method, path)
+        if response is not None:
+            return response
+        if allowed:
+            return json_response(405, {'error': f"{method} is not mocked for {path}"},
+                                 [('Allow', ', '.join(allowed))])
+        return json_response(404, {'error': f"No mock route for {method} {path}"})
+
+
+class MockApplication:
+    """ASGI application answering HTTP requests from a MockServerConfig."""
+
+    def __init__(self, config):
+        self.config = config
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        response = self.config.respond(scope['method'], scope['path'])
+        delay = self.config.delay(response)
+        if delay:
+            await asyncio.sleep(delay)
+        await send({'type': 'http.response.start', 'status': response.status,
+                    'headers': response.asgi_headers})
+        await send({'type': 'http.response.body',
+                    'body': b'' if scope['method'] == 'HEAD' else response.body})
+
+
+class _MockProtocol(asyncio.Protocol):
+    """
+    One HTTP/1.1 connection of the built-in server.
+
+    Pipelined requests are answered in order: a delayed response holds back
+    the ones behind it.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.transport = None
+        self.buffer = bytearray()
+        self.discard = 0  # Request body bytes still to skip
+        self.ready_at = 0.0  # When the last scheduled response is written
+        self.closing = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+        sock = transport.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+    def data_received(self, data):
+        if self.discard:
+            skipped = min(self.discard, len(data))
+            self.discard -= skipped
+            data = data[skipped:]
+        self.buffer += data
+        while not self.closing:
+            end = self.buffer.find(b'\r\n\r\n')
+            if end < 0:
+                if len(self.buffer) > MAX_HEAD_SIZE:
+                    self._reply(json_response(431, {'error': 'Request head too large'}), True, False)
+                return
+            head = bytes(self.buffer[:end]).decode('latin-1')
+            del self.buffer[:end + 4]
+            self._handle(head)
+
+    def _handle(self, head):
+        lines = head.split('\r\n')
+        parts = lines[0].split(' ')
+        if len(parts) != 3:
+            self._reply(json_response(400, {'error': 'Malformed request line'}), True, False)
+            return
+        method, target, version = parts
+        close = version == 'HTTP/1.0'
+        length = 0
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value.strip()) if value.strip().isdigit() else 0
+            elif name == 'connection':
+                value = value.strip().lower()
+                close = value == 'close' or (close and value != 'keep-alive')
+            elif name == 'transfer-encoding' and 'chunked' in value.lower():
+                self._reply(json_response(411, {'error': 'Chunked request bodies are not supported'}),
+                            True, False)
+                return
+        if length:
+            skipped = min(length, len(self.buffer))
+            del self.buffer[:skipped]
+            self.discard = length - skipped
+        if '://' in target:
+            target = urlsplit(target).path or '/'  # Absolute-form (proxy) targets
+        response = self.config.respond(method, target)
+        self._reply(response, close, method == 'HEAD')
+
+    def _reply(self, response, close, head):
+        if close:
+            self.closing = True
+        data = response.wire(head, close)
+        delay = self.config.delay(response)
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if not delay and self.ready_at <= now:
+            self._write(data, close)
+            return
+        self.ready_at = max(now + delay, self.ready_at)
+        loop.call_at(self.ready_at, self._write, data, close)
+
+    def _write(self, data, close):
+        if self.transport is None:
+            return
+        self.transport.write(data)
+        if close:
+            self.transport.close()
+
+
+def listen(host='127.0.0.1', port=0, backlog=4096):
+    """A listening socket to pass to ``serve`` (in one or several processes)."""
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def serve(config, sock):
+    """Serve ``config`` on a listening socket with the built-in server until interrupted."""
+    async def main():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: _MockProtocol(config), sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -1,9 +1,14 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.utils import timezone
 import json
 import uuid
 
+from .compression import validate_compression
+from .governor import validate_limits
+from .retries import validate_retry_policy
+
 class Team(models.Model):
     """
     Team model for collaborative API testing.
@@ -40,6 +45,15 @@ class Project(models.Model):
     # Many-to-many relationship: projects can be shared with multiple teams
     teams = models.ManyToManyField(Team, related_name='projects', blank=True,
                                   help_text="Teams that have access to this project")
+    # Outbound probe limits per destination host, enforced by probe_app.governor
+    host_limits = models.JSONField(default=dict, blank=True,
+                                   help_text='Per-host limits for probes, e.g. {"api.example.com": {"rate": 10, "burst": 20, "concurrency": 4}, "*": {"concurrency": 8}}')
+    
+    def clean(self):
+        try:
+            self.host_limits = validate_limits(self.host_limits or {})
+        except ValueError as e:
+            raise ValidationError({'host_limits': str(e)})
     
     def __str__(self):
         return self.name
@@ -108,6 +122,13 @@ class APIRequest(models.Model):
         ('OPTIONS', 'OPTIONS'),
     )
     
+    # Choices for the HTTP protocol version probes are sent with
+    HTTP_VERSIONS = (
+        ('1.1', 'HTTP/1.1'),
+        ('2', 'HTTP/2'),
+        ('prefer-2', 'HTTP/2 if the server supports it'),
+    )
+    
     name = models.CharField(max_length=100, help_text="A descriptive name for this API request")
     description = models.TextField(blank=True, null=True, help_text="Optional description explaining what this API does")
     url = models.TextField(help_text="The complete URL or URL template for the API endpoint")
@@ -124,12 +145,32 @@ class APIRequest(models.Model):
     timeout = models.IntegerField(default=30000, help_text="Request timeout in milliseconds")
     follow_redirects = models.BooleanField(default=True, help_text="Whether to automatically follow HTTP redirects")
     verify_ssl = models.BooleanField(default=True, help_text="Whether to verify SSL certificates for HTTPS requests")
+    http_version = models.CharField(max_length=8, choices=HTTP_VERSIONS, default='1.1',
+                                    help_text="HTTP version to send the request with (HTTP/2 requires httpx[http2])")
+    retry_policy = models.JSONField(default=dict, blank=True,
+                                    help_text='Retries and hedging, e.g. {"max_attempts": 3, "backoff_ms": 200, "retry_on_status": [502, 503, 504], "hedge": "p95"} (empty: one attempt)')
+    request_compression = models.CharField(max_length=16, blank=True, default='',
+                                           help_text="Compress the request body with gzip, deflate, br or zstd, optionally with a level (e.g. gzip:9); empty to send it uncompressed")
     # Timestamp fields for tracking when the request was created and modified
     created_at = models.DateTimeField(auto_now_add=True, help_text="Timestamp when this API request was created")
     updated_at = models.DateTimeField(auto_now=True, help_text="Timestamp when this API request was last modified")
     # Foreign key: each API request belongs to exactly one collection
     collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='requests',
                                   help_text="The collection that contains this API request")
+    # Pinned history entry that new executions are compared against
+    baseline = models.ForeignKey('RequestHistory', on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='baseline_for',
+                                help_text="History entry pinned as the reference response for diffs")
+    
+    def clean(self):
+        try:
+            self.retry_policy = validate_retry_policy(self.retry_policy or {})
+        except ValueError as e:
+            raise ValidationError({'retry_policy': str(e)})
+        try:
+            self.request_compression = validate_compression(self.request_compression)
+        except ValueError as e:
+            raise ValidationError({'request_compression': str(e)})
     
     def __str__(self):
         return f"{self.method} {self.name}"
@@ -160,6 +201,27 @@ class RequestHistory(models.Model):
     response_headers = models.JSONField(default=dict, blank=True, null=True, help_text="HTTP headers received in the response")
     response_body = models.JSONField(default=dict, blank=True, null=True, help_text="Response body content (JSON or text)")
     response_time = models.FloatField(default=0, help_text="Time taken for the request to complete (in milliseconds)")
+    queue_time = models.FloatField(default=0, help_text="Time the request waited for the host governor before it was sent (in milliseconds)")
+    http_version = models.CharField(max_length=16, blank=True, default='',
+                                    help_text="HTTP version negotiated with the server (e.g., HTTP/1.1, HTTP/2)")
+    attempts = models.JSONField(default=list, blank=True,
+                                help_text="Every attempt made for this execution (retries and hedged duplicates) with its status, error and timing")
+    error = models.TextField(blank=True, default='',
+                             help_text="Why the execution got no response (connection error, timeout, cancellation); empty if it got one")
+    response_size = models.BigIntegerField(null=True, blank=True,
+                                           help_text="Size of the response body after content decoding (in bytes)")
+    response_wire_size = models.BigIntegerField(null=True, blank=True,
+                                                help_text="Size of the response body as received, before content decoding (in bytes)")
+    response_encoding = models.CharField(max_length=32, blank=True, default='',
+                                         help_text="Content-Encoding of the response (e.g., gzip, br, zstd); empty if uncompressed")
+    decompression_time = models.FloatField(null=True, blank=True,
+                                           help_text="Time spent decompressing the response body (in milliseconds)")
+    coalesced = models.BooleanField(default=False,
+                                    help_text="Whether the response came from an identical probe already in flight instead of an upstream call of its own")
+    response_hash = models.CharField(max_length=32, blank=True, default='',
+                                     help_text="Fingerprint of the response status and canonical body")
+    response_changed = models.BooleanField(null=True, blank=True,
+                                           help_text="Whether the response differs from the previous execution (empty for the first one)")
     
     # Execution metadata
     executed_at = models.DateTimeField(default=timezone.now, help_text="Timestamp when this request was executed")
@@ -169,6 +231,86 @@ class RequestHistory(models.Model):
     class Meta:
         ordering = ['-executed_at']  # Show most recent executions first
         verbose_name_plural = "Request histories"
+        indexes = [
+            # Supports per-request history listings and time-ranged exports
+            models.Index(fields=['request', 'executed_at'], name='history_request_time_idx'),
+        ]
     
     def __str__(self):
         return f"{self.method} {self.url} - {self.response_status}"
+
+
+class RequestSummary(models.Model):
+    """
+    Latest results of one API request, kept up to date on every execution.
+    
+    A denormalized digest of the request's history (last status and latency,
+    rolling p95, pass/fail streak) so that pages and API listings can show
+    the health of many requests with one query, however long their history
+    grows. Maintained by probe_app.summaries; rebuild it from the history
+    with the rebuild_request_summaries command.
+    """
+    # One summary per request, sharing the request's primary key
+    request = models.OneToOneField(APIRequest, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='summary',
+                                   help_text="The API request this summary describes")
+    last_status = models.IntegerField(null=True, blank=True, help_text="HTTP status code of the latest execution")
+    last_response_time = models.FloatField(null=True, blank=True,
+                                           help_text="Response time of the latest execution (in milliseconds)")
+    last_response_hash = models.CharField(max_length=32, blank=True, default='',
+                                          help_text="Response fingerprint of the latest execution")
+    last_passed = models.BooleanField(null=True, blank=True,
+                                      help_text="Whether the latest execution passed (a status below 400)")
+    streak = models.PositiveIntegerField(default=0,
+                                         help_text="Consecutive latest executions with the same outcome as the last one")
+    p95_response_time = models.FloatField(null=True, blank=True,
+                                          help_text="95th percentile of the recent response times (in milliseconds)")
+    recent_response_times = models.JSONField(default=list, blank=True,
+                                             help_text="Response times of the most recent executions, oldest first")
+    last_run_at = models.DateTimeField(null=True, blank=True, help_text="When the latest execution ran")
+    
+    def __str__(self):
+        return f"Summary of request {self.request_id}"
+
+
+class HistorySearchDocument(models.Model):
+    """
+    Full-text search document for one RequestHistory entry.
+    
+    Holds the searchable text of an execution (URL, response header values and
+    the string content of the response body). The document itself is plain
+    text; the full-text index over it is database specific (an FTS5 table on
+    SQLite, a GIN index on a tsvector expression on PostgreSQL) and is created
+    by the migration that adds this model. See probe_app.search.
+    """
+    # One document per execution, sharing the history entry's primary key
+    history = models.OneToOneField(RequestHistory, on_delete=models.CASCADE, primary_key=True,
+                                   related_name='search_document',
+                                   help_text="The history entry this document indexes")
+    document = models.TextField(help_text="Searchable text of the execution")
+    
+    def __str__(self):
+        return f"Search document for history {self.history_id}"
+
+
+class HistoryBodyField(models.Model):
+    """
+    One indexed scalar value of a response body, addressed by its JSON path.
+    
+    Enables queries such as "every response where error.code is RATE_LIMITED"
+    through the (path, value) index instead of scanning JSON blobs. Array
+    indices are collapsed ("items[].id"), so a row matches when any element
+    has the value.
+    """
+    history = models.ForeignKey(RequestHistory, on_delete=models.CASCADE, related_name='body_fields',
+                                help_text="The history entry whose response contains this value")
+    path = models.CharField(max_length=255, help_text="JSON path of the value, e.g. 'error.code' or 'items[].id'")
+    value = models.CharField(max_length=255, help_text="Scalar value as text (JSON literal for numbers, booleans and null)")
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['path', 'value'], name='history_body_field_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.path} = {self.value}"
@@ -0,0 +1,130 @@
+"""
+Process-pool offloading of CPU-bound response handling.
+
+Decoding and validating a multi-megabyte response body holds the GIL for
+hundreds of milliseconds, stalling every other probe served by the same
+worker process. Bodies of at least ``PROBEFLEX_OFFLOAD_THRESHOLD`` bytes are
+therefore handed to a pool of helper processes: the raw bytes are copied once
+into a shared memory segment and only the segment name crosses the process
+boundary, so nothing large is pickled on the way in.
+
+Results must stay small too: unpickling a parsed document costs about as much
+as parsing it again. Tasks therefore return compact answers (is this valid
+JSON and its fingerprint, the decoded text of a non-JSON body) and valid JSON
+stays as raw bytes in a ``RawJSON`` wrapper that is only parsed in-process if
+something really needs the Python objects.
+
+Below the threshold, or with ``PROBEFLEX_OFFLOAD_WORKERS = 0``, tasks run
+inline in the calling thread.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+
+import requests
+from django.conf import settings
+
+from .codec import RawJSON, decode_json, fingerprint_json
+
+
+# Bodies of at least this many bytes are handled in the process pool
+OFFLOAD_THRESHOLD = getattr(settings, 'PROBEFLEX_OFFLOAD_THRESHOLD', 1024 * 1024)
+
+# Number of helper processes (0 disables offloading)
+OFFLOAD_WORKERS = getattr(settings, 'PROBEFLEX_OFFLOAD_WORKERS', min(4, os.cpu_count() or 1))
+
+
+def inspect_body(buffer, encoding=None):
+    """
+    Classify a response body the way ``requests`` would decode it.
+
+    Returns ``('json', encoding, fingerprint)`` when the body is valid JSON,
+    otherwise ``('text', decoded_text, None)``. Only the decision and the
+    document's canonical fingerprint cross back from the pool, never the
+    parsed document.
+    """
+    json_encoding = encoding or requests.utils.guess_json_utf(bytes(buffer[:4])) or 'utf-8'
+    try:
+        document = decode_json(buffer, json_encoding)
+    except ValueError:
+        pass
+    else:
+        return 'json', json_encoding, fingerprint_json(document)
+    if encoding is None:
+        encoding = requests.compat.chardet.detect(bytes(buffer))['encoding'] or 'utf-8'
+    return 'text', str(buffer, encoding, errors='replace'), None
+
+
+def _call_shared(function, name, size, args):
+    """Pool-side trampoline: attach to the shared segment and run ``function`` on it."""
+    segment = SharedMemory(name=name)
+    try:
+        with segment.buf[:size] as buffer:
+            return function(buffer, *args)
+    finally:
+        segment.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Never fork: the web server process is multi-threaded
+            _pool = ProcessPoolExecutor(max_workers=OFFLOAD_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+
+
+def run_offloaded(function, content, *args):
+    """
+    Run ``function(buffer, *args)`` on ``content``, in the pool if it is large.
+
+    ``function`` must be a module-level callable (it is sent to the pool by
+    reference) and must not keep ``buffer`` beyond the call. If the pool is
+    unavailable the call falls back to running inline.
+    """
+    if not OFFLOAD_WORKERS or len(content) < OFFLOAD_THRESHOLD:
+        with memoryview(content) as buffer:
+            return function(buffer, *args)
+
+    segment = SharedMemory(create=True, size=len(content))
+    try:
+        segment.buf[:len(content)] = content
+        pool = _get_pool()
+        try:
+            return pool.submit(_call_shared, function, segment.name, len(content), args).result()
+        except BrokenProcessPool:
+            _reset_pool(pool)
+    finally:
+        segment.close()
+        segment.unlink()
+
+    with memoryview(content) as buffer:
+        return function(buffer, *args)
+
+
+def decode_body(content, encoding=None):
+    """
+    Decode a large response body without parsing it in this process.
+
+    Valid JSON comes back as ``RawJSON``; anything else as decoded text.
+    ``encoding`` is the charset declared by the response, if any.
+    """
+    kind, value, fingerprint = run_offloaded(inspect_body, content, encoding)
+    return RawJSON(content, value, fingerprint) if kind == 'json' else value
@@ -0,0 +1,317 @@
+"""
+Retry policies and hedged requests for probes.
+
+A saved API request can carry a retry policy (``APIRequest.retry_policy``)::
+
+    {
+        "max_attempts": 3,
+        "backoff_ms": 200,
+        "max_backoff_ms": 5000,
+        "jitter": true,
+        "retry_on_status": [429, 502, 503, 504],
+        "retry_on_errors": ["connection", "timeout"],
+        "hedge": "p95"
+    }
+
+Failed attempts are retried with exponential backoff (``backoff_ms`` doubled
+per attempt, capped at ``max_backoff_ms``, "full jitter" when ``jitter`` is
+set). A ``Retry-After`` header longer than the backoff is honoured; one longer
+than ``max_backoff_ms`` ends the retries with that response.
+
+``hedge`` sends a duplicate of an idempotent probe when the first one has not
+answered within a delay, and keeps whichever answer comes first: ``"p95"``
+uses the 95th percentile of the request's recent response times, a number is
+a fixed delay in milliseconds. The duplicate uses a fresh connection. The
+slower request is cancelled once the other answers, but its upstream has
+usually received it already.
+
+Every attempt, including cancelled ones, is returned as a list of dictionaries
+that ``record_history`` stores in ``RequestHistory.attempts``.
+"""
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .deadlines import Cancellation, ProbeCancelled, pause
+
+
+# Upper bound for max_attempts in a policy
+MAX_ATTEMPTS = 10
+
+# Status codes and error kinds retried when a policy does not list its own
+DEFAULT_RETRY_STATUSES = (429, 502, 503, 504)
+DEFAULT_RETRY_ERRORS = ('connection', 'timeout')
+
+# Exception classes behind the error kinds a policy can name
+RETRY_ERROR_KINDS = {
+    'connection': requests.ConnectionError,
+    'timeout': requests.Timeout,
+    'chunked': requests.exceptions.ChunkedEncodingError,
+    'any': requests.RequestException,
+}
+
+# Methods safe to send twice
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Recent executions used for the "p95" hedge delay (at most PROBEFLEX_SUMMARY_WINDOW), and the
+# fewest that make it meaningful
+HEDGE_SAMPLE_SIZE = 100
+HEDGE_MIN_SAMPLES = 20
+
+# Seconds the p95 hedge delay of a request is cached
+HEDGE_DELAY_CACHE_TTL = 60
+
+# Threads running hedged attempts (shared by all probes in the process)
+HEDGE_WORKERS = getattr(settings, 'PROBEFLEX_HEDGE_WORKERS', 32)
+
+_POLICY_KEYS = {'max_attempts', 'backoff_ms', 'max_backoff_ms', 'jitter',
+                'retry_on_status', 'retry_on_errors', 'hedge'}
+
+
+def validate_retry_policy(policy):
+    """
+    Check a retry policy and return it with defaults filled in.
+
+    An empty policy means a single attempt without hedging.
+
+    Raises:
+        ValueError: If the policy is malformed
+    """
+    if not isinstance(policy, dict):
+        raise ValueError('The retry policy must be an object')
+    if not policy:
+        return {}
+    unknown = set(policy) - _POLICY_KEYS
+    if unknown:
+        raise ValueError(f"Unknown retry policy settings: {', '.join(sorted(unknown))}")
+    try:
+        normalized = {
+            'max_attempts': int(policy.get('max_attempts', 1)),
+            'backoff_ms': float(policy.get('backoff_ms', 200)),
+            'max_backoff_ms': float(policy.get('max_backoff_ms', 5000)),
+            'jitter': bool(policy.get('jitter', True)),
+            'retry_on_status': sorted({int(code) for code in
+                                       policy.get('retry_on_status', DEFAULT_RETRY_STATUSES)}),
+            'retry_on_errors': list(policy.get('retry_on_errors', DEFAULT_RETRY_ERRORS)),
+        }
+    except (TypeError, ValueError):
+        raise ValueError('Retry policy values must be numbers (retry_on_status a list of status codes)')
+    if not 1 <= normalized['max_attempts'] <= MAX_ATTEMPTS:
+        raise ValueError(f"max_attempts must be between 1 and {MAX_ATTEMPTS}")
+    if normalized['backoff_ms'] < 0 or normalized['max_backoff_ms'] < 0:
+        raise ValueError('Backoff durations cannot be negative')
+    unknown_errors = set(normalized['retry_on_errors']) - set(RETRY_ERROR_KINDS)
+    if unknown_errors:
+        raise ValueError(f"Unknown error kinds: {', '.join(sorted(map(str, unknown_errors)))} "
+                         f"(expected {', '.join(RETRY_ERROR_KINDS)})")
+
+    hedge = policy.get('hedge', False)
+    if hedge not in (False, None, 'p95'):
+        try:
+            hedge = float(hedge)
+        except (TypeError, ValueError):
+            raise ValueError("hedge must be false, 'p95' or a delay in milliseconds")
+        if hedge <= 0:
+            raise ValueError('The hedge delay must be positive')
+    normalized['hedge'] = hedge or False
+    return normalized
+
+
+def hedge_delay(policy, method, api_request_id=None):
+    """
+    Seconds to wait before hedging a probe, or None when it is not hedged.
+
+    Non-idempotent methods are never hedged; "p95" needs enough recent
+    executions of the saved request.
+    """
+    hedge = policy.get('hedge')
+    if not hedge or method not in IDEMPOTENT_METHODS:
+        return None
+    if hedge != 'p95':
+        return hedge / 1000
+    if not api_request_id:
+        return None
+
+    cache_key = f"probeflex:hedge-p95:{api_request_id}"
+    delay = cache.get(cache_key)
+    if delay is None:
+        from .models import RequestSummary  # models import this module for validation
+        from .summaries import percentile
+        times = (RequestSummary.objects.filter(request_id=api_request_id)
+                 .values_list('recent_response_times', flat=True).first() or [])[-HEDGE_SAMPLE_SIZE:]
+        # Cache "no delay" as 0 so requests with few executions are not looked up on every probe
+        delay = percentile(times, 0.95) / 1000 if len(times) >= HEDGE_MIN_SAMPLES else 0
+        cache.set(cache_key, delay, HEDGE_DELAY_CACHE_TTL)
+    return delay or None
+
+
+def _retry_after(response):
+    """Seconds requested by a Retry-After header, or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(policy, attempt):
+    """Backoff in seconds before retry number ``attempt`` (1 for the first retry)."""
+    ceiling = min(policy['max_backoff_ms'], policy['backoff_ms'] * 2 ** (attempt - 1)) / 1000
+    return random.uniform(0, ceiling) if policy['jitter'] else ceiling
+
+
+def _attempt_record(number, hedge, backoff, response=None, elapsed=None, queued=0.0, error=None):
+    return {
+        'attempt': number,
+        'hedge': hedge,
+        'status': response.status_code if response is not None else None,
+        'error': error,
+        'time': elapsed * 1000 if elapsed is not None else None,
+        'queue_time': queued * 1000,
+        'backoff': backoff * 1000,
+    }
+
+
+def _failed_attempt_record(number, hedge, backoff, error):
+    """The record of an attempt that raised ``error`` (timed by ``engine._send``)."""
+    elapsed, queued = getattr(error, 'timing', (None, 0.0))
+    return _attempt_record(number, hedge, backoff, elapsed=elapsed, queued=queued, error=str(error))
+
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS,
+                                             thread_name_prefix='probeflex-hedge')
+        return _hedge_pool
+
+
+def _hedged_send(send, delay, number, backoff, attempts):
+    """
+    Run ``send`` and, if it has not answered after ``delay`` seconds, a duplicate.
+
+    Returns the first successful answer and cancels the other request; if
+    both fail, the primary's error is raised. The attempts are appended to
+    ``attempts``.
+    """
+    pool = _get_hedge_pool()
+    races = [Cancellation()]
+    futures = [pool.submit(send, False, races[0])]
+    done, _ = wait(futures, timeout=delay)
+    if not done:
+        races.append(Cancellation())
+        futures.append(pool.submit(send, True, races[1]))
+
+    pending = set(futures)
+    winner = None
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in futures:
+            if future in done and future.exception() is None and winner is None:
+                winner = future
+
+    for future, race in zip(futures, races):
+        hedge = future is not futures[0]
+        attempt_backoff = backoff if not hedge else 0.0
+        if future is winner:
+            response, elapsed, queued = future.result()
+            attempts.append(_attempt_record(number, hedge, attempt_backoff, response, elapsed, queued))
+        elif future.done():
+            attempts.append(_failed_attempt_record(number, hedge, attempt_backoff,
+                                                   future.exception()))
+        else:
+            race.cancel()
+            attempts.append(_attempt_record(number, hedge, attempt_backoff,
+                                            error='cancelled: the other request answered first'))
+    if winner is None:
+        return futures[0].result()
+    return winner.result()
+
+
+def send_with_policy(send, policy, delay=None, on_retry=None, cancellation=None):
+    """
+    Perform a probe under a retry policy.
+
+    Args:
+        send: Callable ``send(hedge, race=None)`` performing one upstream
+            attempt and returning ``(response, elapsed_seconds, queued_seconds)``;
+            ``race`` is a Cancellation aborting the attempt when a hedged
+            duplicate answers first
+        policy: Normalized retry policy (see validate_retry_policy)
+        delay: Hedge delay in seconds, or None to never hedge
+        on_retry: Optional callable ``on_retry(reason)`` called before each retry
+        cancellation: Optional Cancellation of the whole probe, which also
+            cuts short the backoff between attempts
+
+    Returns:
+        (response, elapsed_seconds, queued_seconds, attempts) of the answer kept
+
+    Raises:
+        requests.RequestException: If the last attempt failed without a response,
+            or ProbeCancelled if the probe was cancelled; the error carries the
+            attempts made as ``attempts``
+    """
+    attempts = []
+    try:
+        return _send_attempts(send, policy, delay, on_retry, cancellation, attempts)
+    except Exception as e:
+        # The probe got no answer: keep its attempt log for the history entry
+        e.attempts = attempts
+        raise
+
+
+def _send_attempts(send, policy, delay, on_retry, cancellation, attempts):
+    """The attempts loop of ``send_with_policy``, appending to ``attempts``."""
+    max_attempts = policy.get('max_attempts', 1) if policy else 1
+    retry_errors = tuple(RETRY_ERROR_KINDS[kind] for kind in policy.get('retry_on_errors', ()))
+    retry_statuses = policy.get('retry_on_status', ())
+    backoff = 0.0
+
+    for number in range(1, max_attempts + 1):
+        try:
+            if delay is not None:
+                response, elapsed, queued = _hedged_send(send, delay, number, backoff, attempts)
+            else:
+                try:
+                    response, elapsed, queued = send(False)
+                except Exception as e:
+                    attempts.append(_failed_attempt_record(number, False, backoff, e))
+                    raise
+                attempts.append(_attempt_record(number, False, backoff, response, elapsed, queued))
+        except retry_errors as e:
+            if number == max_attempts or isinstance(e, ProbeCancelled):
+                raise
+            reason = type(e).__name__
+            requested = None
+        else:
+            if number == max_attempts or response.status_code not in retry_statuses:
+                return response, elapsed, queued, attempts
+            reason = str(response.status_code)
+            requested = _retry_after(response)
+
+        backoff = _backoff(policy, number)
+        if requested is not None:
+            if requested * 1000 > policy['max_backoff_ms']:
+                # The upstream asks for a longer pause than the policy allows: stop here
+                return response, elapsed, queued, attempts
+            backoff = max(backoff, requested)
+        if on_retry:
+            on_retry(reason)
+        pause(backoff, [cancellation])
@@ -0,0 +1,307 @@
+"""
+Collection runs with a live progress channel.
+
+A run executes every APIRequest of a collection (optionally several times and
+with several concurrent workers) in a background thread. Progress counters,
+a live latency histogram and compact per-request results are published
+through Server-Sent Events.
+
+Updates are coalesced server-side: instead of one message per probe, each
+subscriber receives at most one frame per ``SSE_FRAME_INTERVAL`` containing
+the current counters plus the newest results since its previous frame (capped
+at ``MAX_RESULTS_PER_FRAME``). A run doing thousands of requests per second
+therefore costs the browser a few small messages per second.
+
+Runs live in the memory of the process that started them, so the event stream
+must be served by the same worker process that accepted the run.
+"""
+import asyncio
+import threading
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .codec import dumps
+from .deadlines import Cancellation
+from .engine import (probe_data_from_api_request, prepare_probe, execute_probe, record_failure,
+                     record_history)
+from .metrics import (
+    ACTIVE_RUNS, OVERHEAD_LATENCY, POOL_WORKERS, POOL_WORKERS_BUSY, QUEUE_DEPTH, project_label,
+)
+from .stats import LatencyHistogram
+from .transports import ProbeSession
+
+
+# Minimum delay between two frames sent to one subscriber (seconds)
+SSE_FRAME_INTERVAL = 0.25
+
+# Per-request results kept for late subscribers and slow frame intervals
+RESULT_BUFFER_SIZE = 500
+
+# Maximum number of per-request results included in a single frame
+MAX_RESULTS_PER_FRAME = 50
+
+# How long finished runs remain available to subscribers (seconds)
+RUN_RETENTION = 15 * 60
+
+# Upper bound on worker threads a single run may use
+MAX_RUN_CONCURRENCY = 64
+
+# Most probes (requests x iterations) a single run may send
+MAX_RUN_PROBES = getattr(settings, 'PROBEFLEX_MAX_RUN_PROBES', 10000)
+
+
+class ProbeRun:
+    """
+    State of one collection run, shared between worker threads and subscribers.
+
+    All mutable state is guarded by ``self.lock``; subscribers only ever read
+    it through ``frame_since`` which copies what they need.
+    """
+
+    def __init__(self, collection, user, iterations=1, concurrency=1, save_history=True):
+        self.id = uuid.uuid4().hex
+        self.collection_id = collection.id
+        self.project_id = collection.project_id
+        self.user = user
+        self.iterations = iterations
+        self.concurrency = concurrency
+        self.save_history = save_history
+        self.api_requests = list(collection.requests.select_related('collection__project'))
+        self.total = len(self.api_requests) * iterations
+
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.cancellation = Cancellation()
+        self.state = 'pending'
+        self.started_at = None
+        self.finished_at = None
+        self.completed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.status_counts = {}
+        self.histogram = LatencyHistogram()
+        self.results = deque(maxlen=RESULT_BUFFER_SIZE)
+        self.sequence = 0
+
+    @property
+    def finished(self):
+        return self.state in ('finished', 'cancelled')
+
+    def record(self, api_request, iteration, result=None, error=None):
+        """Record the outcome of one probe execution."""
+        with self.lock:
+            self.sequence += 1
+            self.completed += 1
+            entry = {
+                'seq': self.sequence,
+                'api_request_id': api_request.id,
+                'name': api_request.name,
+                'method': api_request.method,
+                'iteration': iteration,
+            }
+            if error is not None:
+                self.failed += 1
+                self.status_counts['error'] = self.status_counts.get('error', 0) + 1
+                entry['error'] = error
+            else:
+                status = result['status_code']
+                if status < 400:
+                    self.succeeded += 1
+                else:
+                    self.failed += 1
+                key = str(status)
+                self.status_counts[key] = self.status_counts.get(key, 0) + 1
+                self.histogram.add(result['time'])
+                entry['status_code'] = status
+                entry['time'] = result['time']
+            self.results.append(entry)
+
+    def progress(self):
+        """Return the run counters and latency summary (caller holds the lock)."""
+        elapsed_end = self.finished_at or time.time()
+        elapsed = elapsed_end - self.started_at if self.started_at else 0
+        return {
+            'run_id': self.id,
+            'state': self.state,
+            'total': self.total,
+            'completed': self.completed,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'status_counts': dict(self.status_counts),
+            'elapsed': elapsed,
+            'rate': self.completed / elapsed if elapsed else 0,
+            'latency': self.histogram.summary(),
+            'histogram': self.histogram.coarse_buckets(),
+        }
+
+    def frame_since(self, last_sequence):
+        """
+        Build a coalesced update for a subscriber that has seen ``last_sequence``.
+
+        Returns ``(frame, new_last_sequence)``. Results older than the newest
+        ``MAX_RESULTS_PER_FRAME`` are not sent; their number is reported as
+        ``skipped_results`` so the client can show that it is sampling.
+        """
+        with self.lock:
+            frame = self.progress()
+            pending = [entry for entry in self.results if entry['seq'] > last_sequence]
+            unseen = self.sequence - last_sequence
+            frame['results'] = pending[-MAX_RESULTS_PER_FRAME:]
+            frame['skipped_results'] = unseen - len(frame['results'])
+            return frame, self.sequence
+
+    def _next_task(self, tasks):
+        with self.lock:
+            task = next(tasks, None)
+        if task is not None:
+            QUEUE_DEPTH.dec()
+        return task
+
+    def _execute_task(self, session, api_request, iteration, task_start):
+        """Execute one probe, write its history and record the outcome."""
+        try:
+            probe = prepare_probe(probe_data_from_api_request(api_request))
+        except Exception as e:
+            self.record(api_request, iteration, error=str(e))
+            return
+        try:
+            result = execute_probe(probe, session=session, decode=self.save_history,
+                                   cancellation=self.cancellation)
+        except Exception as e:
+            if self.save_history:
+                try:
+                    record_failure(api_request, probe, e, self.user)
+                except Exception as history_error:
+                    print(f"Error saving request history: {str(history_error)}")
+            self.record(api_request, iteration, error=str(e))
+            return
+        if self.save_history:
+            try:
+                record_history(api_request, probe, result, self.user)
+            except Exception as history_error:
+                print(f"Error saving request history: {str(history_error)}")
+        self.record(api_request, iteration, result=result)
+        OVERHEAD_LATENCY.observe(
+            max(0.0, time.perf_counter() - task_start - (result['time'] + result['queue_time']) / 1000),
+            project=project_label(self.project_id))
+
+    def _worker(self, session, tasks):
+        """Worker loop: pull (iteration, api_request) pairs until exhausted or cancelled."""
+        try:
+            while not self.cancelled.is_set():
+                task = self._next_task(tasks)
+                if task is None:
+                    break
+                iteration, api_request = task
+                task_start = time.perf_counter()
+                POOL_WORKERS_BUSY.inc()
+                try:
+                    self._execute_task(session, api_request, iteration, task_start)
+                finally:
+                    POOL_WORKERS_BUSY.dec()
+        finally:
+            close_old_connections()
+
+    def execute(self):
+        """Run every task with a bounded pool of worker threads."""
+        with self.lock:
+            self.state = 'running'
+            self.started_at = time.time()
+        tasks = ((iteration, api_request)
+                 for iteration in range(1, self.iterations + 1)
+                 for api_request in self.api_requests)
+        # One session for all workers, so HTTP/2 probes share multiplexed connections
+        session = ProbeSession()
+        workers = [threading.Thread(target=self._worker, args=(session, tasks), daemon=True)
+                   for _ in range(min(self.concurrency, max(self.total, 1)))]
+        ACTIVE_RUNS.inc()
+        POOL_WORKERS.inc(len(workers))
+        QUEUE_DEPTH.inc(self.total)
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            session.close()
+            # Tasks never started (cancelled runs) leave the queue as well
+            QUEUE_DEPTH.dec(sum(1 for _ in tasks))
+            POOL_WORKERS.dec(len(workers))
+            ACTIVE_RUNS.dec()
+        with self.lock:
+            self.state = 'cancelled' if self.cancelled.is_set() else 'finished'
+            self.finished_at = time.time()
+
+    def start(self):
+        """Start executing the run in a background thread."""
+        threading.Thread(target=self.execute, name=f"probe-run-{self.id}", daemon=True).start()
+
+    def cancel(self):
+        """Stop the workers and abort the probes they have in flight."""
+        self.cancelled.set()
+        self.cancellation.cancel()
+
+
+# In-process registry of runs, keyed by run ID
+_runs = {}
+_runs_lock = threading.Lock()
+
+
+def _evict_finished_runs():
+    cutoff = time.time() - RUN_RETENTION
+    for run_id, run in list(_runs.items()):
+        if run.finished and run.finished_at < cutoff:
+            del _runs[run_id]
+
+
+def start_collection_run(collection, user, iterations=1, concurrency=1, save_history=True):
+    """Create, register and start a run for every request in ``collection``."""
+    run = ProbeRun(collection, user,
+                   iterations=max(1, iterations),
+                   concurrency=max(1, min(concurrency, MAX_RUN_CONCURRENCY)),
+                   save_history=save_history)
+    with _runs_lock:
+        _evict_finished_runs()
+        _runs[run.id] = run
+    run.start()
+    return run
+
+
+def get_run(run_id):
+    """Return the registered run with this ID, or None."""
+    with _runs_lock:
+        return _runs.get(run_id)
+
+
+def _format_event(event, data):
+    return b'event: ' + event.encode('ascii') + b'\ndata: ' + dumps(data) + b'\n\n'
+
+
+def iter_run_events(run, interval=SSE_FRAME_INTERVAL):
+    """Yield Server-Sent Events for ``run`` until it finishes (synchronous servers)."""
+    last_sequence = 0
+    while True:
+        finished = run.finished
+        frame, last_sequence = run.frame_since(last_sequence)
+        yield _format_event('progress', frame)
+        if finished:
+            yield _format_event('done', {'run_id': run.id, 'state': run.state})
+            return
+        time.sleep(interval)
+
+
+async def aiter_run_events(run, interval=SSE_FRAME_INTERVAL):
+    """Yield Server-Sent Events for ``run`` until it finishes (ASGI servers)."""
+    last_sequence = 0
+    while True:
+        finished = run.finished
+        frame, last_sequence = run.frame_since(last_sequence)
+        yield _format_event('progress', frame)
+        if finished:
+            yield _format_event('done', {'run_id': run.id, 'state': run.state})
+            return
+        await asyncio.sleep(interval)
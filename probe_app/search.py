@@ -0,0 +1,278 @@
+"""
+Full-text and JSON-path search over request history.
+
+Every recorded execution gets two kinds of index entries:
+
+* a ``HistorySearchDocument`` with its URL, response header values and the
+  string content of its body, covered by a full-text index (FTS5 on SQLite,
+  a GIN index on ``to_tsvector('simple', document)`` on PostgreSQL);
+* ``HistoryBodyField`` rows for the scalar values of a JSON body, keyed by
+  their path, so ``error.code = RATE_LIMITED`` is a single index lookup.
+
+Queries are plain strings::
+
+    timeout $.error.code=RATE_LIMITED status:429 method:POST
+
+Bare words are full-text terms (a trailing ``*`` matches a prefix),
+``$.path=value`` matches a body field (``$.path`` alone: the field exists),
+``status:`` and ``method:`` filter the history columns. All parts must match.
+
+Bodies large enough to be kept as raw bytes (see ``probe_app.offload``)
+contribute only the beginning of their text to the full-text document, and
+no body fields.
+"""
+import re
+import shlex
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q, TextField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .codec import RawJSON, dumps_text, loads
+from .models import HistoryBodyField, HistorySearchDocument, RequestHistory
+
+
+# Index new history entries as they are recorded
+SEARCH_INDEX = getattr(settings, 'PROBEFLEX_SEARCH_INDEX', True)
+
+# Maximum characters of text kept in one full-text document
+MAX_DOCUMENT_SIZE = 32 * 1024
+
+# Maximum body fields indexed per history entry
+MAX_INDEXED_FIELDS = 200
+
+# Values and paths longer than this are left out of the field index
+MAX_FIELD_LENGTH = 255
+
+# FTS5 table created by migration 0005 on SQLite
+SQLITE_FTS_TABLE = 'probe_app_historysearch_fts'
+
+_ARRAY_INDEX = re.compile(r'\[(\d+|\*)\]')
+
+
+class SearchQueryError(ValueError):
+    """Raised for search queries that cannot be parsed."""
+
+
+def _field_value(value):
+    """Text form of a scalar for the field index: strings as is, other scalars as JSON."""
+    return value if isinstance(value, str) else dumps_text(value)
+
+
+def _leaves(body):
+    """
+    Yield ``(path, value)`` for every scalar in a decoded JSON document.
+
+    Object keys are joined with dots and array positions collapse to ``[]``.
+    The walk uses an explicit stack, so deeply nested bodies are fine.
+    """
+    stack = [('', body)]
+    while stack:
+        path, value = stack.pop()
+        if isinstance(value, dict):
+            prefix = f"{path}." if path else ''
+            stack.extend((f"{prefix}{key}", child) for key, child in reversed(value.items()))
+        elif isinstance(value, list):
+            stack.extend((f"{path}[]", child) for child in reversed(value))
+        else:
+            yield path, value
+
+
+def build_index_entries(url, headers, body):
+    """
+    Build the full-text document and body fields of one execution.
+
+    Returns:
+        (document, fields) where fields is a list of unique (path, value) pairs
+    """
+    parts = [url]
+    size = len(url)
+    if isinstance(headers, dict):
+        for value in headers.values():
+            parts.append(str(value))
+            size += len(parts[-1])
+
+    fields = {}
+    if isinstance(body, RawJSON):
+        # Raw bodies are not parsed again just for indexing: keep their head only
+        parts.append(str(bytes(body.content[:MAX_DOCUMENT_SIZE]), body.encoding, errors='ignore'))
+    elif isinstance(body, str):
+        parts.append(body[:MAX_DOCUMENT_SIZE])
+    elif body is not None:
+        for path, value in _leaves(body):
+            if isinstance(value, str) and size < MAX_DOCUMENT_SIZE:
+                parts.append(value)
+                size += len(value)
+            if len(fields) < MAX_INDEXED_FIELDS and len(path) <= MAX_FIELD_LENGTH:
+                text = _field_value(value)
+                if len(text) <= MAX_FIELD_LENGTH:
+                    fields.setdefault((path, text), None)
+            elif size >= MAX_DOCUMENT_SIZE:
+                break
+
+    document = '\n'.join(parts)[:MAX_DOCUMENT_SIZE]
+    return document, list(fields)
+
+
+def index_entries(entries):
+    """
+    Write search index rows for several executions.
+
+    Args:
+        entries: Iterable of (history_id, url, response_headers, response_body)
+    """
+    documents = []
+    fields = []
+    for history_id, url, headers, body in entries:
+        document, body_fields = build_index_entries(url, headers, body)
+        documents.append(HistorySearchDocument(history_id=history_id, document=document))
+        fields.extend(HistoryBodyField(history_id=history_id, path=path, value=value)
+                      for path, value in body_fields)
+    with transaction.atomic():
+        HistorySearchDocument.objects.bulk_create(documents)
+        HistoryBodyField.objects.bulk_create(fields, batch_size=1000)
+
+
+def index_history(history, body):
+    """Index a newly recorded history entry; ``body`` is the undecoded probe result body."""
+    index_entries([(history.id, history.url, history.response_headers, body)])
+
+
+def rebuild_index(batch_size=500, progress=None):
+    """
+    Drop and rebuild the search index for every history entry.
+
+    Bodies are read as JSON text and decoded with the probe codec. Returns the
+    number of entries indexed.
+    """
+    HistorySearchDocument.objects.all().delete()
+    HistoryBodyField.objects.all().delete()
+    rows = (RequestHistory.objects.order_by('id')
+            .values_list('id', 'url', 'response_headers', Cast('response_body', TextField()))
+            .iterator(chunk_size=batch_size))
+    batch = []
+    total = 0
+    for history_id, url, headers, body_text in rows:
+        body = loads(body_text) if body_text is not None else None
+        batch.append((history_id, url, headers, body))
+        if len(batch) >= batch_size:
+            index_entries(batch)
+            total += len(batch)
+            batch = []
+            if progress:
+                progress(total)
+    if batch:
+        index_entries(batch)
+        total += len(batch)
+    return total
+
+
+def normalize_path(path):
+    """Turn ``$.items[3].id`` or ``items[*].id`` into the indexed form ``items[].id``."""
+    if path.startswith('$'):
+        path = path[1:].lstrip('.')
+    return _ARRAY_INDEX.sub('[]', path)
+
+
+def parse_query(query):
+    """
+    Split a search string into its parts.
+
+    Returns:
+        Dictionary with 'terms' (full-text words), 'fields' (list of
+        (path, value-or-None)), 'status' and 'method'
+
+    Raises:
+        SearchQueryError: If the query is malformed
+    """
+    try:
+        tokens = shlex.split(query)
+    except ValueError as e:
+        raise SearchQueryError(f"Invalid search query: {e}")
+
+    parsed = {'terms': [], 'fields': [], 'status': None, 'method': None}
+    for token in tokens:
+        if token.startswith('$'):
+            path, separator, value = token.partition('=')
+            if value.startswith('='):  # Also accept '=='
+                value = value[1:]
+            parsed['fields'].append((normalize_path(path), value if separator else None))
+        elif token.startswith('status:'):
+            try:
+                parsed['status'] = int(token[len('status:'):])
+            except ValueError:
+                raise SearchQueryError(f"Invalid status filter: {token}")
+        elif token.startswith('method:'):
+            parsed['method'] = token[len('method:'):].upper()
+        else:
+            parsed['terms'].append(token)
+    return parsed
+
+
+@lru_cache(maxsize=None)
+def _sqlite_fts_available(alias):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                       [SQLITE_FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _fts5_expression(terms):
+    """Quote every term as an FTS5 phrase so punctuation in URLs cannot break the query."""
+    phrases = []
+    for term in terms:
+        prefix = term.endswith('*')
+        phrase = '"' + term.rstrip('*').replace('"', '""') + '"'
+        phrases.append(phrase + ('*' if prefix else ''))
+    return ' AND '.join(phrases)
+
+
+def _fulltext_ids(terms):
+    """Return a subquery of the history IDs whose document contains every term."""
+    vendor = connection.vendor
+    if vendor == 'sqlite' and _sqlite_fts_available(connection.alias):
+        return RawSQL(f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s",
+                      [_fts5_expression(terms)])
+    if vendor == 'postgresql':
+        # Same expression as the GIN index, so the index is used
+        tsquery = ' & '.join(
+            "'" + term.rstrip('*').replace("'", "''") + "'" + (':*' if term.endswith('*') else '')
+            for term in terms)
+        return RawSQL("SELECT history_id FROM probe_app_historysearchdocument "
+                      "WHERE to_tsvector('simple', document) @@ to_tsquery('simple', %s)", [tsquery])
+    documents = HistorySearchDocument.objects.all()
+    for term in terms:
+        documents = documents.filter(document__icontains=term.rstrip('*'))
+    return documents.values('history_id')
+
+
+def search_history(queryset, query):
+    """
+    Filter a RequestHistory queryset with a search string.
+
+    Raises:
+        SearchQueryError: If the query is malformed
+    """
+    parsed = parse_query(query) if isinstance(query, str) else query
+    terms = [term for term in parsed['terms'] if term.rstrip('*')]
+    if terms:
+        queryset = queryset.filter(id__in=_fulltext_ids(terms))
+    for path, value in parsed['fields']:
+        if value is not None:
+            fields = HistoryBodyField.objects.filter(path=path, value=value)
+        else:
+            # Objects and arrays exist when any leaf below them does; ranges keep the index usable
+            fields = HistoryBodyField.objects.filter(
+                Q(path=path) |
+                Q(path__gte=f"{path}.", path__lt=f"{path}/") |
+                Q(path__gte=f"{path}[", path__lt=f"{path}\\"))
+        queryset = queryset.filter(id__in=fields.values('history_id'))
+    if parsed['status'] is not None:
+        queryset = queryset.filter(response_status=parsed['status'])
+    if parsed['method']:
+        queryset = queryset.filter(method=parsed['method'])
+    return queryset
+
@@ -0,0 +1,192 @@
+"""
+Serializers of the REST API (``probe_app.api``).
+
+Every serializer supports sparse fieldsets: a ``fields`` entry in the
+serializer context (the ``?fields=id,name,url`` query parameter of a read)
+limits the representation to those fields.
+
+Related objects are written as primary keys and checked against what the
+requesting user may access: a project's teams must be teams the user belongs
+to, a collection or environment must belong to an accessible project.
+"""
+from django.db.models import Q
+from rest_framework import serializers
+
+from .bodies import BODY_KIND_KEY, BODY_KINDS, is_typed_body
+from .compression import validate_compression
+from .governor import validate_limits
+from .models import APIRequest, Collection, Environment, Project, RequestHistory, RequestSummary, Team
+from .retries import validate_retry_policy
+
+
+def accessible_projects(user):
+    """Projects the user owns or can reach through one of their teams."""
+    return Project.objects.filter(Q(owner=user) | Q(teams__members=user)).distinct()
+
+
+class SparseFieldsMixin:
+    """Drop every field not listed in ``context['fields']`` (when it is set)."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+
+class AccessiblePrimaryKeyField(serializers.PrimaryKeyRelatedField):
+    """
+    A primary key limited to objects in accessible projects.
+
+    Bulk writes put the objects they reference in ``context['related']``,
+    keyed by model, so thousands of rows are validated without one query each.
+    """
+
+    def __init__(self, model, project_path, **kwargs):
+        self.model = model
+        self.project_path = project_path
+        super().__init__(queryset=model.objects.all(), **kwargs)
+
+    def get_queryset(self):
+        user = self.context['request'].user
+        return self.model.objects.filter(**{f'{self.project_path}__in': accessible_projects(user)})
+
+    def to_internal_value(self, data):
+        related = self.context.get('related', {}).get(self.model)
+        if related is None:
+            return super().to_internal_value(data)
+        try:
+            return related[int(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class ProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    owner = serializers.ReadOnlyField(source='owner.username')
+    teams = serializers.PrimaryKeyRelatedField(many=True, required=False, queryset=Team.objects.all())
+
+    class Meta:
+        model = Project
+        fields = ['id', 'name', 'description', 'owner', 'teams', 'host_limits',
+                  'created_at', 'updated_at']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if 'teams' in fields and request is not None:
+            fields['teams'].child_relation.queryset = Team.objects.filter(members=request.user)
+        return fields
+
+    def validate_host_limits(self, value):
+        try:
+            return validate_limits(value or {})
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+
+class CollectionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    project = AccessiblePrimaryKeyField(Project, 'id')
+    request_count = serializers.IntegerField(read_only=True)
+    passing_count = serializers.IntegerField(read_only=True)
+    failing_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Collection
+        fields = ['id', 'project', 'name', 'description', 'request_count', 'passing_count',
+                  'failing_count', 'created_at', 'updated_at']
+
+
+class EnvironmentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    project = AccessiblePrimaryKeyField(Project, 'id')
+
+    class Meta:
+        model = Environment
+        fields = ['id', 'project', 'name', 'description', 'variables', 'created_at', 'updated_at']
+
+    def validate_variables(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object of variable names to values.')
+        return value
+
+
+class RequestSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RequestSummary
+        fields = ['last_status', 'last_response_time', 'last_passed', 'streak',
+                  'p95_response_time', 'last_run_at']
+        read_only_fields = fields
+
+
+class APIRequestListSerializer(serializers.ListSerializer):
+    """Creates a batch of requests with one ``bulk_create``."""
+
+    def create(self, validated_data):
+        created = APIRequest.objects.bulk_create(
+            [APIRequest(**attrs) for attrs in validated_data], batch_size=500)
+        for api_request in created:
+            # New requests have no summary; cache that so serializing them does not query for it
+            APIRequest.summary.related.set_cached_value(api_request, None)
+        return created
+
+
+class APIRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    collection = AccessiblePrimaryKeyField(Collection, 'project')
+    summary = RequestSummarySerializer(read_only=True)
+
+    class Meta:
+        model = APIRequest
+        list_serializer_class = APIRequestListSerializer
+        fields = ['id', 'collection', 'name', 'description', 'url', 'method', 'headers', 'params',
+                  'body', 'auth', 'timeout', 'follow_redirects', 'verify_ssl', 'http_version',
+                  'retry_policy', 'request_compression', 'baseline', 'summary', 'created_at',
+                  'updated_at']
+        read_only_fields = ['baseline']
+
+    def validate_retry_policy(self, value):
+        try:
+            return validate_retry_policy(value or {})
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_request_compression(self, value):
+        try:
+            return validate_compression(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_body(self, value):
+        if is_typed_body(value) and value[BODY_KIND_KEY] not in BODY_KINDS:
+            raise serializers.ValidationError(
+                f"Unknown body kind; expected one of {', '.join(BODY_KINDS)}.")
+        return value
+
+    def validate_timeout(self, value):
+        if value < 1:
+            raise serializers.ValidationError('The timeout must be at least 1 ms.')
+        return value
+
+    def validate_headers(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object of header names to values.')
+        return value
+
+    def validate_params(self, value):
+        if not isinstance(value, dict):
+            raise serializers.ValidationError('Expected an object of parameter names to values.')
+        return value
+
+
+class RequestHistorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    executed_by = serializers.ReadOnlyField(source='executed_by.username', default=None)
+
+    class Meta:
+        model = RequestHistory
+        fields = ['id', 'request', 'url', 'method', 'headers', 'params', 'body', 'auth',
+                  'response_status', 'response_headers', 'response_body', 'response_time',
+                  'queue_time', 'http_version', 'attempts', 'error', 'coalesced', 'response_size',
+                  'response_wire_size', 'response_encoding', 'decompression_time', 'response_hash',
+                  'response_changed', 'executed_at', 'executed_by']
+        read_only_fields = fields
@@ -0,0 +1,200 @@
+"""
+Single-flight de-duplication of identical concurrent probes.
+
+When several callers send the same idempotent probe at the same moment (a
+dashboard refreshed by a whole team, say), only the first one calls the
+upstream; the others wait for it and get its result, marked ``coalesced``.
+Each caller still records its own history entry.
+
+Probes are identical when their fingerprint matches: method, URL, query
+parameters, headers and authentication after environment substitution, plus
+the options that change what is sent (TLS verification, redirects, HTTP
+version). Only GET and HEAD probes are coalesced, and only while the first
+one is in flight: nothing is cached after it completes.
+
+Within a process, callers wait on the leader's thread. Across processes the
+leader is elected with an atomic ``cache.add`` and publishes its result in
+the cache for ``PROBEFLEX_SINGLE_FLIGHT_RESULT_TTL`` seconds; this needs a
+shared cache backend (Redis, Memcached, database) and otherwise each process
+coalesces on its own. A follower whose leader disappears sends the probe
+itself.
+
+Enable with ``PROBEFLEX_SINGLE_FLIGHT = True``.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .codec import fingerprint_json
+from .engine import execute_probe
+from .metrics import PROBES_COALESCED_TOTAL, project_label
+from .spool import LARGE_RESPONSE_THRESHOLD, SpoolError, share_response
+
+
+# Whether send_request and the API coalesce identical concurrent probes
+SINGLE_FLIGHT = getattr(settings, 'PROBEFLEX_SINGLE_FLIGHT', False)
+
+# Seconds a leader's result stays in the cache for followers in other processes
+RESULT_TTL = getattr(settings, 'PROBEFLEX_SINGLE_FLIGHT_RESULT_TTL', 5)
+
+# Methods whose probes may be coalesced
+COALESCED_METHODS = ('GET', 'HEAD')
+
+# Longest pause between checks for another process's result (seconds)
+_MAX_POLL_INTERVAL = 0.05
+
+
+def probe_fingerprint(probe):
+    """The single-flight key of a prepared probe, or None if it may not be coalesced."""
+    if probe['method'] not in COALESCED_METHODS:
+        return None
+    request_kwargs = probe['request_kwargs']
+    auth = request_kwargs.get('auth')
+    return fingerprint_json({
+        'method': probe['method'],
+        'url': probe['url'],
+        'params': probe['params'],
+        'headers': sorted((str(name).lower(), str(value)) for name, value in probe['headers'].items()),
+        'auth': list(auth) if auth else None,
+        'verify': request_kwargs.get('verify', True),
+        'redirects': request_kwargs.get('allow_redirects', True),
+        'http_version': probe.get('http_version', '1.1'),
+    })
+
+
+class _Flight:
+    """One in-flight probe and the outcome its followers wait for."""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _follower_result(result, user, scope, probe):
+    """A copy of the leader's result for one follower."""
+    PROBES_COALESCED_TOTAL.inc(project=project_label(probe.get('project_id')), scope=scope)
+    result = dict(result, coalesced=True)
+    if result.get('body_ref') and user is not None:
+        try:
+            result['body_ref'] = share_response(result['body_ref'], user.id)
+        except SpoolError:
+            result.pop('body_ref')
+    return result
+
+
+def _wait_for_shared(key, leader, deadline):
+    """
+    Wait for the result the ``leader`` in another process publishes for ``key``.
+
+    Returns:
+        The leader's outcome, ('result', value) or ('error', exception), or
+        None if the leader went away without publishing one
+    """
+    result_key = f"{key}:result:{leader}"
+    interval = 0.002
+    while time.monotonic() < deadline:
+        outcome = cache.get(result_key)
+        if outcome is not None:
+            return outcome
+        if cache.get(f"{key}:leader") != leader:
+            # The leader finished (its result may have landed meanwhile) or died
+            return cache.get(result_key)
+        time.sleep(interval)
+        interval = min(interval * 2, _MAX_POLL_INTERVAL)
+    return None
+
+
+def _lead_shared(key, probe, spool_for, kwargs):
+    """
+    Send the probe unless another process already is, then share the outcome.
+
+    Returns:
+        (result, scope) where scope is None when this process called the
+        upstream and 'shared' when another process did
+
+    Raises:
+        Whatever execute_probe raised, in this process or the leading one
+    """
+    leader_key = f"{key}:leader"
+    total = probe['timeouts'][2]
+    lease = int(total * (probe.get('retry_policy') or {}).get('max_attempts', 1)) + 60
+    token = uuid.uuid4().hex
+    if not cache.add(leader_key, token, timeout=lease):
+        leader = cache.get(leader_key)
+        outcome = leader and _wait_for_shared(key, leader, time.monotonic() + lease)
+        if outcome:
+            kind, value = outcome
+            if kind == 'error':
+                raise value
+            return value, 'shared'
+
+    try:
+        result = execute_probe(probe, spool_for=spool_for, **kwargs)
+    except Exception as e:
+        _publish(key, token, ('error', e))
+        raise
+    else:
+        # Bodies too large to spool are not copied into the cache; followers send their own probe
+        if result.get('body_ref') or (result.get('body_size') or 0) <= LARGE_RESPONSE_THRESHOLD:
+            _publish(key, token, ('result', result))
+        return result, None
+    finally:
+        if cache.get(leader_key) == token:
+            cache.delete(leader_key)
+
+
+def _publish(key, token, outcome):
+    try:
+        cache.set(f"{key}:result:{token}", outcome, timeout=RESULT_TTL)
+    except Exception as e:
+        # Unpicklable exceptions and similar: followers fall back to their own probe
+        print(f"Single-flight result not shared: {str(e)}")
+
+
+def execute_coalesced(probe, spool_for=None, **kwargs):
+    """
+    ``execute_probe``, shared with identical probes in flight at the same time.
+
+    Results answered by another caller's upstream call carry
+    ``'coalesced': True``. Probes that may not be coalesced, or all probes
+    when single-flight is disabled, are executed directly.
+    """
+    key = probe_fingerprint(probe) if SINGLE_FLIGHT else None
+    if key is None:
+        return execute_probe(probe, spool_for=spool_for, **kwargs)
+    key = f"probeflex:flight:{key}"
+
+    with _flights_lock:
+        flight = _flights.get(key)
+        leading = flight is None
+        if leading:
+            flight = _flights[key] = _Flight()
+    if not leading:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return _follower_result(flight.result, spool_for, 'local', probe)
+
+    try:
+        result, scope = _lead_shared(key, probe, spool_for, kwargs)
+        flight.result = result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+    if scope is not None:
+        return _follower_result(result, spool_for, scope, probe)
+    return result
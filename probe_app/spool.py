@@ -0,0 +1,300 @@
+"""
+Spooled storage for large probe responses.
+
+Responses larger than ``PROBEFLEX_LARGE_RESPONSE_THRESHOLD`` bytes are not
+embedded in the ``send_request`` JSON. Their raw bytes are written to a spool
+directory under an opaque reference and the frontend inspects them lazily:
+JSON documents node by node (addressed by RFC 6901 JSON pointer, with paged
+children) and any body as byte ranges. The browser therefore only ever holds
+the slice the user is looking at.
+
+Spool files are shared through the filesystem so any worker process can
+serve them; parsed JSON documents are additionally kept in a small
+per-process LRU cache so repeated expansions do not re-parse the body.
+"""
+import json
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+
+from .codec import RawJSON, loads
+
+
+# Bodies larger than this (in bytes) are spooled instead of sent inline
+LARGE_RESPONSE_THRESHOLD = getattr(settings, 'PROBEFLEX_LARGE_RESPONSE_THRESHOLD', 256 * 1024)
+
+# Directory holding spooled response bodies
+SPOOL_DIR = Path(getattr(settings, 'PROBEFLEX_SPOOL_DIR',
+                         Path(tempfile.gettempdir()) / 'probeflex-spool'))
+
+# Spooled responses older than this (in seconds) are removed
+SPOOL_TTL = getattr(settings, 'PROBEFLEX_SPOOL_TTL', 60 * 60)
+
+# Number of parsed JSON documents kept in memory per process
+PARSED_CACHE_SIZE = 2
+
+# Paging limits for the lazy inspection API
+DEFAULT_NODE_LIMIT = 100
+MAX_NODE_LIMIT = 1000
+MAX_RANGE_LENGTH = 1024 * 1024
+
+# Scalar strings longer than this are truncated in node listings
+MAX_INLINE_STRING = 1000
+
+
+class SpoolError(Exception):
+    """Raised when a spooled response is missing or a lookup is invalid."""
+
+
+_parsed_cache = OrderedDict()
+_parsed_cache_lock = threading.Lock()
+
+
+def _body_path(ref):
+    return SPOOL_DIR / f"{ref}.body"
+
+
+def _meta_path(ref):
+    return SPOOL_DIR / f"{ref}.meta"
+
+
+def _cache_parsed(ref, document):
+    with _parsed_cache_lock:
+        _parsed_cache[ref] = document
+        _parsed_cache.move_to_end(ref)
+        while len(_parsed_cache) > PARSED_CACHE_SIZE:
+            _parsed_cache.popitem(last=False)
+
+
+def purge_expired():
+    """Delete spooled responses older than the configured TTL."""
+    if not SPOOL_DIR.exists():
+        return
+    cutoff = time.time() - SPOOL_TTL
+    for path in SPOOL_DIR.iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def store_response(content, content_type, owner_id, parsed=None):
+    """
+    Spool a response body and return its reference.
+
+    Args:
+        content: Raw response bytes
+        content_type: Response Content-Type header value
+        owner_id: ID of the user allowed to read the spooled body
+        parsed: Already decoded JSON document, if any, to seed the cache, or a
+            ``RawJSON`` body that was validated but not decoded
+
+    Returns:
+        Opaque reference string used by the inspection API
+    """
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    purge_expired()
+    ref = secrets.token_urlsafe(16)
+    kind = 'json' if parsed is not None and not isinstance(parsed, str) else 'text'
+    if isinstance(parsed, RawJSON):
+        parsed = None
+    with open(_body_path(ref), 'wb') as body_file:
+        body_file.write(content)
+    with open(_meta_path(ref), 'w') as meta_file:
+        json.dump({
+            'owner_id': owner_id,
+            'content_type': content_type,
+            'size': len(content),
+            'kind': kind,
+        }, meta_file)
+    if parsed is not None and kind == 'json':
+        _cache_parsed(ref, parsed)
+    return ref
+
+
+def share_response(ref, owner_id):
+    """
+    Return a reference ``owner_id`` may read for an already spooled body.
+
+    The body file is hard-linked (copied where links are not supported), so
+    probes answered by another user's identical probe do not spool it twice.
+
+    Raises:
+        SpoolError: If the reference is unknown or expired
+    """
+    try:
+        with open(_meta_path(ref)) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        raise SpoolError('Response has expired or does not exist')
+    if meta['owner_id'] == owner_id:
+        return ref
+    shared = secrets.token_urlsafe(16)
+    try:
+        os.link(_body_path(ref), _body_path(shared))
+    except FileNotFoundError:
+        raise SpoolError('Response has expired or does not exist')
+    except OSError:
+        shutil.copyfile(_body_path(ref), _body_path(shared))
+    meta['owner_id'] = owner_id
+    with open(_meta_path(shared), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    return shared
+
+
+def load_meta(ref, owner_id):
+    """
+    Return the metadata of a spooled response owned by ``owner_id``.
+
+    Raises:
+        SpoolError: If the reference is unknown, expired or owned by someone else
+    """
+    if not ref.replace('-', '').replace('_', '').isalnum():
+        raise SpoolError('Unknown response reference')
+    try:
+        with open(_meta_path(ref)) as meta_file:
+            meta = json.load(meta_file)
+    except FileNotFoundError:
+        raise SpoolError('Response has expired or does not exist')
+    if meta['owner_id'] != owner_id:
+        raise SpoolError('Unknown response reference')
+    return meta
+
+
+def _load_document(ref):
+    with _parsed_cache_lock:
+        if ref in _parsed_cache:
+            _parsed_cache.move_to_end(ref)
+            return _parsed_cache[ref]
+    with open(_body_path(ref), 'rb') as body_file:
+        document = loads(body_file.read())
+    _cache_parsed(ref, document)
+    return document
+
+
+def resolve_pointer(document, pointer):
+    """
+    Resolve an RFC 6901 JSON pointer against a parsed document.
+
+    Raises:
+        SpoolError: If the pointer does not address an existing node
+    """
+    if pointer == '':
+        return document
+    if not pointer.startswith('/'):
+        raise SpoolError('JSON pointer must start with "/"')
+    node = document
+    for token in pointer[1:].split('/'):
+        token = token.replace('~1', '/').replace('~0', '~')
+        try:
+            if isinstance(node, list):
+                node = node[int(token)]
+            elif isinstance(node, dict):
+                node = node[token]
+            else:
+                raise KeyError(token)
+        except (KeyError, IndexError, ValueError):
+            raise SpoolError(f'No node at {pointer}')
+    return node
+
+
+def _escape_token(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _describe(value, pointer, key):
+    """Summarize one child node without including its descendants."""
+    entry = {'key': key, 'pointer': pointer}
+    if isinstance(value, dict):
+        entry.update(type='object', length=len(value))
+    elif isinstance(value, list):
+        entry.update(type='array', length=len(value))
+    elif isinstance(value, str) and len(value) > MAX_INLINE_STRING:
+        entry.update(type='string', value=value[:MAX_INLINE_STRING], truncated=True, length=len(value))
+    elif isinstance(value, str):
+        entry.update(type='string', value=value)
+    elif isinstance(value, bool):
+        entry.update(type='boolean', value=value)
+    elif value is None:
+        entry.update(type='null', value=None)
+    else:
+        entry.update(type='number', value=value)
+    return entry
+
+
+def get_node(ref, owner_id, pointer='', offset=0, limit=DEFAULT_NODE_LIMIT):
+    """
+    Return one node of a spooled JSON response with a page of its children.
+
+    Containers list ``limit`` children starting at ``offset``; each child is
+    described by type and length only, so expanding a node never transfers
+    its grandchildren.
+    """
+    meta = load_meta(ref, owner_id)
+    if meta['kind'] != 'json':
+        raise SpoolError('Response is not a JSON document')
+    node = resolve_pointer(_load_document(ref), pointer)
+    limit = max(1, min(limit, MAX_NODE_LIMIT))
+    offset = max(0, offset)
+
+    if isinstance(node, dict):
+        keys = islice(node, offset, offset + limit)
+        children = [_describe(node[key], f"{pointer}/{_escape_token(key)}", key) for key in keys]
+    elif isinstance(node, list):
+        children = [_describe(node[index], f"{pointer}/{index}", index)
+                    for index in range(offset, min(offset + limit, len(node)))]
+    else:
+        return _describe(node, pointer, None)
+
+    return {
+        'pointer': pointer,
+        'type': 'object' if isinstance(node, dict) else 'array',
+        'length': len(node),
+        'offset': offset,
+        'limit': limit,
+        'children': children,
+    }
+
+
+def read_range(ref, owner_id, offset=0, length=64 * 1024):
+    """
+    Return a slice of the raw response body as text.
+
+    The slice is decoded as UTF-8; a multi-byte character cut by the range
+    boundary is dropped, and the next request can continue at ``next_offset``.
+    """
+    meta = load_meta(ref, owner_id)
+    length = max(1, min(length, MAX_RANGE_LENGTH))
+    offset = max(0, min(offset, meta['size']))
+    with open(_body_path(ref), 'rb') as body_file:
+        body_file.seek(offset)
+        chunk = body_file.read(length)
+    return {
+        'offset': offset,
+        'next_offset': offset + len(chunk),
+        'size': meta['size'],
+        'text': chunk.decode('utf-8', errors='ignore'),
+    }
+
+
+def client_payload(result):
+    """
+    Build the send_request response for a probe result.
+
+    Results with a spooled body carry a reference and size instead of the
+    body itself; everything else is returned unchanged.
+    """
+    if not result.get('body_ref'):
+        return result
+    payload = {key: value for key, value in result.items() if key != 'body'}
+    payload['body'] = None
+    return payload
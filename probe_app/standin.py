@@ -0,0 +1,358 @@
+"""
+Local stand-in HTTP/HTTPS server for benchmarking the probe pipeline.
+
+The server answers every request with a JSON document of a configurable size
+after a configurable delay, so probe throughput and latency can be measured
+without depending on a real upstream. Both settings can be overridden per
+request with the ``latency`` (milliseconds) and ``size`` (bytes) query
+parameters; ``depth`` produces a deeply nested document instead of a flat one
+and ``trickle`` (milliseconds) sends the body in small pieces with that pause
+between them, like a slow upstream. With ``echo=1`` the answer describes the
+request instead: its method, path, headers and body (base64), so tests can
+check what a probe sent.
+
+With ``http2=True`` the server speaks HTTP/2 instead (prior knowledge over
+plain HTTP, ALPN over TLS) and answers the streams of a connection
+concurrently; this needs the optional ``h2`` package.
+"""
+import base64
+import json
+import shutil
+import socket
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+
+# Size of the pieces a trickled body is sent in
+TRICKLE_CHUNK_SIZE = 1024
+
+
+def build_payload(size, depth=0):
+    """
+    Build a JSON document of roughly ``size`` bytes.
+
+    With ``depth`` 0 the document is a flat list of small records; otherwise
+    the records are wrapped in ``depth`` levels of nested objects.
+    """
+    record = {'id': 0, 'name': 'probe', 'active': True, 'score': 0.5, 'tags': ['a', 'b']}
+    record_size = len(json.dumps(record)) + 2
+    items = [dict(record, id=index) for index in range(max(1, size // record_size))]
+    document = {'items': items}
+    for level in range(depth):
+        document = {'level': level, 'child': document}
+    return json.dumps(document).encode('utf-8')
+
+
+def generate_self_signed_cert(directory):
+    """
+    Create a throwaway self-signed certificate for localhost with openssl.
+
+    Returns:
+        Tuple of (certfile, keyfile) paths
+
+    Raises:
+        RuntimeError: If the openssl command line tool is not available
+    """
+    if shutil.which('openssl') is None:
+        raise RuntimeError('openssl is required to generate a certificate for the HTTPS stand-in server')
+    certfile = Path(directory) / 'standin.crt'
+    keyfile = Path(directory) / 'standin.key'
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', str(keyfile), '-out', str(certfile)],
+        check=True, capture_output=True,
+    )
+    return str(certfile), str(keyfile)
+
+
+def _echo(method, path, headers, body):
+    """The JSON document answering an ``echo`` request."""
+    return json.dumps({
+        'method': method,
+        'path': path,
+        'headers': {name.lower(): value for name, value in headers},
+        'body': base64.b64encode(body).decode('ascii'),
+    }).encode('utf-8')
+
+
+def _plan_response(server, method, path, headers, request_body):
+    """
+    Count a request and work out its answer from the query parameters.
+
+    Returns:
+        (body, latency in ms, trickle pause in ms)
+    """
+    query = parse_qs(urlsplit(path).query)
+    with server.counter_lock:
+        server.requests_served += 1
+    latency = float(query.get('latency', [server.latency_ms])[0])
+    size = int(query.get('size', [server.payload_size])[0])
+    depth = int(query.get('depth', [server.depth])[0])
+    trickle = float(query.get('trickle', [0])[0])
+    if 'echo' in query:
+        return _echo(method, path, headers, request_body), latency, trickle
+    return server.payload(size, depth), latency, trickle
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without this, Nagle's algorithm
+    # and delayed ACKs add ~40 ms to every keep-alive response
+    disable_nagle_algorithm = True
+
+    def _read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass  # Trailers
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _respond(self):
+        # Read the request body first so keep-alive connections stay usable
+        request_body = self._read_body()
+        body, latency, trickle = _plan_response(self.server, self.command, self.path,
+                                                self.headers.items(), request_body)
+        if latency:
+            time.sleep(latency / 1000)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        try:
+            self.end_headers()
+            if self.command == 'HEAD':
+                pass
+            elif trickle:
+                for offset in range(0, len(body), TRICKLE_CHUNK_SIZE):
+                    self.wfile.write(body[offset:offset + TRICKLE_CHUNK_SIZE])
+                    self.wfile.flush()
+                    time.sleep(trickle / 1000)
+            else:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # The client timed out or gave up
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = do_OPTIONS = _respond
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _StandInH2Handler(socketserver.BaseRequestHandler):
+    """
+    One HTTP/2 connection: frames are read on the handler thread and every
+    stream is answered on a thread of its own, so streams are multiplexed.
+    """
+
+    def setup(self):
+        import h2.config
+        import h2.connection
+
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.conn = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        # Guards the connection state; stream threads wait on it for flow-control window
+        self.lock = threading.Condition()
+        self.closed = False
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.request.sendall(data)
+
+    def handle(self):
+        import h2.events
+
+        with self.server.counter_lock:
+            self.server.connections_opened += 1
+        requests = {}
+        bodies = {}
+        try:
+            with self.lock:
+                self.conn.initiate_connection()
+                self._flush()
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    break
+                with self.lock:
+                    for event in self.conn.receive_data(data):
+                        if isinstance(event, h2.events.RequestReceived):
+                            requests[event.stream_id] = event.headers
+                            bodies[event.stream_id] = []
+                        elif isinstance(event, h2.events.DataReceived):
+                            bodies.setdefault(event.stream_id, []).append(event.data)
+                            # Open the window again so the client can keep sending
+                            self.conn.acknowledge_received_data(event.flow_controlled_length,
+                                                                event.stream_id)
+                        elif isinstance(event, h2.events.StreamEnded):
+                            headers = requests.pop(event.stream_id, [])
+                            body = b''.join(bodies.pop(event.stream_id, []))
+                            threading.Thread(target=self._respond,
+                                             args=(event.stream_id, headers, body),
+                                             daemon=True).start()
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            return
+                    self.lock.notify_all()  # Window updates and resets wake stream threads
+                    self._flush()
+        except OSError:
+            pass  # The client went away
+        finally:
+            with self.lock:
+                self.closed = True
+                self.lock.notify_all()
+
+    def _send_piece(self, stream_id, piece, end_stream):
+        with self.lock:
+            while (not self.closed
+                   and self.conn.local_flow_control_window(stream_id) < len(piece)):
+                self.lock.wait()
+            if self.closed:
+                raise OSError('The connection is closed')
+            self.conn.send_data(stream_id, piece, end_stream=end_stream)
+            self._flush()
+
+    def _respond(self, stream_id, headers, request_body):
+        import h2.exceptions
+
+        pseudo = {name: value for name, value in headers if name.startswith(':')}
+        body, latency, trickle = _plan_response(
+            self.server, pseudo.get(':method', 'GET'), pseudo.get(':path', '/'),
+            [(name, value) for name, value in headers if not name.startswith(':')], request_body)
+        if latency:
+            time.sleep(latency / 1000)
+        try:
+            with self.lock:
+                head = pseudo.get(':method') == 'HEAD'
+                self.conn.send_headers(stream_id, [
+                    (':status', '200'), ('content-type', 'application/json'),
+                    ('content-length', str(len(body)))], end_stream=head or not body)
+                self._flush()
+                piece_size = TRICKLE_CHUNK_SIZE if trickle else self.conn.max_outbound_frame_size
+            if head or not body:
+                return
+            for offset in range(0, len(body), piece_size):
+                self._send_piece(stream_id, body[offset:offset + piece_size],
+                                 offset + piece_size >= len(body))
+                if trickle:
+                    time.sleep(trickle / 1000)
+        except (OSError, h2.exceptions.ProtocolError):
+            pass  # The client reset the stream or closed the connection
+
+
+class _StandInH2Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class StandInServer:
+    """
+    Threaded stand-in server usable as a context manager.
+
+    Example:
+        with StandInServer(latency_ms=20, payload_size=10_000) as server:
+            requests.get(server.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=0, payload_size=1024, depth=0,
+                 tls=False, certfile=None, keyfile=None, http2=False):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.payload_size = payload_size
+        self.depth = depth
+        self.tls = tls
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.http2 = http2
+        self._httpd = None
+        self._thread = None
+        self._tempdir = None
+
+    @property
+    def requests_served(self):
+        """Number of requests answered since the server started."""
+        return self._httpd.requests_served
+
+    @property
+    def connections_opened(self):
+        """Number of HTTP/2 connections accepted since the server started."""
+        return self._httpd.connections_opened
+
+    @property
+    def url(self):
+        scheme = 'https' if self.tls else 'http'
+        return f"{scheme}://{self.host}:{self._httpd.server_address[1]}/"
+
+    def start(self):
+        if self.http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise RuntimeError('The h2 package is required for the HTTP/2 stand-in server')
+            httpd = _StandInH2Server((self.host, self.port), _StandInH2Handler)
+        else:
+            httpd = ThreadingHTTPServer((self.host, self.port), _StandInHandler)
+            httpd.daemon_threads = True
+        httpd.latency_ms = self.latency_ms
+        httpd.payload_size = self.payload_size
+        httpd.depth = self.depth
+        httpd.requests_served = 0
+        httpd.connections_opened = 0
+        httpd.counter_lock = threading.Lock()
+
+        # Payloads are built once per (size, depth) and reused for every response
+        cache = {}
+        cache_lock = threading.Lock()
+
+        def payload(size, depth):
+            with cache_lock:
+                if (size, depth) not in cache:
+                    cache[(size, depth)] = build_payload(size, depth)
+                return cache[(size, depth)]
+        httpd.payload = payload
+
+        if self.tls:
+            certfile, keyfile = self.certfile, self.keyfile
+            if not certfile:
+                self._tempdir = tempfile.TemporaryDirectory()
+                certfile, keyfile = generate_self_signed_cert(self._tempdir.name)
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            if self.http2:
+                context.set_alpn_protocols(['h2'])
+            httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+
+        self._httpd = httpd
+        self._thread = threading.Thread(target=httpd.serve_forever, name='standin-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+            self._tempdir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
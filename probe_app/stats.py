@@ -0,0 +1,148 @@
+"""
+Latency statistics for probe runs.
+
+``LatencyHistogram`` is a log-bucketed sketch (in the style of DDSketch):
+every value is mapped to a bucket whose bounds grow geometrically, so any
+quantile is reported within a fixed relative error. Bucket boundaries depend
+only on the configured accuracy, which makes two histograms with the same
+accuracy mergeable exactly by adding their bucket counts.
+"""
+import math
+
+
+# Default relative accuracy of reported quantiles (1%)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# Values at or below this (in milliseconds) are counted in the zero bucket
+MIN_TRACKED_VALUE = 1e-3
+
+
+class LatencyHistogram:
+    """
+    Mergeable latency histogram with bounded relative error.
+
+    Values are latencies in milliseconds. The histogram is not thread-safe;
+    callers that share one across threads must hold their own lock.
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def _bucket_index(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _bucket_value(self, index):
+        # Midpoint of the bucket (gamma^(i-1), gamma^i] with minimal relative error
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def add(self, value, count=1):
+        """Record a latency value (milliseconds)."""
+        if value <= MIN_TRACKED_VALUE:
+            self.zero_count += count
+        else:
+            index = self._bucket_index(value)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add the counts of another histogram with the same accuracy into this one."""
+        if other.gamma != self.gamma:
+            raise ValueError('Cannot merge histograms with different relative accuracy')
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        if other.max is not None:
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        return self
+
+    def quantile(self, q):
+        """Return the approximate value at quantile ``q`` (0..1), or None when empty."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # Clamp to the observed range so p0/p100 are exact
+                return min(max(self._bucket_value(index), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self):
+        """Return count, mean, min, max and the common percentiles as a dictionary."""
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.quantile(0.50),
+            'p90': self.quantile(0.90),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+    def coarse_buckets(self, max_buckets=20):
+        """
+        Collapse the fine-grained buckets into at most ``max_buckets`` bins.
+
+        Returns a list of ``[upper_bound_ms, count]`` pairs suitable for drawing
+        a live histogram without shipping every internal bucket to the browser.
+        """
+        if not self.buckets:
+            return [[MIN_TRACKED_VALUE, self.zero_count]] if self.zero_count else []
+        indexes = sorted(self.buckets)
+        low, high = indexes[0], indexes[-1]
+        width = max(1, math.ceil((high - low + 1) / max_buckets))
+        bins = []
+        for start in range(low, high + 1, width):
+            end = start + width - 1
+            count = sum(self.buckets.get(i, 0) for i in range(start, end + 1))
+            bins.append([self.gamma ** end, count])
+        if self.zero_count:
+            bins[0][1] += self.zero_count
+        return bins
+
+    def to_dict(self):
+        """Serialize the histogram to a JSON-compatible dictionary."""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'buckets': {str(index): count for index, count in self.buckets.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a histogram serialized with ``to_dict``."""
+        histogram = cls(data.get('relative_accuracy', DEFAULT_RELATIVE_ACCURACY))
+        histogram.buckets = {int(index): count for index, count in data.get('buckets', {}).items()}
+        histogram.zero_count = data.get('zero_count', 0)
+        histogram.count = data.get('count', 0)
+        histogram.total = data.get('total', 0.0)
+        histogram.min = data.get('min')
+        histogram.max = data.get('max')
+        return histogram
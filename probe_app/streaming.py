@@ -0,0 +1,45 @@
+"""
+Helpers for serving StreamingHttpResponse content under both WSGI and ASGI.
+
+Django consumes a streaming response's iterator in full before sending it
+when the iterator type does not match the server: a synchronous generator
+served over ASGI (or an asynchronous one over WSGI) is buffered into a list
+first. These helpers pick the right iterator flavor for the current request
+so exports and event streams are actually delivered incrementally.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+
+
+def is_asgi_request(request):
+    """Return True when the request is being served by the ASGI handler."""
+    return isinstance(request, ASGIRequest)
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Drive a synchronous iterator from async code one item at a time.
+
+    Each ``next()`` runs in Django's thread-sensitive executor so iterators that
+    hold a database cursor always run on the same thread as their connection.
+    """
+    sentinel = object()
+    get_next = sync_to_async(next, thread_sensitive=True)
+    iterator = iter(iterator)
+    while True:
+        chunk = await get_next(iterator, sentinel)
+        if chunk is sentinel:
+            break
+        yield chunk
+
+
+def server_stream(request, iterator):
+    """
+    Adapt a synchronous chunk iterator to the server handling ``request``.
+
+    Under WSGI the iterator is returned unchanged; under ASGI it is wrapped in
+    an async generator that pulls one chunk at a time.
+    """
+    if is_asgi_request(request):
+        return _iterate_in_thread(iterator)
+    return iterator
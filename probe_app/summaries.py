@@ -0,0 +1,166 @@
+"""
+Per-request execution summaries.
+
+Every recorded execution is folded into the ``RequestSummary`` of its
+request: last status, latency and response fingerprint, whether it passed
+(a status below 400), how many executions in a row had that outcome, and the
+95th percentile of the last ``PROBEFLEX_SUMMARY_WINDOW`` response times.
+Collection pages, project pages and the API read these rows instead of the
+history table.
+
+Summaries are updated in the transaction that writes the history entry. A
+missing summary row is inserted first and the row is then locked, so
+concurrent executions of one request, the first ones included, wait for each
+other instead of overwriting or both inserting the row. Run ``python manage.py rebuild_request_summaries`` once to summarize
+history recorded before summaries existed.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from .models import APIRequest, RequestHistory, RequestSummary
+
+
+# Recent response times kept per request for the rolling p95
+SUMMARY_WINDOW = getattr(settings, 'PROBEFLEX_SUMMARY_WINDOW', 100)
+
+# Columns written when a summary changes
+SUMMARY_FIELDS = ['last_status', 'last_response_time', 'last_response_hash', 'last_passed',
+                  'streak', 'p95_response_time', 'recent_response_times', 'last_run_at']
+
+
+def execution_passed(status):
+    """Whether an execution with this status counts as passing."""
+    return status is not None and status < 400
+
+
+def percentile(values, q):
+    """The nearest-rank ``q`` (0..1) percentile of ``values``, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def apply_execution(summary, history):
+    """
+    Fold one history entry into a summary (without saving it).
+
+    An execution older than the one the summary already describes (recorded
+    out of order) only contributes its response time.
+    """
+    times = list(summary.recent_response_times or [])
+    times.append(round(history.response_time, 3))
+    summary.recent_response_times = times[-SUMMARY_WINDOW:]
+    summary.p95_response_time = percentile(summary.recent_response_times, 0.95)
+    if summary.last_run_at is not None and history.executed_at < summary.last_run_at:
+        return summary
+
+    passed = execution_passed(history.response_status)
+    summary.streak = summary.streak + 1 if summary.last_passed is passed else 1
+    summary.last_passed = passed
+    summary.last_status = history.response_status
+    summary.last_response_time = history.response_time
+    summary.last_response_hash = history.response_hash
+    summary.last_run_at = history.executed_at
+    return summary
+
+
+def locked_summary(api_request_id):
+    """
+    The summary of a request, locked for update until the transaction ends.
+
+    Creates an empty summary when the request has none yet: locking a row
+    that does not exist would lock nothing. Must be called inside
+    ``transaction.atomic``.
+    """
+    return RequestSummary.objects.select_for_update().get_or_create(request_id=api_request_id)[0]
+
+
+def update_summaries(histories):
+    """
+    Fold a batch of new history entries into the summaries of their requests.
+
+    Used by bulk writers (the capture proxy); ``record_history`` updates the
+    summary of its single entry itself.
+    """
+    by_request = defaultdict(list)
+    for history in histories:
+        by_request[history.request_id].append(history)
+    if not by_request:
+        return
+
+    request_ids = sorted(by_request)
+    with transaction.atomic():
+        # Missing rows are created first (as in locked_summary), then all are locked in
+        # id order so concurrent batches do not deadlock
+        RequestSummary.objects.bulk_create(
+            [RequestSummary(request_id=request_id) for request_id in request_ids],
+            ignore_conflicts=True)
+        summaries = list(RequestSummary.objects.select_for_update()
+                         .filter(request_id__in=request_ids).order_by('request_id'))
+        for summary in summaries:
+            entries = by_request[summary.request_id]
+            for history in sorted(entries, key=lambda entry: (entry.executed_at, entry.id)):
+                apply_execution(summary, history)
+        RequestSummary.objects.bulk_update(summaries, SUMMARY_FIELDS)
+
+
+def summarize_request(api_request_id):
+    """Build the summary of one request from its history, or None without history."""
+    history = RequestHistory.objects.filter(request_id=api_request_id).order_by('-executed_at', '-id')
+    latest = (history.only('response_status', 'response_time', 'response_hash', 'executed_at')
+              .first())
+    if latest is None:
+        return None
+    times = list(history.values_list('response_time', flat=True)[:SUMMARY_WINDOW])
+    times.reverse()
+
+    # The streak runs back to the latest execution with the other outcome
+    passing = Q(response_status__lt=400)
+    passed = execution_passed(latest.response_status)
+    other_outcome = ~passing | Q(response_status__isnull=True) if passed else passing
+    broken_at = history.filter(other_outcome).values_list('executed_at', flat=True).first()
+    streak = history.filter(executed_at__gt=broken_at) if broken_at else history
+
+    return RequestSummary(
+        request_id=api_request_id,
+        last_status=latest.response_status,
+        last_response_time=latest.response_time,
+        last_response_hash=latest.response_hash,
+        last_passed=passed,
+        streak=streak.count(),
+        p95_response_time=percentile(times, 0.95),
+        recent_response_times=[round(value, 3) for value in times],
+        last_run_at=latest.executed_at,
+    )
+
+
+def rebuild_summaries(batch_size=500, progress=None):
+    """
+    Recompute every request's summary from its history.
+
+    Requests are processed in batches of ``batch_size``, one transaction per
+    batch; ``progress`` is called with the running count after each one.
+
+    Returns:
+        The number of requests summarized
+    """
+    total = 0
+    last_id = 0
+    while True:
+        ids = list(APIRequest.objects.filter(id__gt=last_id).order_by('id')
+                   .values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        with transaction.atomic():
+            RequestSummary.objects.filter(request_id__in=ids).delete()
+            summaries = [summary for summary in map(summarize_request, ids) if summary is not None]
+            RequestSummary.objects.bulk_create(summaries)
+        total += len(summaries)
+        last_id = ids[-1]
+        if progress:
+            progress(total)
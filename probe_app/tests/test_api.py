@@ -0,0 +1,141 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.throttling import SimpleRateThrottle
+
+from probe_app.models import APIRequest
+from probe_app.standin import StandInServer
+
+from .utils import make_request
+
+
+class IdParameterTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='tester'))
+
+    def test_analytics_rejects_malformed_ids(self):
+        for param in ('project', 'collection', 'request'):
+            response = self.client.get('/api/v1/analytics/latency/', {param: 'abc'})
+            self.assertEqual(response.status_code, 400, param)
+            self.assertEqual(response.json(), {'error': f"Invalid {param} ID"})
+
+    def test_list_filters_reject_malformed_ids(self):
+        for path, param in (('/api/v1/history/', 'request'), ('/api/v1/requests/', 'collection'),
+                            ('/api/v1/collections/', 'project')):
+            response = self.client.get(path, {param: '1x'})
+            self.assertEqual(response.status_code, 400, path)
+
+    def test_valid_ids_filter(self):
+        response = self.client.get('/api/v1/history/', {'project': '12345'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+
+class BulkRequestTests(TestCase):
+    def setUp(self):
+        api_request = make_request('http://api.test/a')
+        self.collection = api_request.collection
+        self.user = self.collection.project.owner
+        self.foreign = make_request('http://api.test/b', username='stranger')
+        self.client.force_login(self.user)
+
+    def _bulk(self, method, items):
+        return getattr(self.client, method)('/api/v1/requests/bulk/', items,
+                                            content_type='application/json')
+
+    def test_create(self):
+        response = self._bulk('post', [{'collection': self.collection.id, 'name': f"R{n}",
+                                        'url': f"http://api.test/{n}", 'method': 'GET'}
+                                       for n in range(3)])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['name'] for item in response.json()], ['R0', 'R1', 'R2'])
+        self.assertEqual(self.collection.requests.count(), 4)
+
+    def test_create_rejects_another_users_collection(self):
+        response = self._bulk('post', [
+            {'collection': self.collection.id, 'name': 'Mine', 'url': 'http://api.test/', 'method': 'GET'},
+            {'collection': self.foreign.collection_id, 'name': 'Theirs', 'url': 'http://api.test/',
+             'method': 'GET'}])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()['errors']
+        self.assertEqual(errors[0], {})
+        self.assertIn('collection', errors[1])
+        self.assertFalse(APIRequest.objects.filter(name__in=['Mine', 'Theirs']).exists())
+
+    def test_partial_update(self):
+        second = APIRequest.objects.create(collection=self.collection, name='Second',
+                                           url='http://api.test/2', method='GET')
+        first = self.collection.requests.exclude(pk=second.pk).get()
+        response = self._bulk('patch', [{'id': first.id, 'name': 'Renamed'},
+                                        {'id': second.id, 'method': 'POST'}])
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.name, first.method), ('Renamed', 'GET'))
+        self.assertEqual((second.name, second.method), ('Second', 'POST'))
+
+    def test_partial_update_is_all_or_nothing(self):
+        api_request = self.collection.requests.get()
+        response = self._bulk('patch', [{'id': api_request.id, 'name': 'Renamed'},
+                                        {'id': self.foreign.id, 'name': 'Taken'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id', response.json()['errors'][1])
+        response = self._bulk('patch', [{'id': api_request.id, 'collection': self.foreign.collection_id}])
+        self.assertEqual(response.status_code, 400)
+        api_request.refresh_from_db()
+        self.assertEqual((api_request.name, api_request.collection_id), ('Request', self.collection.id))
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.foreign.name, 'Request')
+
+
+class ListTests(TestCase):
+    def setUp(self):
+        api_request = make_request('http://api.test/0')
+        for n in range(1, 5):
+            APIRequest.objects.create(collection=api_request.collection, name=f"R{n}",
+                                      url=f"http://api.test/{n}", method='GET')
+        self.client.force_login(api_request.collection.project.owner)
+
+    def test_cursor_pagination_walks_every_row_once(self):
+        ids = []
+        url = '/api/v1/requests/?page_size=2'
+        pages = 0
+        while url:
+            page = self.client.get(url).json()
+            if not pages:
+                self.assertIsNone(page['previous'])
+            ids.extend(item['id'] for item in page['results'])
+            url = page['next']
+            pages += 1
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, sorted(APIRequest.objects.values_list('id', flat=True)))
+
+    def test_sparse_fields(self):
+        results = self.client.get('/api/v1/requests/', {'fields': 'id, name'}).json()['results']
+        self.assertEqual(len(results), 5)
+        self.assertEqual({tuple(sorted(item)) for item in results}, {('id', 'name')})
+
+
+class ExecuteThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        self.api_request = make_request(self.server.url)
+        self.client.force_login(self.api_request.collection.project.owner)
+
+    def test_executions_share_the_probe_execute_scope(self):
+        rates = {'user': '100/min', 'probe_execute': '2/min'}
+        with mock.patch.object(SimpleRateThrottle, 'THROTTLE_RATES', rates):
+            execute = f"/api/v1/requests/{self.api_request.id}/execute/"
+            self.assertEqual(self.client.post(execute).status_code, 200)
+            response = self.client.post('/api/v1/requests/bulk-execute/', {'ids': [self.api_request.id]},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.post(execute).status_code, 429)
+            # Other endpoints only count against the user rate
+            self.assertEqual(self.client.get('/api/v1/requests/').status_code, 200)
+        self.assertEqual(self.server.requests_served, 2)
@@ -0,0 +1,138 @@
+import random
+import tempfile
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.test import TestCase
+from django.utils import timezone
+
+from probe_app import archive
+from probe_app.archive import (ARCHIVE_AVAILABLE, ROLLUP_ACCURACY, archive_history, archive_overview,
+                               latency_stats)
+from probe_app.models import APIRequest, RequestHistory
+from probe_app.stats import LatencyHistogram
+
+from .utils import make_request
+
+
+DAYS = 3
+RUNS_PER_DAY = 120
+
+
+@skipUnless(ARCHIVE_AVAILABLE, 'pyarrow is not installed')
+class ArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(archive, 'ARCHIVE_DIR', Path(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        first = make_request('http://api.test/a')
+        second = APIRequest.objects.create(collection=first.collection, name='Second',
+                                           url='http://api.test/b', method='GET')
+        self.project_id = first.collection.project_id
+        self.requests = [first, second]
+        self.day0 = (timezone.now() - timedelta(days=40)).astimezone(dt_timezone.utc).date()
+        rng = random.Random(11)
+        self.executions = []  # (executed_at, request id, response time, status)
+        for day in range(DAYS):
+            for run in range(RUNS_PER_DAY):
+                executed_at = self._at(day, run % 24, run % 60)
+                status = None if run % 25 == 0 else 500 if run % 10 == 0 else 200
+                self.executions.append((executed_at, self.requests[run % 2].id,
+                                        rng.lognormvariate(4, 0.8), status))
+        RequestHistory.objects.bulk_create([
+            RequestHistory(request_id=request_id, url='http://api.test/', method='GET',
+                           response_status=status, response_time=response_time,
+                           executed_at=executed_at)
+            for executed_at, request_id, response_time, status in self.executions])
+
+    def _at(self, day, hour=0, minute=0):
+        return datetime.combine(self.day0 + timedelta(days=day), dt_time(hour, minute),
+                                tzinfo=dt_timezone.utc)
+
+    def _assert_stats(self, row, executions):
+        histogram = LatencyHistogram(ROLLUP_ACCURACY)
+        for _, _, response_time, _ in executions:
+            histogram.add(response_time)
+        failed = sum(1 for *_, status in executions if status is None or status >= 400)
+        self.assertEqual(row['count'], len(executions))
+        self.assertAlmostEqual(row['mean'], histogram.mean)
+        self.assertEqual(row['min'], histogram.min)
+        self.assertEqual(row['max'], histogram.max)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            self.assertAlmostEqual(row[f"p{round(q * 100)}"], histogram.quantile(q), places=6)
+        self.assertAlmostEqual(row['error_rate'], failed / len(executions))
+
+    def _between(self, start, end):
+        return [execution for execution in self.executions if start <= execution[0] < end]
+
+    def test_archive_moves_old_history_into_segments(self):
+        pinned = RequestHistory.objects.order_by('id').first()
+        APIRequest.objects.filter(pk=self.requests[0].pk).update(baseline=pinned)
+
+        self.assertEqual(archive_history(dry_run=True), (len(self.executions) - 1, DAYS))
+        self.assertEqual(RequestHistory.objects.count(), len(self.executions))
+        self.assertEqual(archive_history(), (len(self.executions) - 1, DAYS))
+        self.assertEqual(list(RequestHistory.objects.values_list('id', flat=True)), [pinned.id])
+
+        [overview] = archive_overview([self.project_id])
+        self.assertEqual(overview['segments'], DAYS)
+        self.assertEqual(overview['rows'], len(self.executions) - 1)
+        self.assertEqual((overview['first_day'], overview['last_day']),
+                         (self.day0, self.day0 + timedelta(days=DAYS - 1)))
+
+    def test_whole_days_come_from_rollups(self):
+        archive_history()
+        start, end = self._at(0), self._at(DAYS)
+        with mock.patch.object(archive, '_recent_table') as recent:
+            [row] = latency_stats([self.project_id], start, end)
+        recent.assert_not_called()
+        self._assert_stats(row, self.executions)
+
+    def test_partial_days_at_the_edges(self):
+        archive_history()
+        start, end = self._at(0, 5, 30), self._at(2, 7)
+        [row] = latency_stats([self.project_id], start, end)
+        self._assert_stats(row, self._between(start, end))
+
+    def test_range_within_one_day(self):
+        archive_history()
+        start, end = self._at(1, 3), self._at(1, 20)
+        [row] = latency_stats([self.project_id], start, end, request_id=self.requests[1].id)
+        self._assert_stats(row, [execution for execution in self._between(start, end)
+                                 if execution[1] == self.requests[1].id])
+
+    def test_hourly_interval(self):
+        archive_history()
+        start, end = self._at(1, 2), self._at(1, 6)
+        rows = latency_stats([self.project_id], start, end, interval='hour')
+        self.assertEqual([row['period'] for row in rows],
+                         [self._at(1, hour).isoformat() for hour in range(2, 6)])
+        for hour, row in zip(range(2, 6), rows):
+            self._assert_stats(row, self._between(self._at(1, hour), self._at(1, hour + 1)))
+
+    def test_daily_interval_grouped_by_request(self):
+        archive_history()
+        rows = latency_stats([self.project_id], self._at(0), self._at(DAYS), interval='day',
+                             group_by='request')
+        self.assertEqual(len(rows), DAYS * 2)
+        for row in rows:
+            day = datetime.fromisoformat(row['period'])
+            self._assert_stats(row, [execution for execution in
+                                     self._between(day, day + timedelta(days=1))
+                                     if execution[1] == row['request']])
+
+    def test_include_recent_adds_history_still_in_the_database(self):
+        archive_history()
+        now = timezone.now()
+        recent = RequestHistory.objects.create(request=self.requests[0], url='http://api.test/',
+                                               method='GET', response_status=503, response_time=42.0,
+                                               executed_at=now - timedelta(hours=1))
+        start, end = self._at(0), now
+        [archived] = latency_stats([self.project_id], start, end)
+        [row] = latency_stats([self.project_id], start, end, include_recent=True)
+        self._assert_stats(archived, self.executions)
+        self._assert_stats(row, self.executions + [(recent.executed_at, recent.request_id, 42.0, 503)])
@@ -0,0 +1,75 @@
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from probe_app.standin import StandInServer
+
+
+class StandInServerTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StandInServer(payload_size=2048).start()
+        self.addCleanup(self.server.stop)
+
+    def test_default_and_requested_sizes(self):
+        body = requests.get(self.server.url).json()
+        self.assertIn('items', body)
+        response = requests.get(self.server.url, params={'size': 50000})
+        self.assertAlmostEqual(len(response.content), 50000, delta=2500)
+
+    def test_nested_payload(self):
+        body = requests.get(self.server.url, params={'depth': 30}).json()
+        for level in reversed(range(30)):
+            self.assertEqual(body['level'], level)
+            body = body['child']
+        self.assertIn('items', body)
+
+    def test_latency_and_trickle(self):
+        start = time.monotonic()
+        requests.get(self.server.url, params={'latency': 100})
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+        start = time.monotonic()
+        response = requests.get(self.server.url, params={'size': 5000, 'trickle': 20})
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+        self.assertEqual(len(response.content), int(response.headers['Content-Length']))
+
+    def test_counts_requests(self):
+        requests.head(self.server.url)
+        requests.post(self.server.url, json={'a': 1})
+        self.assertEqual(self.server.requests_served, 2)
+
+
+class ProbeBenchCommandTests(SimpleTestCase):
+    """The probe_bench harness end to end; it runs on a temporary database of its own."""
+
+    def _bench(self, *arguments):
+        return subprocess.run(
+            [sys.executable, 'manage.py', 'probe_bench', '--requests', '20', '--concurrency', '2',
+             '--collection-size', '2', '--only', 'send_request', '--only', 'history_write',
+             '--only', 'collection_run', *arguments],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120)
+
+    def test_results_written_and_compared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = Path(directory) / 'baseline.json'
+            completed = self._bench('--output', str(baseline))
+            self.assertEqual(completed.returncode, 0, completed.stderr)
+            report = json.loads(baseline.read_text())
+            self.assertEqual(set(report['results']), {'send_request', 'history_write', 'collection_run'})
+            self.assertEqual(report['meta']['parameters']['requests'], 20)
+            for name, result in report['results'].items():
+                self.assertEqual(result['errors'], 0, name)
+                self.assertEqual(result['operations'], 20, name)
+                self.assertGreater(result['throughput'], 0, name)
+            self.assertEqual(report['results']['send_request']['latency_ms']['count'], 20)
+
+            completed = self._bench('--output', str(Path(directory) / 'next.json'),
+                                    '--compare', str(baseline))
+            self.assertEqual(completed.returncode, 0, completed.stderr)
+            self.assertIn('Comparison with', completed.stdout)
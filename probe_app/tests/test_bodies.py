@@ -0,0 +1,141 @@
+import base64
+import gzip
+import os
+import tempfile
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs
+
+from django.test import SimpleTestCase
+
+from probe_app import bodies
+from probe_app.bodies import BodyFileError, body_file_meta, delete_body_file, store_body_file
+from probe_app.engine import ProbeConfigError, execute_probe, prepare_probe
+from probe_app.standin import StandInServer
+from probe_app.transports import HTTP2_AVAILABLE
+
+# Larger than one upload chunk, so files are sent in several reads
+FILE_CONTENT = os.urandom(150 * 1024)
+
+
+class _BodyFilesTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(bodies, 'BODY_FILES_DIR', Path(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.directory = Path(directory.name)
+
+
+class BodyFileTests(_BodyFilesTestCase):
+    def test_store_and_delete(self):
+        meta = store_body_file([b'abc', b'def'], 'data.bin', '', owner_id=1)
+        self.assertEqual((meta['size'], meta['content_type']), (6, 'application/octet-stream'))
+        self.assertEqual(body_file_meta(meta['ref'])['sha256'], meta['sha256'])
+        with self.assertRaises(BodyFileError):
+            delete_body_file(meta['ref'], owner_id=2)
+        delete_body_file(meta['ref'], owner_id=1)
+        with self.assertRaises(BodyFileError):
+            body_file_meta(meta['ref'])
+
+    def test_oversized_file_is_rejected_without_leftovers(self):
+        with mock.patch.object(bodies, 'BODY_FILE_MAX_SIZE', 5):
+            with self.assertRaises(BodyFileError):
+                store_body_file([b'abc', b'def'], 'data.bin', '', owner_id=1)
+        self.assertEqual(list(self.directory.iterdir()), [])
+
+    def test_invalid_and_missing_references(self):
+        for ref in (None, 'short', '../../etc/passwd', 'x' * 20):
+            with self.assertRaises(BodyFileError):
+                body_file_meta(ref)
+
+    def test_probe_with_missing_file_is_a_config_error(self):
+        for body in ({'$body': 'binary', 'file': 'x' * 20},
+                     {'$body': 'multipart', 'files': {'upload': 'not a ref'}}):
+            with self.assertRaises(ProbeConfigError):
+                prepare_probe({'url': 'http://api.test/', 'method': 'POST', 'body': body})
+
+
+class UploadTests(_BodyFilesTestCase):
+    http2 = False
+
+    def setUp(self):
+        super().setUp()
+        self.server = StandInServer(http2=self.http2).start()
+        self.addCleanup(self.server.stop)
+        self.ref = store_body_file([FILE_CONTENT], 'data.bin', 'application/x-test', owner_id=1)['ref']
+
+    def _send(self, body, **fields):
+        probe = prepare_probe(dict({'url': self.server.url + '?echo=1', 'method': 'POST', 'body': body,
+                                    'http_version': '2' if self.http2 else '1.1'}, **fields))
+        result = execute_probe(probe, governed=False)
+        echo = result['body']
+        return result, echo['headers'], base64.b64decode(echo['body'])
+
+    def test_raw_body(self):
+        result, headers, received = self._send({'$body': 'raw', 'text': 'héllo'})
+        self.assertEqual(received, 'héllo'.encode('utf-8'))
+        self.assertEqual(headers['content-type'], 'text/plain; charset=utf-8')
+
+    def test_form_body(self):
+        _, headers, received = self._send({'$body': 'form', 'fields': {'a': '1', 'b': {'x': 1}}})
+        self.assertEqual(headers['content-type'], 'application/x-www-form-urlencoded')
+        self.assertEqual(parse_qs(received.decode('ascii')), {'a': ['1'], 'b': ['{"x": 1}']})
+
+    def test_binary_body_with_content_length(self):
+        result, headers, received = self._send({'$body': 'binary', 'file': self.ref})
+        self.assertEqual(received, FILE_CONTENT)
+        self.assertEqual(headers['content-type'], 'application/x-test')
+        self.assertEqual(headers['content-length'], str(len(FILE_CONTENT)))
+        self.assertNotIn('transfer-encoding', headers)
+        self.assertEqual(result['upload']['size'], len(FILE_CONTENT))
+        self.assertGreater(result['upload']['throughput'], 0)
+
+    def test_chunked_binary_body(self):
+        result, headers, received = self._send({'$body': 'binary', 'file': self.ref, 'chunked': True})
+        self.assertEqual(received, FILE_CONTENT)
+        self.assertNotIn('content-length', headers)
+        if not self.http2:  # HTTP/2 has no chunked encoding, only DATA frames
+            self.assertEqual(headers['transfer-encoding'], 'chunked')
+        self.assertEqual(result['upload']['size'], len(FILE_CONTENT))
+
+    def test_multipart_body(self):
+        body = {'$body': 'multipart', 'fields': {'name': 'probe', 'meta': {'n': 1}},
+                'files': {'upload': {'file': self.ref, 'filename': 'report "q".bin'}}}
+        result, headers, received = self._send(body)
+        content_type, _, boundary = headers['content-type'].partition('; boundary=')
+        self.assertEqual(content_type, 'multipart/form-data')
+        self.assertEqual(headers['content-length'], str(len(received)))
+        self.assertEqual(result['upload']['size'], len(received))
+        parts = received.split(f"--{boundary}".encode('ascii'))
+        self.assertEqual(parts[0], b'')
+        self.assertEqual(parts[-1], b'--\r\n')
+        self.assertEqual(parts[1], b'\r\nContent-Disposition: form-data; name="name"\r\n\r\nprobe\r\n')
+        self.assertEqual(parts[2], b'\r\nContent-Disposition: form-data; name="meta"\r\n\r\n{"n": 1}\r\n')
+        self.assertEqual(parts[3], b'\r\nContent-Disposition: form-data; name="upload"; '
+                                   b'filename="report %22q%22.bin"\r\nContent-Type: application/x-test'
+                                   b'\r\n\r\n' + FILE_CONTENT + b'\r\n')
+
+    def test_compressed_upload(self):
+        result, headers, received = self._send({'$body': 'binary', 'file': self.ref},
+                                               request_compression='gzip')
+        self.assertEqual(headers['content-encoding'], 'gzip')
+        self.assertNotIn('content-length', headers)
+        self.assertEqual(gzip.decompress(received), FILE_CONTENT)
+        upload = result['upload']
+        self.assertEqual((upload['encoding'], upload['size'], upload['uncompressed_size']),
+                         ('gzip', len(received), len(FILE_CONTENT)))
+
+    def test_file_removed_before_sending(self):
+        probe = prepare_probe({'url': self.server.url + '?echo=1', 'method': 'POST',
+                               'body': {'$body': 'binary', 'file': self.ref},
+                               'http_version': '2' if self.http2 else '1.1'})
+        delete_body_file(self.ref, owner_id=1)
+        with self.assertRaises(OSError):
+            execute_probe(probe, governed=False)
+
+
+@skipUnless(HTTP2_AVAILABLE, 'httpx with HTTP/2 support is not installed')
+class HTTP2UploadTests(UploadTests):
+    http2 = True
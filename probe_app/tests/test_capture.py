@@ -0,0 +1,76 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+
+from probe_app.capture import CaptureRecorder, template_path
+from probe_app.mocks import MockServerConfig, build_routes
+from probe_app.models import APIRequest, Collection, Project, RequestHistory
+
+
+def _exchange(method, url, status=200, response=None):
+    body = json.dumps(response if response is not None else {'url': url}).encode('utf-8')
+    return {
+        'method': method,
+        'url': url,
+        'headers': {'Content-Type': 'application/json'},
+        'lower_headers': {'content-type': 'application/json'},
+        'body': b'{"value": 1}',
+        'body_complete': True,
+        'status': status,
+        'response_headers': {'Content-Type': 'application/json'},
+        'lower_response_headers': {'content-type': 'application/json'},
+        'response_body': body,
+        'response_complete': True,
+        'time': 1.5,
+        'http_version': 'HTTP/1.1',
+        'executed_at': timezone.now(),
+    }
+
+
+class CaptureRecorderTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create(username='tester')
+        project = Project.objects.create(name='Project', owner=owner)
+        self.collection = Collection.objects.create(name='Captured', project=project)
+        self.recorder = CaptureRecorder(self.collection, flush_interval=60)
+        self.addCleanup(self.recorder.close)
+
+    def test_template_path(self):
+        self.assertEqual(template_path('/users/42/orders/0f8fad5b-d9cb-469f-a165-70867728950e'),
+                         '/users/{id}/orders/{id}')
+        self.assertEqual(template_path('/users/{{user_id}}/profile'), '/users/{id}/profile')
+
+    def test_captured_route_replays_for_any_id(self):
+        self.recorder._write([
+            _exchange('POST', 'http://api.test/echo/123', response={'echo': 123}),
+            _exchange('POST', 'http://api.test/echo/456', response={'echo': 456}),
+        ])
+        api_request = APIRequest.objects.get(collection=self.collection)
+        self.assertEqual(api_request.url, 'http://api.test/echo/{id}')
+        self.assertEqual(sorted(RequestHistory.objects.values_list('url', flat=True)),
+                         ['http://api.test/echo/123', 'http://api.test/echo/456'])
+
+        routes, skipped = build_routes(self.collection)
+        self.assertEqual(skipped, [])
+        response = MockServerConfig(routes).respond('POST', '/echo/999')
+        self.assertEqual(response.status, 200)
+        self.assertEqual(json.loads(response.body), {'echo': 456})
+        self.assertEqual(MockServerConfig(routes).respond('GET', '/echo/999').status, 405)
+
+    def test_history_per_request_limit(self):
+        self.recorder.history_per_request = 2
+        self.recorder._write([_exchange('GET', f'http://api.test/items/{n}') for n in range(3)])
+        self.recorder._write([_exchange('GET', 'http://api.test/items/9')])
+        self.assertEqual(RequestHistory.objects.count(), 2)
+
+    def test_failed_batch_leaves_no_routes(self):
+        with mock.patch.object(RequestHistory.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.recorder._write([_exchange('GET', 'http://api.test/items/1')])
+        self.assertEqual(APIRequest.objects.count(), 0)
+        self.recorder._write([_exchange('GET', 'http://api.test/items/2')])
+        api_request = APIRequest.objects.get()
+        self.assertEqual(RequestHistory.objects.get().request, api_request)
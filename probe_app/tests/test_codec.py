@@ -0,0 +1,92 @@
+import datetime
+import json
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase, TestCase
+
+from probe_app import codec
+from probe_app.codec import RawJSON, db_json, decode_json, dumps, loads
+from probe_app.models import RequestHistory
+
+from .utils import make_request
+
+
+NONCE = 'feedfacefeedface'
+
+# A body that quotes the marker of the second fragment spliced with NONCE
+MARKER_BODY = RawJSON(f'{{"note": "\\u0000{NONCE}:1\\u0000"}}'.encode('ascii'))
+
+
+class CodecMixin:
+    codec_name = 'json'
+
+    def setUp(self):
+        patcher = mock.patch.object(codec, 'CODEC_NAME', self.codec_name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        if self.codec_name == 'orjson':
+            patcher = mock.patch.object(codec, '_ORJSON_OPTIONS', codec.orjson.OPT_NON_STR_KEYS
+                                        | codec.orjson.OPT_PASSTHROUGH_DATETIME, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class DumpsTests(CodecMixin, SimpleTestCase):
+    def test_raw_json_is_spliced(self):
+        value = {'body': RawJSON(b'{"items": [1, 2]}'), 'list': [RawJSON(b'"s"'), RawJSON(b'3')],
+                 'text': 'café', 'at': datetime.datetime(2026, 1, 2, 3, 4, 5)}
+        self.assertEqual(loads(dumps(value)), {'body': {'items': [1, 2]}, 'list': ['s', 3],
+                                               'text': 'café', 'at': '2026-01-02T03:04:05'})
+        self.assertIn(b'{"items": [1, 2]}', dumps(value))
+
+    def test_body_containing_marker_text(self):
+        with mock.patch.object(codec.secrets, 'token_hex', return_value=NONCE):
+            encoded = dumps([MARKER_BODY, RawJSON(b'2'), f"\x00{NONCE}"])
+        self.assertEqual(loads(encoded), [{'note': f"\x00{NONCE}:1\x00"}, 2, f"\x00{NONCE}"])
+
+    def test_non_utf8_fragment(self):
+        raw = RawJSON('{"name": "café"}'.encode('utf-16'), encoding='utf-16')
+        self.assertEqual(loads(dumps({'body': raw})), {'body': {'name': 'café'}})
+
+    def test_big_integers_fall_back_to_json(self):
+        self.assertEqual(loads(dumps({'big': 2 ** 70, 'body': RawJSON(b'[1]')})),
+                         {'big': 2 ** 70, 'body': [1]})
+
+    def test_loads_accepts_what_json_accepts(self):
+        self.assertEqual(loads(memoryview(b'[1]')), [1])
+        self.assertTrue(loads('NaN') != loads('NaN'))
+        self.assertEqual(decode_json('{"a": 1}'.encode('utf-16-le')), {'a': 1})
+        with self.assertRaises(ValueError):
+            decode_json(b'{}', 'no-such-charset')
+
+
+@skipUnless(codec.orjson is not None, 'orjson is not installed')
+class OrjsonDumpsTests(DumpsTests):
+    codec_name = 'orjson'
+
+
+class DbJsonTests(CodecMixin, TestCase):
+    def _stored(self, value):
+        api_request = make_request('http://api.test/')
+        history = RequestHistory.objects.create(request=api_request, url=api_request.url,
+                                                method='GET', response_body=db_json(value))
+        history.refresh_from_db()
+        return history.response_body
+
+    def test_round_trip(self):
+        self.assertEqual(self._stored({'a': [1, 'two', None], 'b': {'c': True}}),
+                         {'a': [1, 'two', None], 'b': {'c': True}})
+        self.assertEqual(self._stored('plain text'), 'plain text')
+
+    def test_raw_json(self):
+        self.assertEqual(self._stored(RawJSON(b'{"items": [1, 2]}')), {'items': [1, 2]})
+        self.assertEqual(self._stored(MARKER_BODY), json.loads(MARKER_BODY.content))
+
+    def test_none_is_null(self):
+        self.assertIsNone(db_json(None))
+        self.assertIsNone(self._stored(None))
+
+
+@skipUnless(codec.orjson is not None, 'orjson is not installed')
+class OrjsonDbJsonTests(DbJsonTests):
+    codec_name = 'orjson'
@@ -0,0 +1,128 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from probe_app import comparisons
+from probe_app.codec import RawJSON
+from probe_app.comparisons import compare_environments, diff_bodies, latency_delta, t_quantile
+from probe_app.models import APIRequest, Environment
+from probe_app.standin import StandInServer
+
+from .utils import make_request
+
+
+class LatencyDeltaTests(SimpleTestCase):
+    def test_welch_interval(self):
+        # Variances 4 and 6.67: standard error sqrt(3), 4.96 degrees of freedom
+        delta = latency_delta([10, 12, 14], [20, 22, 24, 26])
+        self.assertEqual(delta['mean'], 11)
+        self.assertAlmostEqual(delta['relative'], 11 / 12)
+        self.assertAlmostEqual(delta['ci_low'], 11 - 4.80817, places=4)
+        self.assertAlmostEqual(delta['ci_high'], 11 + 4.80817, places=4)
+        self.assertTrue(delta['significant'])
+
+    def test_overlapping_samples_are_not_significant(self):
+        delta = latency_delta([10, 20, 30], [12, 22, 32])
+        self.assertEqual(delta['mean'], 2)
+        self.assertLess(delta['ci_low'], 0)
+        self.assertGreater(delta['ci_high'], 0)
+        self.assertFalse(delta['significant'])
+
+    def test_constant_samples(self):
+        delta = latency_delta([10, 10], [15, 15])
+        self.assertEqual((delta['ci_low'], delta['ci_high']), (5, 5))
+        self.assertTrue(delta['significant'])
+
+    def test_small_samples(self):
+        delta = latency_delta([10], [20, 30])
+        self.assertEqual(delta['mean'], 15)
+        self.assertIsNone(delta['ci_low'])
+        self.assertFalse(delta['significant'])
+        self.assertIsNone(latency_delta([], [20]))
+        self.assertIsNone(latency_delta([0, 0], [1, 1])['relative'])
+
+    def test_t_quantile(self):
+        self.assertEqual(t_quantile(4.96), 2.776)
+        self.assertEqual(t_quantile(0.5), 12.706)
+        self.assertEqual(t_quantile(35), 2.042)
+        self.assertEqual(t_quantile(500), 1.960)
+
+
+class DiffBodiesTests(SimpleTestCase):
+    def test_json(self):
+        diff = diff_bodies(RawJSON(b'{"a": 1, "b": [1]}'), {'a': 2, 'b': [1]})
+        self.assertEqual(diff, {'kind': 'json', 'truncated': False, 'changes': [
+            {'op': 'replace', 'path': '/a', 'old': 1, 'new': 2}]})
+
+    def test_values_equal_in_python_are_diffed_exactly(self):
+        self.assertEqual(diff_bodies(1, True)['changes'],
+                         [{'op': 'replace', 'path': '', 'old': 1, 'new': True}])
+
+    def test_text(self):
+        diff = diff_bodies('x\ny\n', 'x\nz\n')
+        self.assertEqual(diff['kind'], 'text')
+        self.assertEqual(diff['lines'][-2:], ['-y', '+z'])
+
+
+class CompareEnvironmentsTests(TestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        self.api_request = make_request('{{base}}?size={{size}}')
+        self.collection = self.api_request.collection
+        self.second = APIRequest.objects.create(collection=self.collection, name='Second',
+                                                url='{{base}}?size=100', method='GET')
+
+    def _environment(self, name, **variables):
+        return Environment.objects.create(project=self.collection.project, name=name,
+                                          variables=variables)
+
+    def _compare(self, environments, **options):
+        return compare_environments([self.api_request, self.second], environments, workers=2,
+                                    **options)
+
+    def test_status_mismatch_and_body_diff(self):
+        with StandInServer() as closed:
+            closed_url = closed.url
+        environments = [self._environment('Staging', base=self.server.url, size='200'),
+                        self._environment('Staging', base=self.server.url, size='400'),
+                        self._environment('Down', base=closed_url, size='200')]
+        report = self._compare(environments, iterations=2)
+        self.assertEqual(report['environments'], [f"Staging #{environments[0].id}",
+                                                  f"Staging #{environments[1].id}", 'Down'])
+        self.assertEqual(report['summaries']['Down']['errors'], 4)
+        self.assertEqual(report['status_mismatches'], 2)
+        self.assertEqual(report['body_differences'], 1)
+
+        first, second = report['requests']
+        larger, down = first['comparisons']
+        self.assertEqual([side['statuses'] for side in first['environments']],
+                         [{'200': 2}, {'200': 2}, {'error': 2}])
+        self.assertFalse(larger['status_mismatch'])
+        self.assertFalse(larger['body']['identical'])
+        self.assertEqual(larger['body']['kind'], 'json')
+        self.assertTrue(all(change['path'].startswith('/items/') for change in larger['body']['changes']))
+        self.assertEqual(larger['latency_delta_ms']['mean'],
+                         first['environments'][1]['latency_ms']['mean']
+                         - first['environments'][0]['latency_ms']['mean'])
+        self.assertIsNotNone(larger['latency_delta_ms']['ci_low'])
+        self.assertTrue(down['status_mismatch'])
+        self.assertIsNone(down['body'])
+        self.assertIsNone(down['latency_delta_ms'])
+        self.assertEqual(second['comparisons'][0]['body'], {'identical': True})
+
+    def test_tasks_run_by_iteration_request_environment(self):
+        environments = [self._environment('A', base=self.server.url, size='200'),
+                        self._environment('B', base=self.server.url, size='200')]
+        run_pool = comparisons.run_pool
+        with mock.patch.object(comparisons, 'run_pool', side_effect=run_pool) as patched:
+            report = self._compare(environments, iterations=2)
+        tasks = [(iteration, api_request.id, index)
+                 for iteration, api_request, index in patched.call_args.args[0]]
+        self.assertEqual(tasks, [(1, self.api_request.id, 0), (1, self.api_request.id, 1),
+                                 (1, self.second.id, 0), (1, self.second.id, 1),
+                                 (2, self.api_request.id, 0), (2, self.api_request.id, 1),
+                                 (2, self.second.id, 0), (2, self.second.id, 1)])
+        self.assertEqual(report['status_mismatches'], 0)
+        self.assertEqual(report['body_differences'], 0)
+        self.assertEqual(self.server.requests_served, 8)
@@ -0,0 +1,94 @@
+import gzip
+import json
+import unittest
+import zlib
+
+import requests
+from django.test import SimpleTestCase
+
+from probe_app.compression import (BROTLI_AVAILABLE, ZSTD_AVAILABLE, ContentDecoder, ResponseTooLarge,
+                                   compress_bytes, compressor, validate_compression)
+from probe_app.engine import execute_probe, prepare_probe
+from probe_app.standin import StandInServer, build_payload
+
+BODY = build_payload(200_000)
+
+
+def _feed(decoder, data, size=1000):
+    for offset in range(0, len(data), size):
+        decoder.feed(data[offset:offset + size])
+    return decoder.finish()
+
+
+class ContentDecoderTests(SimpleTestCase):
+    def _round_trip(self, setting):
+        encoding, compressed, _ = compress_bytes(BODY, setting)
+        decoder = ContentDecoder(encoding)
+        self.assertEqual(_feed(decoder, compressed), BODY)
+        stats = decoder.stats()
+        self.assertEqual((stats['encoding'], stats['wire_size'], stats['size']),
+                         (encoding, len(compressed), len(BODY)))
+        self.assertTrue(stats['decoded'])
+
+    def test_gzip_and_deflate(self):
+        self._round_trip('gzip')
+        self._round_trip('deflate:9')
+
+    @unittest.skipUnless(BROTLI_AVAILABLE, 'brotli is not installed')
+    def test_brotli(self):
+        self._round_trip('br')
+
+    @unittest.skipUnless(ZSTD_AVAILABLE, 'zstandard is not installed')
+    def test_zstd(self):
+        self._round_trip('zstd:19')
+
+    def test_stacked_encodings_are_undone_in_reverse(self):
+        encoded = gzip.compress(zlib.compress(BODY))
+        self.assertEqual(_feed(ContentDecoder('deflate, gzip'), encoded), BODY)
+
+    def test_unknown_encoding_is_kept_as_received(self):
+        decoder = ContentDecoder('compress')
+        self.assertEqual(_feed(decoder, b'raw'), b'raw')
+        self.assertFalse(decoder.stats()['decoded'])
+
+    def test_decompression_bomb_stops_at_limit(self):
+        bomb = gzip.compress(b'\0' * (64 * 1024 ** 2))
+        decoder = ContentDecoder('gzip', limit=1024 ** 2)
+        with self.assertRaises(ResponseTooLarge):
+            _feed(decoder, bomb, size=4096)
+        self.assertLessEqual(decoder.size, 1024 ** 2 + 64 * 1024)
+
+    def test_wire_size_limit(self):
+        with self.assertRaises(ResponseTooLarge):
+            _feed(ContentDecoder('', limit=100), b'x' * 1000)
+
+    def test_corrupt_body(self):
+        with self.assertRaises(requests.exceptions.ContentDecodingError):
+            _feed(ContentDecoder('gzip'), b'not gzip at all')
+
+
+class RequestCompressionTests(SimpleTestCase):
+    def test_validate_compression(self):
+        self.assertEqual(validate_compression(' GZIP:9 '), 'gzip:9')
+        self.assertEqual(validate_compression(None), '')
+        for value in ('gzip:10', 'lzma', 'br:x'):
+            with self.assertRaises(ValueError):
+                validate_compression(value)
+
+    def test_streaming_compressor(self):
+        encoding, stream = compressor('gzip:1')
+        compressed = b''.join(stream.compress(BODY[offset:offset + 4096])
+                              for offset in range(0, len(BODY), 4096)) + stream.flush()
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(compressed), BODY)
+
+    def test_compressed_probe_against_standin(self):
+        document = json.loads(BODY)
+        with StandInServer() as server:
+            probe = prepare_probe({'url': server.url, 'method': 'POST', 'body': document,
+                                   'request_compression': 'gzip'})
+            result = execute_probe(probe, governed=False)
+        self.assertEqual(result['status_code'], 200)
+        stats = result['request_compression']
+        self.assertEqual(stats['encoding'], 'gzip')
+        self.assertLess(stats['wire_size'], stats['size'] / 4)
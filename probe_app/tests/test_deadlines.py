@@ -0,0 +1,110 @@
+import threading
+import time
+
+import requests
+from django.test import SimpleTestCase
+
+from probe_app.deadlines import (Cancellation, ProbeCancelled, ProbeDeadlineExceeded, pause,
+                                 timeout_budgets)
+from probe_app.engine import execute_probe, prepare_probe
+from probe_app.retries import send_with_policy, validate_retry_policy
+from probe_app.standin import StandInServer
+
+
+def _cancel_after(cancellation, seconds):
+    timer = threading.Timer(seconds, cancellation.cancel)
+    timer.start()
+    return timer
+
+
+class TimeoutBudgetTests(SimpleTestCase):
+    def test_budgets(self):
+        self.assertEqual(timeout_budgets(2000), (2, 2, 2))
+        self.assertEqual(timeout_budgets(60000), (10, 30, 60))
+        self.assertEqual(timeout_budgets(None), (10, 30, 30))
+        self.assertEqual(timeout_budgets(10 ** 9)[2], 300)
+
+
+class TotalDeadlineTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        # 20 pieces, 50 ms apart: no single read waits long, the whole body takes a second
+        self.trickle_url = self.server.url + '?size=20000&trickle=50'
+
+    def test_trickling_server_hits_total_deadline(self):
+        probe = prepare_probe({'url': self.trickle_url, 'timeout': 300})
+        start = time.monotonic()
+        with self.assertRaises(ProbeDeadlineExceeded):
+            execute_probe(probe, governed=False)
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_fast_response_within_deadline(self):
+        result = execute_probe(prepare_probe({'url': self.server.url, 'timeout': 2000}), governed=False)
+        self.assertEqual(result['status_code'], 200)
+
+    def test_cancel_aborts_probe_in_flight(self):
+        cancellation = Cancellation()
+        _cancel_after(cancellation, 0.1)
+        start = time.monotonic()
+        with self.assertRaises(ProbeCancelled):
+            execute_probe(prepare_probe({'url': self.trickle_url, 'timeout': 10000}), governed=False,
+                          cancellation=cancellation)
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_slow_headers_hit_total_deadline(self):
+        probe = prepare_probe({'url': self.server.url + '?latency=3000', 'timeout': 300})
+        start = time.monotonic()
+        with self.assertRaises(ProbeDeadlineExceeded):
+            execute_probe(probe, governed=False)
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_cancel_aborts_probe_waiting_for_headers(self):
+        cancellation = Cancellation()
+        _cancel_after(cancellation, 0.2)
+        start = time.monotonic()
+        with self.assertRaises(ProbeCancelled):
+            execute_probe(prepare_probe({'url': self.server.url + '?latency=3000', 'timeout': 10000}),
+                          governed=False, cancellation=cancellation)
+        self.assertLess(time.monotonic() - start, 0.8)
+
+
+class PauseTests(SimpleTestCase):
+    def test_pause_without_cancellation_sleeps(self):
+        start = time.monotonic()
+        pause(0.05, [None])
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_cancel_wakes_pause(self):
+        cancellation = Cancellation()
+        _cancel_after(cancellation, 0.05)
+        start = time.monotonic()
+        with self.assertRaises(ProbeCancelled):
+            pause(10, [cancellation])
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_pause_after_cancel_fails_at_once(self):
+        cancellation = Cancellation()
+        cancellation.cancel()
+        with self.assertRaises(ProbeCancelled):
+            pause(10, [cancellation])
+
+
+class RetryBackoffTests(SimpleTestCase):
+    def test_cancel_interrupts_backoff(self):
+        policy = validate_retry_policy({'max_attempts': 3, 'backoff_ms': 10000,
+                                        'max_backoff_ms': 10000, 'jitter': False,
+                                        'retry_on_errors': ['connection']})
+        calls = []
+
+        def send(hedge, race=None):
+            calls.append(hedge)
+            raise requests.ConnectionError('refused')
+
+        cancellation = Cancellation()
+        _cancel_after(cancellation, 0.05)
+        start = time.monotonic()
+        with self.assertRaises(ProbeCancelled):
+            send_with_policy(send, policy, cancellation=cancellation)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(calls, [False])
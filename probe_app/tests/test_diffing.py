@@ -0,0 +1,118 @@
+import copy
+import random
+
+from django.test import SimpleTestCase, TestCase
+
+from probe_app import diffing
+from probe_app.codec import db_json
+from probe_app.diffing import diff_history, diff_json, diff_text, response_fingerprint
+from probe_app.models import RequestHistory
+
+from .utils import make_request
+
+
+def _apply(document, changes):
+    """Apply diff changes in order, as JSON Patch operations."""
+    root = [document]
+    for change in changes:
+        tokens = [token.replace('~1', '/').replace('~0', '~') for token in change['path'].split('/')[1:]]
+        parent, key = root, 0
+        for token in tokens:
+            parent, key = parent[key], token
+        if isinstance(parent, list):
+            key = int(key)
+        if change['op'] == 'remove':
+            del parent[key]
+        elif change['op'] == 'add' and isinstance(parent, list):
+            parent.insert(key, change['new'])
+        else:
+            parent[key] = change['new']
+    return root[0]
+
+
+class DiffJsonTests(SimpleTestCase):
+    def test_nested_replace(self):
+        changes, truncated = diff_json({'a': {'b': [1, 2, 3]}}, {'a': {'b': [1, 5, 3]}})
+        self.assertEqual(changes, [{'op': 'replace', 'path': '/a/b/1', 'old': 2, 'new': 5}])
+        self.assertFalse(truncated)
+
+    def test_removal_from_long_array(self):
+        old = [{'id': index} for index in range(10000)]
+        new = old[:4000] + old[4001:]
+        changes, _ = diff_json(old, new)
+        self.assertEqual(changes, [{'op': 'remove', 'path': '/4000', 'old': {'id': 4000}}])
+
+    def test_keys_are_escaped(self):
+        changes, _ = diff_json({'a/b': 1, 'c~d': 1}, {'a/b': 2, 'c~d': 2})
+        self.assertEqual([change['path'] for change in changes], ['/a~1b', '/c~0d'])
+
+    def test_exact_mode_tells_numbers_from_booleans(self):
+        self.assertEqual(diff_json([1], [True])[0], [])
+        self.assertEqual(len(diff_json([1], [True], exact=True)[0]), 1)
+
+    def test_limit_truncates(self):
+        changes, truncated = diff_json(list(range(100)), [-index for index in range(1, 101)], limit=10)
+        self.assertEqual(len(changes), 10)
+        self.assertTrue(truncated)
+
+    def test_changes_turn_old_into_new(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            old = [rng.randint(0, 5) for _ in range(rng.randint(0, 30))]
+            new = list(old)
+            for _ in range(rng.randint(1, 4)):
+                operation = rng.choice('ird')
+                if operation == 'i':
+                    new.insert(rng.randint(0, len(new)), rng.randint(0, 9))
+                elif new and operation == 'd':
+                    del new[rng.randrange(len(new))]
+                elif new:
+                    new[rng.randrange(len(new))] = rng.randint(0, 9)
+            old_document = {'list': old, 'nested': {'list': list(old)}}
+            new_document = {'list': new, 'nested': {'list': new[::-1]}}
+            changes, _ = diff_json(old_document, new_document, limit=10 ** 6)
+            self.assertEqual(_apply(copy.deepcopy(old_document), changes), new_document)
+
+
+class DiffTextTests(SimpleTestCase):
+    def test_hunks_are_numbered_against_the_full_text(self):
+        old = ''.join(f"line {index}\n" for index in range(100))
+        lines, truncated = diff_text(old, old.replace('line 50\n', 'changed\n'))
+        self.assertIn('@@ -48,7 +48,7 @@', lines)
+        self.assertIn('-line 50', lines)
+        self.assertIn('+changed', lines)
+        self.assertFalse(truncated)
+
+
+class DiffHistoryTests(TestCase):
+    def setUp(self):
+        self.api_request = make_request('http://upstream.test/')
+        # Rolled back tests reuse history IDs
+        diffing._body_cache.clear()
+
+    def _entry(self, body, status=200):
+        return RequestHistory.objects.create(
+            request=self.api_request, url=self.api_request.url, method='GET', response_status=status,
+            response_body=db_json(body), response_hash=response_fingerprint(status, body))
+
+    def test_json_changes(self):
+        result = diff_history(self._entry({'a': 1}), self._entry({'a': 2}))
+        self.assertEqual(result['kind'], 'json')
+        self.assertFalse(result['identical'])
+        self.assertEqual(result['changes'], [{'op': 'replace', 'path': '/a', 'old': 1, 'new': 2}])
+
+    def test_text_changes(self):
+        result = diff_history(self._entry('a\nb\n'), self._entry('a\nc\n'))
+        self.assertEqual(result['kind'], 'text')
+        self.assertIn('+c', result['lines'])
+
+    def test_identical_fingerprints_keep_the_body_kind(self):
+        result = diff_history(self._entry('same text'), self._entry('same text'))
+        self.assertEqual((result['identical'], result['kind'], result['lines']), (True, 'text', []))
+        result = diff_history(self._entry({'a': [1]}), self._entry({'a': [1]}))
+        self.assertEqual((result['identical'], result['kind'], result['changes']), (True, 'json', []))
+
+    def test_status_change_is_not_identical(self):
+        result = diff_history(self._entry({'a': 1}), self._entry({'a': 1}, status=500))
+        self.assertTrue(result['status_changed'])
+        self.assertFalse(result['identical'])
@@ -0,0 +1,101 @@
+import gzip
+import json
+
+from django.test import TestCase
+
+from probe_app.exporters import export_stream
+from probe_app.models import RequestHistory
+
+from .utils import make_request
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.api_request = make_request('http://api.test/items', method='POST')
+        self.json = self._record({'name': 'widget'}, {'Content-Type': 'application/json'},
+                                 response_body={'id': 7}, response_size=9, response_wire_size=4,
+                                 response_encoding='gzip')
+        self.raw = self._record({'$body': 'raw', 'text': 'a,b\n1,2'}, {'content-type': 'text/csv'},
+                                response_body='plain text')
+        self.form = self._record({'$body': 'form', 'fields': {'q': 'a b', 'n': 2}},
+                                 {'Content-Type': 'application/x-www-form-urlencoded'})
+        self.multipart = self._record(
+            {'$body': 'multipart', 'fields': {'title': 'Report'},
+             'files': {'upload': {'file': 'r' * 32, 'filename': 'report.pdf',
+                                  'content_type': 'application/pdf'}}},
+            {'Content-Type': 'multipart/form-data; boundary=probeflex-1'})
+        self.binary = self._record({'$body': 'binary', 'file': 'b' * 32, 'content_type': 'image/png'}, {})
+        self.get = self._record({}, {}, method='GET', error='ConnectionError: refused',
+                                response_status=None, response_body=None)
+
+    def _record(self, body, headers, method='POST', **fields):
+        fields.setdefault('response_status', 200)
+        fields.setdefault('response_headers', {'Content-Type': 'application/json'})
+        return RequestHistory.objects.create(request=self.api_request, url=self.api_request.url,
+                                             method=method, body=body, headers=headers,
+                                             response_time=12.5, queue_time=1.5, **fields)
+
+    def _export(self, export_format, compress=False):
+        history = RequestHistory.objects.order_by('id')
+        return b''.join(export_stream(history, export_format, compress=compress, chunk_size=2))
+
+    def test_har(self):
+        entries = json.loads(self._export('har'))['log']['entries']
+        self.assertEqual(len(entries), 6)
+        json_entry, raw, form, multipart, binary, get = entries
+
+        self.assertEqual(json_entry['request']['postData'],
+                         {'mimeType': 'application/json', 'text': '{"name":"widget"}'})
+        content = json_entry['response']['content']
+        self.assertEqual(json.loads(content['text']), {'id': 7})
+        self.assertEqual((content['size'], content['compression'], content['mimeType']),
+                         (9, 5, 'application/json'))
+        self.assertEqual(json_entry['response']['bodySize'], 4)
+        self.assertEqual(json_entry['time'], 14)
+        self.assertEqual(json_entry['timings']['blocked'], 1.5)
+
+        self.assertEqual(raw['request']['postData'], {'mimeType': 'text/csv', 'text': 'a,b\n1,2'})
+        self.assertEqual(raw['response']['content']['text'], 'plain text')
+        self.assertEqual(form['request']['postData'], {
+            'mimeType': 'application/x-www-form-urlencoded',
+            'params': [{'name': 'q', 'value': 'a b'}, {'name': 'n', 'value': '2'}],
+            'text': 'q=a+b&n=2',
+        })
+        self.assertEqual(multipart['request']['postData'], {
+            'mimeType': 'multipart/form-data; boundary=probeflex-1',
+            'params': [{'name': 'title', 'value': 'Report'},
+                       {'name': 'upload', 'fileName': 'report.pdf', 'contentType': 'application/pdf'}],
+            'text': '',
+        })
+        self.assertEqual(binary['request']['postData']['mimeType'], 'image/png')
+        self.assertNotIn('postData', get['request'])
+        self.assertEqual((get['response']['status'], get['response']['_error']),
+                         (0, 'ConnectionError: refused'))
+
+    def test_jsonl(self):
+        lines = self._export('jsonl').splitlines()
+        self.assertEqual(len(lines), 6)
+        first = json.loads(lines[0])
+        self.assertEqual((first['id'], first['body'], first['response_body']),
+                         (self.json.id, {'name': 'widget'}, {'id': 7}))
+        self.assertEqual(json.loads(lines[1])['response_body'], 'plain text')
+        self.assertIsNone(json.loads(lines[5])['response_body'])
+
+    def test_gzip(self):
+        for export_format in ('jsonl', 'har'):
+            self.assertEqual(gzip.decompress(self._export(export_format, compress=True)),
+                             self._export(export_format))
+
+    def test_view(self):
+        self.client.force_login(self.api_request.collection.project.owner)
+        project_id = self.api_request.collection.project_id
+        response = self.client.get('/api/history/export/',
+                                   {'project': project_id, 'format': 'har', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="probeflex-project-{project_id}.har.gz"')
+        entries = json.loads(gzip.decompress(b''.join(response.streaming_content)))['log']['entries']
+        self.assertEqual([entry['comment'] for entry in entries],
+                         [f"ProbeFlex history #{entry.id}" for entry in RequestHistory.objects.order_by('id')])
+        self.assertEqual(self.client.get('/api/history/export/', {'format': 'csv', 'project': project_id})
+                         .status_code, 400)
@@ -0,0 +1,90 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from probe_app import governor
+from probe_app.deadlines import Cancellation, ProbeCancelled
+from probe_app.governor import GovernorTimeout, govern
+
+
+URL = 'http://api.example.com/items'
+
+
+class GovernTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _site_tokens(self):
+        tokens, _ = cache.get('probeflex:governor:site:bucket:api.example.com')
+        return tokens
+
+    def test_site_token_refunded_when_project_level_times_out(self):
+        project_limits = {'api.example.com': {'rate': 0.001, 'burst': 1}}
+        with mock.patch.object(governor, 'HOST_LIMITS', {'api.example.com': {'rate': 1, 'burst': 5}}):
+            with govern(URL, 7, project_limits):
+                pass
+            after_first = self._site_tokens()
+            with self.assertRaises(GovernorTimeout):
+                with govern(URL, 7, project_limits):
+                    self.fail('The probe should not be admitted')
+        self.assertAlmostEqual(self._site_tokens(), after_first, delta=0.1)
+
+    def test_cancel_ends_rate_wait_and_refunds(self):
+        cancellation = Cancellation()
+        with mock.patch.object(governor, 'HOST_LIMITS', {'api.example.com': {'rate': 0.1, 'burst': 1}}):
+            with govern(URL):
+                pass
+            timer = threading.Timer(0.05, cancellation.cancel)
+            timer.start()
+            start = time.monotonic()
+            with self.assertRaises(ProbeCancelled):
+                with govern(URL, cancellations=[cancellation]):
+                    self.fail('The probe should not be admitted')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertGreater(self._site_tokens(), -0.5)
+
+    def test_cancel_ends_concurrency_wait(self):
+        cancellation = Cancellation()
+        with mock.patch.object(governor, 'HOST_LIMITS', {'*': {'concurrency': 1}}):
+            with govern(URL):
+                timer = threading.Timer(0.05, cancellation.cancel)
+                timer.start()
+                start = time.monotonic()
+                with self.assertRaises(ProbeCancelled):
+                    with govern(URL, cancellations=[cancellation]):
+                        self.fail('The probe should not be admitted')
+                self.assertLess(time.monotonic() - start, 1)
+
+    def test_rate_paces_probes_after_burst(self):
+        with mock.patch.object(governor, 'HOST_LIMITS', {'api.example.com': {'rate': 20, 'burst': 2}}):
+            waits = []
+            for _ in range(4):
+                with govern(URL) as permit:
+                    waits.append(permit.wait)
+        self.assertLess(max(waits[:2]), 0.02)
+        self.assertGreater(waits[2], 0.02)
+        self.assertGreater(sum(waits), 0.08)
+
+    def test_concurrency_limit_queues_second_probe(self):
+        released = threading.Event()
+        with mock.patch.object(governor, 'HOST_LIMITS', {'*': {'concurrency': 1}}):
+            def hold():
+                with govern(URL):
+                    released.wait(5)
+            holder = threading.Thread(target=hold)
+            holder.start()
+            time.sleep(0.05)
+            threading.Timer(0.1, released.set).start()
+            with govern(URL) as permit:
+                self.assertGreater(permit.wait, 0.05)
+            holder.join()
+
+    def test_concurrency_slot_released_on_exit(self):
+        with mock.patch.object(governor, 'HOST_LIMITS', {'*': {'concurrency': 1}}):
+            with govern(URL) as permit:
+                self.assertEqual(len(permit.slots), 1)
+            with govern(URL) as permit:
+                self.assertLess(permit.wait, 0.05)
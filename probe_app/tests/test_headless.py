@@ -0,0 +1,129 @@
+import json
+import tempfile
+import xml.etree.ElementTree as ET
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from probe_app.headless import junit_xml, run_suite
+from probe_app.models import APIRequest, Environment, RequestHistory
+from probe_app.standin import StandInServer
+
+from .utils import make_request
+
+
+def _entry(name, iteration=1, status_code=200, error=None):
+    return {'api_request_id': 1, 'name': name, 'method': 'GET', 'project': 'Project',
+            'collection': 'Collection', 'url': f"http://api.test/{name}", 'status_code': status_code,
+            'time': 12.5, 'error': error, 'iteration': iteration,
+            'passed': error is None and status_code < 400}
+
+
+class JUnitXmlTests(SimpleTestCase):
+    def test_failures_and_errors(self):
+        results = [_entry('ok'), _entry('ok', iteration=2), _entry('broken', status_code=503),
+                   _entry('down', status_code=None, error='ConnectionError: refused')]
+        suite = ET.fromstring(junit_xml(results, 'Project.Collection', 1.5)).find('testsuite')
+        self.assertEqual({key: suite.get(key) for key in ('name', 'tests', 'failures', 'errors', 'time')},
+                         {'name': 'Project.Collection', 'tests': '4', 'failures': '1', 'errors': '1',
+                          'time': '1.500'})
+        ok, again, broken, down = suite.findall('testcase')
+        self.assertEqual((ok.get('name'), ok.get('classname'), ok.get('time')),
+                         ('GET ok', 'Project.Collection', '0.013'))
+        self.assertEqual(list(ok), [])
+        self.assertEqual(again.get('name'), 'GET ok #2')
+        self.assertEqual([child.tag for child in broken], ['failure'])
+        self.assertEqual(broken.find('failure').get('message'), 'HTTP 503')
+        self.assertEqual([child.tag for child in down], ['error'])
+        self.assertEqual(down.find('error').get('message'), 'ConnectionError: refused')
+        self.assertIn('http://api.test/down', down.find('error').text)
+
+
+class RunSuiteTests(TransactionTestCase):
+    # Worker threads write history through their own connections
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        with StandInServer() as closed:
+            self.closed_url = closed.url
+        self.ok = make_request('{{base}}?size=100')
+        collection = self.ok.collection
+        self.unresolved = APIRequest.objects.create(collection=collection, name='Unresolved',
+                                                    url='{{base}}?size={{size}}', method='GET')
+        self.down = APIRequest.objects.create(collection=collection, name='Down',
+                                              url=self.closed_url, method='GET')
+        self.api_requests = [self.ok, self.unresolved, self.down]
+
+    def test_results_in_suite_order(self):
+        results, wall_time = run_suite(self.api_requests, variables={'base': self.server.url},
+                                       workers=1, iterations=2)
+        self.assertGreater(wall_time, 0)
+        self.assertEqual([(entry['iteration'], entry['api_request_id']) for entry in results],
+                         [(iteration, api_request.id) for iteration in (1, 2)
+                          for api_request in self.api_requests])
+        ok, unresolved, down = results[:3]
+        self.assertTrue(ok['passed'])
+        self.assertEqual((ok['status_code'], ok['url']), (200, self.server.url + '?size=100'))
+        self.assertEqual(unresolved['error'], 'Undefined variables: size')
+        self.assertFalse(unresolved['passed'])
+        self.assertIn('ConnectionError', down['error'])
+        # Probes with undefined variables are not sent or recorded
+        self.assertEqual(self.server.requests_served, 2)
+        self.assertEqual(RequestHistory.objects.filter(request=self.ok).count(), 2)
+        self.assertEqual(RequestHistory.objects.filter(request=self.down).count(), 2)
+        self.assertFalse(RequestHistory.objects.filter(request=self.unresolved).exists())
+
+    def test_without_history(self):
+        results, _ = run_suite([self.ok], variables={'base': self.server.url}, save_history=False)
+        self.assertTrue(results[0]['passed'])
+        self.assertFalse(RequestHistory.objects.exists())
+
+
+class ProbeCommandTests(TestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.ok = make_request('{{base}}?size={{size}}')
+        self.collection = self.ok.collection
+        Environment.objects.create(project=self.collection.project, name='Local',
+                                   variables={'base': self.server.url, 'size': '100'})
+
+    def _run(self, *args):
+        stdout = StringIO()
+        call_command('probe', 'run', '--collection', str(self.collection.id), *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_passing_suite(self):
+        junit = self.directory / 'reports' / 'junit.xml'
+        report = self.directory / 'reports' / 'report.json'
+        output = self._run('--environment', 'Local', '--var', 'size=200', '--iterations', '2',
+                           '--no-history', '--junit', str(junit), '--json', str(report))
+        self.assertIn('2 passed, 0 failed, 0 errors', output)
+        self.assertEqual(ET.parse(junit).getroot().find('testsuite').get('tests'), '2')
+        data = json.loads(report.read_text())
+        self.assertEqual((data['suite'], data['environment']), ('Project.Collection', 'Local'))
+        self.assertEqual({entry['url'] for entry in data['results']}, {self.server.url + '?size=200'})
+        self.assertFalse(RequestHistory.objects.exists())
+
+    def test_failing_suite_exits_with_status_1(self):
+        junit = self.directory / 'junit.xml'
+        with self.assertRaises(CommandError) as raised:
+            self._run('--var', f"base={self.server.url}", '--junit', str(junit))
+        self.assertEqual(raised.exception.returncode, 1)
+        self.assertEqual(str(raised.exception), '1 of 1 probes failed')
+        error = ET.parse(junit).getroot().find('testsuite/testcase/error')
+        self.assertEqual(error.get('message'), 'Undefined variables: size')
+        self.assertEqual(self.server.requests_served, 0)
+
+    def test_invalid_arguments(self):
+        for args in (['--environment', 'Missing'], ['--workers', '0'], ['--var', 'novalue']):
+            with self.assertRaises(CommandError, msg=args):
+                self._run(*args)
+        with self.assertRaises(CommandError):
+            call_command('probe', 'run', '--collection', '12345', stdout=StringIO())
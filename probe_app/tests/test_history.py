@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from probe_app.models import RequestHistory, RequestSummary
+from probe_app.standin import StandInServer
+
+from .utils import make_request
+
+
+class FailedExecutionHistoryTests(TestCase):
+    def test_timed_out_attempts_are_recorded(self):
+        with StandInServer(latency_ms=1000) as server:
+            api_request = make_request(server.url, timeout=100, retry_policy={
+                'max_attempts': 2, 'backoff_ms': 0, 'retry_on_errors': ['timeout']})
+            self.client.force_login(api_request.collection.project.owner)
+            response = self.client.post('/api/send/', {'url': server.url, 'method': 'GET',
+                                                       'api_request_id': api_request.id},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 504)
+        history = RequestHistory.objects.get(request=api_request)
+        self.assertIsNone(history.response_status)
+        self.assertIn('ProbeDeadlineExceeded', history.error)
+        self.assertEqual([attempt['attempt'] for attempt in history.attempts], [1, 2])
+        for attempt in history.attempts:
+            self.assertIsNone(attempt['status'])
+            self.assertGreaterEqual(attempt['time'], 90)
+        self.assertGreaterEqual(history.response_time, 90)
+        self.assertFalse(RequestSummary.objects.get(request=api_request).last_passed)
+
+    def test_refused_connection_is_recorded_without_policy(self):
+        with StandInServer() as server:
+            url = server.url
+        api_request = make_request(url)
+        self.client.force_login(api_request.collection.project.owner)
+        response = self.client.post('/api/send/', {'url': url, 'method': 'GET',
+                                                   'api_request_id': api_request.id},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 500)
+        history = RequestHistory.objects.get(request=api_request)
+        self.assertIsNone(history.response_status)
+        self.assertIn('ConnectionError', history.error)
+        self.assertEqual(history.attempts, [])
@@ -0,0 +1,82 @@
+import random
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from probe_app.loadtest import AgentState, build_plan, merge_reports, run_share, split_plan
+from probe_app.standin import StandInServer
+from probe_app.stats import LatencyHistogram
+
+from .utils import make_request
+
+
+def _result(time, status=200):
+    return {'status_code': status, 'time': time, 'wire_size': 10, 'body_size': 20,
+            'decompression_time': 0.5}
+
+
+class MergeReportsTests(SimpleTestCase):
+    def test_merged_agents_match_one_agent(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(3, 1) for _ in range(3000)]
+        agents = [AgentState(index) for index in range(3)]
+        single = AgentState(0)
+        for index, value in enumerate(values):
+            status = 500 if index % 100 == 0 else 200
+            agents[index % 3].record(result=_result(value, status))
+            single.record(result=_result(value, status))
+        agents[1].record(error=TimeoutError())
+
+        merged = merge_reports([agent.report(final=True) for agent in agents])
+        expected = single.report()
+        self.assertEqual(merged['completed'], len(values) + 1)
+        self.assertEqual(merged['errors'], 1)
+        self.assertEqual(merged['error_counts'], {'TimeoutError': 1})
+        self.assertEqual(merged['status_counts'], expected['status_counts'])
+        self.assertEqual(merged['wire_bytes'], expected['wire_bytes'])
+        self.assertEqual(merged['histogram']['buckets'], expected['histogram']['buckets'])
+        summary = LatencyHistogram.from_dict(expected['histogram']).summary()
+        for key in ('count', 'min', 'max', 'p50', 'p95', 'p99'):
+            self.assertEqual(merged['latency_ms'][key], summary[key], key)
+        self.assertAlmostEqual(merged['latency_ms']['mean'], summary['mean'])
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(3)
+        values = sorted(rng.uniform(1, 500) for _ in range(10001))
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.add(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(histogram.quantile(q) - exact) / exact, 0.01 + 1e-9)
+
+
+class PlanTests(TestCase):
+    def test_split_plan_divides_requests_and_rate(self):
+        plan = build_plan([make_request('http://api.test/')], total_requests=10, rate=9, concurrency=2)
+        shares = split_plan(plan, 3)
+        self.assertEqual([share['total_requests'] for share in shares], [4, 3, 3])
+        self.assertEqual([share['offset'] for share in shares], [0, 1, 2])
+        self.assertEqual({share['rate'] for share in shares}, {3})
+
+    def test_run_share_against_standin(self):
+        with StandInServer() as server:
+            plan = build_plan([make_request(server.url), make_request(server.url + '?size=4096')],
+                              total_requests=30, concurrency=3)
+            report = run_share(split_plan(plan, 1)[0])
+            self.assertEqual(server.requests_served, 30)
+        self.assertEqual(report['completed'], 30)
+        self.assertEqual(report['status_counts'], {'200': 30})
+        self.assertEqual(report['histogram']['count'], 30)
+
+
+class LocalAgentsTests(TestCase):
+    def test_two_local_agents_run_a_load_test(self):
+        with StandInServer() as server:
+            api_request = make_request(server.url)
+            output = StringIO()
+            call_command('probe_load', 'run', '--request', str(api_request.id), '--agents', '2',
+                         '--requests', '20', '--connect-timeout', '30', stdout=output)
+        self.assertIn('20 probes from 2 agents', output.getvalue())
+        self.assertIn("{'200': 20}", output.getvalue())
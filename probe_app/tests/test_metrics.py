@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from probe_app import metrics
+from probe_app.metrics import REGISTRY, Counter, Gauge, Histogram, Registry
+
+
+class RegistryTests(SimpleTestCase):
+    def test_label_sets_overflow_to_other(self):
+        counter = Counter('test_probes_total', 'Probes.', ('project', 'method'))
+        with mock.patch.object(metrics, 'MAX_LABEL_SETS', 3):
+            for project in range(1, 6):
+                counter.inc(project=project, method='GET')
+            counter.inc(2, project=1, method='GET')
+        self.assertEqual(counter.render()[2:], [
+            'test_probes_total{project="1",method="GET"} 3',
+            'test_probes_total{project="2",method="GET"} 1',
+            'test_probes_total{project="3",method="GET"} 1',
+            'test_probes_total{project="other",method="other"} 2',
+        ])
+
+    def test_text_format(self):
+        registry = Registry()
+        counter = registry.register(Counter('test_total', 'A counter.', ('reason',)))
+        gauge = registry.register(Gauge('test_workers', 'A gauge.'))
+        histogram = registry.register(Histogram('test_seconds', 'A histogram.', ('project',),
+                                                buckets=(1, 0.1)))
+        counter.inc(reason='say "hi"\\\n')
+        gauge.set(4)
+        gauge.dec(1.5)
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value, project='7')
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP test_total A counter.',
+            '# TYPE test_total counter',
+            'test_total{reason="say \\"hi\\"\\\\\\n"} 1',
+            '# HELP test_workers A gauge.',
+            '# TYPE test_workers gauge',
+            'test_workers 2.5',
+            '# HELP test_seconds A histogram.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{project="7",le="0.1"} 2',
+            'test_seconds_bucket{project="7",le="1"} 3',
+            'test_seconds_bucket{project="7",le="+Inf"} 4',
+            'test_seconds_sum{project="7"} 2.65',
+            'test_seconds_count{project="7"} 4',
+        ]) + '\n')
+
+
+class MetricsViewTests(SimpleTestCase):
+    def test_open_without_token(self):
+        with override_settings(PROBEFLEX_METRICS_TOKEN=None):
+            response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertEqual(response.content.decode(), REGISTRY.render())
+
+    @override_settings(PROBEFLEX_METRICS_TOKEN='s3cret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='s3cret').status_code, 401)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE probeflex_probes_total counter', response.content)
@@ -0,0 +1,80 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from probe_app import engine, offload
+from probe_app.codec import RawJSON, fingerprint_json
+from probe_app.engine import execute_probe, prepare_probe
+from probe_app.offload import decode_body
+from probe_app.standin import StandInServer, build_payload
+
+
+THRESHOLD = 4096
+
+DOCUMENT = {'items': [{'id': index, 'name': 'café'} for index in range(200)]}
+
+
+class OffloadTests(SimpleTestCase):
+    workers = 0
+
+    def setUp(self):
+        for name, value in (('OFFLOAD_THRESHOLD', THRESHOLD), ('OFFLOAD_WORKERS', self.workers),
+                            ('_pool', None)):
+            patcher = mock.patch.object(offload, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self._shutdown_pool)
+        patcher = mock.patch.object(offload, '_get_pool', wraps=offload._get_pool)
+        self.get_pool = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _shutdown_pool(self):
+        if offload._pool is not None:
+            offload._pool.shutdown()
+
+    def _assert_pool_used(self, used):
+        self.assertEqual(self.get_pool.called, used)
+        if used:
+            # A broken pool is dropped after the inline fallback
+            self.assertIsNotNone(offload._pool)
+        self.get_pool.reset_mock()
+
+    def test_json_stays_raw(self):
+        content = json.dumps(DOCUMENT).encode('utf-8')
+        self.assertGreaterEqual(len(content), THRESHOLD)
+        body = decode_body(content)
+        self._assert_pool_used(bool(self.workers))
+        self.assertIsInstance(body, RawJSON)
+        self.assertIs(body.content, content)
+        self.assertEqual((body.encoding, body.fingerprint), ('utf-8', fingerprint_json(DOCUMENT)))
+        self.assertEqual(body.parse(), DOCUMENT)
+
+    def test_text_is_decoded(self):
+        content = ('é not json ' * 1000).encode('latin-1')
+        self.assertEqual(decode_body(content, 'latin-1'), 'é not json ' * 1000)
+        self._assert_pool_used(bool(self.workers))
+        self.assertEqual(decode_body(b'{"truncated": ' + b' ' * THRESHOLD, 'utf-8'),
+                         '{"truncated": ' + ' ' * THRESHOLD)
+
+    def test_threshold(self):
+        document = json.dumps(['x' * (THRESHOLD - 6)]).encode('utf-8')
+        self.assertEqual(len(document), THRESHOLD - 2)
+        self.assertIsInstance(decode_body(document), RawJSON)
+        self._assert_pool_used(False)
+        self.assertIsInstance(decode_body(document + b'  '), RawJSON)
+        self._assert_pool_used(bool(self.workers))
+
+    def test_probe_response(self):
+        with StandInServer() as server, mock.patch.object(engine, 'OFFLOAD_THRESHOLD', THRESHOLD):
+            large = execute_probe(prepare_probe({'url': server.url + '?size=8000'}), governed=False)
+            self._assert_pool_used(bool(self.workers))
+            small = execute_probe(prepare_probe({'url': server.url + '?size=100'}), governed=False)
+            self._assert_pool_used(False)
+        self.assertIsInstance(large['body'], RawJSON)
+        self.assertEqual(large['body'].parse(), json.loads(build_payload(8000)))
+        self.assertEqual(small['body'], json.loads(build_payload(100)))
+
+
+class PooledOffloadTests(OffloadTests):
+    workers = 2
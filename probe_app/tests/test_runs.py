@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from probe_app import views
+from probe_app.models import APIRequest
+
+from .utils import make_request
+
+
+class RunCollectionTests(TestCase):
+    def setUp(self):
+        api_request = make_request('http://api.test/a')
+        APIRequest.objects.create(collection=api_request.collection, name='Second',
+                                  url='http://api.test/b', method='GET')
+        self.url = f"/api/collections/{api_request.collection_id}/run/"
+        self.client.force_login(api_request.collection.project.owner)
+
+    def _run(self, iterations):
+        with mock.patch.object(views, 'MAX_RUN_PROBES', 10), \
+                mock.patch.object(views, 'start_collection_run') as start:
+            start.return_value = mock.Mock(id='run', total=iterations * 2)
+            response = self.client.post(self.url, {'iterations': iterations},
+                                        content_type='application/json')
+        return response, start
+
+    def test_rejects_runs_over_the_probe_cap(self):
+        response, start = self._run(6)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('10 probes per run', response.json()['error'])
+        start.assert_not_called()
+
+    def test_rejects_zero_iterations(self):
+        response, start = self._run(0)
+        self.assertEqual(response.status_code, 400)
+        start.assert_not_called()
+
+    def test_accepts_runs_within_the_cap(self):
+        response, start = self._run(5)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['total'], 10)
+        self.assertEqual(start.call_args.kwargs['iterations'], 5)
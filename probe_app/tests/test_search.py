@@ -0,0 +1,128 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from probe_app.codec import RawJSON
+from probe_app.models import HistorySearchDocument, RequestHistory
+from probe_app.search import (SQLITE_FTS_TABLE, SearchQueryError, _sqlite_fts_available,
+                              build_index_entries, index_history, parse_query, search_history)
+
+from .utils import make_request
+
+
+class ParseQueryTests(SimpleTestCase):
+    def test_parts(self):
+        parsed = parse_query('timeout $.error.code=RATE_LIMITED $.items[3].id==7 $.meta '
+                             'status:429 method:post "two words" time*')
+        self.assertEqual(parsed, {
+            'terms': ['timeout', 'two words', 'time*'],
+            'fields': [('error.code', 'RATE_LIMITED'), ('items[].id', '7'), ('meta', None)],
+            'status': 429,
+            'method': 'POST',
+        })
+
+    def test_malformed(self):
+        with self.assertRaises(SearchQueryError):
+            parse_query('status:abc')
+        with self.assertRaises(SearchQueryError):
+            parse_query('"unbalanced')
+
+
+class BuildIndexEntriesTests(SimpleTestCase):
+    def test_json_body(self):
+        document, fields = build_index_entries(
+            'http://api.test/x', {'X-Trace': 'abc'},
+            {'error': {'code': 'RATE', 'retry': True}, 'items': [{'id': 1}, {'id': 2}]})
+        self.assertEqual(document, 'http://api.test/x\nabc\nRATE')
+        self.assertEqual(fields, [('error.code', 'RATE'), ('error.retry', 'true'),
+                                  ('items[].id', '1'), ('items[].id', '2')])
+
+    def test_raw_body_is_not_parsed(self):
+        document, fields = build_index_entries('http://api.test/x', None, RawJSON(b'{"k": "v"}'))
+        self.assertEqual(document, 'http://api.test/x\n{"k": "v"}')
+        self.assertEqual(fields, [])
+
+
+class SearchHistoryTests(TestCase):
+    def setUp(self):
+        self.api_request = make_request('http://api.test/orders')
+        self.limited = self._record('http://api.test/orders', 'POST', 429,
+                                    {'error': {'code': 'RATE_LIMITED', 'detail': 'Slow down'}})
+        self.found = self._record('http://api.test/orders/7', 'GET', 200,
+                                  {'items': [{'id': 7, 'state': 'shipped'}]})
+        self.text = self._record('http://api.test/health', 'GET', 503, 'upstream timeout')
+
+    def _record(self, url, method, status, body):
+        history = RequestHistory.objects.create(request=self.api_request, url=url, method=method,
+                                                response_status=status, response_body=body,
+                                                response_headers={'Server': 'standin'})
+        index_history(history, body)
+        return history
+
+    def _search(self, query):
+        return set(search_history(RequestHistory.objects.all(), query))
+
+    def test_words(self):
+        self.assertEqual(self._search('timeout'), {self.text})
+        self.assertEqual(self._search('ship*'), {self.found})
+        self.assertEqual(self._search('standin'), {self.limited, self.found, self.text})
+        self.assertEqual(self._search('slow down'), {self.limited})
+        self.assertEqual(self._search('slow timeout'), set())
+
+    def test_body_fields(self):
+        self.assertEqual(self._search('$.error.code=RATE_LIMITED'), {self.limited})
+        self.assertEqual(self._search('$.items[0].id=7'), {self.found})
+        self.assertEqual(self._search('$.items[*].id=8'), set())
+        self.assertEqual(self._search('$.error'), {self.limited})
+        self.assertEqual(self._search('$.items'), {self.found})
+        self.assertEqual(self._search('$.error.code'), {self.limited})
+
+    def test_status_and_method(self):
+        self.assertEqual(self._search('status:503'), {self.text})
+        self.assertEqual(self._search('method:get'), {self.found, self.text})
+        self.assertEqual(self._search('standin method:GET status:200'), {self.found})
+
+    def test_fts_triggers_follow_documents(self):
+        if connection.vendor != 'sqlite' or not _sqlite_fts_available(connection.alias):
+            self.skipTest('SQLite without FTS5')
+
+        def matches(term):
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT rowid FROM {SQLITE_FTS_TABLE} "
+                               f"WHERE {SQLITE_FTS_TABLE} MATCH %s", [term])
+                return {row[0] for row in cursor.fetchall()}
+
+        self.assertEqual(matches('timeout'), {self.text.id})
+        HistorySearchDocument.objects.filter(history=self.text).update(document='recovered')
+        self.assertEqual(matches('timeout'), set())
+        self.assertEqual(matches('recovered'), {self.text.id})
+        HistorySearchDocument.objects.filter(history=self.text).delete()
+        self.assertEqual(matches('recovered'), set())
+        self.assertEqual(matches('shipped'), {self.found.id})
+
+    def test_view(self):
+        self.client.force_login(self.api_request.collection.project.owner)
+        response = self.client.get('/api/history/search/', {'q': '$.error.code=RATE_LIMITED'})
+        self.assertEqual([entry['id'] for entry in response.json()['results']], [self.limited.id])
+        project_id = self.api_request.collection.project_id
+        response = self.client.get('/api/history/search/', {'q': 'standin', 'project': project_id,
+                                                            'limit': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertTrue(response.json()['has_more'])
+        self.assertEqual(self.client.get('/api/history/search/',
+                                         {'q': 'standin', 'project': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/history/search/', {'q': 'status:x'}).status_code, 400)
+
+    def test_view_hides_other_users_history(self):
+        self.client.force_login(User.objects.create(username='stranger'))
+        response = self.client.get('/api/history/search/', {'q': 'standin'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.get('/admin/probe_app/requesthistory/',
+                                   {'q': 'standin method:GET status:503'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.text])
+        response = self.client.get('/admin/probe_app/requesthistory/', {'q': 'status:x'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        self.assertIn('Invalid status filter', ' '.join(str(m) for m in response.context['messages']))
@@ -0,0 +1,53 @@
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from probe_app import singleflight
+from probe_app.engine import prepare_probe
+from probe_app.singleflight import execute_coalesced
+from probe_app.standin import StandInServer
+
+
+class SingleFlightTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = StandInServer(latency_ms=300).start()
+        self.addCleanup(self.server.stop)
+        patcher = mock.patch.object(singleflight, 'SINGLE_FLIGHT', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _send_together(self, method, callers=4):
+        barrier = threading.Barrier(callers)
+        results = []
+
+        def call():
+            probe = prepare_probe({'url': self.server.url, 'method': method, 'body': {}})
+            barrier.wait()
+            results.append(execute_coalesced(probe))
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_gets_share_one_upstream_call(self):
+        results = self._send_together('GET')
+        self.assertEqual(self.server.requests_served, 1)
+        self.assertEqual(sorted(bool(result.get('coalesced')) for result in results),
+                         [False, True, True, True])
+        self.assertEqual(len({result['body_size'] for result in results}), 1)
+
+    def test_posts_are_not_coalesced(self):
+        results = self._send_together('POST', callers=2)
+        self.assertEqual(self.server.requests_served, 2)
+        self.assertFalse(any(result.get('coalesced') for result in results))
+
+    def test_sequential_gets_are_not_cached(self):
+        for _ in range(2):
+            execute_coalesced(prepare_probe({'url': self.server.url}))
+        self.assertEqual(self.server.requests_served, 2)
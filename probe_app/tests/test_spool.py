@@ -0,0 +1,150 @@
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+
+from probe_app import spool
+from probe_app.engine import execute_probe, prepare_probe
+from probe_app.spool import (LARGE_RESPONSE_THRESHOLD, MAX_NODE_LIMIT, MAX_RANGE_LENGTH, SpoolError,
+                             client_payload, get_node, load_meta, purge_expired, read_range,
+                             share_response, store_response)
+from probe_app.standin import StandInServer
+
+
+DOCUMENT = {
+    'items': [{'id': index} for index in range(250)],
+    'a/b': {'~k': 1},
+    'long': 'x' * 1500,
+    'flag': None,
+}
+
+
+class SpoolDirMixin:
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(spool, 'SPOOL_DIR', Path(directory.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        spool._parsed_cache.clear()
+        self.addCleanup(spool._parsed_cache.clear)
+
+
+class GetNodeTests(SpoolDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.ref = store_response(json.dumps(DOCUMENT).encode('utf-8'), 'application/json', 1,
+                                  parsed=DOCUMENT)
+
+    def test_root(self):
+        node = get_node(self.ref, 1)
+        self.assertEqual((node['type'], node['length'], node['offset']), ('object', 4, 0))
+        items, escaped, long, flag = node['children']
+        self.assertEqual(items, {'key': 'items', 'pointer': '/items', 'type': 'array', 'length': 250})
+        self.assertEqual(escaped['pointer'], '/a~1b')
+        self.assertEqual((long['length'], len(long['value']), long['truncated']), (1500, 1000, True))
+        self.assertEqual(flag['type'], 'null')
+
+    def test_pages_of_children(self):
+        node = get_node(self.ref, 1, pointer='/items', offset=240, limit=50)
+        self.assertEqual([child['key'] for child in node['children']], list(range(240, 250)))
+        self.assertEqual(node['children'][0], {'key': 240, 'pointer': '/items/240', 'type': 'object',
+                                               'length': 1})
+        self.assertEqual(get_node(self.ref, 1, pointer='/items', limit=10 ** 6)['limit'], MAX_NODE_LIMIT)
+        self.assertEqual(len(get_node(self.ref, 1, pointer='/items', limit=0)['children']), 1)
+
+    def test_pointer_tokens_are_unescaped(self):
+        self.assertEqual(get_node(self.ref, 1, pointer='/a~1b/~0k'),
+                         {'key': None, 'pointer': '/a~1b/~0k', 'type': 'number', 'value': 1})
+        self.assertEqual(get_node(self.ref, 1, pointer='/items/7/id')['value'], 7)
+        for pointer in ('items', '/missing', '/items/250', '/items/x', '/long/0'):
+            with self.assertRaises(SpoolError, msg=pointer):
+                get_node(self.ref, 1, pointer=pointer)
+
+    def test_document_is_parsed_from_disk(self):
+        spool._parsed_cache.clear()
+        self.assertEqual(get_node(self.ref, 1, pointer='/items/3/id')['value'], 3)
+        self.assertIn(self.ref, spool._parsed_cache)
+
+    def test_text_body_has_no_nodes(self):
+        ref = store_response(b'plain', 'text/plain', 1, parsed='plain')
+        with self.assertRaises(SpoolError):
+            get_node(ref, 1)
+
+    def test_other_owner(self):
+        with self.assertRaises(SpoolError):
+            get_node(self.ref, 2)
+
+
+class ReadRangeTests(SpoolDirMixin, SimpleTestCase):
+    def test_length_is_capped(self):
+        content = b'0123456789' * (MAX_RANGE_LENGTH // 5)
+        ref = store_response(content, 'text/plain', 1)
+        first = read_range(ref, 1, length=10 * MAX_RANGE_LENGTH)
+        self.assertEqual(len(first['text']), MAX_RANGE_LENGTH)
+        self.assertEqual((first['next_offset'], first['size']), (MAX_RANGE_LENGTH, len(content)))
+        second = read_range(ref, 1, offset=first['next_offset'], length=10 * MAX_RANGE_LENGTH)
+        self.assertEqual(second['next_offset'], len(content))
+        self.assertEqual(read_range(ref, 1, offset=len(content) + 5)['text'], '')
+
+    def test_cut_character_is_dropped(self):
+        ref = store_response('aé'.encode('utf-8'), 'text/plain', 1)
+        self.assertEqual(read_range(ref, 1, length=2), {'offset': 0, 'next_offset': 2, 'size': 3,
+                                                        'text': 'a'})
+
+
+class ShareAndPurgeTests(SpoolDirMixin, SimpleTestCase):
+    def test_share_response(self):
+        ref = store_response(b'{"a": 1}', 'application/json', 1, parsed={'a': 1})
+        self.assertEqual(share_response(ref, 1), ref)
+        shared = share_response(ref, 2)
+        self.assertNotEqual(shared, ref)
+        self.assertEqual(get_node(shared, 2, pointer='/a')['value'], 1)
+        with self.assertRaises(SpoolError):
+            load_meta(shared, 1)
+        with self.assertRaises(SpoolError):
+            load_meta(ref, 2)
+        with self.assertRaises(SpoolError):
+            share_response('missing', 2)
+
+    def test_expired_responses_are_purged(self):
+        old = store_response(b'old', 'text/plain', 1)
+        stale = time.time() - spool.SPOOL_TTL - 10
+        for path in spool.SPOOL_DIR.glob(f"{old}.*"):
+            os.utime(path, (stale, stale))
+        fresh = store_response(b'fresh', 'text/plain', 1)
+        self.assertEqual({path.stem for path in spool.SPOOL_DIR.iterdir()}, {fresh})
+        with self.assertRaises(SpoolError):
+            read_range(old, 1)
+        self.assertEqual(read_range(fresh, 1)['text'], 'fresh')
+        purge_expired()
+        self.assertEqual(read_range(fresh, 1)['text'], 'fresh')
+
+
+class SpoolViewTests(SpoolDirMixin, TestCase):
+    def test_views_check_the_owner(self):
+        owner = User.objects.create(username='tester')
+        ref = store_response(json.dumps(DOCUMENT).encode('utf-8'), 'application/json', owner.id,
+                             parsed=DOCUMENT)
+        self.client.force_login(owner)
+        response = self.client.get(f"/api/responses/{ref}/node/",
+                                   {'pointer': '/items', 'offset': 'x', 'limit': '2'})
+        self.assertEqual([child['key'] for child in response.json()['children']], [0, 1])
+        response = self.client.get(f"/api/responses/{ref}/range/", {'length': '4'})
+        self.assertEqual(response.json()['text'], '{"it')
+        self.client.force_login(User.objects.create(username='stranger'))
+        self.assertEqual(self.client.get(f"/api/responses/{ref}/node/").status_code, 404)
+        self.assertEqual(self.client.get(f"/api/responses/{ref}/range/").status_code, 404)
+
+    def test_large_probe_response_is_spooled(self):
+        owner = User.objects.create(username='tester')
+        with StandInServer(payload_size=LARGE_RESPONSE_THRESHOLD + 1000) as server:
+            result = execute_probe(prepare_probe({'url': server.url}), spool_for=owner, governed=False)
+        self.assertTrue(spool._body_path(result['body_ref']).exists())
+        self.assertIsNone(client_payload(result)['body'])
+        self.assertEqual(get_node(result['body_ref'], owner.id, pointer='/items/0/id')['value'], 0)
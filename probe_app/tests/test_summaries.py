@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from probe_app.models import RequestHistory, RequestSummary
+from probe_app.summaries import locked_summary, rebuild_summaries, update_summaries
+
+from .utils import make_request
+
+
+class SummaryTests(TestCase):
+    def setUp(self):
+        self.api_request = make_request('http://api.test/items')
+        self.start = timezone.now() - timedelta(days=1)
+
+    def _history(self, status, minute, response_time=10.0):
+        return RequestHistory.objects.create(
+            request=self.api_request, url=self.api_request.url, method='GET',
+            response_status=status, response_time=response_time, response_hash=f'hash-{minute}',
+            executed_at=self.start + timedelta(minutes=minute))
+
+    def _record(self, *entries):
+        update_summaries([self._history(*entry) for entry in entries])
+        return RequestSummary.objects.get(request=self.api_request)
+
+    def test_streak_counts_executions_with_the_latest_outcome(self):
+        summary = self._record((200, 0), (201, 1), (500, 2), (None, 3), (404, 4))
+        self.assertIs(summary.last_passed, False)
+        self.assertEqual(summary.streak, 3)
+        self.assertEqual(summary.last_status, 404)
+
+        summary = self._record((200, 5))
+        self.assertIs(summary.last_passed, True)
+        self.assertEqual(summary.streak, 1)
+        self.assertEqual(summary.last_response_hash, 'hash-5')
+
+    def test_out_of_order_entry_only_adds_its_response_time(self):
+        self._record((200, 10, 20.0))
+        summary = self._record((500, 5, 300.0))
+        self.assertEqual(summary.last_status, 200)
+        self.assertEqual(summary.last_run_at, self.start + timedelta(minutes=10))
+        self.assertIs(summary.last_passed, True)
+        self.assertEqual(summary.streak, 1)
+        self.assertEqual(summary.recent_response_times, [20.0, 300.0])
+        self.assertEqual(summary.p95_response_time, 300.0)
+
+    def test_batch_is_applied_in_execution_order(self):
+        summary = self._record((200, 3, 30.0), (500, 1, 10.0), (200, 2, 20.0))
+        self.assertEqual(summary.last_status, 200)
+        self.assertEqual(summary.streak, 2)
+        self.assertEqual(summary.recent_response_times, [10.0, 20.0, 30.0])
+
+    def test_rebuild_matches_incremental_summary(self):
+        incremental = self._record((200, 0, 5.0), (503, 1, 50.0), (200, 2, 7.0), (200, 3, 9.0))
+        RequestSummary.objects.all().delete()
+        self.assertEqual(rebuild_summaries(batch_size=1), 1)
+        rebuilt = RequestSummary.objects.get(request=self.api_request)
+        for field in ('last_status', 'last_response_time', 'last_response_hash', 'last_passed',
+                      'streak', 'p95_response_time', 'recent_response_times', 'last_run_at'):
+            self.assertEqual(getattr(rebuilt, field), getattr(incremental, field), field)
+
+    def test_rebuild_skips_requests_without_history(self):
+        make_request('http://api.test/other')
+        self._record((200, 0))
+        self.assertEqual(rebuild_summaries(), 1)
+        self.assertEqual(RequestSummary.objects.count(), 1)
+
+    def test_locked_summary_creates_the_row_it_locks(self):
+        with transaction.atomic():
+            summary = locked_summary(self.api_request.pk)
+            self.assertIsNotNone(summary.pk)
+            self.assertIsNone(summary.last_run_at)
+            self.assertTrue(RequestSummary.objects.filter(request=self.api_request).exists())
+            self.assertEqual(locked_summary(self.api_request.pk).pk, summary.pk)
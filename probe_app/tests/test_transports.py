@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import skipUnless
+
+from django.test import SimpleTestCase
+
+from probe_app.deadlines import ProbeDeadlineExceeded
+from probe_app.engine import execute_probe, prepare_probe
+from probe_app.standin import StandInServer, build_payload
+from probe_app.transports import HTTP2_AVAILABLE, ProbeSession
+
+
+@skipUnless(HTTP2_AVAILABLE, 'httpx with HTTP/2 support is not installed')
+class TransportParityTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StandInServer().start()
+        self.addCleanup(self.server.stop)
+
+    def _execute(self, http_version, **fields):
+        return execute_probe(prepare_probe(dict(fields, http_version=http_version)), governed=False)
+
+    def test_url_query_and_params_reach_the_server(self):
+        # size comes from the URL's query string, depth from the params
+        fields = {'url': self.server.url + '?size=4096', 'params': {'depth': '2'}}
+        expected = build_payload(4096, 2)
+        results = {version: self._execute(version, **fields) for version in ('1.1', 'prefer-2')}
+        for version, result in results.items():
+            self.assertEqual(result['status_code'], 200, version)
+            self.assertEqual(result['body_size'], len(expected), version)
+        self.assertEqual(results['1.1']['body'], results['prefer-2']['body'])
+        self.assertEqual(results['prefer-2']['body']['level'], 1)
+
+
+@skipUnless(HTTP2_AVAILABLE, 'httpx with HTTP/2 support is not installed')
+class HTTP2Tests(SimpleTestCase):
+    def setUp(self):
+        self.server = StandInServer(http2=True).start()
+        self.addCleanup(self.server.stop)
+
+    def _probe(self, query, timeout=5000):
+        return prepare_probe({'url': self.server.url + query, 'http_version': '2', 'timeout': timeout})
+
+    def test_concurrent_probes_share_one_connection(self):
+        probe = self._probe('?latency=300&size=5000')
+        start = time.monotonic()
+        with ProbeSession() as session, ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(
+                lambda _: execute_probe(probe, session=session, governed=False), range(8)))
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual({result['status_code'] for result in results}, {200})
+        self.assertEqual({result['http_version'] for result in results}, {'HTTP/2'})
+        self.assertEqual(self.server.requests_served, 8)
+        self.assertEqual(self.server.connections_opened, 1)
+
+    def test_slow_headers_hit_total_deadline(self):
+        start = time.monotonic()
+        with self.assertRaises(ProbeDeadlineExceeded):
+            execute_probe(self._probe('?latency=3000', timeout=300), governed=False)
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_stalled_stream_hits_total_deadline(self):
+        # Every piece arrives within the read timeout, but the deadline passes
+        # while the third one is awaited
+        start = time.monotonic()
+        with ProbeSession() as session:
+            with self.assertRaises(ProbeDeadlineExceeded):
+                execute_probe(self._probe('?size=20000&trickle=1000', timeout=1200),
+                              session=session, governed=False)
+        self.assertLess(time.monotonic() - start, 1.6)
@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+
+from probe_app import usersearch
+from probe_app.usersearch import search_users
+
+
+class SearchUsersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for username, email in (('alice', 'alice@example.com'), ('alicia', ''),
+                                ('bob', 'ALfred@example.com'), ('carol', 'carol@al.example.com')):
+            User.objects.create(username=username, email=email)
+
+    def _usernames(self, query, **page):
+        rows, has_more = search_users(query, **page)
+        return [username for _, username, _ in rows], has_more
+
+    def test_prefix_of_username_or_email(self):
+        self.assertEqual(self._usernames('al'), (['alice', 'alicia', 'bob'], False))
+        self.assertEqual(self._usernames(' ALI '), (['alice', 'alicia'], False))
+        self.assertEqual(self._usernames('alice@'), (['alice'], False))
+        self.assertEqual(self._usernames('lice'), ([], False))
+
+    def test_pages_fetch_one_extra_row(self):
+        for index in range(5):
+            User.objects.create(username=f"user{index}")
+        fetched = []
+        fetch = usersearch._fetch_page
+
+        def fetch_page(prefix, page, page_size):
+            fetched.append(fetch(prefix, page, page_size))
+            return fetched[-1]
+
+        with mock.patch.object(usersearch, '_fetch_page', fetch_page):
+            self.assertEqual(self._usernames('user', page_size=2), (['user0', 'user1'], True))
+            self.assertEqual(self._usernames('user', page=2, page_size=2), (['user2', 'user3'], True))
+            self.assertEqual(self._usernames('user', page=3, page_size=2), (['user4'], False))
+            self.assertEqual(self._usernames('user', page=2, page_size=3), (['user3', 'user4'], False))
+        self.assertEqual([len(rows) for rows in fetched], [3, 3, 1, 2])
+
+    def test_short_prefixes_are_cached(self):
+        self.assertEqual(self._usernames('al', page_size=2), (['alice', 'alicia'], True))
+        User.objects.filter(username='alice').delete()
+        with mock.patch.object(usersearch, '_fetch_page') as fetch:
+            self.assertEqual(self._usernames('AL', page_size=2), (['alice', 'alicia'], True))
+        fetch.assert_not_called()
+        self.assertEqual(self._usernames('alic', page_size=2), (['alicia'], False))
+        with mock.patch.object(usersearch, 'USER_SEARCH_CACHE_TTL', 0):
+            self.assertEqual(self._usernames('al', page_size=2), (['alicia', 'bob'], False))
+
+    def test_view_excludes_current_user(self):
+        self.client.force_login(User.objects.get(username='alice'))
+        response = self.client.get('/api/search-users/', {'q': 'al'}).json()
+        self.assertEqual(response, {
+            'results': [{'id': User.objects.get(username=username).id, 'username': username,
+                         'email': email}
+                        for username, email in (('alicia', ''), ('bob', 'ALfred@example.com'))],
+            'pagination': {'more': False},
+        })
+        self.assertEqual(self.client.get('/api/search-users/', {'q': ' '}).json(),
+                         {'results': [], 'pagination': {'more': False}})
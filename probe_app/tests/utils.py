@@ -0,0 +1,13 @@
+"""Shared fixtures of the probe_app tests."""
+from django.contrib.auth.models import User
+
+from probe_app.models import APIRequest, Collection, Project
+
+
+def make_request(url, method='GET', username='tester', **fields):
+    """A saved APIRequest in a new project and collection owned by ``username``."""
+    user, _ = User.objects.get_or_create(username=username)
+    project = Project.objects.create(name='Project', owner=user)
+    collection = Collection.objects.create(name='Collection', project=project)
+    return APIRequest.objects.create(collection=collection, name='Request', url=url, method=method,
+                                     **fields)
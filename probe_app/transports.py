@@ -0,0 +1,370 @@
+"""
+HTTP transports for probes: HTTP/1.1 with requests, HTTP/2 with httpx.
+
+``APIRequest.http_version`` selects the protocol: ``'1.1'`` uses
+``requests`` as before, ``'2'`` requires HTTP/2 (ALPN over TLS, prior
+knowledge over plain HTTP) and ``'prefer-2'`` offers HTTP/2 and falls back
+to HTTP/1.1 when the server does not negotiate it. HTTP/2 needs the optional
+``httpx[http2]`` package; without it ``'prefer-2'`` probes use HTTP/1.1.
+
+A ``ProbeSession`` holds the connections shared by the probes of one run.
+Its httpx clients are shared by every worker thread, so concurrent HTTP/2
+probes to one host are multiplexed as streams over a few connections rather
+than opening one connection each. HTTP/1.1 probes keep one requests session
+per thread.
+
+Either way the probe gets a ``ProbeResponse`` whose body has been read
+under the attempt's deadline, and httpx errors are raised as the matching
+``requests`` exceptions so callers handle one set of errors. HTTP/1.1
+probes send on connections that attach themselves to the deadline of the
+attempt using them, so a probe can be cut off or cancelled while it still
+waits for the response headers. HTTP/2 streams share their connection, so
+rather than shutting it down their reads time out when the deadline passes. Streamed request
+bodies (``probe_app.bodies``) are opened afresh for every attempt and the
+response carries their upload statistics.
+
+Response bodies are read as they came over the wire and decoded by
+``probe_app.compression.ContentDecoder``, which bounds the body size and
+measures the compressed and decoded sizes and the decompression time; the
+response carries those transfer statistics too.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import DecodeError, ProtocolError, ReadTimeoutError, SSLError
+
+from .bodies import BodyReader, StreamingBody
+from .compression import DECODE_CHUNK_SIZE, ContentDecoder
+from .deadlines import armed
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    import httpx
+except ImportError:
+    httpx = None
+
+# Whether HTTP/2 probes can be sent
+HTTP2_AVAILABLE = httpx is not None
+
+# Protocol choices of APIRequest.http_version
+HTTP_VERSIONS = ('1.1', '2', 'prefer-2')
+
+# Protocol names of urllib3's numeric response versions
+_REQUESTS_VERSIONS = {9: 'HTTP/0.9', 10: 'HTTP/1.0', 11: 'HTTP/1.1', 20: 'HTTP/2'}
+
+
+# The deadline of the attempt each thread is sending, if any
+_sending = threading.local()
+
+
+class _DeadlineConnectionMixin:
+    """Attaches the connection to the deadline of the attempt sending on it."""
+
+    def _attach(self):
+        deadline = getattr(_sending, 'deadline', None)
+        if deadline is not None:
+            deadline.attach(self)
+
+    def connect(self):
+        super().connect()
+        self._attach()
+
+    def request(self, *args, **kwargs):
+        # A reused connection is already connected; a new one attaches again once it is
+        self._attach()
+        return super().request(*args, **kwargs)
+
+
+class _DeadlineHTTPConnection(_DeadlineConnectionMixin, HTTPConnection):
+    pass
+
+
+class _DeadlineHTTPSConnection(_DeadlineConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _DeadlineHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _DeadlineHTTPConnection
+
+
+class _DeadlineHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _DeadlineHTTPSConnection
+
+
+_DEADLINE_POOL_CLASSES = {'http': _DeadlineHTTPConnectionPool, 'https': _DeadlineHTTPSConnectionPool}
+
+
+class _DeadlineAdapter(HTTPAdapter):
+    """An HTTPAdapter whose connections attach themselves to the attempt's deadline."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _DEADLINE_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        if not proxy.lower().startswith('socks'):
+            manager.pool_classes_by_scheme = _DEADLINE_POOL_CLASSES
+        return manager
+
+
+def _new_requests_session():
+    session = requests.Session()
+    adapter = _DeadlineAdapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ProbeResponse:
+    """
+    The status, headers and fully read (decoded) body of one upstream
+    response, its transfer statistics (``ContentDecoder.stats``) and the
+    upload statistics of a streamed request body (``BodyReader.stats``).
+    """
+
+    __slots__ = ('status_code', 'headers', 'content', 'encoding', 'http_version', 'upload',
+                 'transfer')
+
+    def __init__(self, status_code, headers, content, encoding, http_version, upload=None,
+                 transfer=None):
+        self.status_code = status_code
+        self.headers = headers  # Case-insensitive mapping
+        self.content = content
+        self.encoding = encoding
+        self.http_version = http_version
+        self.upload = upload
+        self.transfer = transfer
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8', errors='replace')
+
+
+def _translate_httpx_error(error):
+    """The requests exception matching an httpx one."""
+    if isinstance(error, httpx.ConnectTimeout):
+        return requests.ConnectTimeout(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.ReadTimeout(str(error))
+    if isinstance(error, (httpx.NetworkError, httpx.RemoteProtocolError)):
+        return requests.ConnectionError(str(error))
+    if isinstance(error, httpx.TooManyRedirects):
+        return requests.TooManyRedirects(str(error))
+    if isinstance(error, httpx.InvalidURL):
+        return requests.exceptions.InvalidURL(str(error))
+    return requests.RequestException(str(error))
+
+
+def _new_httpx_client(http_version, verify):
+    # Plain HTTP has no ALPN, so HTTP/2-only clients speak it with prior knowledge
+    return httpx.Client(http1=http_version == 'prefer-2', http2=True, verify=verify)
+
+
+class ProbeSession:
+    """
+    Connections reused by the probes of one run, shared by its worker threads.
+
+    Use as a context manager, or call ``close`` once the run is over.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._requests_sessions = []
+        self._httpx_clients = {}
+
+    def requests_session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = _new_requests_session()
+            with self._lock:
+                self._requests_sessions.append(session)
+        return session
+
+    def httpx_client(self, http_version, verify):
+        key = (http_version, verify)
+        with self._lock:
+            client = self._httpx_clients.get(key)
+            if client is None:
+                client = self._httpx_clients[key] = _new_httpx_client(http_version, verify)
+            return client
+
+    def close(self):
+        with self._lock:
+            sessions, self._requests_sessions = self._requests_sessions, []
+            clients, self._httpx_clients = list(self._httpx_clients.values()), {}
+        for session in sessions:
+            session.close()
+        for client in clients:
+            client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_body(request_kwargs, deadline):
+    """
+    Open a new reader over a streamed request body for one attempt.
+
+    Returns:
+        (request_kwargs with the reader as ``data``, the reader or None)
+    """
+    body = request_kwargs.get('data')
+    if not isinstance(body, StreamingBody):
+        return request_kwargs, None
+    reader = body.open(deadline)
+    return dict(request_kwargs, data=reader), reader
+
+
+def _raw_chunks(response):
+    """
+    The body of a streamed requests response as received, without content
+    decoding, with urllib3 errors raised as requests ones (as iter_content does).
+    """
+    try:
+        yield from response.raw.stream(DECODE_CHUNK_SIZE, decode_content=False)
+    except ProtocolError as e:
+        raise requests.exceptions.ChunkedEncodingError(e) from e
+    except DecodeError as e:
+        raise requests.exceptions.ContentDecodingError(e) from e
+    except ReadTimeoutError as e:
+        raise requests.ConnectionError(e) from e
+    except SSLError as e:
+        raise requests.exceptions.SSLError(e) from e
+
+
+def _send_requests(session, probe, deadline, fresh):
+    connect_timeout, read_timeout, _ = probe['timeouts']
+    shared = session is not None and not fresh
+    client = session.requests_session() if shared else _new_requests_session()
+    request_kwargs, upload = _open_body(probe['request_kwargs'], deadline)
+    if upload is not None and upload.chunked:
+        # Without a length requests sends Transfer-Encoding: chunked
+        request_kwargs['data'] = iter(upload)
+    _sending.deadline = deadline
+    try:
+        with armed(deadline):
+            response = client.request(probe['method'], probe['url'], stream=True,
+                                      timeout=(connect_timeout, read_timeout), **request_kwargs)
+    finally:
+        _sending.deadline = None
+        if upload is not None:
+            upload.close()
+        if not shared:
+            # The response keeps its connection; only the idle pool is closed
+            client.close()
+    # The body is streamed so a trickling server cannot outlast the total deadline
+    decoder = ContentDecoder(response.headers.get('Content-Encoding'))
+    try:
+        with armed(deadline, response):
+            for chunk in _raw_chunks(response):
+                decoder.feed(chunk)
+            content = decoder.finish()
+    except requests.RequestException:
+        # A body cut short (too large, corrupt) leaves the connection unusable
+        response.close()
+        raise
+    response.raw.release_conn()
+    return ProbeResponse(response.status_code, response.headers, content, response.encoding,
+                         _REQUESTS_VERSIONS.get(response.raw.version, ''),
+                         upload.stats() if upload is not None else None, decoder.stats())
+
+
+def _httpx_request_kwargs(url, request_kwargs):
+    """
+    Translate the URL and requests keyword arguments of a probe for httpx.
+
+    The params are merged into the URL's own query string, as requests does;
+    httpx would replace the query string with them.
+    """
+    kwargs = {key: request_kwargs[key] for key in ('headers', 'json') if key in request_kwargs}
+    params = request_kwargs.get('params')
+    kwargs['url'] = httpx.URL(url).copy_merge_params(params) if params else url
+    data = request_kwargs.get('data')
+    if isinstance(data, BodyReader):
+        # An iterator is sent chunked unless the length is set (HTTP/2 drops the chunking)
+        kwargs['content'] = iter(data)
+        if not data.chunked:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Content-Length': str(len(data))})
+    elif isinstance(data, (bytes, str)):
+        kwargs['content'] = data
+    elif data is not None:
+        kwargs['data'] = data
+    return kwargs
+
+
+def _bound_reads(request, read_timeout, deadline):
+    """
+    Let the next read of an httpx request wait no longer than its deadline.
+
+    httpx looks the timeouts up in the request on every HTTP/2 read, so a
+    stalled stream times out when its deadline passes.
+    """
+    request.extensions['timeout']['read'] = max(min(read_timeout, deadline.remaining()), 0.001)
+
+
+def _send_httpx(session, probe, deadline, fresh):
+    connect_timeout, read_timeout, _ = probe['timeouts']
+    request_kwargs, upload = _open_body(probe['request_kwargs'], deadline)
+    verify = request_kwargs.get('verify', True)
+    shared = session is not None and not fresh
+    client = (session.httpx_client(probe['http_version'], verify) if shared
+              else _new_httpx_client(probe['http_version'], verify))
+    try:
+        request = client.build_request(
+            probe['method'], timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            **_httpx_request_kwargs(probe['url'], request_kwargs))
+        _bound_reads(request, read_timeout, deadline)
+        with armed(deadline):
+            response = client.send(request, stream=True, auth=request_kwargs.get('auth'),
+                                   follow_redirects=request_kwargs.get('allow_redirects', True))
+        try:
+            # An HTTP/1.1 response has its connection to itself, which the deadline
+            # shuts down. HTTP/2 streams share theirs, so their reads are bounded by
+            # the deadline instead and it is checked between chunks
+            own_connection = response.http_version != 'HTTP/2'
+            decoder = ContentDecoder(response.headers.get('Content-Encoding'))
+            with armed(deadline, response if own_connection else None):
+                chunks = response.iter_raw()
+                while True:
+                    _bound_reads(response.request, read_timeout, deadline)
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        break
+                    deadline.check()
+                    decoder.feed(chunk)
+                content = decoder.finish()
+        finally:
+            response.close()
+    except httpx.HTTPError as e:
+        raise _translate_httpx_error(e) from e
+    finally:
+        if upload is not None:
+            upload.close()
+        if not shared:
+            client.close()
+    return ProbeResponse(response.status_code, response.headers, content,
+                         response.encoding, response.http_version,
+                         upload.stats() if upload is not None else None, decoder.stats())
+
+
+def send(session, probe, deadline, fresh=False):
+    """
+    Send a prepared probe and read its response under ``deadline``.
+
+    ``session`` is a ProbeSession or None for one-off connections; ``fresh``
+    forces a new connection even with a session (hedged duplicates).
+
+    Raises:
+        requests.RequestException: If the upstream call fails
+    """
+    if probe.get('http_version', '1.1') == '1.1':
+        return _send_requests(session, probe, deadline, fresh)
+    return _send_httpx(session, probe, deadline, fresh)
@@ -0,0 +1,70 @@
+"""
+Indexed user lookup for the team member picker.
+
+Matches are case-insensitive prefixes of the username or the email address,
+served by expression indexes on ``LOWER(username)`` and ``LOWER(email)``
+(created by migration 0006): range scans on SQLite, ``LIKE 'prefix%'`` with
+``text_pattern_ops`` on PostgreSQL. Pages are fetched with one extra row to
+tell whether there are more, so no query ever counts the matches.
+
+Short prefixes match the most users and are what every search starts with,
+so their pages are cached for ``PROBEFLEX_USER_SEARCH_CACHE_TTL`` seconds.
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+
+# Seconds a page of results for a short prefix stays cached (0 disables caching)
+USER_SEARCH_CACHE_TTL = getattr(settings, 'PROBEFLEX_USER_SEARCH_CACHE_TTL', 30)
+
+# Only prefixes up to this many characters are cached; longer ones are selective enough
+USER_SEARCH_CACHE_MAX_LENGTH = 3
+
+# Sorts after every other character in SQLite's binary collation
+_MAX_CHARACTER = '\U0010ffff'
+
+
+def _prefix_filter(field, prefix):
+    """Case-insensitive prefix condition on ``field`` that can use its LOWER() index."""
+    if connection.vendor == 'sqlite':
+        # SQLite's LIKE is case-insensitive and cannot use an index: compare a range instead
+        return Q(**{f"{field}_lower__gte": prefix, f"{field}_lower__lt": prefix + _MAX_CHARACTER})
+    return Q(**{f"{field}_lower__startswith": prefix})
+
+
+def _fetch_page(prefix, page, page_size):
+    offset = (page - 1) * page_size
+    users = (User.objects
+             .annotate(username_lower=Lower('username'), email_lower=Lower('email'))
+             .filter(_prefix_filter('username', prefix) | _prefix_filter('email', prefix))
+             .order_by('username')
+             .values_list('id', 'username', 'email'))
+    return list(users[offset:offset + page_size + 1])
+
+
+def search_users(query, page=1, page_size=20):
+    """
+    Find users whose username or email starts with ``query``.
+
+    Returns:
+        (rows, has_more) where rows is a list of (id, username, email)
+    """
+    prefix = query.strip().lower()
+    cache_key = None
+    if USER_SEARCH_CACHE_TTL and len(prefix) <= USER_SEARCH_CACHE_MAX_LENGTH:
+        digest = hashlib.md5(prefix.encode('utf-8')).hexdigest()
+        cache_key = f"probeflex:user-search:{digest}:{page}:{page_size}"
+        rows = cache.get(cache_key)
+        if rows is not None:
+            return rows[:page_size], len(rows) > page_size
+
+    rows = _fetch_page(prefix, page, page_size)
+    if cache_key:
+        cache.set(cache_key, rows, USER_SEARCH_CACHE_TTL)
+    return rows[:page_size], len(rows) > page_size
@@ -1,20 +1,33 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.views import LoginView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, ListView, DetailView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.contrib.auth.models import User
-from django.db.models import Q
+from django.db.models import Count, Q
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
 
 from .forms import (
     CustomAuthenticationForm, CustomUserCreationForm, 
     ProjectForm, CollectionForm, TeamForm, APIRequestForm
 )
 from .models import Project, Collection, Team, APIRequest, RequestHistory
+from .codec import json_response, loads as codec_loads
+from .diffing import diff_history
+from .search import SearchQueryError, search_history as search_history_index
+from .usersearch import search_users
+from .engine import ProbeConfigError, prepare_probe, record_failure, record_history
+from .governor import GovernorTimeout
+from .exporters import EXPORT_FORMATS, export_stream
+from .metrics import REGISTRY, OVERHEAD_LATENCY, project_label
+from .spool import SpoolError, client_payload, get_node, read_range
+from .singleflight import execute_coalesced
+from .runs import MAX_RUN_PROBES, start_collection_run, get_run, iter_run_events, aiter_run_events
+from .streaming import is_asgi_request, server_stream
 
 import requests
 import json
@@ -89,6 +102,16 @@ def home(request):
     return render(request, 'home.html', context)
 
 
+def _record_failure(api_request, probe, error, user):
+    """Save a failed execution of a saved API request to history, keeping its attempts."""
+    if api_request is None or probe is None:
+        return
+    try:
+        record_failure(api_request, probe, error, user)
+    except Exception as history_error:
+        print(f"Error saving request history: {str(history_error)}")
+
+
 @login_required
 @require_POST
 @csrf_exempt  # For test purposes only, remove in production
@@ -107,9 +130,9 @@ def send_request(request):
     - Custom headers and query parameters
     - JSON request bodies for POST/PUT/PATCH requests
     - SSL verification control and redirect following
-    - Request timeout handling
+    - Request timeouts (connect, read and total deadline from the request's timeout)
     - Response time measurement
-    - Automatic request history tracking
+    - Automatic request history tracking, including executions that got no response
     
     Returns:
         JsonResponse containing:
@@ -117,15 +140,23 @@ def send_request(request):
         - headers: Response headers as dictionary
         - body: Response body (JSON or text)
         - time: Response time in milliseconds
+        - queue_time: Time queued for the per-host governor in milliseconds
+        - attempts: Every attempt made under the request's retry policy
+        - http_version: Protocol negotiated with the server (HTTP/1.1 or HTTP/2)
+        - wire_size, content_encoding, decompression_time: The response body as
+          received and the time spent decoding it (body_size is the decoded size)
+        - request_compression: Sizes and time of a compressed request body
+        - coalesced: Present (true) when an identical probe in flight answered it
     """
+    handler_start = time.perf_counter()
+    api_request = probe = None
     try:
         # Debug logging for request analysis
         print(f"Request received: {request.body[:1000] if hasattr(request, 'body') else 'No body'}")
         
         # Handle both JSON and form data input formats
         if request.content_type == 'application/json':
-            data = json.loads(request.body)
-            print(f"Parsed JSON data: {json.dumps(data)[:1000]}")
+            data = codec_loads(request.body)
         else:
             # Handle form data from older interfaces
             data = {
@@ -136,209 +167,63 @@ def send_request(request):
                 'body': {},
                 'auth': {},
             }
-            
-        # Extract request configuration from parsed data
-        url = data.get('url', '')
-        method = data.get('method', 'GET').upper()
-        headers = data.get('headers', {})
-        params = data.get('params', {})
-        request_body = data.get('body', {})
-        auth_data = data.get('auth', {})
-        follow_redirects = data.get('follow_redirects', True)
-        verify_ssl = data.get('verify_ssl', True)
-        
-        # Validate required fields
-        if not url:
-            return JsonResponse({'error': 'URL is required'}, status=400)
-        
-        # Debug logging for request processing
-        print(f"Processing request: {method} {url}")
-        print(f"Verify SSL: {verify_ssl}")
-        print(f"Auth data structure: {type(auth_data)}")
-        print(f"Auth data: {json.dumps(auth_data)}")
-        print(f"Headers before auth: {json.dumps(headers)}")
-        
-        # Check if authentication is already applied to headers (by client-side JS)
-        auth_already_applied = False
-        if 'Authorization' in headers:
-            print(f"Authorization header already exists: {headers['Authorization'][:15]}...")
-            auth_already_applied = True
-        
-        # Handle different authentication methods
-        auth = None
-        
-        # Basic Authentication: uses HTTP Basic Auth with username/password
-        if auth_data and auth_data.get('type') == 'basic':
-            username = auth_data.get('username', '')
-            password = auth_data.get('password', '')
-            if username:
-                auth = (username, password)
-                print(f"Using Basic Auth: username={username}, password={'*'*len(password) if password else 'None'}")
-                
-        # Bearer Token Authentication: adds Authorization header with Bearer token
-        elif auth_data and auth_data.get('type') == 'bearer' and not auth_already_applied:
-            token = auth_data.get('token', '')
-            if token:
-                headers['Authorization'] = f"Bearer {token}"
-                print(f"Using Bearer Token Auth: {token[:5]}***")
-                
-        # API Key Authentication: can be in header or query parameter
-        elif auth_data and auth_data.get('type') == 'apikey' and not auth_already_applied:
-            key_name = auth_data.get('key', '')
-            key_value = auth_data.get('value', '')
-            location = auth_data.get('location', 'header')
-            
-            if key_name and key_value:
-                if location == 'header':
-                    headers[key_name] = key_value
-                    print(f"Using API Key Auth in header: {key_name}={key_value[:5]}***")
-                elif location == 'query':
-                    params[key_name] = key_value
-                    print(f"Using API Key Auth in query param: {key_name}={key_value[:5]}***")
-        
-        print(f"Headers after auth: {json.dumps(headers)}")
-        print(f"Auth tuple: {auth}")
-        
-        # Set default headers if not already present
-        if method in ['POST', 'PUT', 'PATCH'] and 'Content-Type' not in headers:
-            headers['Content-Type'] = 'application/json'
-        
-        # Add User-Agent for API identification
-        if 'User-Agent' not in headers:
-            headers['User-Agent'] = 'ProbeFlex/1.0 (API Testing Tool)'
-        
-        # Add Accept header for response format preference
-        if 'Accept' not in headers:
-            headers['Accept'] = 'application/json, text/plain, */*'
-        
-        print(f"Headers after defaults: {json.dumps(headers)}")
-        
-        # Record start time for response time measurement
-        start_time = time.time()
-        
-        # Prepare request configuration
-        request_kwargs = {
-            'headers': headers,
-            'params': params,
-            'verify': verify_ssl,
-            'allow_redirects': follow_redirects,
-            'timeout': 30  # Add a reasonable timeout to prevent hanging
-        }
-        
-        # Add Basic Auth if configured (for requests library)
-        if auth:
-            request_kwargs['auth'] = auth
-            print(f"Added Basic Auth to request_kwargs")
-        
-        # Debug logging (hide sensitive auth information)
-        debug_kwargs = request_kwargs.copy()
-        if 'auth' in debug_kwargs:
-            debug_kwargs['auth'] = '(AUTH CREDENTIALS HIDDEN)'
-        if 'headers' in debug_kwargs and 'Authorization' in debug_kwargs['headers']:
-            headers_copy = debug_kwargs['headers'].copy()
-            headers_copy['Authorization'] = headers_copy['Authorization'][:10] + '...'
-            debug_kwargs['headers'] = headers_copy
-        
-        print(f"Final request kwargs: {json.dumps(debug_kwargs)}")
         
-        # Handle request body for methods that support it
-        if method in ['POST', 'PUT', 'PATCH']:
-            # Send empty JSON object if no body provided
-            if not request_body or request_body == {}:
-                request_kwargs['json'] = {}
-            else:
-                request_kwargs['json'] = request_body
-            print(f"JSON body being sent: {request_kwargs.get('json', {})}")
-            
-        # Handle GET requests with body content (convert to query params)
-        elif method == 'GET' and request_body:
-            print(f"Warning: Body content sent with GET request: {request_body}")
-            # Convert body content to query parameters for GET requests
-            if isinstance(request_body, dict):
-                for key, value in request_body.items():
-                    request_kwargs['params'][key] = value
-        
-        # Execute the HTTP request based on method
-        if method == 'GET':
-            response = requests.get(url, **request_kwargs)
-        elif method == 'POST':
-            # Detailed logging for POST requests
-            print(f"=== MAKING POST REQUEST ===")
-            print(f"URL: {url}")
-            print(f"Headers: {request_kwargs.get('headers', {})}")
-            print(f"JSON Body: {request_kwargs.get('json', {})}")
-            print(f"Auth: {request_kwargs.get('auth', 'None')}")
-            print(f"Verify SSL: {request_kwargs.get('verify', True)}")
-            print(f"========================")
-            response = requests.post(url, **request_kwargs)
-        elif method == 'PUT':
-            response = requests.put(url, **request_kwargs)
-        elif method == 'PATCH':
-            response = requests.patch(url, **request_kwargs)
-        elif method == 'DELETE':
-            response = requests.delete(url, **request_kwargs)
-        elif method == 'HEAD':
-            response = requests.head(url, **request_kwargs)
-        elif method == 'OPTIONS':
-            response = requests.options(url, **request_kwargs)
-        else:
-            return JsonResponse({'error': 'Invalid HTTP method'}, status=400)
-        
-        # Log response details
-        print(f"=== RESPONSE RECEIVED ===")
-        print(f"Status Code: {response.status_code}")
-        print(f"Response Headers: {dict(response.headers)}")
-        print(f"Response Body (first 500 chars): {response.text[:500]}")
-        print(f"========================")
-        
-        # Calculate response time
-        end_time = time.time()
-        response_time = (end_time - start_time) * 1000  # Convert to milliseconds
+        # Look up the saved API request (if any) so the probe is attributed to its
+        # project, governed by the project's host limits and retried per its policy
+        api_request_id = data.get('api_request_id')
+        data['host_limits'] = {}
+        data['retry_policy'] = {}
+        if api_request_id:
+            api_request = (APIRequest.objects.select_related('collection__project')
+                           .filter(id=api_request_id).first())
+            if api_request:
+                data['project_id'] = api_request.collection.project_id
+                data['host_limits'] = api_request.collection.project.host_limits
+                data['retry_policy'] = api_request.retry_policy
+                if not data.get('timeout'):
+                    data['timeout'] = api_request.timeout
+                if not data.get('http_version'):
+                    data['http_version'] = api_request.http_version
+                if 'request_compression' not in data:
+                    data['request_compression'] = api_request.request_compression
         
-        # Parse response body (attempt JSON first, fallback to text)
+        # Resolve authentication, default headers and body handling
         try:
-            response_body = response.json()
-        except ValueError:
-            response_body = response.text
+            probe = prepare_probe(data)
+        except ProbeConfigError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        print(f"Processing request: {probe['method']} {probe['url']}")
         
-        # Prepare response data for frontend
-        response_data = {
-            'status_code': response.status_code,
-            'headers': dict(response.headers),
-            'body': response_body,
-            'time': response_time
-        }
+        # Execute the HTTP request (shared with identical probes in flight when
+        # single-flight is enabled), spooling large bodies for lazy inspection
+        response_data = execute_coalesced(probe, spool_for=request.user)
         
         # Save request execution to history for tracking and debugging
-        api_request_id = data.get('api_request_id')
-        if api_request_id:
+        if api_request:
             try:
-                api_request = get_object_or_404(APIRequest, id=api_request_id)
-                
-                # Create detailed history record
-                history = RequestHistory.objects.create(
-                    request=api_request,
-                    url=url,
-                    method=method,
-                    headers=headers,
-                    params=params,
-                    body=request_body,
-                    auth=auth_data,
-                    response_status=response.status_code,
-                    response_headers=dict(response.headers),
-                    response_body=response_body,
-                    response_time=response_time,
-                    executed_by=request.user
-                )
+                record_history(api_request, probe, response_data, request.user)
             except Exception as history_error:
                 print(f"Error saving request history: {str(history_error)}")
                 # Don't fail the main request if history saving fails
         
-        print(f"Request completed: {method} {url} - {response.status_code}")
-        return JsonResponse(response_data)
-    
+        print(f"Request completed: {probe['method']} {probe['url']} - {response_data['status_code']}")
+        payload = client_payload(response_data)
+        OVERHEAD_LATENCY.observe(
+            max(0.0, time.perf_counter() - handler_start -
+                (response_data['time'] + response_data['queue_time']) / 1000),
+            project=project_label(probe['project_id']))
+        return json_response(payload)
+    
+    except GovernorTimeout as e:
+        print(f"Governor timeout: {str(e)}")
+        return JsonResponse({'error': str(e)}, status=503)
+    except requests.Timeout as e:
+        print(f"Request timeout: {str(e)}")
+        _record_failure(api_request, probe, e, request.user)
+        return JsonResponse({'error': str(e)}, status=504)
     except requests.RequestException as e:
         print(f"Request error: {str(e)}")
+        _record_failure(api_request, probe, e, request.user)
         return JsonResponse({'error': str(e)}, status=500)
     except json.JSONDecodeError as e:
         print(f"JSON decode error: {str(e)}")
@@ -398,9 +283,19 @@ class ProjectDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
                 project.teams.filter(members=self.request.user).exists())
     
     def get_context_data(self, **kwargs):
-        """Add project's collections to the template context."""
+        """
+        Add project's collections to the template context.
+        
+        Each collection carries its request count and how many of its requests
+        passed or failed on their latest execution, counted from the request
+        summaries in the same query.
+        """
         context = super().get_context_data(**kwargs)
-        context['collections'] = self.object.collections.all()
+        context['collections'] = self.object.collections.annotate(
+            request_count=Count('requests'),
+            passing_count=Count('requests', filter=Q(requests__summary__last_passed=True)),
+            failing_count=Count('requests', filter=Q(requests__summary__last_passed=False)),
+        )
         return context
 
 
@@ -519,9 +414,9 @@ class CollectionDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
                 project.teams.filter(members=self.request.user).exists())
     
     def get_context_data(self, **kwargs):
-        """Add collection's API requests to the template context."""
+        """Add collection's API requests, with their execution summaries, to the template context."""
         context = super().get_context_data(**kwargs)
-        context['requests'] = self.object.requests.all()
+        context['requests'] = self.object.requests.select_related('summary')
         return context
 
 
@@ -783,8 +678,9 @@ def user_search(request):
     """
     AJAX endpoint for searching users to add to teams.
     
-    Supports searching by username or email with pagination.
-    Used by Select2 widget in team forms for user selection.
+    Matches users whose username or email starts with the search term
+    (case-insensitive), using indexed lookups. Used by Select2 widget in team
+    forms for user selection.
     
     Query Parameters:
         q: Search term for username or email
@@ -798,7 +694,7 @@ def user_search(request):
         }
     """
     query = request.GET.get('q', '').strip()
-    page = int(request.GET.get('page', 1))
+    page = max(_int_param(request, 'page', 1), 1)
     page_size = 20
     
     if not query:
@@ -807,28 +703,406 @@ def user_search(request):
             'pagination': {'more': False}
         })
     
-    # Search users by username or email, excluding the current user
-    users = User.objects.filter(
-        Q(username__icontains=query) | Q(email__icontains=query)
-    ).exclude(id=request.user.id).order_by('username')
-    
-    # Implement pagination
-    start_offset = (page - 1) * page_size
-    end_offset = start_offset + page_size
-    
-    paginated_users = users[start_offset:end_offset]
-    has_more = users.count() > end_offset
+    # Pages are shared between users (and cached), so the current user is dropped here
+    rows, has_more = search_users(query, page=page, page_size=page_size)
     
     # Format results for Select2
     results = []
-    for user in paginated_users:
+    for user_id, username, email in rows:
+        if user_id == request.user.id:
+            continue
         results.append({
-            'id': user.id,
-            'username': user.username,
-            'email': user.email or '',
+            'id': user_id,
+            'username': username,
+            'email': email or '',
         })
     
     return JsonResponse({
         'results': results,
         'pagination': {'more': has_more}
     })
+
+
+# ============================================================================
+# HISTORY EXPORT VIEW
+# ============================================================================
+
+@login_required
+@require_GET
+def export_history(request):
+    """
+    Stream request history as a HAR or JSONL download.
+    
+    History is selected by exactly one scope (an API request, a collection or a
+    project) plus an optional time range. Rows are read with a server-side
+    iterator and written to the response as they arrive, so memory use stays
+    flat no matter how many executions are exported.
+    
+    Query Parameters:
+        format: 'jsonl' (default) or 'har'
+        request / collection / project: ID of the scope to export
+        since / until: Optional ISO 8601 datetimes bounding executed_at
+        gzip: '1' to gzip-compress the stream
+    
+    Returns:
+        StreamingHttpResponse with the export as an attachment
+    """
+    export_format = request.GET.get('format', 'jsonl').lower()
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': 'Unsupported export format'}, status=400)
+    
+    for scope in ('request', 'collection', 'project'):
+        value = request.GET.get(scope)
+        if value and not value.isdigit():
+            return JsonResponse({'error': f'Invalid {scope} ID'}, status=400)
+
+    # Resolve the requested scope to its owning project for the access check
+    if request.GET.get('request'):
+        api_request = get_object_or_404(APIRequest.objects.select_related('collection__project'),
+                                        id=request.GET['request'])
+        project = api_request.collection.project
+        history = RequestHistory.objects.filter(request=api_request)
+        scope_name = f"request-{api_request.id}"
+    elif request.GET.get('collection'):
+        collection = get_object_or_404(Collection.objects.select_related('project'),
+                                       id=request.GET['collection'])
+        project = collection.project
+        history = RequestHistory.objects.filter(request__collection=collection)
+        scope_name = f"collection-{collection.id}"
+    elif request.GET.get('project'):
+        project = get_object_or_404(Project, id=request.GET['project'])
+        history = RequestHistory.objects.filter(request__collection__project=project)
+        scope_name = f"project-{project.id}"
+    else:
+        return JsonResponse({'error': 'One of request, collection or project is required'}, status=400)
+    
+    if not (project.owner == request.user or
+            project.teams.filter(members=request.user).exists()):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    # Apply the optional time range
+    for param, lookup in (('since', 'executed_at__gte'), ('until', 'executed_at__lt')):
+        value = request.GET.get(param)
+        if value:
+            moment = parse_datetime(value)
+            if moment is None:
+                return JsonResponse({'error': f'Invalid {param} datetime'}, status=400)
+            history = history.filter(**{lookup: moment})
+    
+    # Export oldest first so HAR viewers show executions in chronological order
+    history = history.order_by('executed_at', 'id')
+    
+    compress = request.GET.get('gzip') in ('1', 'true')
+    filename = f"probeflex-{scope_name}.{export_format}"
+    if compress:
+        filename += '.gz'
+    
+    response = StreamingHttpResponse(
+        server_stream(request, export_stream(history, export_format, compress=compress)),
+        content_type='application/gzip' if compress else EXPORT_FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# ============================================================================
+# HISTORY SEARCH VIEW
+# ============================================================================
+
+@login_required
+@require_GET
+def search_history(request):
+    """
+    Search the request history of every project the user can access.
+    
+    Uses the history search index (see probe_app.search), so matching URLs,
+    header values and response body content does not scan stored responses.
+    
+    Query Parameters:
+        q: Search string, e.g. 'timeout $.error.code=RATE_LIMITED status:429'
+        project: Optional project ID to restrict the search to
+        limit: Maximum number of results (default 50, at most 200)
+    
+    Returns:
+        JsonResponse with the newest matching executions and a has_more flag
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'A search query is required'}, status=400)
+    limit = min(max(_int_param(request, 'limit', 50), 1), 200)
+    project_id = request.GET.get('project')
+    if project_id and not project_id.isdigit():
+        return JsonResponse({'error': 'Invalid project ID'}, status=400)
+
+    projects = (Project.objects.filter(owner=request.user) |
+                Project.objects.filter(teams__members=request.user))
+    if project_id:
+        projects = projects.filter(id=project_id)
+    history = RequestHistory.objects.filter(
+        request__collection__project__in=projects.values('id'))
+    try:
+        history = search_history_index(history, query)
+    except SearchQueryError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    # Fetch one extra row to know whether there are more results
+    entries = list(history.select_related('request')
+                   .only('id', 'url', 'method', 'response_status', 'response_time',
+                         'executed_at', 'request__id', 'request__name')
+                   .order_by('-executed_at', '-id')[:limit + 1])
+    results = [{
+        'id': entry.id,
+        'request_id': entry.request.id,
+        'request_name': entry.request.name,
+        'method': entry.method,
+        'url': entry.url,
+        'status': entry.response_status,
+        'response_time': entry.response_time,
+        'executed_at': entry.executed_at,
+    } for entry in entries[:limit]]
+    return json_response({'results': results, 'has_more': len(entries) > limit})
+
+
+# ============================================================================
+# COLLECTION RUN VIEWS
+# ============================================================================
+
+@login_required
+@require_POST
+def run_collection(request, pk):
+    """
+    Start executing every API request in a collection in the background.
+    
+    Accepts an optional JSON body with 'iterations' (how many times to run the
+    collection), 'concurrency' (number of worker threads) and 'save_history'.
+    Progress is published on the run's event stream.
+    
+    Returns:
+        JsonResponse with the run_id and the URL of its event stream, or a 400
+        when requests x iterations exceeds MAX_RUN_PROBES
+    """
+    collection = get_object_or_404(Collection.objects.select_related('project'), id=pk)
+    project = collection.project
+    if not (project.owner == request.user or
+            project.teams.filter(members=request.user).exists()):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    try:
+        options = json.loads(request.body) if request.body else {}
+        iterations = int(options.get('iterations', 1))
+        concurrency = int(options.get('concurrency', 1))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'error': 'Invalid run options'}, status=400)
+    if iterations < 1 or iterations * collection.requests.count() > MAX_RUN_PROBES:
+        return JsonResponse({'error': f"Between 1 and {MAX_RUN_PROBES} probes per run "
+                                      f"(requests x iterations)"}, status=400)
+    
+    run = start_collection_run(collection, request.user,
+                               iterations=iterations,
+                               concurrency=concurrency,
+                               save_history=bool(options.get('save_history', True)))
+    return JsonResponse({
+        'run_id': run.id,
+        'total': run.total,
+        'events_url': reverse('run_events', kwargs={'run_id': run.id}),
+    }, status=202)
+
+
+def _get_accessible_run(request, run_id):
+    """Return the run if it exists and the user may see its project, else None."""
+    run = get_run(run_id)
+    if run is None:
+        return None
+    project = get_object_or_404(Project, id=run.project_id)
+    if not (project.owner == request.user or
+            project.teams.filter(members=request.user).exists()):
+        return None
+    return run
+
+
+@login_required
+@require_GET
+def run_events(request, run_id):
+    """
+    Server-Sent Events stream with live progress for a collection run.
+    
+    Emits coalesced 'progress' events (counters, latency percentiles, a coarse
+    latency histogram and the newest per-request results) at a fixed maximum
+    rate, followed by a single 'done' event when the run ends.
+    """
+    run = _get_accessible_run(request, run_id)
+    if run is None:
+        return JsonResponse({'error': 'Run not found'}, status=404)
+    
+    events = aiter_run_events(run) if is_asgi_request(request) else iter_run_events(run)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering (nginx)
+    return response
+
+
+@login_required
+@require_POST
+def cancel_run(request, run_id):
+    """Stop a running collection run, aborting the probes it has in flight."""
+    run = _get_accessible_run(request, run_id)
+    if run is None:
+        return JsonResponse({'error': 'Run not found'}, status=404)
+    run.cancel()
+    return JsonResponse({'run_id': run.id, 'state': 'cancelling'})
+
+
+# ============================================================================
+# HISTORY DIFF VIEWS
+# ============================================================================
+
+def _get_accessible_history(request, pk):
+    """Return the history entry if the user may see its project, else None."""
+    entry = get_object_or_404(
+        RequestHistory.objects.select_related('request__collection__project').defer('response_body'),
+        id=pk)
+    project = entry.request.collection.project
+    if not (project.owner == request.user or
+            project.teams.filter(members=request.user).exists()):
+        return None
+    return entry
+
+
+@login_required
+@require_GET
+def history_diff(request, pk):
+    """
+    Compare the response of a history entry with another execution.
+    
+    Query Parameters:
+        against: 'previous' (the preceding execution of the same request, the
+                 default), 'baseline' (the request's pinned baseline) or the
+                 ID of any history entry of a request in an accessible project
+    
+    Returns:
+        JsonResponse with a structural diff for JSON bodies or a unified
+        line diff for text bodies
+    """
+    entry = _get_accessible_history(request, pk)
+    if entry is None:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    against = request.GET.get('against', 'previous')
+    if against == 'previous':
+        other = (RequestHistory.objects.filter(request_id=entry.request_id)
+                 .filter(Q(executed_at__lt=entry.executed_at) |
+                         Q(executed_at=entry.executed_at, id__lt=entry.id))
+                 .defer('response_body').order_by('-executed_at', '-id').first())
+        if other is None:
+            return JsonResponse({'error': 'No previous execution to compare with'}, status=404)
+    elif against == 'baseline':
+        baseline_id = entry.request.baseline_id
+        if baseline_id is None:
+            return JsonResponse({'error': 'No baseline pinned for this request'}, status=404)
+        other = _get_accessible_history(request, baseline_id)
+    else:
+        try:
+            other = _get_accessible_history(request, int(against))
+        except ValueError:
+            return JsonResponse({'error': "against must be 'previous', 'baseline' or a history ID"},
+                                status=400)
+    if other is None:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    return json_response(diff_history(other, entry))
+
+
+@login_required
+@require_POST
+def pin_baseline(request, pk):
+    """
+    Pin a history entry as the baseline response of its API request.
+    
+    Accepts an optional JSON body {"pinned": false} to remove the baseline
+    instead, if this entry is the one currently pinned.
+    """
+    entry = _get_accessible_history(request, pk)
+    if entry is None:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    try:
+        options = json.loads(request.body) if request.body else {}
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    
+    api_request = entry.request
+    if options.get('pinned', True):
+        api_request.baseline = entry
+    elif api_request.baseline_id == entry.id:
+        api_request.baseline = None
+    api_request.save(update_fields=['baseline'])
+    return JsonResponse({'request_id': api_request.id, 'baseline_id': api_request.baseline_id})
+
+
+# ============================================================================
+# LARGE RESPONSE INSPECTION VIEWS
+# ============================================================================
+
+def _int_param(request, name, default):
+    """Read an integer query parameter, falling back to the default when invalid."""
+    try:
+        return int(request.GET.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+@login_required
+@require_GET
+def response_node(request, ref):
+    """
+    Return one node of a spooled JSON response, with a page of its children.
+    
+    Query Parameters:
+        pointer: RFC 6901 JSON pointer of the node (default: document root)
+        offset / limit: Window of children to return for objects and arrays
+    """
+    try:
+        node = get_node(ref, request.user.id,
+                        pointer=request.GET.get('pointer', ''),
+                        offset=_int_param(request, 'offset', 0),
+                        limit=_int_param(request, 'limit', 100))
+    except SpoolError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    return json_response(node)
+
+
+@login_required
+@require_GET
+def response_range(request, ref):
+    """
+    Return a byte range of a spooled response body as text.
+    
+    Query Parameters:
+        offset: Byte offset to start reading at (default 0)
+        length: Number of bytes to read (default 64 KB, capped at 1 MB)
+    """
+    try:
+        chunk = read_range(ref, request.user.id,
+                           offset=_int_param(request, 'offset', 0),
+                           length=_int_param(request, 'length', 64 * 1024))
+    except SpoolError as e:
+        return JsonResponse({'error': str(e)}, status=404)
+    return json_response(chunk)
+
+
+# ============================================================================
+# METRICS VIEW
+# ============================================================================
+
+@require_GET
+def metrics(request):
+    """
+    Expose probe engine metrics in the Prometheus text format.
+    
+    When PROBEFLEX_METRICS_TOKEN is configured, scrapers must send it as a
+    bearer token; otherwise the endpoint is open, as is usual for /metrics.
+    """
+    token = getattr(settings, 'PROBEFLEX_METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponse('Unauthorized', status=401, content_type='text/plain')
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
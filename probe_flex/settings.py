@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'crispy_forms',
     'crispy_bootstrap5',
     'rest_framework',
+    'rest_framework.authtoken',
     'allauth',
     'allauth.account',
     'allauth.socialaccount',
@@ -92,6 +93,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock when a transaction starts, so concurrent executions updating
+        # the same request summary wait for each other instead of failing with "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
 
@@ -166,3 +170,67 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+
+# ProbeFlex probe engine
+# Response bodies larger than this many bytes are spooled to disk and inspected lazily
+PROBEFLEX_LARGE_RESPONSE_THRESHOLD = 256 * 1024
+PROBEFLEX_SPOOL_DIR = BASE_DIR / 'spool'
+PROBEFLEX_SPOOL_TTL = 60 * 60  # seconds
+# Response bodies of at least this many bytes are decoded in a pool of helper processes
+PROBEFLEX_OFFLOAD_THRESHOLD = 1024 * 1024
+PROBEFLEX_OFFLOAD_WORKERS = min(4, os.cpu_count() or 1)  # 0 decodes in the request thread
+# JSON codec for probe responses, history and event streams: 'auto' (orjson if installed), 'orjson' or 'json'
+PROBEFLEX_JSON_CODEC = 'auto'
+# Index history entries for full-text and body-field search as they are recorded
+PROBEFLEX_SEARCH_INDEX = True
+# Seconds the team member picker caches results for short search prefixes (0 disables)
+PROBEFLEX_USER_SEARCH_CACHE_TTL = 30
+# Site-wide outbound limits per destination host, e.g. {"api.example.com": {"rate": 10, "burst": 20, "concurrency": 4}}
+# (projects add their own in Project.host_limits; use a shared CACHES backend to enforce them across processes)
+PROBEFLEX_HOST_LIMITS = {}
+PROBEFLEX_GOVERNOR_MAX_WAIT = 60  # seconds a probe may queue for its host before failing
+# Probe timeouts in milliseconds: the connect and per-read budget caps and the longest total deadline allowed
+PROBEFLEX_CONNECT_TIMEOUT = 10000
+PROBEFLEX_READ_TIMEOUT = 30000
+PROBEFLEX_MAX_TIMEOUT = 300000
+# Threads sending hedged duplicates of slow probes (see APIRequest.retry_policy)
+PROBEFLEX_HEDGE_WORKERS = 32
+# Share one upstream call between identical GET/HEAD probes sent at the same time (across
+# processes too with a shared CACHES backend); followers' results and history are marked coalesced
+PROBEFLEX_SINGLE_FLIGHT = False
+PROBEFLEX_SINGLE_FLIGHT_RESULT_TTL = 5  # seconds a result stays readable by followers in other processes
+# Recent response times kept per request for the rolling p95 of its summary
+PROBEFLEX_SUMMARY_WINDOW = 100
+# Columnar archive of old history (needs pyarrow): where segments are written, the age in days at
+# which the archive_history command moves history there, and the Parquet compression codec
+PROBEFLEX_ARCHIVE_DIR = BASE_DIR / 'archive'
+PROBEFLEX_ARCHIVE_AFTER_DAYS = 30
+PROBEFLEX_ARCHIVE_COMPRESSION = 'zstd'
+# Files uploaded for multipart and binary request bodies, the largest accepted, and the bytes
+# read at a time when they are stored and streamed to the upstream
+PROBEFLEX_BODY_FILES_DIR = BASE_DIR / 'bodyfiles'
+PROBEFLEX_BODY_FILE_MAX_SIZE = 2 * 1024 ** 3
+PROBEFLEX_UPLOAD_CHUNK_SIZE = 64 * 1024
+# Largest response body a probe reads, both as received and after decompression (bytes)
+PROBEFLEX_MAX_RESPONSE_SIZE = 512 * 1024 ** 2
+# Most items one bulk create, update or execute call of the REST API may carry
+PROBEFLEX_API_BULK_LIMIT = 1000
+# Most probes (requests x iterations) one collection run may send
+PROBEFLEX_MAX_RUN_PROBES = 10000
+# Bearer token required to scrape /metrics/ (None leaves the endpoint open)
+PROBEFLEX_METRICS_TOKEN = os.environ.get('PROBEFLEX_METRICS_TOKEN')
+
+# REST API (/api/v1/): tokens or basic auth for machine clients, the session for the browsable API
+REST_FRAMEWORK = {
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.TokenAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.IsAuthenticated'],
+    'DEFAULT_THROTTLE_CLASSES': ['rest_framework.throttling.UserRateThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '5000/hour',
+        'probe_execute': '300/hour',  # single and bulk executions
+    },
+}
@@ -4,9 +4,14 @@ from django.contrib.auth import views as auth_views
 from django.views.generic import RedirectView
 from django.conf import settings
 from django.conf.urls.static import static
+from rest_framework.authtoken.views import obtain_auth_token
+
+from probe_app.api import router as api_router
 
 from probe_app.views import (
-    CustomLoginView, SignUpView, home, send_request, user_search,
+    CustomLoginView, SignUpView, home, send_request, user_search, export_history,
+    run_collection, run_events, cancel_run, response_node, response_range, metrics,
+    history_diff, pin_baseline, search_history,
     ProjectListView, ProjectDetailView, ProjectCreateView, ProjectUpdateView, ProjectDeleteView,
     CollectionDetailView, CollectionCreateView,
     APIRequestDetailView, APIRequestCreateView,
@@ -21,11 +26,27 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('signup/', SignUpView.as_view(), name='signup'),
     
+    # Prometheus metrics for the probe engine
+    path('metrics/', metrics, name='metrics'),
+    
     # Home and API testing
     path('', RedirectView.as_view(url='/home/'), name='index'),
     path('home/', home, name='home'),
     path('api/send/', send_request, name='send_request'),
     path('api/search-users/', user_search, name='search_users'),
+    path('api/history/export/', export_history, name='export_history'),
+    path('api/history/search/', search_history, name='search_history'),
+    path('api/history/<int:pk>/diff/', history_diff, name='history_diff'),
+    path('api/history/<int:pk>/baseline/', pin_baseline, name='pin_baseline'),
+    path('api/responses/<str:ref>/node/', response_node, name='response_node'),
+    path('api/responses/<str:ref>/range/', response_range, name='response_range'),
+    path('api/collections/<int:pk>/run/', run_collection, name='run_collection'),
+    path('api/runs/<str:run_id>/events/', run_events, name='run_events'),
+    path('api/runs/<str:run_id>/cancel/', cancel_run, name='cancel_run'),
+    
+    # REST API for machine clients
+    path('api/v1/', include(api_router.urls)),
+    path('api/v1/auth/token/', obtain_auth_token, name='api_token'),
     
     # Project URLs
     path('projects/', ProjectListView.as_view(), name='project_list'),
@@ -69,8 +69,21 @@ function initializeRequestUI() {
         addFormItemBtn.addEventListener('click', addFormItemRow);
     }
 
+    // Add multipart field button
+    const addMultipartItemBtn = document.getElementById('add-multipart-item');
+    if (addMultipartItemBtn) {
+        addMultipartItemBtn.addEventListener('click', addMultipartRow);
+    }
+
+    // Files chosen for multipart and binary bodies are uploaded right away
+    document.addEventListener('change', function(event) {
+        if (event.target.matches('input.body-file')) {
+            uploadBodyFile(event.target);
+        }
+    });
+
     // Add remove button event listeners for initial rows
-    document.querySelectorAll('.remove-param, .remove-header, .remove-form-item').forEach(button => {
+    document.querySelectorAll('.remove-param, .remove-header, .remove-form-item, .remove-multipart-item').forEach(button => {
         button.addEventListener('click', function() {
             this.closest('.row').remove();
         });
@@ -172,6 +185,77 @@ function addFormItemRow() {
     }
 }
 
+/**
+ * Add a new multipart field row (a text value or a file)
+ */
+function addMultipartRow() {
+    const multipartRow = document.createElement('div');
+    multipartRow.className = 'row mb-2';
+    multipartRow.innerHTML = `
+        <div class="col-3">
+            <input type="text" class="form-control multipart-key" placeholder="Key">
+        </div>
+        <div class="col-3">
+            <input type="text" class="form-control multipart-value" placeholder="Value">
+        </div>
+        <div class="col-4">
+            <input type="file" class="form-control body-file multipart-file">
+        </div>
+        <div class="col-2">
+            <button class="btn btn-sm btn-outline-danger remove-multipart-item">Remove</button>
+        </div>
+    `;
+    
+    const multipartRows = document.querySelector('.multipart-rows');
+    if (multipartRows) {
+        multipartRows.appendChild(multipartRow);
+        
+        // Add event listener to the newly created remove button
+        multipartRow.querySelector('.remove-multipart-item').addEventListener('click', function() {
+            multipartRow.remove();
+        });
+    }
+}
+
+/**
+ * Upload the file chosen in a file input as a body file.
+ * The browser streams it from disk; the returned reference is kept in the
+ * input's data-ref attribute and sent in place of the file contents.
+ * @param {HTMLInputElement} input - File input of a multipart row or binary body
+ */
+function uploadBodyFile(input) {
+    delete input.dataset.ref;
+    const file = input.files[0];
+    if (!file) return;
+    
+    const csrfTokenElement = document.querySelector('[name=csrfmiddlewaretoken]');
+    const formData = new FormData();
+    formData.append('file', file);
+    input.classList.remove('is-valid', 'is-invalid');
+    input.dataset.uploading = 'true';
+    
+    fetch('/api/v1/body-files/', {
+        method: 'POST',
+        headers: csrfTokenElement ? { 'X-CSRFToken': csrfTokenElement.value } : {},
+        body: formData
+    })
+    .then(response => response.json().then(data => ({ ok: response.ok, data: data })))
+    .then(({ ok, data }) => {
+        if (!ok) {
+            throw new Error(data.error || data.detail || 'Upload failed');
+        }
+        input.dataset.ref = data.ref;
+        input.classList.add('is-valid');
+    })
+    .catch(error => {
+        input.classList.add('is-invalid');
+        alert('Error uploading ' + file.name + ': ' + error.message);
+    })
+    .finally(() => {
+        delete input.dataset.uploading;
+    });
+}
+
 /**
  * Safe JSON parsing for Django json_script filter output
  * @param {string} elementId - ID of the element containing JSON data
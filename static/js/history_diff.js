@@ -0,0 +1,171 @@
+/**
+ * Response diffs and baselines for the request history of ProbeFlex
+ *
+ * Compares a history entry with the previous execution or the pinned
+ * baseline and renders the server-computed diff: structural changes
+ * (JSON pointer, old and new value) for JSON bodies, unified diff lines
+ * for text bodies.
+ */
+
+// Background colours of the change rows and diff lines
+const DIFF_OP_CLASSES = {
+    add: 'table-success',
+    remove: 'table-danger',
+    replace: 'table-warning'
+};
+
+/**
+ * Get the CSRF token rendered on the page
+ * @returns {string|null} CSRF token value
+ */
+function getDiffCsrfToken() {
+    const csrfTokenElement = document.querySelector('[name=csrfmiddlewaretoken]');
+    return csrfTokenElement ? csrfTokenElement.value : null;
+}
+
+/**
+ * Wire up the compare and pin buttons of the history table
+ */
+function initializeHistoryDiff() {
+    document.querySelectorAll('.history-diff-btn').forEach(button => {
+        button.addEventListener('click', () => {
+            loadHistoryDiff(button.dataset.historyId, button.dataset.against);
+        });
+    });
+    document.querySelectorAll('.history-pin-btn').forEach(button => {
+        button.addEventListener('click', () => {
+            pinBaseline(button.dataset.historyId, button.dataset.pinned !== 'true');
+        });
+    });
+    const closeButton = document.getElementById('history-diff-close');
+    if (closeButton) {
+        closeButton.addEventListener('click', () => {
+            document.getElementById('history-diff-panel').classList.add('d-none');
+        });
+    }
+}
+
+/**
+ * Fetch and display the diff of a history entry
+ * @param {string} historyId - ID of the history entry
+ * @param {string} against - 'previous', 'baseline' or another history ID
+ */
+function loadHistoryDiff(historyId, against) {
+    const panel = document.getElementById('history-diff-panel');
+    const content = document.getElementById('history-diff-content');
+    panel.classList.remove('d-none');
+    content.textContent = 'Computing diff...';
+
+    fetch(`/api/history/${historyId}/diff/?against=${encodeURIComponent(against)}`)
+    .then(response => response.json().then(data => {
+        if (!response.ok) {
+            throw new Error(data.error || 'Server returned ' + response.status);
+        }
+        return data;
+    }))
+    .then(renderHistoryDiff)
+    .catch(error => {
+        console.error('Error loading diff:', error);
+        content.innerHTML = '';
+        const message = document.createElement('div');
+        message.className = 'alert alert-warning mb-0';
+        message.textContent = error.message;
+        content.appendChild(message);
+    });
+}
+
+/**
+ * Render a diff returned by the server
+ * @param {Object} diff - Diff result with 'changes' or 'lines'
+ */
+function renderHistoryDiff(diff) {
+    const content = document.getElementById('history-diff-content');
+    document.getElementById('history-diff-title').textContent =
+        `Response diff: #${diff.old.id} → #${diff.new.id}`;
+    content.innerHTML = '';
+
+    if (diff.status_changed) {
+        const status = document.createElement('p');
+        status.textContent = `Status changed from ${diff.old.status} to ${diff.new.status}`;
+        content.appendChild(status);
+    }
+    if (diff.identical) {
+        const message = document.createElement('p');
+        message.className = 'text-muted mb-0';
+        message.textContent = 'Responses are identical.';
+        content.appendChild(message);
+        return;
+    }
+
+    if (diff.kind === 'text') {
+        const pre = document.createElement('pre');
+        pre.className = 'mb-0';
+        diff.lines.forEach(line => {
+            const span = document.createElement('div');
+            if (line.startsWith('+')) {
+                span.className = DIFF_OP_CLASSES.add;
+            } else if (line.startsWith('-')) {
+                span.className = DIFF_OP_CLASSES.remove;
+            } else if (line.startsWith('@@')) {
+                span.className = 'text-muted';
+            }
+            span.textContent = line;
+            pre.appendChild(span);
+        });
+        content.appendChild(pre);
+    } else {
+        const table = document.createElement('table');
+        table.className = 'table table-sm small mb-0';
+        table.innerHTML = '<thead><tr><th>Change</th><th>Path</th><th>Old</th><th>New</th></tr></thead>';
+        const tbody = document.createElement('tbody');
+        diff.changes.forEach(change => {
+            const row = document.createElement('tr');
+            row.className = DIFF_OP_CLASSES[change.op] || '';
+            [change.op, change.path || '/',
+             'old' in change ? JSON.stringify(change.old) : '',
+             'new' in change ? JSON.stringify(change.new) : ''].forEach(value => {
+                const cell = document.createElement('td');
+                cell.className = 'font-monospace text-break';
+                cell.textContent = value;
+                row.appendChild(cell);
+            });
+            tbody.appendChild(row);
+        });
+        table.appendChild(tbody);
+        content.appendChild(table);
+    }
+
+    if (diff.truncated) {
+        const note = document.createElement('p');
+        note.className = 'text-muted small mt-2 mb-0';
+        note.textContent = 'Diff truncated: only the first differences are shown.';
+        content.appendChild(note);
+    }
+}
+
+/**
+ * Pin or unpin a history entry as the request's baseline
+ * @param {string} historyId - ID of the history entry
+ * @param {boolean} pinned - Whether to pin (true) or unpin (false)
+ */
+function pinBaseline(historyId, pinned) {
+    fetch(`/api/history/${historyId}/baseline/`, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getDiffCsrfToken()
+        },
+        body: JSON.stringify({ pinned: pinned })
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error('Server returned ' + response.status + ' ' + response.statusText);
+        }
+        window.location.hash = 'history';
+        window.location.reload();
+    })
+    .catch(error => {
+        console.error('Error pinning baseline:', error);
+        alert('Could not update the baseline: ' + error.message);
+    });
+}
@@ -0,0 +1,230 @@
+/**
+ * Live collection run monitoring for ProbeFlex
+ *
+ * Starts a collection run and follows its Server-Sent Events stream. The
+ * server already coalesces updates, so every 'progress' event is rendered
+ * as-is: counters, a coarse latency histogram and the newest results.
+ */
+
+// Maximum number of result rows kept in the results table
+const RUN_RESULT_ROWS = 200;
+
+let runEventSource = null;
+let runCancelUrl = null;
+
+/**
+ * Get the CSRF token rendered on the page
+ * @returns {string|null} CSRF token value
+ */
+function getRunCsrfToken() {
+    const csrfTokenElement = document.querySelector('[name=csrfmiddlewaretoken]');
+    return csrfTokenElement ? csrfTokenElement.value : null;
+}
+
+/**
+ * Wire up the run panel buttons
+ */
+function initializeRunMonitor() {
+    const startButton = document.getElementById('run-start-btn');
+    const cancelButton = document.getElementById('run-cancel-btn');
+    if (!startButton) {
+        return;
+    }
+    startButton.addEventListener('click', startRun);
+    if (cancelButton) {
+        cancelButton.addEventListener('click', cancelRun);
+    }
+}
+
+/**
+ * Start a collection run and subscribe to its event stream
+ */
+function startRun() {
+    const panel = document.getElementById('run-panel');
+    const iterations = parseInt(document.getElementById('run-iterations').value, 10) || 1;
+    const concurrency = parseInt(document.getElementById('run-concurrency').value, 10) || 1;
+
+    document.getElementById('run-start-btn').disabled = true;
+    document.getElementById('run-results').innerHTML = '';
+    document.getElementById('run-progress-section').classList.remove('d-none');
+    document.getElementById('run-state').textContent = 'Starting...';
+
+    fetch(panel.dataset.runUrl, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getRunCsrfToken()
+        },
+        body: JSON.stringify({ iterations: iterations, concurrency: concurrency })
+    })
+    .then(response => {
+        if (!response.ok) {
+            throw new Error('Server returned ' + response.status + ' ' + response.statusText);
+        }
+        return response.json();
+    })
+    .then(data => {
+        runCancelUrl = `/api/runs/${data.run_id}/cancel/`;
+        document.getElementById('run-cancel-btn').disabled = false;
+        subscribeToRun(data.events_url);
+    })
+    .catch(error => {
+        console.error('Error starting run:', error);
+        document.getElementById('run-state').textContent = 'Error: ' + error.message;
+        document.getElementById('run-start-btn').disabled = false;
+    });
+}
+
+/**
+ * Ask the server to cancel the active run
+ */
+function cancelRun() {
+    if (!runCancelUrl) {
+        return;
+    }
+    document.getElementById('run-cancel-btn').disabled = true;
+    fetch(runCancelUrl, {
+        method: 'POST',
+        headers: { 'X-CSRFToken': getRunCsrfToken() }
+    }).catch(error => console.error('Error cancelling run:', error));
+}
+
+/**
+ * Follow the event stream of a run
+ * @param {string} eventsUrl - URL of the run's Server-Sent Events stream
+ */
+function subscribeToRun(eventsUrl) {
+    if (runEventSource) {
+        runEventSource.close();
+    }
+    runEventSource = new EventSource(eventsUrl);
+
+    runEventSource.addEventListener('progress', event => {
+        renderRunProgress(JSON.parse(event.data));
+    });
+
+    runEventSource.addEventListener('done', event => {
+        const data = JSON.parse(event.data);
+        document.getElementById('run-state').textContent = `Run ${data.state}`;
+        finishRun();
+    });
+
+    runEventSource.onerror = () => {
+        document.getElementById('run-state').textContent = 'Connection to run lost';
+        finishRun();
+    };
+}
+
+/**
+ * Close the event stream and reset the run buttons
+ */
+function finishRun() {
+    if (runEventSource) {
+        runEventSource.close();
+        runEventSource = null;
+    }
+    runCancelUrl = null;
+    document.getElementById('run-start-btn').disabled = false;
+    document.getElementById('run-cancel-btn').disabled = true;
+}
+
+/**
+ * Format a latency value for display
+ * @param {number|null} value - Latency in milliseconds
+ * @returns {string} Rounded latency with unit
+ */
+function formatLatency(value) {
+    return value === null || value === undefined ? '-' : `${Math.round(value)} ms`;
+}
+
+/**
+ * Render one coalesced progress frame
+ * @param {Object} frame - Progress frame sent by the server
+ */
+function renderRunProgress(frame) {
+    const percent = frame.total ? Math.round(frame.completed / frame.total * 100) : 100;
+    const progressBar = document.getElementById('run-progress-bar');
+    progressBar.style.width = `${percent}%`;
+    progressBar.className = frame.failed ? 'progress-bar bg-warning' : 'progress-bar bg-success';
+
+    document.getElementById('run-state').textContent =
+        `${frame.state} - ${frame.completed}/${frame.total} (${frame.rate.toFixed(1)} req/s)`;
+
+    const latency = frame.latency;
+    const counters = [
+        ['Passed', frame.succeeded],
+        ['Failed', frame.failed],
+        ['p50', formatLatency(latency.p50)],
+        ['p95', formatLatency(latency.p95)],
+        ['p99', formatLatency(latency.p99)],
+        ['Max', formatLatency(latency.max)],
+    ];
+    const countersElement = document.getElementById('run-counters');
+    countersElement.innerHTML = '';
+    counters.forEach(([label, value]) => {
+        const span = document.createElement('span');
+        span.className = 'me-3';
+        span.innerHTML = `<strong>${label}:</strong> `;
+        span.appendChild(document.createTextNode(value));
+        countersElement.appendChild(span);
+    });
+
+    renderRunHistogram(frame.histogram);
+    appendRunResults(frame.results, frame.skipped_results);
+}
+
+/**
+ * Draw the coarse latency histogram as a row of bars
+ * @param {Array} bins - List of [upper_bound_ms, count] pairs
+ */
+function renderRunHistogram(bins) {
+    const histogram = document.getElementById('run-histogram');
+    histogram.innerHTML = '';
+    const maxCount = Math.max(1, ...bins.map(bin => bin[1]));
+    bins.forEach(([upperBound, count]) => {
+        const bar = document.createElement('div');
+        bar.className = 'bg-primary me-1';
+        bar.style.flex = '1';
+        bar.style.height = `${Math.max(2, count / maxCount * 100)}%`;
+        bar.title = `<= ${Math.round(upperBound)} ms: ${count}`;
+        histogram.appendChild(bar);
+    });
+}
+
+/**
+ * Prepend the newest results to the results table
+ * @param {Array} results - Per-request results included in the frame
+ * @param {number} skipped - Results the server coalesced away
+ */
+function appendRunResults(results, skipped) {
+    const tbody = document.getElementById('run-results');
+    if (skipped > 0) {
+        const row = document.createElement('tr');
+        row.innerHTML = `<td colspan="4" class="text-muted small">${skipped} more results not shown</td>`;
+        tbody.prepend(row);
+    }
+    results.forEach(result => {
+        const row = document.createElement('tr');
+        const status = result.error ? 'Error' : result.status_code;
+        let statusClass = 'bg-danger';
+        if (!result.error && result.status_code < 400) {
+            statusClass = 'bg-success';
+        } else if (!result.error && result.status_code < 500) {
+            statusClass = 'bg-warning';
+        }
+        row.innerHTML = `
+            <td>${result.iteration}</td>
+            <td></td>
+            <td><span class="badge ${statusClass}">${status}</span></td>
+            <td>${result.error ? '-' : formatLatency(result.time)}</td>
+        `;
+        row.children[1].textContent = `${result.method} ${result.name}`;
+        if (result.error) {
+            row.title = result.error;
+        }
+        tbody.prepend(row);
+    });
+    while (tbody.children.length > RUN_RESULT_ROWS) {
+        tbody.removeChild(tbody.lastChild);
+    }
+}
@@ -139,14 +139,41 @@ function getBody() {
                 }
             }
         });
-        return formData;
+        // Typed body: sent URL-encoded rather than as JSON
+        return { '$body': 'form', fields: formData };
     } else if (bodyType === 'raw') {
         const rawEditorElement = document.getElementById('raw-editor');
         if (!rawEditorElement) {
             console.warn('raw-editor element not found, returning empty string');
             return '';
         }
-        return rawEditorElement.value;
+        return { '$body': 'raw', text: rawEditorElement.value };
+    } else if (bodyType === 'multipart') {
+        // Files are referenced by the body file they were uploaded to
+        const fields = {};
+        const files = {};
+        document.querySelectorAll('.multipart-rows .row').forEach(row => {
+            const keyElement = row.querySelector('.multipart-key');
+            const valueElement = row.querySelector('.multipart-value');
+            const fileElement = row.querySelector('.multipart-file');
+            const key = keyElement ? keyElement.value.trim() : '';
+            if (!key) return;
+            if (fileElement && fileElement.dataset.ref) {
+                files[key] = { file: fileElement.dataset.ref, filename: fileElement.files[0] ? fileElement.files[0].name : undefined };
+            } else if (valueElement) {
+                fields[key] = valueElement.value;
+            }
+        });
+        const chunkedElement = document.getElementById('multipart-chunked');
+        return { '$body': 'multipart', fields: fields, files: files, chunked: chunkedElement ? chunkedElement.checked : false };
+    } else if (bodyType === 'binary') {
+        const fileElement = document.getElementById('binary-file');
+        if (!fileElement || !fileElement.dataset.ref) {
+            alert('Choose a file and wait for its upload to finish.');
+            return {};
+        }
+        const chunkedElement = document.getElementById('binary-chunked');
+        return { '$body': 'binary', file: fileElement.dataset.ref, chunked: chunkedElement ? chunkedElement.checked : false };
     }
     
     return {};
@@ -231,6 +258,158 @@ function updateResponse(message) {
     document.getElementById('response-headers-content').innerHTML = '<p class="text-muted">Waiting for response...</p>';
 }
 
+// Number of children requested per page when expanding large JSON nodes
+const LAZY_NODE_PAGE_SIZE = 100;
+
+// Number of bytes requested per page when viewing a large body as text
+const LAZY_TEXT_PAGE_SIZE = 64 * 1024;
+
+/**
+ * Format a byte count for display
+ * @param {number} size - Size in bytes
+ * @returns {string} Human readable size
+ */
+function formatBytes(size) {
+    if (size >= 1024 * 1024) {
+        return `${(size / (1024 * 1024)).toFixed(1)} MB`;
+    }
+    if (size >= 1024) {
+        return `${(size / 1024).toFixed(1)} KB`;
+    }
+    return `${size} B`;
+}
+
+/**
+ * Render a spooled response body with a lazy tree or paged text view
+ * @param {HTMLElement} container - Element to render into
+ * @param {Object} data - Response data containing body_ref, body_kind and body_size
+ */
+function renderSpooledBody(container, data) {
+    const info = document.createElement('div');
+    info.className = 'text-muted small mb-2';
+    info.textContent = `Large response (${formatBytes(data.body_size)}) - loaded on demand`;
+    container.appendChild(info);
+    
+    if (data.body_kind === 'json') {
+        const tree = document.createElement('div');
+        tree.className = 'lazy-json font-monospace small';
+        container.appendChild(tree);
+        loadLazyNode(tree, data.body_ref, '', 0);
+    } else {
+        const pre = document.createElement('pre');
+        container.appendChild(pre);
+        loadLazyText(container, pre, data.body_ref, 0);
+    }
+}
+
+/**
+ * Fetch a page of children for a JSON node and append them to a list
+ * @param {HTMLElement} list - Element receiving the child rows
+ * @param {string} ref - Spooled response reference
+ * @param {string} pointer - JSON pointer of the node being expanded
+ * @param {number} offset - Index of the first child to load
+ */
+function loadLazyNode(list, ref, pointer, offset) {
+    const query = new URLSearchParams({ pointer: pointer, offset: offset, limit: LAZY_NODE_PAGE_SIZE });
+    fetch(`/api/responses/${ref}/node/?${query}`)
+    .then(response => response.json())
+    .then(node => {
+        if (node.error) {
+            throw new Error(node.error);
+        }
+        node.children.forEach(child => list.appendChild(createLazyNodeRow(ref, child)));
+        
+        const loaded = node.offset + node.children.length;
+        if (loaded < node.length) {
+            const more = document.createElement('button');
+            more.className = 'btn btn-link btn-sm p-0';
+            more.textContent = `Show more (${node.length - loaded} remaining)`;
+            more.addEventListener('click', () => {
+                more.remove();
+                loadLazyNode(list, ref, pointer, loaded);
+            });
+            list.appendChild(more);
+        }
+    })
+    .catch(error => {
+        const message = document.createElement('div');
+        message.className = 'text-danger';
+        message.textContent = 'Error: ' + error.message;
+        list.appendChild(message);
+    });
+}
+
+/**
+ * Create the row for one JSON node; containers expand on click
+ * @param {string} ref - Spooled response reference
+ * @param {Object} child - Node summary returned by the server
+ * @returns {HTMLElement} Row element
+ */
+function createLazyNodeRow(ref, child) {
+    const row = document.createElement('div');
+    row.className = 'ms-3';
+    const label = document.createElement('span');
+    label.className = 'text-primary';
+    label.textContent = `${child.key}: `;
+    row.appendChild(label);
+    
+    if (child.type === 'object' || child.type === 'array') {
+        const toggle = document.createElement('a');
+        toggle.href = '#';
+        const summary = child.type === 'object' ? `{…} ${child.length} keys` : `[…] ${child.length} items`;
+        toggle.textContent = `▸ ${summary}`;
+        const children = document.createElement('div');
+        let loaded = false;
+        toggle.addEventListener('click', event => {
+            event.preventDefault();
+            if (!loaded) {
+                loaded = true;
+                loadLazyNode(children, ref, child.pointer, 0);
+            }
+            const hidden = children.classList.toggle('d-none');
+            toggle.textContent = `${hidden ? '▸' : '▾'} ${summary}`;
+        });
+        row.appendChild(toggle);
+        row.appendChild(children);
+    } else {
+        const value = document.createElement('span');
+        value.textContent = JSON.stringify(child.value) + (child.truncated ? ` … (${child.length} chars)` : '');
+        row.appendChild(value);
+    }
+    return row;
+}
+
+/**
+ * Fetch the next byte range of a spooled body and append it as text
+ * @param {HTMLElement} container - Element holding the text view
+ * @param {HTMLElement} pre - Element receiving the text
+ * @param {string} ref - Spooled response reference
+ * @param {number} offset - Byte offset to continue from
+ */
+function loadLazyText(container, pre, ref, offset) {
+    fetch(`/api/responses/${ref}/range/?offset=${offset}&length=${LAZY_TEXT_PAGE_SIZE}`)
+    .then(response => response.json())
+    .then(chunk => {
+        if (chunk.error) {
+            throw new Error(chunk.error);
+        }
+        pre.appendChild(document.createTextNode(chunk.text));
+        if (chunk.next_offset < chunk.size) {
+            const more = document.createElement('button');
+            more.className = 'btn btn-link btn-sm p-0';
+            more.textContent = `Load more (${formatBytes(chunk.size - chunk.next_offset)} remaining)`;
+            more.addEventListener('click', () => {
+                more.remove();
+                loadLazyText(container, pre, ref, chunk.next_offset);
+            });
+            container.appendChild(more);
+        }
+    })
+    .catch(error => {
+        pre.appendChild(document.createTextNode('\nError: ' + error.message));
+    });
+}
+
 /**
  * Display the API response in the UI
  * @param {Object} data - Response data from the API
@@ -253,13 +432,25 @@ function displayResponse(data) {
     document.getElementById('status-code').className = `badge ${statusClass}`;
     
     // Update response time
-    document.getElementById('response-time').textContent = `${Math.round(data.time || 0)} ms`;
-    
+    // Time spent queued for the host governor is shown separately from upstream latency
+    const queueTime = Math.round(data.queue_time || 0);
+    document.getElementById('response-time').textContent =
+        `${Math.round(data.time || 0)} ms` + (queueTime ? ` (+${queueTime} ms queued)` : '');
+
+    // Compressed responses show their size on the wire and the time spent decoding them
+    document.getElementById('response-time').title = data.content_encoding
+        ? `${data.content_encoding}: ${formatBytes(data.wire_size)} received, ` +
+          `${formatBytes(data.body_size)} decoded in ${(data.decompression_time || 0).toFixed(2)} ms`
+        : '';
+
     // Update response body
     const responseBodyContainer = document.getElementById('response-body-content');
     responseBodyContainer.innerHTML = '';
     
-    if (typeof data.body === 'object') {
+    if (data.body_ref) {
+        // Large bodies stay on the server and are fetched slice by slice
+        renderSpooledBody(responseBodyContainer, data);
+    } else if (typeof data.body === 'object') {
         // Check if JSONFormatter is available
         if (typeof JSONFormatter === 'function') {
             try {
@@ -379,6 +570,22 @@ function sendRequest() {
     }
     const csrfToken = csrfTokenElement.value;
     
+    // Timeout in milliseconds (the saved request's timeout when left empty)
+    const timeoutElement = document.getElementById('timeout');
+    const timeout = timeoutElement && timeoutElement.value ? parseInt(timeoutElement.value, 10) : null;
+    
+    // HTTP version chosen in the request form (the saved request's version otherwise)
+    const httpVersionElement = document.getElementById('id_http_version');
+    const httpVersion = httpVersionElement ? httpVersionElement.value : null;
+    
+    // Request body compression chosen in the request form (the saved request's otherwise)
+    const compressionElement = document.getElementById('id_request_compression');
+    const requestCompression = compressionElement ? compressionElement.value : undefined;
+    
+    // Saved requests record their executions in the request history
+    const requestIdElement = document.getElementById('request-id');
+    const apiRequestId = requestIdElement ? JSON.parse(requestIdElement.textContent) : null;
+    
     // Send the request
     fetch('/api/send/', {
         method: 'POST',
@@ -394,7 +601,11 @@ function sendRequest() {
             body: body,
             auth: auth,
             follow_redirects: followRedirects,
-            verify_ssl: verifySSL
+            verify_ssl: verifySSL,
+            timeout: timeout,
+            http_version: httpVersion,
+            request_compression: requestCompression,
+            api_request_id: apiRequestId
         })
     })
     .then(response => {